@@ -0,0 +1,14 @@
+"""
+接口压测
+
+在临时测试数据库中生成数据，启动本地模拟面板和中转服务，对热点接口重复调用并统计耗时和查询次数。
+
+使用方法（在项目根目录执行）：
+    python -m benchmarks
+    python -m benchmarks --agents 10 --customers 200 --iterations 50
+    python -m benchmarks --only get_prices,customer_nodes --latency 50 --failure-rate 0.05
+    python -m benchmarks --json result.json
+
+模块导入耗时（worker 启动、自动重载）单独统计：
+    python -m benchmarks.importtime --budget-ms 1500
+"""
@@ -0,0 +1,69 @@
+import argparse
+import os
+import sys
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='热点接口压测')
+    parser.add_argument('--agents', type=int, default=5, help='二级代理数量')
+    parser.add_argument('--customers', type=int, default=50, help='每个代理的客户数量')
+    parser.add_argument('--orders', type=int, default=4, help='每个客户的订单数量')
+    parser.add_argument('--nodes', type=int, default=2, help='每个订单的节点数量')
+    parser.add_argument('--panels', type=int, default=4, help='模拟面板数量（x-ui 和 3x-ui 各一半）')
+    parser.add_argument('--latency', type=float, default=0, help='模拟服务固定延迟（毫秒）')
+    parser.add_argument('--jitter', type=float, default=0, help='模拟服务随机延迟上限（毫秒）')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='模拟服务返回错误的概率')
+    parser.add_argument('--iterations', type=int, default=20, help='每个场景的执行次数')
+    parser.add_argument('--only', default='', help='只执行指定场景，逗号分隔')
+    parser.add_argument('--keepdb', action='store_true', help='保留测试数据库')
+    parser.add_argument('--json', help='将结果写入JSON文件')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'vpncms.settings')
+    import django
+    django.setup()
+
+    from django.db import connection
+    from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+    from .fake_servers import FakePanelServer, FakeTransitServer
+    from .fixtures import create_dataset
+    from .runner import run_benchmarks, format_results, write_json
+
+    server_options = {'latency_ms': args.latency, 'jitter_ms': args.jitter, 'failure_rate': args.failure_rate}
+    panel_servers = [
+        FakePanelServer(panel_type='x-ui' if i % 2 == 0 else '3x-ui', **server_options).start()
+        for i in range(args.panels)
+    ]
+    transit_server = FakeTransitServer(**server_options).start()
+
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=args.keepdb)
+    try:
+        with override_settings(API_BASE_URL=f'http://{transit_server.address}'):
+            print('生成压测数据...', file=sys.stderr)
+            dataset = create_dataset(
+                panel_servers,
+                agents=args.agents,
+                customers_per_agent=args.customers,
+                orders_per_customer=args.orders,
+                nodes_per_order=args.nodes,
+            )
+            only = [name.strip() for name in args.only.split(',') if name.strip()]
+            results = run_benchmarks(dataset, iterations=args.iterations, only=only)
+        print(format_results(results))
+        if args.json:
+            write_json(results, args.json, meta=vars(args))
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=args.keepdb)
+        teardown_test_environment()
+        for server in panel_servers + [transit_server]:
+            server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+"""
+本地模拟服务
+
+FakePanelServer 模拟 x-ui / 3x-ui 面板的登录、入站增删查、xray 配置和服务状态接口，
+FakeTransitServer 模拟 nyanpass 中转接口。两者都在后台线程中运行，
+可以设置每个请求的固定延迟、随机抖动和失败率，用于压测时复现面板变慢或出错的情况。
+"""
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class FakeServer:
+    """在后台线程运行的 HTTP 服务，子类实现 handle(method, path, body) 返回 (状态码, 响应数据)"""
+
+    def __init__(self, latency_ms=0, jitter_ms=0, failure_rate=0.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.failure_rate = failure_rate
+        self.request_count = 0
+        self.lock = threading.Lock()
+        self.httpd = None
+        self.thread = None
+
+    @property
+    def address(self):
+        host, port = self.httpd.server_address[:2]
+        return f'{host}:{port}'
+
+    def start(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def respond(self, method):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                with server.lock:
+                    server.request_count += 1
+                delay = server.latency_ms + random.uniform(0, server.jitter_ms)
+                if delay:
+                    time.sleep(delay / 1000)
+                if server.failure_rate and random.random() < server.failure_rate:
+                    status_code, payload, headers = 500, {'success': False, 'msg': '模拟故障'}, {}
+                else:
+                    status_code, payload, headers = server.dispatch(method, self.path, body, self.headers)
+                content = json.dumps(payload).encode()
+                self.send_response(status_code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(content)))
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(content)
+
+            def do_GET(self):
+                self.respond('GET')
+
+            def do_POST(self):
+                self.respond('POST')
+
+            def do_DELETE(self):
+                self.respond('DELETE')
+
+            def do_PUT(self):
+                self.respond('PUT')
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.httpd:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+
+    def dispatch(self, method, path, body, headers):
+        raise NotImplementedError
+
+    @staticmethod
+    def parse_body(body):
+        """同时支持 JSON 和表单格式的请求体"""
+        if not body:
+            return {}
+        try:
+            data = json.loads(body)
+            return data if isinstance(data, dict) else {}
+        except ValueError:
+            return {key: values[0] for key, values in parse_qs(body.decode()).items()}
+
+
+class FakePanelServer(FakeServer):
+    """模拟 x-ui / 3x-ui 面板，入站保存在内存中，每次查询列表时流量计数都会增长"""
+
+    def __init__(self, panel_type='x-ui', socks_servers=3, xray_version='1.8.4', **kwargs):
+        super().__init__(**kwargs)
+        self.panel_type = panel_type
+        self.xray_version = xray_version
+        self.inbounds = {}
+        self.next_id = 1
+        self.xray_setting = {
+            'outbounds': [
+                {
+                    'protocol': 'socks',
+                    'tag': f'socks-{i}',
+                    'settings': {
+                        'servers': [{
+                            'address': f'10.0.0.{i + 1}',
+                            'port': 1080,
+                            'users': [{'user': f'user{i}', 'pass': f'pass{i}'}],
+                        }]
+                    },
+                }
+                for i in range(socks_servers)
+            ],
+            'routing': {'rules': []},
+        }
+
+    def seed_inbounds(self, count, start_port=20000):
+        """预先创建一批入站"""
+        for i in range(count):
+            self.add_inbound({'port': start_port + i, 'remark': f'seed-{i}', 'protocol': 'vmess'})
+
+    def add_inbound(self, data):
+        with self.lock:
+            inbound_id = self.next_id
+            self.next_id += 1
+            self.inbounds[inbound_id] = {
+                'id': inbound_id,
+                'up': 0,
+                'down': 0,
+                'total': 0,
+                'remark': data.get('remark', ''),
+                'enable': True,
+                'expiryTime': int(data.get('expiryTime') or 0),
+                'listen': '',
+                'port': int(data.get('port') or 0),
+                'protocol': data.get('protocol', 'vmess'),
+                'settings': data.get('settings', '{}'),
+                'streamSettings': data.get('streamSettings', '{}'),
+                'tag': f"inbound-{data.get('port')}",
+                'sniffing': data.get('sniffing', '{}'),
+            }
+            return self.inbounds[inbound_id]
+
+    def list_inbounds(self):
+        with self.lock:
+            for inbound in self.inbounds.values():
+                inbound['up'] += random.randint(0, 1 << 20)
+                inbound['down'] += random.randint(0, 4 << 20)
+            return [dict(inbound) for inbound in self.inbounds.values()]
+
+    def dispatch(self, method, path, body, headers):
+        path = urlparse(path).path.rstrip('/') or '/'
+        data = self.parse_body(body)
+        ok = lambda obj=None: (200, {'success': True, 'msg': '', 'obj': obj}, {})
+
+        # 只响应本面板类型的接口，与真实面板一致，便于测试面板类型识别
+        if path.startswith('/xui/') and self.panel_type != 'x-ui' or \
+                path.startswith('/panel/') and self.panel_type != '3x-ui':
+            return 404, {'success': False, 'msg': '404 page not found', 'obj': None}, {}
+        if path == '/login':
+            return 200, {'success': True, 'msg': '登录成功', 'obj': None}, {
+                'Set-Cookie': f'session=fake-{random.getrandbits(32):x}; Path=/; HttpOnly'
+            }
+        if path in ('/xui/inbound/list', '/panel/inbound/list', '/panel/api/inbounds/list'):
+            return ok(self.list_inbounds())
+        if path in ('/xui/inbound/add', '/panel/api/inbounds/add', '/panel/inbound/add'):
+            return ok(self.add_inbound(data))
+        match = re.match(r'^/(?:xui/inbound|panel/inbound|panel/api/inbounds)/del/(\d+)$', path)
+        if match:
+            with self.lock:
+                removed = self.inbounds.pop(int(match.group(1)), None)
+            return (200, {'success': True, 'msg': '删除成功', 'obj': None}, {}) if removed else \
+                (200, {'success': False, 'msg': '入站不存在', 'obj': None}, {})
+        if path == '/panel/xray':
+            return ok(json.dumps({'xraySetting': self.xray_setting, 'inboundTags': []}))
+        if path == '/panel/xray/update':
+            if data.get('xraySetting'):
+                try:
+                    self.xray_setting = json.loads(data['xraySetting'])
+                except ValueError:
+                    pass
+            return ok()
+        if path == '/server/status':
+            return ok({'cpu': 1.5, 'mem': {'current': 1, 'total': 4}, 'xray': {'state': 'running', 'version': self.xray_version}})
+        if path in ('/server/restartXrayService', '/panel/api/server/restartXrayService'):
+            return ok()
+        return 404, {'success': False, 'msg': '请重新登录', 'obj': None}, {}
+
+
+class FakeTransitServer(FakeServer):
+    """模拟 nyanpass 中转接口"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.rules = {}
+        self.next_id = 1
+
+    def dispatch(self, method, path, body, headers):
+        parsed = urlparse(path)
+        path = parsed.path.rstrip('/')
+        data = self.parse_body(body)
+
+        if path == '/api/v1/auth/login':
+            return 200, {'code': 0, 'data': f'fake-token-{random.getrandbits(32):x}'}, {}
+        if path == '/api/v1/user/info':
+            return 200, {'code': 0, 'data': {'username': 'bench', 'balance': 100, 'traffic_used': 0, 'traffic_enable': 1 << 40}}, {}
+        if path == '/api/v1/user/devicegroup':
+            return 200, {'code': 0, 'data': [{'id': 1, 'name': 'in', 'type': 'in'}, {'id': 2, 'name': 'out', 'type': 'out'}]}, {}
+        if path == '/api/v1/user/forward' and method == 'POST':
+            with self.lock:
+                rule_id = self.next_id
+                self.next_id += 1
+                self.rules[rule_id] = {'id': rule_id, 'listen_port': 30000 + rule_id, **data}
+            return 200, {'code': 0, 'msg': 'ok'}, {}
+        if path == '/api/v1/user/forward':
+            with self.lock:
+                rules = list(self.rules.values())
+            return 200, {'code': 0, 'data': rules, 'total': len(rules)}, {}
+        if path == '/api/v1/user/forward/search_rules':
+            with self.lock:
+                rules = list(self.rules.values())[-1:]
+            return 200, {'code': 0, 'data': rules}, {}
+        match = re.match(r'^/api/v1/user/forward/(\d+)$', path)
+        if match:
+            with self.lock:
+                self.rules.pop(int(match.group(1)), None)
+            return 200, {'code': 0, 'msg': 'ok'}, {}
+        return 404, {'code': 404, 'msg': 'not found'}, {}
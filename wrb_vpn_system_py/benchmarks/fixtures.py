@@ -0,0 +1,165 @@
+"""
+压测数据
+
+create_dataset 按指定规模批量生成一级代理、二级代理、客户、订单、节点、面板和聊天会话，
+面板地址指向本地模拟面板。所有数据使用 bulk_create 写入，生成几万条数据只需几秒。
+"""
+import json
+import random
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.utils import timezone
+
+from chat.models import ChatSession, ChatMessage
+from panels.models import AgentPanel
+from users.models import User, PaymentOrder, NodeInfo
+
+BENCH_PASSWORD = 'bench-password'
+BENCH_COUNTRY = '美国'
+NODE_TYPES = ['normal', 'live']
+PERIODS = ['monthly', 'quarterly', 'half_yearly', 'yearly']
+
+PRICE_FIELDS = {
+    'normal_monthly_price': Decimal('10.00'),
+    'normal_quarterly_price': Decimal('28.00'),
+    'normal_half_yearly_price': Decimal('54.00'),
+    'normal_yearly_price': Decimal('100.00'),
+    'live_monthly_price': Decimal('20.00'),
+    'live_quarterly_price': Decimal('56.00'),
+    'live_half_yearly_price': Decimal('108.00'),
+    'live_yearly_price': Decimal('200.00'),
+    'transit_monthly_price': Decimal('15.00'),
+    'transit_quarterly_price': Decimal('42.00'),
+    'transit_half_yearly_price': Decimal('80.00'),
+    'transit_yearly_price': Decimal('150.00'),
+}
+
+
+class Dataset:
+    """生成的数据中压测需要直接引用的对象"""
+
+    def __init__(self):
+        self.agent_l1 = None
+        self.agents = []
+        self.customers = []
+        self.panels = []
+
+
+def create_dataset(panel_servers, agents=5, customers_per_agent=50, orders_per_customer=4,
+                   nodes_per_order=2, chat_sessions_per_agent=20, messages_per_session=5):
+    """
+    批量生成压测数据
+
+    参数:
+    - panel_servers: FakePanelServer 列表，每个模拟面板对应一条 AgentPanel
+    """
+    password = make_password(BENCH_PASSWORD)
+    dataset = Dataset()
+    now = timezone.now()
+
+    dataset.agent_l1 = User.objects.create(
+        username='bench_l1', password=password, user_type='agent_l1', is_agent=True,
+        balance=Decimal('1000000'), **PRICE_FIELDS
+    )
+
+    User.objects.bulk_create([
+        User(
+            username=f'bench_agent_{i}', password=password, user_type='agent_l2', is_agent=True,
+            parent=dataset.agent_l1, domain=f'agent{i}.bench.local', balance=Decimal('1000000'), **PRICE_FIELDS
+        )
+        for i in range(agents)
+    ])
+    dataset.agents = list(User.objects.filter(user_type='agent_l2', username__startswith='bench_agent_').order_by('id'))
+
+    User.objects.bulk_create([
+        User(
+            username=f'bench_customer_{agent.id}_{i}', password=password, user_type='customer',
+            parent=agent, balance=Decimal('100000')
+        )
+        for agent in dataset.agents
+        for i in range(customers_per_agent)
+    ], batch_size=1000)
+    dataset.customers = list(User.objects.filter(user_type='customer', username__startswith='bench_customer_').order_by('id'))
+
+    AgentPanel.objects.bulk_create([
+        AgentPanel(
+            ip_address=server.address, ip='127.0.0.1', port=int(server.address.split(':')[1]),
+            username='admin', password='admin', panel_type=server.panel_type,
+            is_active=True, is_online=True, country=BENCH_COUNTRY,
+        )
+        for server in panel_servers
+    ])
+    dataset.panels = list(AgentPanel.objects.filter(ip='127.0.0.1').order_by('id'))
+
+    orders = []
+    for customer in dataset.customers:
+        for i in range(orders_per_customer):
+            node_type = random.choice(NODE_TYPES)
+            period = random.choice(PERIODS)
+            orders.append(PaymentOrder(
+                user=customer,
+                out_trade_no=f'BENCH{uuid.uuid4().hex[:24].upper()}',
+                payment_type='other',
+                product_name='节点购买',
+                amount=PRICE_FIELDS[f'{node_type}_{period}_price'] * nodes_per_order,
+                status='success',
+                param=json.dumps({'region': BENCH_COUNTRY, 'nodeType': node_type, 'protocol': 'vmess', 'period': period, 'quantity': nodes_per_order}),
+                country=BENCH_COUNTRY,
+                node_count=nodes_per_order,
+                node_protocol='vmess',
+                period=period,
+                node_type=node_type,
+                is_processed=True,
+            ))
+    PaymentOrder.objects.bulk_create(orders, batch_size=1000)
+
+    nodes = []
+    port = 20000
+    for order in PaymentOrder.objects.filter(out_trade_no__startswith='BENCH').only('id', 'user_id'):
+        for i in range(nodes_per_order):
+            panel = random.choice(dataset.panels)
+            port += 1
+            nodes.append(NodeInfo(
+                order_id=order.id,
+                user_id=order.user_id,
+                remark=f'bench-{order.id}-{i}',
+                protocol='vmess',
+                host='127.0.0.1',
+                port=port,
+                uuid=str(uuid.uuid4()),
+                panel_id=panel.id,
+                status='active',
+                expiry_time=now + timedelta(days=30),
+                config_text=f'vmess://bench-{order.id}-{i}',
+            ))
+    NodeInfo.objects.bulk_create(nodes, batch_size=1000)
+
+    # 为模拟面板创建对应的入站，使面板轮询能匹配到节点
+    for panel, server in zip(dataset.panels, panel_servers):
+        panel_nodes = list(NodeInfo.objects.filter(panel_id=panel.id).only('id', 'port', 'remark'))
+        for node in panel_nodes:
+            node.panel_node_id = server.add_inbound({'port': node.port, 'remark': node.remark, 'protocol': 'vmess'})['id']
+        NodeInfo.objects.bulk_update(panel_nodes, ['panel_node_id'], batch_size=1000)
+
+    sessions = []
+    for agent in dataset.agents:
+        agent_customers = [customer for customer in dataset.customers if customer.parent_id == agent.id]
+        for customer in agent_customers[:chat_sessions_per_agent]:
+            sessions.append(ChatSession(client=customer, agent=agent))
+    ChatSession.objects.bulk_create(sessions, batch_size=1000)
+    messages = []
+    for session in ChatSession.objects.filter(agent__in=dataset.agents):
+        for i in range(messages_per_session):
+            from_client = i % 2 == 0
+            messages.append(ChatMessage(
+                session=session,
+                sender_id=session.client_id if from_client else session.agent_id,
+                message_type='client' if from_client else 'agent',
+                content=f'消息 {i}',
+            ))
+    ChatMessage.objects.bulk_create(messages, batch_size=1000)
+
+    return dataset
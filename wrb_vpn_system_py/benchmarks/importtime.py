@@ -0,0 +1,105 @@
+"""
+导入耗时
+
+在新的解释器中用 python -X importtime 执行 django.setup() 并导入指定模块（默认 vpncms.urls，
+即 worker 处理第一个请求前要加载的全部代码），统计总耗时和项目内各模块的累计耗时，
+用来确认 gunicorn 启动、自动重载的耗时没有随代码增长而变慢。
+
+使用方法（在项目根目录执行）：
+    python -m benchmarks.importtime
+    python -m benchmarks.importtime --module users.views.payment --top 20
+    python -m benchmarks.importtime --budget-ms 1500 --repeat 5
+
+指定 --budget-ms 时，多次执行的中位数超过预算则以非零状态码退出。
+users.tests.ImportTimeBudgetTest 在测试中按 IMPORT_TIME_BUDGET_MS 检查同样的预算，
+python -m benchmarks 中的 import_urls 场景也会调用这里的 measure_import_time。
+未指定 settings 模块时使用环境变量 DJANGO_SETTINGS_MODULE，没有设置时为 vpncms.settings。
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LINE_PATTERN = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|( *)(\S+)$')
+
+
+def get_project_packages():
+    return {
+        name for name in os.listdir(PROJECT_ROOT)
+        if os.path.isfile(os.path.join(PROJECT_ROOT, name, '__init__.py'))
+    }
+
+
+def measure_import_time(module='vpncms.urls', settings_module=None):
+    """
+    在子进程中导入模块并解析 -X importtime 的输出
+
+    返回:
+    - {'total_ms', 'wall_ms', 'modules': [(模块名, 自身耗时ms, 累计耗时ms)]}
+    """
+    code = f'import time; t = time.perf_counter(); import django; django.setup(); import {module}; ' \
+           f'print((time.perf_counter() - t) * 1000)'
+    settings_module = settings_module or os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'vpncms.settings')
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings_module)
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=PROJECT_ROOT, env=env, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f'导入 {module} 失败:\n{result.stderr[-2000:]}')
+
+    modules = []
+    for line in result.stderr.splitlines():
+        match = LINE_PATTERN.match(line)
+        if match:
+            self_us, cumulative_us, _, name = match.groups()
+            modules.append((name, int(self_us) / 1000, int(cumulative_us) / 1000))
+    return {
+        'total_ms': round(sum(self_ms for _, self_ms, _ in modules), 2),
+        'wall_ms': round(float(result.stdout.strip().splitlines()[-1]), 2),
+        'modules': modules,
+    }
+
+
+def median_total(runs):
+    """多次执行的总导入耗时中位数（毫秒）"""
+    totals = sorted(run['total_ms'] for run in runs)
+    return totals[len(totals) // 2]
+
+
+def format_report(runs, top=15):
+    packages = get_project_packages()
+    totals = sorted(run['total_ms'] for run in runs)
+    median = median_total(runs)
+    lines = [f'导入耗时: 中位数 {median}ms，最小 {totals[0]}ms，最大 {totals[-1]}ms（{len(runs)} 次）']
+
+    last = runs[-1]['modules']
+    project = [item for item in last if item[0].split('.')[0] in packages]
+    lines.append(f'项目模块 {len(project)} 个，自身耗时合计 {round(sum(item[1] for item in project), 2)}ms')
+    lines.append(f'累计耗时最长的 {top} 个项目模块:')
+    for name, self_ms, cumulative_ms in sorted(project, key=lambda item: -item[2])[:top]:
+        lines.append(f'  {cumulative_ms:>9.2f}ms  (自身 {self_ms:>8.2f}ms)  {name}')
+    return median, '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.importtime', description='统计模块导入耗时')
+    parser.add_argument('--module', default='vpncms.urls', help='要导入的模块')
+    parser.add_argument('--settings', help='DJANGO_SETTINGS_MODULE，默认取环境变量，没有设置时为 vpncms.settings')
+    parser.add_argument('--repeat', type=int, default=3, help='执行次数，取中位数')
+    parser.add_argument('--top', type=int, default=15, help='列出累计耗时最长的项目模块数量')
+    parser.add_argument('--budget-ms', type=float, default=0, help='导入耗时预算（毫秒），超出时以非零状态码退出')
+    args = parser.parse_args()
+
+    runs = [measure_import_time(args.module, args.settings) for _ in range(max(1, args.repeat))]
+    median, report = format_report(runs, top=args.top)
+    print(report)
+    if args.budget_ms and median > args.budget_ms:
+        print(f'导入耗时 {median}ms 超出预算 {args.budget_ms}ms', file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""
+压测执行
+
+每个场景重复执行若干次，记录每次的耗时和数据库查询次数，输出 p50/p95/最大耗时和平均/最大查询次数。
+接口通过 DRF 的 APIClient 在进程内调用，不经过网络，测到的是视图本身的耗时；
+面板和中转接口请求发往本地模拟服务。
+"""
+import json
+import math
+import os
+import time
+import uuid
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from panels.inventory import refresh_panel_inventory
+from users.panel_session import update_single_panel
+from .importtime import measure_import_time
+
+
+def percentile(values, percent):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, math.ceil(percent / 100 * len(values)) - 1))
+    return values[index]
+
+
+def measure(name, func, iterations=20, warmup=1):
+    """
+    执行场景并统计
+
+    func 每次调用返回响应对象或None，响应状态码不是2xx时计为错误
+    """
+    for _ in range(warmup):
+        func()
+
+    latencies = []
+    queries = []
+    errors = 0
+    for _ in range(iterations):
+        with CaptureQueriesContext(connection) as context:
+            started_at = time.perf_counter()
+            response = func()
+            latencies.append((time.perf_counter() - started_at) * 1000)
+        queries.append(len(context.captured_queries))
+        status_code = getattr(response, 'status_code', 200)
+        if not 200 <= status_code < 300:
+            errors += 1
+
+    return {
+        'name': name,
+        'iterations': iterations,
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'max_ms': round(max(latencies), 2),
+        'mean_ms': round(sum(latencies) / len(latencies), 2),
+        'queries_avg': round(sum(queries) / len(queries), 1),
+        'queries_max': max(queries),
+        'errors': errors,
+    }
+
+
+def get_client(user):
+    client = APIClient()
+    client.force_authenticate(user=user)
+    return client
+
+
+def build_scenarios(dataset):
+    """返回 {场景名: 无参函数}"""
+    agent = dataset.agents[0]
+    customer = next(customer for customer in dataset.customers if customer.parent_id == agent.id)
+    host = agent.domain
+
+    customer_client = get_client(customer)
+    agent_client = get_client(agent)
+    l1_client = get_client(dataset.agent_l1)
+
+    def balance_payment():
+        return customer_client.post('/api/balance-payment/', {
+            'region': '美国',
+            'nodeType': 'normal',
+            'protocol': 'vmess',
+            'period': 'monthly',
+            'quantity': 1,
+            'paymentMethod': 'balance',
+        }, format='json', HTTP_HOST=host, HTTP_IDEMPOTENCY_KEY=uuid.uuid4().hex)
+
+    def panel_poller():
+        for panel in dataset.panels:
+            update_single_panel(panel)
+
+    return {
+        'get_prices': lambda: customer_client.get('/api/prices/', HTTP_HOST=host),
+        'balance_payment': balance_payment,
+        'customer_nodes': lambda: customer_client.get('/api/customers/nodes/', {'page': 1, 'page_size': 20}, HTTP_HOST=host),
+        'agent_customer_nodes': lambda: agent_client.get('/api/customers/nodes/', {'page': 1, 'page_size': 20}, HTTP_HOST=host),
+        'payment_orders_list': lambda: l1_client.get('/api/payment-orders/', {'page': 50, 'page_size': 20}),
+        'payment_orders_list_cursor': lambda: l1_client.get('/api/payment-orders/', {'pagination': 'cursor', 'page_size': 20}),
+        'agent_chat_users': lambda: agent_client.get('/api/chat/sessions/agent_chat_users/'),
+        'panel_poller': panel_poller,
+        'panel_inventory_fleet': lambda: refresh_panel_inventory(dataset.panels),
+        # 新进程中 django.setup() 并导入 URL 配置的耗时，不经过测试数据库
+        'import_urls': lambda: measure_import_time(
+            'vpncms.urls', os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'vpncms.settings')
+        ),
+    }
+
+
+def run_benchmarks(dataset, iterations=20, only=None):
+    results = []
+    for name, func in build_scenarios(dataset).items():
+        if only and name not in only:
+            continue
+        results.append(measure(name, func, iterations=iterations))
+    return results
+
+
+def format_results(results):
+    if not results:
+        return '没有执行任何场景'
+    columns = ['name', 'iterations', 'p50_ms', 'p95_ms', 'max_ms', 'mean_ms', 'queries_avg', 'queries_max', 'errors']
+    widths = {column: max(len(column), *(len(str(row[column])) for row in results)) for column in columns}
+    lines = ['  '.join(column.ljust(widths[column]) for column in columns)]
+    for row in results:
+        lines.append('  '.join(str(row[column]).ljust(widths[column]) for column in columns))
+    return '\n'.join(lines)
+
+
+def write_json(results, path, meta=None):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'meta': meta or {}, 'results': results}, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,78 @@
+"""
+批量生成CDK优惠码并导出为CSV
+
+使用方法：
+    python manage.py generate_cdks --count 20000 --discount 90 --max-uses 1 --days 30 --creator admin
+    python manage.py generate_cdks --count 500 --discount 80 --max-uses 5 --creator agent1 --prefix VIP --output vip.csv
+"""
+import sys
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from cdk.serializers import CDKBulkGenerateSerializer
+from cdk.services import bulk_generate_cdks, iter_cdk_csv
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = '批量生成CDK优惠码并导出为CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, required=True, help='生成数量')
+        parser.add_argument('--discount', type=int, required=True, help='折扣百分比(1-100)')
+        parser.add_argument('--max-uses', type=int, default=1, help='每个优惠码的最大使用次数')
+        parser.add_argument('--creator', required=True, help='创建人用户名（决定优惠码适用的站点）')
+        parser.add_argument('--valid-from', help='生效时间，默认当前时间')
+        parser.add_argument('--valid-until', help='过期时间，与 --days 二选一')
+        parser.add_argument('--days', type=int, default=30, help='有效天数，未指定 --valid-until 时使用')
+        parser.add_argument('--length', type=int, default=12, help='优惠码长度')
+        parser.add_argument('--prefix', default='', help='优惠码前缀（大写字母和数字）')
+        parser.add_argument('--output', help='CSV输出文件，默认输出到标准输出')
+
+    def handle(self, *args, **options):
+        try:
+            creator = User.objects.get(username=options['creator'])
+        except User.DoesNotExist:
+            raise CommandError(f"用户 {options['creator']} 不存在")
+
+        valid_from = parse_datetime(options['valid_from']) if options['valid_from'] else timezone.now()
+        if options['valid_until']:
+            valid_until = parse_datetime(options['valid_until'])
+        else:
+            valid_until = valid_from + timedelta(days=options['days'])
+
+        serializer = CDKBulkGenerateSerializer(data={
+            'count': options['count'],
+            'length': options['length'],
+            'prefix': options['prefix'],
+            'discount': options['discount'],
+            'max_uses': options['max_uses'],
+            'valid_from': valid_from,
+            'valid_until': valid_until,
+        })
+        if not serializer.is_valid():
+            raise CommandError(f"参数错误: {serializer.errors}")
+        params = serializer.validated_data
+
+        # 先在一个事务中写入全部优惠码再导出，失败时整体回滚
+        try:
+            with transaction.atomic():
+                chunks = list(bulk_generate_cdks(created_by=creator, **params))
+        except IntegrityError:
+            raise CommandError("生成的优惠码多次与已有优惠码冲突，请重试")
+        output = open(options['output'], 'w', encoding='utf-8', newline='') if options['output'] else sys.stdout
+        try:
+            for line in iter_cdk_csv(chunks):
+                output.write(line)
+        finally:
+            if options['output']:
+                output.close()
+
+        if options['output']:
+            self.stdout.write(self.style.SUCCESS(f"已生成 {params['count']} 个优惠码，导出到 {options['output']}"))
@@ -21,4 +21,27 @@ class CDKSerializer(serializers.ModelSerializer):
     def validate(self, data):
         if data['valid_from'] >= data['valid_until']:
             raise serializers.ValidationError("生效时间必须早于过期时间")
-        return data 
\ No newline at end of file
+        return data
+
+
+class CDKBulkGenerateSerializer(serializers.Serializer):
+    """批量生成CDK参数"""
+    count = serializers.IntegerField(min_value=1, max_value=100000)
+    length = serializers.IntegerField(min_value=8, max_value=32, default=12)
+    prefix = serializers.RegexField(r'^[A-Z0-9]*$', max_length=8, required=False, allow_blank=True, default='')
+    discount = serializers.IntegerField()
+    max_uses = serializers.IntegerField(min_value=1)
+    valid_from = serializers.DateTimeField()
+    valid_until = serializers.DateTimeField()
+
+    def validate_discount(self, value):
+        if not 1 <= value <= 100:
+            raise serializers.ValidationError("折扣必须在1-100之间")
+        return value
+
+    def validate(self, data):
+        if data['valid_from'] >= data['valid_until']:
+            raise serializers.ValidationError("生效时间必须早于过期时间")
+        if len(data['prefix']) + 8 > data['length']:
+            raise serializers.ValidationError("前缀过长，随机部分至少需要8位")
+        return data
@@ -0,0 +1,181 @@
+"""
+CDK（优惠码）核销服务
+
+- redeem_coupon 使用一条带条件的 UPDATE 完成核销，根据受影响行数判断是否成功，
+  并发下单时不会超发，也不会整行回写覆盖其他字段
+- get_coupon_snapshot 为 validate_coupon 等只读校验提供短时缓存
+- bulk_generate_cdks 分批批量生成优惠码，唯一性由数据库唯一索引保证
+"""
+import csv
+import secrets
+import string
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import CDK
+
+# 优惠码快照缓存时间（秒），只用于展示校验，核销始终以数据库为准
+COUPON_CACHE_TTL = 30
+# 缓存中表示优惠码不存在的标记
+COUPON_NOT_FOUND = 'not_found'
+# 批量生成时每批插入的数量
+CDK_BULK_CHUNK_SIZE = 1000
+# 单批插入遇到唯一索引冲突时的最大重试次数
+CDK_BULK_MAX_RETRIES = 5
+CDK_CODE_ALPHABET = string.ascii_uppercase + string.digits
+CDK_EXPORT_FIELDS = ['code', 'discount', 'max_uses', 'used_count', 'valid_from', 'valid_until', 'is_active']
+
+
+def get_coupon_cache_key(code):
+    return f'cdk_coupon:{code}'
+
+
+def get_coupon_snapshot(code):
+    """
+    获取优惠码快照（带短时缓存）
+
+    返回:
+    - 包含优惠码及创建者信息的字典，优惠码不存在时返回None
+    """
+    cache_key = get_coupon_cache_key(code)
+    snapshot = cache.get(cache_key)
+    if snapshot is None:
+        coupon = CDK.objects.select_related('created_by').filter(code=code).first()
+        if coupon:
+            snapshot = {
+                'id': coupon.id,
+                'code': coupon.code,
+                'discount': coupon.discount,
+                'max_uses': coupon.max_uses,
+                'used_count': coupon.used_count,
+                'valid_from': coupon.valid_from,
+                'valid_until': coupon.valid_until,
+                'is_active': coupon.is_active,
+                'creator_type': coupon.created_by.user_type,
+                'creator_domain': coupon.created_by.domain,
+                'creator_username': coupon.created_by.username,
+            }
+        else:
+            snapshot = COUPON_NOT_FOUND
+        cache.set(cache_key, snapshot, COUPON_CACHE_TTL)
+    return None if snapshot == COUPON_NOT_FOUND else snapshot
+
+
+def invalidate_coupon_cache(code):
+    """优惠码变更后清除缓存"""
+    cache.delete(get_coupon_cache_key(code))
+
+
+def is_coupon_valid_for_domain(snapshot, source_domain):
+    """检查优惠码是否适用于当前站点：一级代理的优惠码全站有效，二级代理的只对自己的域名有效"""
+    if snapshot['creator_type'] == 'agent_l1':
+        return True
+    if snapshot['creator_type'] == 'agent_l2':
+        return bool(snapshot['creator_domain'] and source_domain and source_domain.endswith(snapshot['creator_domain']))
+    return False
+
+
+def redeem_coupon(code):
+    """
+    原子核销优惠码
+
+    返回:
+    - True 表示核销成功，False 表示优惠码不存在、已停用、不在有效期内或已达使用上限
+    """
+    now = timezone.now()
+    updated = CDK.objects.filter(
+        code=code,
+        is_active=True,
+        valid_from__lte=now,
+        valid_until__gte=now,
+        used_count__lt=F('max_uses'),
+    ).update(used_count=F('used_count') + 1, updated_at=now)
+    invalidate_coupon_cache(code)
+    return updated == 1
+
+
+def release_coupon(code):
+    """撤销一次核销（下单失败时归还使用次数）"""
+    CDK.objects.filter(code=code, used_count__gt=0).update(
+        used_count=F('used_count') - 1, updated_at=timezone.now()
+    )
+    invalidate_coupon_cache(code)
+
+
+def generate_codes(count, length=12, prefix=''):
+    """
+    生成一批互不重复的随机码
+
+    随机部分使用 secrets 生成，12位时共有 36^12 种组合，与已有优惠码冲突的概率极低，
+    少量冲突由数据库唯一索引在插入时发现后整批重新生成
+    """
+    codes = set()
+    random_length = length - len(prefix)
+    while len(codes) < count:
+        codes.add(prefix + ''.join(secrets.choice(CDK_CODE_ALPHABET) for _ in range(random_length)))
+    return list(codes)
+
+
+def bulk_generate_cdks(count, discount, max_uses, valid_from, valid_until, created_by,
+                       length=12, prefix='', chunk_size=CDK_BULK_CHUNK_SIZE):
+    """
+    批量生成优惠码并分批写入数据库
+
+    这是一个生成器，每插入一批就产出该批的 CDK 对象列表。每批在各自的事务（调用方已开启事务时为保存点）中写入，
+    需要整体成功或整体回滚时，调用方应在事务中消费完生成器
+
+    异常:
+    - IntegrityError: 某一批连续多次与已有优惠码冲突
+    """
+    remaining = count
+    while remaining > 0:
+        size = min(chunk_size, remaining)
+        for attempt in range(CDK_BULK_MAX_RETRIES):
+            chunk = [
+                CDK(
+                    code=code,
+                    discount=discount,
+                    max_uses=max_uses,
+                    valid_from=valid_from,
+                    valid_until=valid_until,
+                    created_by=created_by,
+                )
+                for code in generate_codes(size, length, prefix)
+            ]
+            try:
+                with transaction.atomic():
+                    CDK.objects.bulk_create(chunk)
+                break
+            except IntegrityError:
+                # 与已有优惠码冲突，整批重新生成
+                if attempt == CDK_BULK_MAX_RETRIES - 1:
+                    raise
+        remaining -= size
+        yield chunk
+
+
+class Echo:
+    """只实现 write 的伪文件对象，供 csv.writer 逐行产出内容"""
+
+    def write(self, value):
+        return value
+
+
+def iter_cdk_csv(cdk_chunks):
+    """将 CDK 对象分批转换为 CSV 行，用于 StreamingHttpResponse"""
+    writer = csv.writer(Echo())
+    yield writer.writerow(CDK_EXPORT_FIELDS)
+    for chunk in cdk_chunks:
+        for cdk in chunk:
+            yield writer.writerow([
+                cdk.code,
+                cdk.discount,
+                cdk.max_uses,
+                cdk.used_count,
+                cdk.valid_from.isoformat(),
+                cdk.valid_until.isoformat(),
+                cdk.is_active,
+            ])
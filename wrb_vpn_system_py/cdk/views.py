@@ -3,10 +3,14 @@ from rest_framework import viewsets, status
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import action
+from django.db import IntegrityError, transaction
 from django.utils import timezone
 from .models import CDK
-from .serializers import CDKSerializer
+from django.http import StreamingHttpResponse
+from .serializers import CDKSerializer, CDKBulkGenerateSerializer
 from .utils import api_response
+from .services import invalidate_coupon_cache, bulk_generate_cdks, iter_cdk_csv
+from users.pagination import KeysetPagination, use_keyset_pagination
 import random
 import string
 
@@ -33,6 +37,15 @@ class CDKViewSet(viewsets.ModelViewSet):
 
     def list(self, request, *args, **kwargs):
         queryset = self.get_queryset()
+        if use_keyset_pagination(request):
+            paginator = KeysetPagination(ordering=('-created_at', '-id'))
+            page = paginator.paginate_queryset(queryset, request, self)
+            serializer = self.get_serializer(page, many=True)
+            return api_response(
+                code=200,
+                message="获取CDK列表成功",
+                data=paginator.get_paginated_response(serializer.data).data
+            )
         page = self.paginate_queryset(queryset)
         if page is not None:
             serializer = self.get_serializer(page, many=True)
@@ -78,10 +91,13 @@ class CDKViewSet(viewsets.ModelViewSet):
     def update(self, request, *args, **kwargs):
         partial = kwargs.pop('partial', False)
         instance = self.get_object()
+        old_code = instance.code
         serializer = self.get_serializer(instance, data=request.data, partial=partial)
         try:
             serializer.is_valid(raise_exception=True)
             self.perform_update(serializer)
+            invalidate_coupon_cache(old_code)
+            invalidate_coupon_cache(instance.code)
             return api_response(
                 code=200,
                 message="更新CDK成功",
@@ -103,6 +119,7 @@ class CDKViewSet(viewsets.ModelViewSet):
                 data={}
             )
         self.perform_destroy(instance)
+        invalidate_coupon_cache(instance.code)
         return api_response(
             code=200,
             message="删除CDK成功",
@@ -128,12 +145,75 @@ class CDKViewSet(viewsets.ModelViewSet):
                     data={"code": code}
                 )
 
+    @action(detail=False, methods=['post'])
+    def bulk_generate(self, request):
+        """批量生成CDK，全部写入成功后以CSV流式返回生成的优惠码"""
+        if request.user.user_type not in ['admin', 'agent_l1', 'agent_l2']:
+            return api_response(
+                code=403,
+                message="没有权限生成CDK",
+                data={}
+            )
+        data = request.data.get('data', request.data)
+        serializer = CDKBulkGenerateSerializer(data=data)
+        if not serializer.is_valid():
+            return api_response(
+                code=400,
+                message="参数错误",
+                data=serializer.errors
+            )
+        params = serializer.validated_data
+        # 在响应开始前写入全部优惠码，任一批失败时整体回滚，不会留下没有导出的优惠码
+        try:
+            with transaction.atomic():
+                chunks = list(bulk_generate_cdks(
+                    count=params['count'],
+                    discount=params['discount'],
+                    max_uses=params['max_uses'],
+                    valid_from=params['valid_from'],
+                    valid_until=params['valid_until'],
+                    created_by=request.user,
+                    length=params['length'],
+                    prefix=params['prefix'],
+                ))
+        except IntegrityError:
+            return api_response(
+                code=500,
+                message="生成的优惠码多次与已有优惠码冲突，请重试",
+                data={}
+            )
+        filename = f"cdk_{timezone.now().strftime('%Y%m%d%H%M%S')}.csv"
+        response = StreamingHttpResponse(iter_cdk_csv(chunks), content_type='text/csv; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """按当前筛选条件以CSV流式导出CDK，代理只能导出自己创建的CDK"""
+        if request.user.user_type not in ['admin', 'agent_l1', 'agent_l2']:
+            return api_response(
+                code=403,
+                message="没有权限导出CDK",
+                data={}
+            )
+        queryset = self.get_queryset().order_by('id')
+        if request.user.user_type != 'admin':
+            queryset = queryset.filter(created_by=request.user)
+        filename = f"cdk_export_{timezone.now().strftime('%Y%m%d%H%M%S')}.csv"
+        response = StreamingHttpResponse(
+            iter_cdk_csv([queryset.iterator(chunk_size=2000)]),
+            content_type='text/csv; charset=utf-8'
+        )
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
     @action(detail=True, methods=['post'])
     def toggle_status(self, request, pk=None):
         """切换CDK的启用/停用状态"""
         instance = self.get_object()
         instance.is_active = not instance.is_active
-        instance.save()
+        instance.save(update_fields=['is_active', 'updated_at'])
+        invalidate_coupon_cache(instance.code)
         serializer = self.get_serializer(instance)
         status_text = "启用" if instance.is_active else "停用"
         return api_response(
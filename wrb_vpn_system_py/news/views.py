@@ -7,6 +7,7 @@ from .models import News
 from .serializers import NewsSerializer, NewsListSerializer
 from django.core.paginator import Paginator
 from rest_framework.decorators import action
+from users.pagination import KeysetPagination, use_keyset_pagination
 
 class NewsViewSet(viewsets.ModelViewSet):
     queryset = News.objects.all()
@@ -39,6 +40,26 @@ class NewsViewSet(viewsets.ModelViewSet):
 
     def list(self, request, *args, **kwargs):
         queryset = self.get_queryset()
+
+        # 游标分页，按当前排序字段加id作为游标键
+        if use_keyset_pagination(request):
+            ordering = self.request.query_params.get('ordering', '-created_at')
+            if ordering not in ['-created_at', 'created_at', '-updated_at', 'updated_at']:
+                ordering = '-created_at'
+            paginator = KeysetPagination(ordering=(ordering, '-id' if ordering.startswith('-') else 'id'))
+            paginator.page_size_query_param = 'pageSize'
+            news_page = paginator.paginate_queryset(queryset, request, self)
+            serializer = self.get_serializer(news_page, many=True, context={'request': request})
+            return Response({
+                'code': 200,
+                'message': '获取新闻列表成功',
+                'data': {
+                    'list': serializer.data,
+                    'total': paginator.count,
+                    'pageSize': paginator.get_page_size(request),
+                    'next_cursor': paginator.next_cursor
+                }
+            })
         
         # 分页
         page = request.query_params.get('page', 1)
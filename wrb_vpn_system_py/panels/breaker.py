@@ -0,0 +1,253 @@
+"""
+面板熔断器
+
+每个面板一个熔断器，状态保存在缓存中，多个进程通过共享缓存（settings.CACHES，Redis 或数据库缓存表）共用：
+- closed: 正常请求，记录连续失败次数和响应耗时的指数滑动平均（EWMA）；
+  EWMA 在进程内累积，每个面板最多每 PANEL_BREAKER_EWMA_SAVE_INTERVAL 秒写回一次缓存，
+  状态没有变化的成功请求不写缓存（数据库缓存时不会给每次面板请求增加一次写入）
+- open: 连续失败达到 PANEL_BREAKER_FAILURE_THRESHOLD 次后打开，面板标记为离线，
+  请求直接抛出 PanelUnavailable，不再等待超时
+- half_open: 到达重试时间后只放行一个探测（后台线程登录面板，或者一个正常请求），
+  成功则关闭熔断器并把面板重新标记为在线，失败则重新打开，重试间隔按指数退避增长；
+  探测进程异常退出时探测锁过期，后台线程会重新探测
+
+请求面板接口的 make_request_with_cookie 通过 with_circuit_breaker 接入熔断器。
+面板的 is_online 由熔断器维护：打开时标记离线，请求成功时恢复在线，单次请求失败不改变在线状态。
+缓存中的读改写不是原子操作，并发失败时计数可能略有偏差，只影响打开的时机。
+"""
+import logging
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+
+from .models import AgentPanel
+
+logger = logging.getLogger(__name__)
+
+PANEL_BREAKER_FAILURE_THRESHOLD = getattr(settings, 'PANEL_BREAKER_FAILURE_THRESHOLD', 3)
+# 第一次打开后的重试间隔（秒），每次探测失败翻倍，最长 PANEL_BREAKER_MAX_BACKOFF
+PANEL_BREAKER_BASE_BACKOFF = getattr(settings, 'PANEL_BREAKER_BASE_BACKOFF', 15)
+PANEL_BREAKER_MAX_BACKOFF = getattr(settings, 'PANEL_BREAKER_MAX_BACKOFF', 600)
+PANEL_BREAKER_EWMA_ALPHA = getattr(settings, 'PANEL_BREAKER_EWMA_ALPHA', 0.3)
+# 半开状态探测锁的有效期（秒），探测进程异常退出时锁会自动过期
+PANEL_BREAKER_PROBE_TTL = getattr(settings, 'PANEL_BREAKER_PROBE_TTL', 30)
+# 响应耗时 EWMA 写回缓存的最短间隔（秒）
+PANEL_BREAKER_EWMA_SAVE_INTERVAL = getattr(settings, 'PANEL_BREAKER_EWMA_SAVE_INTERVAL', 60)
+PANEL_BREAKER_STATE_TTL = 24 * 3600
+PANEL_BREAKER_KEY = 'panel_breaker:{panel_id}'
+PANEL_BREAKER_PROBE_KEY = 'panel_breaker_probe:{panel_id}'
+
+# 进程内累积的响应耗时 EWMA，{panel_id: 毫秒}
+local_ewma = {}
+
+
+class PanelUnavailable(Exception):
+    """面板熔断器处于打开状态"""
+
+    def __init__(self, panel, retry_at):
+        self.panel_id = panel.id
+        self.retry_at = retry_at
+        super().__init__(f"面板 {panel.id} 离线（熔断中，{max(0, retry_at - time.time()):.0f} 秒后重试）")
+
+
+def get_breaker_state(panel_id):
+    return cache.get(PANEL_BREAKER_KEY.format(panel_id=panel_id)) or {
+        'state': 'closed',
+        'failures': 0,
+        'ewma_ms': None,
+        'ewma_saved_at': None,
+        'backoff': 0,
+        'opened_at': None,
+        'retry_at': None,
+    }
+
+
+def save_breaker_state(panel_id, state):
+    cache.set(PANEL_BREAKER_KEY.format(panel_id=panel_id), state, PANEL_BREAKER_STATE_TTL)
+
+
+def get_breaker_states(panel_ids):
+    """批量读取熔断器状态，返回 {panel_id: state}"""
+    keys = {PANEL_BREAKER_KEY.format(panel_id=panel_id): panel_id for panel_id in panel_ids}
+    found = cache.get_many(list(keys))
+    return {panel_id: found.get(key) or get_breaker_state(panel_id) for key, panel_id in keys.items()}
+
+
+def set_panel_online(panel, is_online):
+    if panel.is_online != is_online:
+        panel.is_online = is_online
+        AgentPanel.objects.filter(id=panel.id).update(is_online=is_online)
+
+
+def allow_request(panel):
+    """熔断器关闭，或到达重试时间且抢到探测锁时返回True"""
+    state = get_breaker_state(panel.id)
+    if state['state'] == 'closed':
+        return True
+    if time.time() < state['retry_at']:
+        return False
+    if not cache.add(PANEL_BREAKER_PROBE_KEY.format(panel_id=panel.id), 1, PANEL_BREAKER_PROBE_TTL):
+        return False
+    state['state'] = 'half_open'
+    save_breaker_state(panel.id, state)
+    return True
+
+
+def check_panel_available(panel):
+    """熔断器打开时直接抛出 PanelUnavailable"""
+    if not allow_request(panel):
+        raise PanelUnavailable(panel, get_breaker_state(panel.id)['retry_at'] or time.time())
+
+
+def record_success(panel, elapsed_ms=None):
+    state = get_breaker_state(panel.id)
+    recovered = state['state'] != 'closed'
+    changed = recovered or state['failures'] > 0
+    if elapsed_ms is not None:
+        previous = local_ewma.get(panel.id, state['ewma_ms'])
+        ewma = elapsed_ms if previous is None else \
+            PANEL_BREAKER_EWMA_ALPHA * elapsed_ms + (1 - PANEL_BREAKER_EWMA_ALPHA) * previous
+        local_ewma[panel.id] = ewma
+        now = time.time()
+        if changed or now - (state.get('ewma_saved_at') or 0) >= PANEL_BREAKER_EWMA_SAVE_INTERVAL:
+            state['ewma_ms'] = ewma
+            state['ewma_saved_at'] = now
+            changed = True
+    if changed:
+        state.update({'state': 'closed', 'failures': 0, 'backoff': 0, 'opened_at': None, 'retry_at': None})
+        save_breaker_state(panel.id, state)
+    if recovered:
+        cache.delete(PANEL_BREAKER_PROBE_KEY.format(panel_id=panel.id))
+        logger.info(f"面板 {panel.id} 恢复，熔断器关闭")
+    # 熔断器关闭时面板也可能被其他代码标记为离线，请求成功即恢复在线（已在线时不写数据库）
+    set_panel_online(panel, True)
+
+
+def record_failure(panel, error=''):
+    now = time.time()
+    state = get_breaker_state(panel.id)
+    state['failures'] += 1
+    if state['state'] == 'half_open':
+        # 探测失败，重新打开并加倍重试间隔
+        state['backoff'] = min(PANEL_BREAKER_MAX_BACKOFF, max(PANEL_BREAKER_BASE_BACKOFF, state['backoff'] * 2))
+        state['state'] = 'open'
+        state['retry_at'] = now + state['backoff']
+        cache.delete(PANEL_BREAKER_PROBE_KEY.format(panel_id=panel.id))
+        logger.warning(f"面板 {panel.id} 探测失败，{state['backoff']} 秒后重试: {error}")
+    elif state['state'] == 'closed' and state['failures'] >= PANEL_BREAKER_FAILURE_THRESHOLD:
+        state['backoff'] = PANEL_BREAKER_BASE_BACKOFF
+        state['state'] = 'open'
+        state['opened_at'] = now
+        state['retry_at'] = now + state['backoff']
+        logger.warning(f"面板 {panel.id} 连续失败 {state['failures']} 次，熔断器打开: {error}")
+    save_breaker_state(panel.id, state)
+    if state['state'] == 'open':
+        set_panel_online(panel, False)
+        panel_prober.watch(panel.id)
+
+
+def with_circuit_breaker(panel_arg=0):
+    """
+    请求面板的函数接入熔断器
+
+    参数:
+    - panel_arg: 面板对象在位置参数中的下标（实例方法为1）
+
+    熔断器打开时直接抛出 PanelUnavailable；函数抛出异常或返回5xx响应计为失败，否则计为成功并记录耗时
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            panel = args[panel_arg]
+            check_panel_available(panel)
+            started_at = time.monotonic()
+            try:
+                response = func(*args, **kwargs)
+            except Exception as e:
+                record_failure(panel, str(e))
+                raise
+            if response is not None and response.status_code >= 500:
+                record_failure(panel, f'HTTP {response.status_code}')
+            else:
+                record_success(panel, (time.monotonic() - started_at) * 1000)
+            return response
+        return wrapper
+    return decorator
+
+
+class PanelProber:
+    """后台线程按退避时间探测熔断中的面板，探测成功后面板立即恢复在线，不必等下一次轮询"""
+
+    def __init__(self, interval=1):
+        self.interval = interval
+        self.watching = set()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def watch(self, panel_id):
+        with self.lock:
+            self.watching.add(panel_id)
+            if self.thread and self.thread.is_alive():
+                return
+            self.thread = threading.Thread(target=self.run, name='panel-prober')
+            self.thread.daemon = True
+            self.thread.start()
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            with self.lock:
+                panel_ids = list(self.watching)
+            if not panel_ids:
+                continue
+            try:
+                close_old_connections()
+                self.probe_due(panel_ids)
+            except Exception as e:
+                logger.error(f"探测熔断面板失败: {str(e)}")
+            finally:
+                close_old_connections()
+
+    def probe_due(self, panel_ids):
+        now = time.time()
+        for panel_id, state in get_breaker_states(panel_ids).items():
+            if state['state'] == 'closed':
+                # 已被其他进程或正常请求恢复
+                with self.lock:
+                    self.watching.discard(panel_id)
+                continue
+            if state['state'] == 'half_open':
+                # 探测锁还在说明探测正在进行；锁已过期（探测进程异常退出）时重新探测
+                if cache.get(PANEL_BREAKER_PROBE_KEY.format(panel_id=panel_id)):
+                    continue
+            elif now < state['retry_at']:
+                continue
+            panel = AgentPanel.objects.filter(id=panel_id, is_active=True).first()
+            if panel is None:
+                with self.lock:
+                    self.watching.discard(panel_id)
+                continue
+            if allow_request(panel):
+                self.probe(panel)
+
+    def probe(self, panel):
+        from users.panel_session import get_login_cookie
+
+        panel_info = {
+            'ip': panel.ip_address,
+            'username': panel.username,
+            'password': panel.password,
+            'panel_type': panel.panel_type
+        }
+        started_at = time.monotonic()
+        if get_login_cookie(panel, panel_info):
+            record_success(panel, (time.monotonic() - started_at) * 1000)
+        else:
+            record_failure(panel, '登录失败')
+
+
+panel_prober = PanelProber()
@@ -0,0 +1,436 @@
+"""
+面板驱动
+
+把 x-ui 和 3x-ui 的接口差异（入站接口路径、请求头、新建入站ID的获取方式、xray 配置和重启接口）
+收拢到各自的驱动类中，驱动基于 httpx.AsyncClient 实现：
+- PanelDriver.list_inbounds / add_inbound / update_inbound / delete_inbound
+- get_xray_config / update_xray_config / status / restart_xray（x-ui 不支持 xray 配置和重启）
+- set_inbounds_enabled / delete_inbounds 在同一个登录会话中批量启停、删除入站
+- cookie 失效时自动重新登录并重试一次
+
+所有请求在同一个后台事件循环上执行，共享一个连接池：
+- PanelClient 是同步封装，供现有视图和后台线程调用，接入面板熔断器，登录后的 cookie 写回数据库
+- run_fleet 对一批面板并发执行同一操作，上千个面板只占用一个线程
+
+注意不能在驱动事件循环所在的线程里调用 PanelClient 或 run_fleet。
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+
+import httpx
+from django.conf import settings
+
+from vpncms.instrumentation import instrument_async_transport
+from .breaker import PanelUnavailable, allow_request, check_panel_available, record_failure, record_success
+from .models import AgentPanel
+
+logger = logging.getLogger(__name__)
+
+PANEL_DRIVER_TIMEOUT = getattr(settings, 'PANEL_DRIVER_TIMEOUT', 10)
+PANEL_DRIVER_MAX_CONNECTIONS = getattr(settings, 'PANEL_DRIVER_MAX_CONNECTIONS', 1000)
+# run_fleet 同时进行的面板操作数
+PANEL_FLEET_CONCURRENCY = getattr(settings, 'PANEL_FLEET_CONCURRENCY', 500)
+# 同一面板同时进行的请求数（批量启停、删除入站时）
+PANEL_SESSION_CONCURRENCY = getattr(settings, 'PANEL_SESSION_CONCURRENCY', 8)
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/134.0.0.0 Safari/537.36'
+INBOUND_FORM_FIELDS = [
+    'up', 'down', 'total', 'remark', 'enable', 'expiryTime', 'listen', 'port',
+    'protocol', 'settings', 'streamSettings', 'sniffing',
+]
+
+
+class PanelError(Exception):
+    """面板接口返回失败（如端口已被占用），面板本身可以访问"""
+
+
+class PanelUnreachable(PanelError):
+    """登录失败、服务端错误或响应无法解析，计入熔断器失败次数"""
+
+
+class PanelDriver:
+    panel_type = None
+    inbound_list_path = None
+    inbound_add_path = None
+    inbound_update_path = None
+    inbound_delete_path = None
+    # 入站列表页面，作为入站接口的 Referer
+    inbounds_page = None
+
+    def __init__(self, panel, client):
+        self.panel = panel
+        self.client = client
+        self.base_url = f'http://{panel.ip_address}'
+        self.cookie = panel.cookie
+        self.cookie_changed = False
+
+    @property
+    def host(self):
+        return self.panel.ip_address
+
+    def headers(self, referer_path='/'):
+        return {
+            'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
+            'host': self.host,
+            'Accept': 'application/json, text/plain, */*',
+            'User-Agent': USER_AGENT,
+            'Origin': f'http://{self.host}',
+            'Referer': f'{self.base_url}{referer_path}',
+        }
+
+    async def login(self):
+        response = await self.client.post(
+            f'{self.base_url}/login',
+            data={'username': self.panel.username, 'password': self.panel.password},
+            headers=self.headers(),
+        )
+        cookie = response.headers.get('set-cookie')
+        if not cookie:
+            raise PanelUnreachable(f'面板 {self.panel.id} 登录失败: HTTP {response.status_code}')
+        self.cookie = cookie
+        self.cookie_changed = True
+        return cookie
+
+    @staticmethod
+    def needs_login(response, result):
+        if response.status_code in (401, 404):
+            return True
+        msg = (result or {}).get('msg') or ''
+        return result is not None and not result.get('success') and ('请重新登录' in msg or '登录已过期' in msg)
+
+    async def request(self, path, data=None, referer_path='/'):
+        """POST 面板接口并返回解析后的JSON，cookie 失效时重新登录后重试一次"""
+        if not self.cookie:
+            await self.login()
+        for attempt in range(2):
+            headers = self.headers(referer_path)
+            headers['cookie'] = self.cookie
+            response = await self.client.post(f'{self.base_url}{path}', headers=headers, data=data)
+            try:
+                result = response.json()
+            except ValueError:
+                result = None
+            if attempt == 0 and self.needs_login(response, result):
+                await self.login()
+                continue
+            break
+        if response.status_code >= 500 or not isinstance(result, dict):
+            raise PanelUnreachable(f'面板 {self.panel.id} 请求 {path} 失败: HTTP {response.status_code}')
+        return result
+
+    async def call(self, path, data=None, referer_path='/'):
+        """请求面板接口，success 为 false 时抛出 PanelError，否则返回 obj"""
+        result = await self.request(path, data, referer_path)
+        if not result.get('success'):
+            raise PanelError(result.get('msg') or '未知错误')
+        return result.get('obj')
+
+    async def list_inbounds(self):
+        return await self.call(self.inbound_list_path, referer_path=self.inbounds_page) or []
+
+    async def add_inbound(self, form):
+        """添加入站，返回包含 id 的入站数据"""
+        obj = await self.call(self.inbound_add_path, form, self.inbounds_page)
+        return await self.resolve_added_inbound(form, obj)
+
+    async def resolve_added_inbound(self, form, obj):
+        return obj
+
+    async def update_inbound(self, inbound_id, form):
+        return await self.call(self.inbound_update_path.format(id=inbound_id), form, self.inbounds_page)
+
+    async def delete_inbound(self, inbound_id):
+        return await self.call(self.inbound_delete_path.format(id=inbound_id), referer_path=self.inbounds_page)
+
+    async def status(self):
+        return await self.call('/server/status')
+
+    async def get_xray_config(self):
+        raise PanelError(f'{self.panel_type} 面板不支持修改xray配置')
+
+    async def update_xray_config(self, xray_setting):
+        raise PanelError(f'{self.panel_type} 面板不支持修改xray配置')
+
+    async def restart_xray(self):
+        raise PanelError(f'{self.panel_type} 面板不支持重启Xray服务')
+
+    @staticmethod
+    def inbound_form(inbound):
+        """把入站列表中的入站转换为更新接口需要的表单"""
+        form = {field: inbound.get(field) for field in INBOUND_FORM_FIELDS if inbound.get(field) is not None}
+        form['enable'] = 'true' if inbound.get('enable') else 'false'
+        return form
+
+    async def set_inbounds_enabled(self, inbound_ids, enable, concurrency=None):
+        """
+        批量启用或停用入站，先拉取一次入站列表，只更新状态需要改变的入站
+
+        返回:
+        - {'done': [已处于目标状态的入站ID], 'missing': [面板上不存在的入站ID], 'failed': {入站ID: 错误}}
+        """
+        wanted = {int(inbound_id) for inbound_id in inbound_ids}
+        inbounds = {inbound['id']: inbound for inbound in await self.list_inbounds() if inbound.get('id') in wanted}
+        semaphore = asyncio.Semaphore(concurrency or PANEL_SESSION_CONCURRENCY)
+
+        async def update(inbound):
+            async with semaphore:
+                form = self.inbound_form(inbound)
+                form['enable'] = 'true' if enable else 'false'
+                await self.update_inbound(inbound['id'], form)
+
+        pending = [inbound for inbound in inbounds.values() if bool(inbound.get('enable')) != enable]
+        errors = await asyncio.gather(*(update(inbound) for inbound in pending), return_exceptions=True)
+        failed = {inbound['id']: str(error) for inbound, error in zip(pending, errors) if isinstance(error, Exception)}
+        return {
+            'done': [inbound_id for inbound_id in inbounds if inbound_id not in failed],
+            'missing': sorted(wanted - set(inbounds)),
+            'failed': failed,
+        }
+
+    async def delete_inbounds(self, inbound_ids, concurrency=None):
+        """
+        批量删除入站，面板上已经不存在的入站视为已删除
+
+        返回:
+        - {'done': [已删除的入站ID], 'missing': [面板上不存在的入站ID], 'failed': {入站ID: 错误}}
+        """
+        wanted = {int(inbound_id) for inbound_id in inbound_ids}
+        existing = [inbound['id'] for inbound in await self.list_inbounds() if inbound.get('id') in wanted]
+        semaphore = asyncio.Semaphore(concurrency or PANEL_SESSION_CONCURRENCY)
+
+        async def delete(inbound_id):
+            async with semaphore:
+                await self.delete_inbound(inbound_id)
+
+        errors = await asyncio.gather(*(delete(inbound_id) for inbound_id in existing), return_exceptions=True)
+        failed = {inbound_id: str(error) for inbound_id, error in zip(existing, errors) if isinstance(error, Exception)}
+        return {
+            'done': [inbound_id for inbound_id in existing if inbound_id not in failed],
+            'missing': sorted(wanted - set(existing)),
+            'failed': failed,
+        }
+
+
+class XUIDriver(PanelDriver):
+    panel_type = 'x-ui'
+    inbound_list_path = '/xui/inbound/list'
+    inbound_add_path = '/xui/inbound/add'
+    inbound_update_path = '/xui/inbound/update/{id}'
+    inbound_delete_path = '/xui/inbound/del/{id}'
+    inbounds_page = '/xui/inbounds'
+
+    def headers(self, referer_path='/'):
+        headers = super().headers(referer_path)
+        headers['x-requested-with'] = 'XMLHttpRequest'
+        return headers
+
+    async def resolve_added_inbound(self, form, obj):
+        """x-ui 的添加接口不返回新入站，按端口在入站列表中查找"""
+        if isinstance(obj, dict) and obj.get('id'):
+            return obj
+        port = str(form.get('port'))
+        for inbound in await self.list_inbounds():
+            if str(inbound.get('port')) == port:
+                return inbound
+        raise PanelError(f'面板 {self.panel.id} 添加入站成功，但未找到端口 {port} 对应的入站')
+
+
+class ThreeXUIDriver(PanelDriver):
+    panel_type = '3x-ui'
+    inbound_list_path = '/panel/inbound/list'
+    inbound_add_path = '/panel/api/inbounds/add'
+    inbound_update_path = '/panel/inbound/update/{id}'
+    inbound_delete_path = '/panel/inbound/del/{id}'
+    inbounds_page = '/panel/inbounds'
+
+    @property
+    def host(self):
+        # 3x-ui 的地址可能带有路径前缀
+        return self.panel.ip_address.split('/')[0]
+
+    async def get_xray_config(self):
+        """返回 {'xraySetting': ..., 'inboundTags': ...}"""
+        obj = await self.call('/panel/xray/', referer_path='/panel/')
+        return json.loads(obj) if isinstance(obj, str) else obj
+
+    async def update_xray_config(self, xray_setting):
+        return await self.call('/panel/xray/update', {'xraySetting': json.dumps(xray_setting)}, '/panel/')
+
+    async def restart_xray(self):
+        return await self.call('/server/restartXrayService', referer_path='/panel')
+
+
+PANEL_DRIVERS = {
+    'x-ui': XUIDriver,
+    '3x-ui': ThreeXUIDriver,
+}
+
+
+def get_driver(panel, client):
+    try:
+        return PANEL_DRIVERS[panel.panel_type](panel, client)
+    except KeyError:
+        raise PanelError(f'不支持的面板类型: {panel.panel_type}')
+
+
+class DriverLoop:
+    """在后台线程中运行的事件循环，所有面板请求共享一个 httpx.AsyncClient 连接池"""
+
+    def __init__(self):
+        self.loop = None
+        self.client = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        with self.lock:
+            if self.loop is None:
+                loop = asyncio.new_event_loop()
+                # 启用请求统计时包装连接池，面板请求的次数和耗时计入 /metrics 和 Server-Timing
+                transport = instrument_async_transport(httpx.AsyncHTTPTransport(
+                    verify=False,
+                    limits=httpx.Limits(max_connections=PANEL_DRIVER_MAX_CONNECTIONS),
+                ))
+                self.client = httpx.AsyncClient(timeout=PANEL_DRIVER_TIMEOUT, transport=transport)
+                thread = threading.Thread(target=loop.run_forever, name='panel-driver-loop')
+                thread.daemon = True
+                thread.start()
+                self.loop = loop
+        return self.loop
+
+    def run(self, coroutine_factory):
+        """在事件循环上执行 coroutine_factory(client) 并等待结果"""
+        loop = self.start()
+        return asyncio.run_coroutine_threadsafe(coroutine_factory(self.client), loop).result()
+
+
+driver_loop = DriverLoop()
+
+
+def is_unreachable(error):
+    return isinstance(error, (PanelUnreachable, httpx.TransportError))
+
+
+def save_cookies(drivers):
+    """把重新登录得到的 cookie 写回数据库"""
+    panels = []
+    for driver in drivers:
+        if driver is not None and driver.cookie_changed:
+            driver.panel.cookie = driver.cookie
+            panels.append(driver.panel)
+    if panels:
+        AgentPanel.objects.bulk_update(panels, ['cookie'])
+
+
+class PanelClient:
+    """
+    面板驱动的同步封装
+
+    用法:
+        client = PanelClient(panel)
+        inbounds = client.list_inbounds()
+        inbound = client.add_inbound(form_data)
+    """
+
+    def __init__(self, panel):
+        self.panel = panel
+
+    def list_inbounds(self):
+        return self.call('list_inbounds')
+
+    def add_inbound(self, form):
+        return self.call('add_inbound', form)
+
+    def update_inbound(self, inbound_id, form):
+        return self.call('update_inbound', inbound_id, form)
+
+    def delete_inbound(self, inbound_id):
+        return self.call('delete_inbound', inbound_id)
+
+    def status(self):
+        return self.call('status')
+
+    def get_xray_config(self):
+        return self.call('get_xray_config')
+
+    def update_xray_config(self, xray_setting):
+        return self.call('update_xray_config', xray_setting)
+
+    def restart_xray(self):
+        return self.call('restart_xray')
+
+    def set_inbounds_enabled(self, inbound_ids, enable):
+        return self.call('set_inbounds_enabled', inbound_ids, enable)
+
+    def delete_inbounds(self, inbound_ids):
+        return self.call('delete_inbounds', inbound_ids)
+
+    def call(self, operation, *args):
+        check_panel_available(self.panel)
+        panel = self.panel
+
+        async def run(client):
+            driver = None
+            try:
+                driver = get_driver(panel, client)
+                return driver, await getattr(driver, operation)(*args), None
+            except Exception as e:
+                return driver, None, e
+
+        started_at = time.monotonic()
+        driver, result, error = driver_loop.run(run)
+        save_cookies([driver])
+        if error is None or not is_unreachable(error):
+            record_success(self.panel, (time.monotonic() - started_at) * 1000)
+        else:
+            record_failure(self.panel, str(error))
+        if error is not None:
+            raise error
+        return result
+
+
+def run_fleet(panels, operation, *args, concurrency=PANEL_FLEET_CONCURRENCY, panel_args=None):
+    """
+    在驱动事件循环上对一批面板并发执行同一操作
+
+    熔断中的面板直接跳过，结果中的异常为 PanelUnavailable。
+    panel_args 为 {panel_id: 参数元组} 时，各面板使用自己的参数，否则都使用 args。
+
+    返回:
+    - {panel_id: (结果, 异常)}
+    """
+    outcomes = {}
+    allowed = []
+    for panel in panels:
+        if allow_request(panel):
+            allowed.append(panel)
+        else:
+            outcomes[panel.id] = (None, PanelUnavailable(panel, time.time()))
+
+    async def run_all(client):
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run_one(panel):
+            async with semaphore:
+                driver = None
+                started_at = time.monotonic()
+                try:
+                    driver = get_driver(panel, client)
+                    call_args = panel_args[panel.id] if panel_args else args
+                    result, error = await getattr(driver, operation)(*call_args), None
+                except Exception as e:
+                    result, error = None, e
+                return panel, driver, result, error, (time.monotonic() - started_at) * 1000
+
+        return await asyncio.gather(*(run_one(panel) for panel in allowed))
+
+    results = driver_loop.run(run_all) if allowed else []
+    save_cookies([driver for _, driver, _, _, _ in results])
+    for panel, driver, result, error, elapsed_ms in results:
+        if error is None or not is_unreachable(error):
+            record_success(panel, elapsed_ms)
+        else:
+            record_failure(panel, str(error))
+        outcomes[panel.id] = (result, error)
+    return outcomes
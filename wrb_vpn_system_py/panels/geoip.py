@@ -0,0 +1,196 @@
+"""
+离线IP归属地查询
+
+数据文件由 build_geoip 命令从 IP段CSV（起始IP,结束IP,国家）生成，格式为：
+- 文件头: 8字节标识 WRBGEO01，4字节国家数量，4字节IP段数量
+- 国家表: 每项为2字节长度 + UTF-8名称
+- IP段表: 按起始IP排序，每项为16字节起始IP、16字节结束IP、2字节国家序号
+  IPv4 地址按 IPv4-mapped IPv6（::ffff:a.b.c.d）存储，与 IPv6 统一比较
+
+查询时用 mmap 映射文件，对IP段表二分查找，不需要把整个文件读入内存；
+查询结果通过 LRU 缓存，同一个IP重复查询不再访问文件。
+get_ip_country 在本地查不到时，按 GEOIP_HTTP_FALLBACK 配置决定是否使用 ip-api.com 在线查询。
+"""
+import ipaddress
+import logging
+import mmap
+import os
+import struct
+import threading
+from bisect import bisect_right
+from functools import lru_cache
+
+import requests
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+GEOIP_MAGIC = b'WRBGEO01'
+GEOIP_HEADER = struct.Struct('>8sII')
+GEOIP_RECORD = struct.Struct('>16s16sH')
+GEOIP_DATABASE_PATH = getattr(settings, 'GEOIP_DATABASE_PATH', os.path.join(settings.BASE_DIR, 'data', 'geoip.bin'))
+GEOIP_CACHE_SIZE = getattr(settings, 'GEOIP_CACHE_SIZE', 4096)
+
+
+def ip_to_key(ip):
+    """将IP转换为16字节大端序表示，IPv4转为IPv4-mapped IPv6"""
+    address = ipaddress.ip_address(ip)
+    if address.version == 4:
+        address = ipaddress.IPv6Address(f'::ffff:{address}')
+    return address.packed
+
+
+class RecordStarts:
+    """IP段起始地址的只读序列，供 bisect 直接在 mmap 上二分查找"""
+
+    def __init__(self, data, offset, count):
+        self.data = data
+        self.offset = offset
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        start = self.offset + index * GEOIP_RECORD.size
+        return self.data[start:start + 16]
+
+
+class GeoIPDatabase:
+    """mmap 映射的IP段数据库"""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, country_count, record_count = GEOIP_HEADER.unpack_from(self.data, 0)
+        if magic != GEOIP_MAGIC:
+            self.close()
+            raise ValueError(f'{path} 不是有效的IP数据库文件')
+
+        offset = GEOIP_HEADER.size
+        self.countries = []
+        for _ in range(country_count):
+            (length,) = struct.unpack_from('>H', self.data, offset)
+            offset += 2
+            self.countries.append(self.data[offset:offset + length].decode('utf-8'))
+            offset += length
+        self.records_offset = offset
+        self.starts = RecordStarts(self.data, offset, record_count)
+
+    def lookup(self, ip):
+        """返回IP所在国家，未收录时返回None"""
+        key = ip_to_key(ip)
+        index = bisect_right(self.starts, key) - 1
+        if index < 0:
+            return None
+        _, end, country_index = GEOIP_RECORD.unpack_from(self.data, self.records_offset + index * GEOIP_RECORD.size)
+        if key > end:
+            return None
+        return self.countries[country_index]
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+
+def write_database(path, ranges):
+    """
+    写入IP数据库文件
+
+    参数:
+    - ranges: (起始IP, 结束IP, 国家) 的可迭代对象，IP可以是字符串或 ipaddress 对象
+
+    返回:
+    - 写入的IP段数量（相邻且国家相同的IP段会合并）
+    """
+    records = sorted((ip_to_key(str(start)), ip_to_key(str(end)), country) for start, end, country in ranges)
+    merged = []
+    for start, end, country in records:
+        if merged and merged[-1][2] == country and \
+                int.from_bytes(merged[-1][1], 'big') + 1 >= int.from_bytes(start, 'big'):
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+            continue
+        merged.append([start, end, country])
+
+    countries = sorted({country for _, _, country in merged})
+    country_index = {country: index for index, country in enumerate(countries)}
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(GEOIP_HEADER.pack(GEOIP_MAGIC, len(countries), len(merged)))
+        for country in countries:
+            encoded = country.encode('utf-8')
+            f.write(struct.pack('>H', len(encoded)))
+            f.write(encoded)
+        for start, end, country in merged:
+            f.write(GEOIP_RECORD.pack(start, end, country_index[country]))
+    os.replace(tmp_path, path)
+    return len(merged)
+
+
+_database = None
+_database_lock = threading.Lock()
+
+
+def get_database():
+    """懒加载数据库文件，文件不存在或损坏时返回None"""
+    global _database
+    if _database is None:
+        with _database_lock:
+            if _database is None:
+                if not os.path.exists(GEOIP_DATABASE_PATH):
+                    return None
+                try:
+                    _database = GeoIPDatabase(GEOIP_DATABASE_PATH)
+                except Exception as e:
+                    logger.error(f"加载IP数据库失败: {str(e)}")
+                    return None
+    return _database
+
+
+def reload_database():
+    """数据文件更新后重新加载并清空缓存"""
+    global _database
+    with _database_lock:
+        old_database, _database = _database, None
+    if old_database:
+        old_database.close()
+    cached_lookup.cache_clear()
+
+
+def lookup_country(ip):
+    """查询IP所在国家，数据库不可用、IP无效或未收录时返回None"""
+    database = get_database()
+    if database is None:
+        return None
+    return cached_lookup(database, ip)
+
+
+@lru_cache(maxsize=GEOIP_CACHE_SIZE)
+def cached_lookup(database, ip):
+    try:
+        return database.lookup(ip)
+    except ValueError:
+        return None
+
+
+def get_ip_country(ip):
+    """获取IP地址所在国家，优先查询本地IP数据库，查不到时按配置使用在线接口"""
+    country = lookup_country(ip)
+    if country:
+        return country
+    if not getattr(settings, 'GEOIP_HTTP_FALLBACK', True):
+        return "未知"
+    try:
+        # 使用ip-api.com的免费API
+        response = requests.get(f'http://ip-api.com/json/{ip}', timeout=5)
+        if response.status_code == 200:
+            data = response.json()
+            if data['status'] == 'success':
+                return data['country']
+    except Exception as e:
+        print(f"获取IP国家信息失败: {str(e)}")
+    return "未知"
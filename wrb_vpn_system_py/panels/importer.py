@@ -0,0 +1,258 @@
+"""
+面板批量导入
+
+支持 CSV（表头: ip,port,username,password,panel_type,country）和 JSON（对象数组）两种格式，
+panel_type、country 可以为空。导入流程：
+- 校验必填字段，过滤文件内重复和已存在的面板
+- 用线程池并发登录所有面板（最多 max_workers 个同时进行），未指定类型时自动识别 x-ui / 3x-ui，
+  同时读取 xray 版本，并通过一次入站列表查询得到 used_ports 和 nodes_count
+- 国家优先使用文件中的值，否则查询本地IP数据库
+- 连接成功的面板用 bulk_create 一次写入
+"""
+import csv
+import io
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from .geoip import get_ip_country
+from .models import AgentPanel
+
+logger = logging.getLogger(__name__)
+
+PANEL_IMPORT_FIELDS = ['ip', 'port', 'username', 'password', 'panel_type', 'country']
+PANEL_IMPORT_MAX_WORKERS = 16
+PANEL_IMPORT_TIMEOUT = 10
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/134.0.0.0 Safari/537.36'
+INBOUND_LIST_PATHS = {
+    'x-ui': '/xui/inbound/list',
+    '3x-ui': '/panel/inbound/list',
+}
+
+
+def parse_panel_file(content, file_format):
+    """
+    解析导入文件
+
+    参数:
+    - content: 文件内容（str）
+    - file_format: 'csv' 或 'json'
+
+    返回:
+    - 面板字典列表
+    """
+    if file_format == 'json':
+        rows = json.loads(content)
+        if isinstance(rows, dict):
+            rows = rows.get('panels', [])
+        if not isinstance(rows, list):
+            raise ValueError('JSON 内容必须是面板数组')
+    else:
+        rows = list(csv.DictReader(io.StringIO(content.lstrip('\ufeff'))))
+    return [
+        {field: str(row.get(field) or '').strip() for field in PANEL_IMPORT_FIELDS}
+        for row in rows if isinstance(row, dict)
+    ]
+
+
+def build_headers(ip, panel_type, referer_path='/'):
+    host = ip.split('/')[0] if panel_type == '3x-ui' else ip
+    return {
+        'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
+        'host': host,
+        'Accept': 'application/json, text/plain, */*',
+        'User-Agent': USER_AGENT,
+        'Origin': f'http://{host}',
+        'Referer': f'http://{ip}{referer_path}',
+    }
+
+
+def list_inbounds(session, ip, panel_type, cookie):
+    """查询入站列表，成功返回列表，面板类型不匹配或失败时返回None"""
+    headers = build_headers(ip, panel_type, '/panel/inbounds' if panel_type == '3x-ui' else '/xui/inbounds')
+    headers['cookie'] = cookie
+    try:
+        response = session.post(f'http://{ip}{INBOUND_LIST_PATHS[panel_type]}', headers=headers,
+                                timeout=PANEL_IMPORT_TIMEOUT, verify=False)
+        result = response.json()
+    except (requests.RequestException, ValueError):
+        return None
+    if response.status_code != 200 or not result.get('success'):
+        return None
+    return result.get('obj') or []
+
+
+def get_xray_version(session, ip, panel_type, cookie):
+    headers = build_headers(ip, panel_type)
+    headers['cookie'] = cookie
+    try:
+        response = session.post(f'http://{ip}/server/status', headers=headers, timeout=PANEL_IMPORT_TIMEOUT, verify=False)
+        return ((response.json().get('obj') or {}).get('xray') or {}).get('version')
+    except (requests.RequestException, ValueError, AttributeError):
+        return None
+
+
+def probe_panel(row):
+    """
+    登录面板并读取基本信息
+
+    返回:
+    - {'ok', 'error', 'panel_type', 'xray_version', 'cookie', 'used_ports', 'nodes_count'}
+    """
+    result = {'ok': False, 'error': None, 'panel_type': row['panel_type'] or None,
+              'xray_version': None, 'cookie': None, 'used_ports': '', 'nodes_count': 0}
+    ip = row['ip']
+    session = requests.Session()
+    try:
+        login_type = row['panel_type'] or '3x-ui'
+        response = session.post(
+            f'http://{ip}/login',
+            data={'username': row['username'], 'password': row['password']},
+            headers=build_headers(ip, login_type),
+            timeout=PANEL_IMPORT_TIMEOUT,
+            verify=False,
+        )
+        try:
+            login_result = response.json()
+        except ValueError:
+            login_result = {}
+        cookie = response.headers.get('Set-Cookie')
+        if not cookie or not (login_result.get('success') or login_result.get('msg') == '登录成功'):
+            result['error'] = f"登录失败: {login_result.get('msg') or f'HTTP {response.status_code}'}"
+            return result
+        result['cookie'] = cookie
+
+        # 未指定类型时依次尝试两种面板的入站列表接口
+        candidates = [row['panel_type']] if row['panel_type'] else ['3x-ui', 'x-ui']
+        inbounds = None
+        for panel_type in candidates:
+            inbounds = list_inbounds(session, ip, panel_type, cookie)
+            if inbounds is not None:
+                result['panel_type'] = panel_type
+                break
+        if inbounds is None:
+            result['error'] = '获取入站列表失败，无法确认面板类型'
+            return result
+
+        ports = [str(inbound.get('port')) for inbound in inbounds if inbound.get('port')]
+        result['used_ports'] = ','.join(ports)
+        result['nodes_count'] = len(inbounds)
+        result['xray_version'] = get_xray_version(session, ip, result['panel_type'], cookie)
+        result['ok'] = True
+    except requests.RequestException as e:
+        result['error'] = f'连接失败: {str(e)}'
+    except Exception as e:
+        logger.error(f"检测面板 {ip} 失败: {str(e)}")
+        result['error'] = str(e)
+    finally:
+        session.close()
+    return result
+
+
+def validate_rows(rows):
+    """校验必填字段并过滤重复，返回 (有效行, 错误列表)"""
+    valid = []
+    errors = []
+    seen = set()
+    existing = set(AgentPanel.objects.filter(
+        ip_address__in=[row['ip'] for row in rows if row['ip']]
+    ).values_list('ip_address', flat=True))
+
+    for index, row in enumerate(rows, 1):
+        missing = [field for field in ['ip', 'port', 'username', 'password'] if not row[field]]
+        if missing:
+            errors.append({'row': index, 'ip': row['ip'], 'error': f"缺少字段: {', '.join(missing)}"})
+            continue
+        if not row['port'].isdigit():
+            errors.append({'row': index, 'ip': row['ip'], 'error': '端口必须是数字'})
+            continue
+        if row['panel_type'] and row['panel_type'] not in INBOUND_LIST_PATHS:
+            errors.append({'row': index, 'ip': row['ip'], 'error': '面板类型必须是 x-ui 或 3x-ui'})
+            continue
+        if row['ip'] in seen:
+            errors.append({'row': index, 'ip': row['ip'], 'error': '文件中重复'})
+            continue
+        if row['ip'] in existing:
+            errors.append({'row': index, 'ip': row['ip'], 'error': '面板已存在'})
+            continue
+        seen.add(row['ip'])
+        valid.append((index, row))
+    return valid, errors
+
+
+def import_panels(rows, max_workers=PANEL_IMPORT_MAX_WORKERS, dry_run=False, import_failed=False):
+    """
+    批量检测并导入面板
+
+    参数:
+    - rows: parse_panel_file 返回的面板列表
+    - dry_run: 只检测不写入
+    - import_failed: 连接失败的面板也导入（标记为离线）
+
+    返回:
+    - {'total', 'created', 'failed', 'results'}，results 中每项为
+      {'row', 'ip', 'ok', 'error', 'panel_type', 'xray_version', 'country', 'nodes_count', 'id'}
+    """
+    valid, errors = validate_rows(rows)
+    results = [{'row': error['row'], 'ip': error['ip'], 'ok': False, 'error': error['error']} for error in errors]
+
+    def check(row):
+        # 国家在线查询（本地库未收录时）也放在线程中并发执行
+        country = row['country'] or get_ip_country(row['ip'].split(':')[0].split('/')[0])
+        return probe_panel(row), country
+
+    workers = max(1, min(max_workers, len(valid) or 1))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        checked = list(executor.map(lambda item: check(item[1]), valid))
+
+    panels = []
+    imported = []
+    for (index, row), (probe, country) in zip(valid, checked):
+        item = {
+            'row': index,
+            'ip': row['ip'],
+            'ok': probe['ok'],
+            'error': probe['error'],
+            'panel_type': probe['panel_type'],
+            'xray_version': probe['xray_version'],
+            'country': country,
+            'nodes_count': probe['nodes_count'],
+            'id': None,
+        }
+        results.append(item)
+        if not probe['ok'] and not (import_failed and row['panel_type']):
+            continue
+        imported.append(item)
+        panels.append(AgentPanel(
+            ip_address=row['ip'],
+            ip=row['ip'][:50],
+            port=int(row['port']),
+            username=row['username'],
+            password=row['password'],
+            panel_type=probe['panel_type'] or row['panel_type'],
+            is_active=True,
+            is_online=probe['ok'],
+            country=country,
+            cookie=probe['cookie'],
+            used_ports=probe['used_ports'],
+            nodes_count=probe['nodes_count'],
+        ))
+
+    if panels and not dry_run:
+        AgentPanel.objects.bulk_create(panels)
+        # MySQL 的 bulk_create 不回填主键，按地址查询新建面板的ID
+        created_ids = dict(AgentPanel.objects.filter(
+            ip_address__in=[panel.ip_address for panel in panels]
+        ).values_list('ip_address', 'id'))
+        for item in imported:
+            item['id'] = created_ids.get(item['ip'])
+
+    results.sort(key=lambda item: item['row'])
+    return {
+        'total': len(rows),
+        'created': 0 if dry_run else len(panels),
+        'failed': sum(1 for item in results if not item['ok']),
+        'results': results,
+    }
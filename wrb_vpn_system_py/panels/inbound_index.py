@@ -0,0 +1,111 @@
+"""
+面板入站索引
+
+每个面板在缓存中保存一份 端口 -> 入站ID、备注 -> 入站ID 的索引，查询节点对应的入站时不再拉取整个入站列表：
+- 面板轮询、查看节点列表时用完整的入站列表重建索引
+- 添加入站后写入新入站，删除入站后移除
+- 添加入站时优先从添加接口的响应中解析入站ID（3x-ui 和较新版本的 x-ui 会返回新入站），
+  响应中没有时才拉取一次入站列表，并顺便重建索引
+
+索引只是加速查询，没有命中时调用方仍以面板返回的入站列表为准；命中也不代表入站仍在面板上，
+判断节点是否已激活等需要确认入站存在的场景不能只看索引。
+"""
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+INBOUND_INDEX_KEY = 'panel_inbounds:{panel_id}'
+# 轮询每小时一次，索引保留两个轮询周期
+INBOUND_INDEX_TTL = getattr(settings, 'INBOUND_INDEX_TTL', 2 * 3600)
+
+
+def get_inbound_index(panel_id):
+    """返回 {'ports': {端口: 入站ID}, 'remarks': {备注: 入站ID}}，没有索引时返回None"""
+    return cache.get(INBOUND_INDEX_KEY.format(panel_id=panel_id))
+
+
+def rebuild_inbound_index(panel_id, inbounds):
+    """用完整的入站列表重建索引"""
+    index = {'ports': {}, 'remarks': {}}
+    for inbound in inbounds:
+        if inbound.get('id') is None:
+            continue
+        if inbound.get('port'):
+            index['ports'][str(inbound['port'])] = inbound['id']
+        if inbound.get('remark'):
+            index['remarks'][inbound['remark']] = inbound['id']
+    cache.set(INBOUND_INDEX_KEY.format(panel_id=panel_id), index, INBOUND_INDEX_TTL)
+    return index
+
+
+def index_inbound(panel_id, inbound_id, port=None, remark=None):
+    """添加入站后写入索引，面板还没有索引时不创建（不完整的索引无法判断入站不存在）"""
+    index = get_inbound_index(panel_id)
+    if index is None or inbound_id is None:
+        return
+    if port:
+        index['ports'][str(port)] = inbound_id
+    if remark:
+        index['remarks'][remark] = inbound_id
+    cache.set(INBOUND_INDEX_KEY.format(panel_id=panel_id), index, INBOUND_INDEX_TTL)
+
+
+def unindex_inbound(panel_id, inbound_id):
+    """删除入站后从索引中移除"""
+    unindex_inbounds(panel_id, [inbound_id])
+
+
+def unindex_inbounds(panel_id, inbound_ids):
+    """批量删除入站后从索引中移除"""
+    index = get_inbound_index(panel_id)
+    if index is None:
+        return
+    removed = {str(inbound_id) for inbound_id in inbound_ids}
+    for mapping in (index['ports'], index['remarks']):
+        for key in [key for key, value in mapping.items() if str(value) in removed]:
+            del mapping[key]
+    cache.set(INBOUND_INDEX_KEY.format(panel_id=panel_id), index, INBOUND_INDEX_TTL)
+
+
+def lookup_inbound_id(panel_id, port=None, remark=None):
+    """按端口或备注查询入站ID，未命中或没有索引时返回None"""
+    index = get_inbound_index(panel_id)
+    if index is None:
+        return None
+    if port:
+        inbound_id = index['ports'].get(str(port))
+        if inbound_id is not None:
+            return inbound_id
+    if remark:
+        return index['remarks'].get(remark)
+    return None
+
+
+def resolve_added_inbound_id(panel, form_data, add_result):
+    """
+    获取刚添加的入站ID
+
+    参数:
+    - form_data: 添加入站时提交的表单
+    - add_result: 添加接口返回的JSON
+    """
+    from .drivers import PanelClient
+
+    obj = add_result.get('obj')
+    if isinstance(obj, dict) and obj.get('id') is not None:
+        index_inbound(panel.id, obj['id'], obj.get('port') or form_data.get('port'), obj.get('remark') or form_data.get('remark'))
+        return obj['id']
+
+    # 添加接口没有返回入站，拉取一次入站列表并重建索引
+    request_port = form_data.get('port')
+    if not request_port:
+        return None
+    try:
+        index = rebuild_inbound_index(panel.id, PanelClient(panel).list_inbounds())
+    except Exception as e:
+        logger.error(f"获取面板 {panel.id} 入站列表失败: {str(e)}")
+        return None
+    return index['ports'].get(str(request_port))
@@ -0,0 +1,163 @@
+"""
+面板入站清单同步
+
+定时任务 update_all_nodes_count 通过 run_fleet 在一个事件循环上并发拉取所有面板的入站列表，然后增量同步：
+- 每个面板保存入站清单的哈希（入站ID、端口、备注、启用状态），哈希没有变化时不写数据库，
+  只在面板此前被标记为离线时恢复在线状态
+- 清单有变化的面板批量更新节点数量、已用端口和哈希，并重建入站索引
+- 与 NodeInfo 对账：入站ID失效但端口仍在面板上的节点重新找回 panel_node_id，
+  面板上已经找不到的节点标记为 orphaned，之后重新出现时恢复为 active
+各入站的流量增量每次都会记录。
+"""
+import hashlib
+import json
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from users.models import NodeInfo
+from users.traffic import ingest_panel_traffic
+from .drivers import run_fleet
+from .inbound_index import get_inbound_index, rebuild_inbound_index
+from .models import AgentPanel
+
+logger = logging.getLogger(__name__)
+
+# 最近这段时间内修改过的节点可能正在开通或迁移，对账时不标记为 orphaned
+INVENTORY_ORPHAN_GRACE_MINUTES = getattr(settings, 'INVENTORY_ORPHAN_GRACE_MINUTES', 10)
+
+
+def inventory_hash(inbounds):
+    items = sorted(
+        [str(inbound.get('id')), str(inbound.get('port')), inbound.get('remark') or '', bool(inbound.get('enable', True))]
+        for inbound in inbounds
+    )
+    return hashlib.sha1(json.dumps(items, ensure_ascii=False).encode()).hexdigest()
+
+
+def reconcile_nodes(inbounds_by_panel, started_at):
+    """
+    对账面板入站和节点记录
+
+    参数:
+    - inbounds_by_panel: {面板ID: 入站列表}，只包含清单有变化的面板
+    - started_at: 拉取入站列表的时间，之后修改过的节点不标记为 orphaned
+
+    返回:
+    - {'rediscovered', 'orphaned', 'restored'}
+    """
+    stats = {'rediscovered': 0, 'orphaned': 0, 'restored': 0}
+    if not inbounds_by_panel:
+        return stats
+
+    inbound_ids = {}
+    inbound_ports = {}
+    for panel_id, inbounds in inbounds_by_panel.items():
+        inbound_ids[panel_id] = {inbound['id'] for inbound in inbounds if inbound.get('id') is not None}
+        inbound_ports[panel_id] = {
+            str(inbound['port']): inbound['id'] for inbound in inbounds
+            if inbound.get('port') and inbound.get('id') is not None
+        }
+
+    grace_before = started_at - timedelta(minutes=INVENTORY_ORPHAN_GRACE_MINUTES)
+    updates = []
+    nodes = NodeInfo.objects.filter(
+        panel_id__in=list(inbounds_by_panel), status__in=['active', 'orphaned']
+    ).only('id', 'panel_id', 'panel_node_id', 'port', 'status', 'updated_at')
+    for node in nodes.iterator(chunk_size=2000):
+        if node.panel_node_id in inbound_ids[node.panel_id]:
+            if node.status == 'orphaned':
+                node.status = 'active'
+                stats['restored'] += 1
+                updates.append(node)
+            continue
+        inbound_id = inbound_ports[node.panel_id].get(str(node.port))
+        if inbound_id is not None:
+            node.panel_node_id = inbound_id
+            node.status = 'active'
+            stats['rediscovered'] += 1
+            updates.append(node)
+        elif node.status == 'active' and node.updated_at < grace_before:
+            node.status = 'orphaned'
+            stats['orphaned'] += 1
+            updates.append(node)
+
+    if updates:
+        NodeInfo.objects.bulk_update(updates, ['panel_node_id', 'status'], batch_size=1000)
+    return stats
+
+
+def sync_panel_inventories(results):
+    """
+    按入站清单哈希增量同步一批面板
+
+    参数:
+    - results: [(面板, 入站列表)]
+
+    返回:
+    - {'changed', 'unchanged', 'rediscovered', 'orphaned', 'restored'}
+    """
+    started_at = timezone.now()
+    changed = []
+    back_online = []
+    inbounds_by_panel = {}
+    for panel, inbounds in results:
+        digest = inventory_hash(inbounds)
+        if digest == panel.inventory_hash:
+            if not panel.is_online:
+                panel.is_online = True
+                back_online.append(panel.id)
+            if get_inbound_index(panel.id) is None:
+                rebuild_inbound_index(panel.id, inbounds)
+            continue
+        panel.inventory_hash = digest
+        panel.nodes_count = len(inbounds)
+        panel.used_ports = ','.join(str(inbound.get('port')) for inbound in inbounds if inbound.get('port'))
+        panel.is_online = True
+        changed.append(panel)
+        inbounds_by_panel[panel.id] = inbounds
+        rebuild_inbound_index(panel.id, inbounds)
+
+    if changed:
+        AgentPanel.objects.bulk_update(changed, ['nodes_count', 'used_ports', 'is_online', 'inventory_hash'], batch_size=500)
+    if back_online:
+        AgentPanel.objects.filter(id__in=back_online).update(is_online=True)
+
+    stats = {'changed': len(changed), 'unchanged': len(results) - len(changed)}
+    stats.update(reconcile_nodes(inbounds_by_panel, started_at))
+    return stats
+
+
+def refresh_panel_inventory(panels):
+    """
+    刷新一批面板的入站清单
+
+    返回:
+    - (成功数量, 失败列表 [{'id', 'ip', 'error'}])
+    """
+    panels = list(panels)
+    outcomes = run_fleet(panels, 'list_inbounds')
+
+    results = []
+    failed = []
+    for panel in panels:
+        inbounds, error = outcomes[panel.id]
+        if error is not None:
+            # 单次失败不标记离线，连续失败由熔断器标记
+            failed.append({'id': panel.id, 'ip': panel.ip_address, 'error': str(error)})
+            continue
+        results.append((panel, inbounds))
+
+    stats = sync_panel_inventories(results)
+    logger.info(f"面板清单同步完成: {stats}, 失败 {len(failed)} 个")
+
+    # 记录各入站的流量增量，失败不影响面板状态更新
+    for panel, inbounds in results:
+        try:
+            ingest_panel_traffic(panel, inbounds)
+        except Exception as e:
+            logger.error(f"面板 {panel.id} 流量采样失败: {str(e)}")
+
+    return len(results), failed
@@ -0,0 +1,58 @@
+"""
+从IP段CSV生成离线IP数据库
+
+CSV 每行为：起始IP,结束IP,国家（可带表头，IP支持IPv4/IPv6，也可以是整数形式的IPv4），
+例如 DB-IP / IP2Location 的免费国家库导出后取这三列即可。
+文件以原子替换方式写入，已运行的服务进程需要重启后才会加载新文件。
+
+使用方法：
+    python manage.py build_geoip ip_ranges.csv
+    python manage.py build_geoip ip_ranges.csv --output /data/geoip.bin
+"""
+import csv
+import ipaddress
+
+from django.core.management.base import BaseCommand, CommandError
+
+from panels.geoip import GEOIP_DATABASE_PATH, write_database, reload_database
+
+
+def parse_ip(value):
+    value = value.strip()
+    if value.isdigit():
+        return ipaddress.ip_address(int(value))
+    return ipaddress.ip_address(value)
+
+
+class Command(BaseCommand):
+    help = '从IP段CSV生成离线IP数据库'
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_file', help='IP段CSV文件')
+        parser.add_argument('--output', default=GEOIP_DATABASE_PATH, help='输出文件，默认为 GEOIP_DATABASE_PATH')
+
+    def iter_ranges(self, path):
+        with open(path, encoding='utf-8-sig', newline='') as f:
+            for line_no, row in enumerate(csv.reader(f), 1):
+                if len(row) < 3 or not row[2].strip():
+                    continue
+                try:
+                    start, end = parse_ip(row[0]), parse_ip(row[1])
+                except ValueError:
+                    if line_no == 1:
+                        # 表头
+                        continue
+                    self.stderr.write(f"第 {line_no} 行IP格式错误，已跳过: {row[:3]}")
+                    continue
+                if start.version != end.version or start > end:
+                    self.stderr.write(f"第 {line_no} 行IP段无效，已跳过: {row[:3]}")
+                    continue
+                yield start, end, row[2].strip()
+
+    def handle(self, *args, **options):
+        try:
+            count = write_database(options['output'], self.iter_ranges(options['csv_file']))
+        except FileNotFoundError:
+            raise CommandError(f"文件不存在: {options['csv_file']}")
+        reload_database()
+        self.stdout.write(self.style.SUCCESS(f"已生成IP数据库 {options['output']}，共 {count} 个IP段"))
@@ -0,0 +1,56 @@
+"""
+疏散面板：将指定面板上的所有活跃节点迁移到同国家的其他面板
+
+使用方法：
+    python manage.py evacuate_panel <panel_id>
+    python manage.py evacuate_panel <panel_id> --targets 3 5 --batch-size 100
+
+中断后重新执行同一命令即可继续：已迁移的节点会被跳过，未完成的节点会被恢复。
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from panels.models import AgentPanel
+from users.migration_planner import evacuate_panel
+
+
+class Command(BaseCommand):
+    help = '将面板上的所有活跃节点迁移到同国家的其他面板'
+
+    def add_arguments(self, parser):
+        parser.add_argument('panel_id', type=int, help='需要疏散的面板ID')
+        parser.add_argument('--targets', type=int, nargs='*', help='限定目标面板ID，默认使用同国家的所有在线面板')
+        parser.add_argument('--batch-size', type=int, help='每批迁移的节点数量')
+        parser.add_argument('--workers', type=int, help='迁移线程池大小')
+        parser.add_argument('--per-panel', type=int, help='单个目标面板的最大并发迁移数')
+        parser.add_argument('--disable', action='store_true', help='疏散前停用该面板，避免新节点继续分配到该面板')
+
+    def handle(self, *args, **options):
+        try:
+            panel = AgentPanel.objects.get(id=options['panel_id'])
+        except AgentPanel.DoesNotExist:
+            raise CommandError(f"面板 {options['panel_id']} 不存在")
+
+        if options['disable'] and panel.is_active:
+            panel.is_active = False
+            panel.save(update_fields=['is_active'])
+            self.stdout.write(f"已停用面板 {panel.id}")
+
+        self.stdout.write(f"开始疏散面板 {panel.id} ({panel.ip_address})，国家: {panel.country}")
+        progress = evacuate_panel(
+            panel,
+            batch_size=options['batch_size'],
+            target_ids=options['targets'],
+            max_workers=options['workers'],
+            per_panel_limit=options['per_panel'],
+        )
+
+        if progress['message']:
+            self.stderr.write(progress['message'])
+        summary = (
+            f"疏散完成：共 {progress['total']} 个节点，成功 {progress['succeeded']}，"
+            f"失败 {progress['failed']}，跳过 {progress['skipped']}，恢复 {progress['resumed']}，批次 {progress['batches']}"
+        )
+        if progress['failed'] or progress['skipped']:
+            self.stdout.write(self.style.WARNING(summary))
+        else:
+            self.stdout.write(self.style.SUCCESS(summary))
@@ -0,0 +1,48 @@
+"""
+从CSV/JSON批量导入面板
+
+CSV 表头: ip,port,username,password,panel_type,country（panel_type、country 可留空）
+
+使用方法：
+    python manage.py import_panels panels.csv
+    python manage.py import_panels panels.json --workers 32 --dry-run
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from panels.importer import parse_panel_file, import_panels, PANEL_IMPORT_MAX_WORKERS
+
+
+class Command(BaseCommand):
+    help = '从CSV/JSON批量导入面板'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help='CSV或JSON文件')
+        parser.add_argument('--format', choices=['csv', 'json'], help='文件格式，默认按扩展名判断')
+        parser.add_argument('--workers', type=int, default=PANEL_IMPORT_MAX_WORKERS, help='并发检测数')
+        parser.add_argument('--dry-run', action='store_true', help='只检测不写入')
+        parser.add_argument('--import-failed', action='store_true', help='连接失败（且指定了面板类型）的面板也导入，标记为离线')
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or ('json' if options['file'].lower().endswith('.json') else 'csv')
+        try:
+            with open(options['file'], encoding='utf-8') as f:
+                rows = parse_panel_file(f.read(), file_format)
+        except FileNotFoundError:
+            raise CommandError(f"文件不存在: {options['file']}")
+        except ValueError as e:
+            raise CommandError(f"解析导入文件失败: {str(e)}")
+
+        result = import_panels(rows, max_workers=options['workers'], dry_run=options['dry_run'],
+                               import_failed=options['import_failed'])
+        for item in result['results']:
+            if item['ok']:
+                self.stdout.write(
+                    f"第 {item['row']} 行 {item['ip']}: {item['panel_type']} xray {item.get('xray_version') or '-'} "
+                    f"{item.get('country')} 入站 {item.get('nodes_count')}"
+                )
+            else:
+                self.stderr.write(f"第 {item['row']} 行 {item['ip']}: {item['error']}")
+        prefix = '[dry-run] ' if options['dry_run'] else ''
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}共 {result['total']} 个面板，导入 {result['created']} 个，失败 {result['failed']} 个"
+        ))
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-19 18:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('panels', '0007_agentpanel_ip'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='agentpanel',
+            name='inventory_hash',
+            field=models.CharField(blank=True, default='', max_length=40, verbose_name='入站清单哈希'),
+        ),
+    ]
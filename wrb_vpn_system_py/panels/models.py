@@ -25,6 +25,7 @@ class AgentPanel(models.Model):
     memory_usage = models.FloatField(null=True, blank=True, verbose_name='内存使用率')
     disk_usage = models.FloatField(null=True, blank=True, verbose_name='磁盘使用率')
     nodes_count = models.IntegerField(default=0, verbose_name='节点数量')
+    inventory_hash = models.CharField(max_length=40, default='', blank=True, verbose_name='入站清单哈希')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
 
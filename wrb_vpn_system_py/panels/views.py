@@ -3,7 +3,7 @@ from django.shortcuts import render
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.permissions import AllowAny
+from rest_framework.permissions import AllowAny, IsAuthenticated
 from django.utils import timezone
 
 from .models import AgentPanel
@@ -16,20 +16,15 @@ from django.db.models import Q
 from django.db import models
 import random
 import uuid
+import time
 from users.models import NodeInfo, PaymentOrder
-
-def get_ip_country(ip):
-    """获取IP地址所在国家"""
-    try:
-        # 使用ip-api.com的免费API
-        response = requests.get(f'http://ip-api.com/json/{ip}', timeout=5)
-        if response.status_code == 200:
-            data = response.json()
-            if data['status'] == 'success':
-                return data['country']
-    except Exception as e:
-        print(f"获取IP国家信息失败: {str(e)}")
-    return "未知"
+from users.traffic import ingest_panel_traffic
+from .geoip import get_ip_country
+from .importer import parse_panel_file, import_panels, PANEL_IMPORT_MAX_WORKERS
+from users.restarts import record_restart, xray_restart_scheduler
+from .breaker import with_circuit_breaker, get_breaker_states
+from .inventory import refresh_panel_inventory, sync_panel_inventories
+from .inbound_index import rebuild_inbound_index, unindex_inbound
 
 # Create your views here.
 
@@ -280,6 +275,92 @@ class AgentPanelViewSet(viewsets.ModelViewSet):
                 'data': {'connected': False}
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
+    def breaker_status(self, request):
+        """查询所有面板的熔断器状态（closed/open/half_open）、连续失败次数、平均响应耗时和距下次重试的秒数"""
+        if request.user.user_type not in ['admin', 'agent_l1']:
+            return Response({
+                'code': 403,
+                'message': '没有权限查看面板状态',
+                'data': None
+            }, status=status.HTTP_403_FORBIDDEN)
+        panels = list(AgentPanel.objects.filter(is_active=True).values('id', 'ip_address', 'country', 'is_online'))
+        states = get_breaker_states([panel['id'] for panel in panels])
+        for panel in panels:
+            state = states[panel['id']]
+            panel.update({
+                'state': state['state'],
+                'failures': state['failures'],
+                'ewma_ms': round(state['ewma_ms'], 1) if state['ewma_ms'] is not None else None,
+                'retry_in': max(0, round(state['retry_at'] - time.time())) if state['retry_at'] else None,
+            })
+        return Response({
+            'code': 200,
+            'message': '获取熔断器状态成功',
+            'data': panels
+        })
+
+    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated])
+    def bulk_import(self, request):
+        """
+        批量导入面板
+
+        上传 file（CSV 或 JSON 文件），或在请求体 panels 中直接提交面板数组。
+        所有面板并发检测登录，自动识别面板类型，连接成功的面板一次性写入。
+
+        可选参数:
+        - dry_run: 为 true 时只检测不写入
+        - import_failed: 为 true 时连接失败（且指定了面板类型）的面板也导入，标记为离线
+        - max_workers: 并发检测数，默认16，最大64
+        """
+        if request.user.user_type not in ['admin', 'agent_l1']:
+            return Response({
+                'code': 403,
+                'message': '没有权限导入面板',
+                'data': None
+            }, status=status.HTTP_403_FORBIDDEN)
+        try:
+            upload = request.FILES.get('file')
+            if upload:
+                file_format = 'json' if upload.name.lower().endswith('.json') else 'csv'
+                rows = parse_panel_file(upload.read().decode('utf-8'), file_format)
+            else:
+                panels = request.data.get('panels')
+                if not isinstance(panels, list):
+                    return Response({
+                        'code': 400,
+                        'message': '请上传文件或提供panels数组',
+                        'data': None
+                    }, status=status.HTTP_400_BAD_REQUEST)
+                rows = parse_panel_file(json.dumps(panels), 'json')
+        except (ValueError, UnicodeDecodeError) as e:
+            return Response({
+                'code': 400,
+                'message': f'解析导入文件失败: {str(e)}',
+                'data': None
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        if not rows:
+            return Response({
+                'code': 400,
+                'message': '导入文件中没有面板数据',
+                'data': None
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            max_workers = min(int(request.data.get('max_workers') or PANEL_IMPORT_MAX_WORKERS), 64)
+        except (TypeError, ValueError):
+            max_workers = PANEL_IMPORT_MAX_WORKERS
+        dry_run = str(request.data.get('dry_run', '')).lower() in ['1', 'true']
+        import_failed = str(request.data.get('import_failed', '')).lower() in ['1', 'true']
+
+        result = import_panels(rows, max_workers=max_workers, dry_run=dry_run, import_failed=import_failed)
+        return Response({
+            'code': 200,
+            'message': f"检测 {result['total']} 个面板，导入 {result['created']} 个，失败 {result['failed']} 个",
+            'data': result
+        })
+
     @action(detail=True, methods=['post'])
     def toggle_status(self, request, pk=None):
         """切换面板的启用/停用状态"""
@@ -369,6 +450,7 @@ class AgentPanelViewSet(viewsets.ModelViewSet):
             panel.save(update_fields=['is_online'])
             return None
 
+    @with_circuit_breaker(panel_arg=1)
     def make_request_with_cookie(self, panel, panel_info, url, headers, method='post', data=None):
         """使用cookie发送请求，如果失败则尝试刷新cookie重试"""
         response = None
@@ -415,9 +497,7 @@ class AgentPanelViewSet(viewsets.ModelViewSet):
                     else:
                         response = requests.get(url, headers=headers, timeout=30, verify=False)
                 else:
-                    # 获取新cookie失败，将面板标记为离线
-                    panel.is_online = False
-                    panel.save(update_fields=['is_online'])
+                    # 获取新cookie失败，由熔断器记录失败
                     raise Exception("尝试重新登录失败，无法获取有效cookie")
             
             return response
@@ -439,28 +519,22 @@ class AgentPanelViewSet(viewsets.ModelViewSet):
                     else:
                         return requests.get(url, headers=headers, timeout=30, verify=False)
                 else:
-                    # 获取新cookie失败，将面板标记为离线
-                    panel.is_online = False
-                    panel.save(update_fields=['is_online'])
+                    # 获取新cookie失败，由熔断器记录失败
                     raise Exception(f"获取Cookie失败，节点可能离线: {str(req_error)}")
             except Exception as login_error:
-                # 重新登录也失败，记录错误并将面板标记为离线
+                # 重新登录也失败，记录错误
                 print(f"重新登录失败: {str(login_error)}")
-                panel.is_online = False
-                panel.save(update_fields=['is_online'])
                 raise Exception(f"重新登录失败，节点离线: {str(login_error)}")
         
         except Exception as e:
-            # 其他所有异常情况，确保面板被标记为离线
+            # 其他所有异常情况，连续失败时由熔断器将面板标记为离线
             print(f"请求处理过程中出错: {str(e)}")
-            panel.is_online = False
-            panel.save(update_fields=['is_online'])
             
             # 如果已经有响应但处理失败，返回该响应
             if response:
                 return response
                 
-            raise Exception(f"请求节点失败，节点已标记为离线: {str(e)}")
+            raise Exception(f"请求节点失败，节点可能离线: {str(e)}")
 
     @action(detail=True, methods=['get'])
     def status(self, request, pk=None):
@@ -611,6 +685,7 @@ class AgentPanelViewSet(viewsets.ModelViewSet):
             panel.is_online = True  # 成功获取节点列表，设置为在线
             panel.used_ports = ','.join(used_ports)  # 使用逗号分隔的端口列表
             panel.save(update_fields=['nodes_count', 'is_online', 'used_ports'])
+            rebuild_inbound_index(panel.id, nodes_data)
             
             # 返回数据
             return Response({
@@ -676,33 +751,9 @@ class AgentPanelViewSet(viewsets.ModelViewSet):
             
             def background_process():
                 try:
-                    updated_count = 0
-                    failed_count = 0
-                    failed_panels = []
-                    
-                    # 单线程循环处理所有面板
-                    for panel in active_panels:
-                        try:
-                            result = self.update_single_panel(panel)
-                            if result['success']:
-                                updated_count += 1
-                            else:
-                                failed_count += 1
-                                failed_panels.append({
-                                    'id': result['panel_id'],
-                                    'ip': result['panel_ip'],
-                                    'error': result['error']
-                                })
-                        except Exception as exc:
-                            print(f'面板 {panel.id} 处理过程中产生异常: {exc}')
-                            failed_count += 1
-                            failed_panels.append({
-                                'id': panel.id,
-                                'ip': panel.ip_address,
-                                'error': str(exc)
-                            })
-                    
-                    print(f"后台更新完成: 成功 {updated_count} 个, 失败 {failed_count} 个")
+                    # 所有面板的入站列表在同一个事件循环上并发拉取
+                    updated_count, failed_panels = refresh_panel_inventory(active_panels)
+                    print(f"后台更新完成: 成功 {updated_count} 个, 失败 {len(failed_panels)} 个")
                 except Exception as e:
                     print(f"后台更新过程出错: {str(e)}")
             
@@ -791,25 +842,14 @@ class AgentPanelViewSet(viewsets.ModelViewSet):
                     
                     nodes_data = result_json.get('obj', [])
                     
-                    # 收集已使用的端口
-                    used_ports = []
-                    for node in nodes_data:
-                        # 根据面板类型提取端口
-                        if panel_info['panel_type'] == 'x-ui':
-                            port = node.get('port')
-                            if port:
-                                used_ports.append(str(port))
-                        elif panel_info['panel_type'] == '3x-ui':
-                            port = node.get('port')
-                            if port:
-                                used_ports.append(str(port))
-                    
-                    # 更新节点数量、在线状态和已使用端口
-                    panel.nodes_count = len(nodes_data)
-                    panel.is_online = True  # 成功获取节点列表，设置为在线
-                    panel.used_ports = ','.join(used_ports)  # 使用逗号分隔的端口列表
-                    print(f"更新面板状态: {panel.id} {panel.nodes_count} {panel.is_online} {panel.used_ports}")
-                    panel.save(update_fields=['nodes_count', 'is_online', 'used_ports'])
+                    # 按入站清单哈希增量更新，清单没有变化时不写数据库；有变化时同步节点记录
+                    sync_panel_inventories([(panel, nodes_data)])
+
+                    # 记录各入站的流量增量，失败不影响面板状态更新
+                    try:
+                        ingest_panel_traffic(panel, nodes_data)
+                    except Exception as traffic_error:
+                        print(f"面板 {panel.id} 流量采样失败: {str(traffic_error)}")
                     
                     result['success'] = True
                     return result
@@ -889,6 +929,7 @@ class AgentPanelViewSet(viewsets.ModelViewSet):
                 try:
                     result = response.json()
                     if result.get('success') or result.get('msg') == '删除成功':
+                        unindex_inbound(panel.id, node_id)
                         # 删除成功后，更新节点列表以更新面板的节点数量和已使用端口
                         try:
                             self.nodes(request, pk=pk)
@@ -1361,6 +1402,79 @@ class AgentPanelViewSet(viewsets.ModelViewSet):
                 'data': None
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
+    def evacuate(self, request, pk=None):
+        """将面板上的所有活跃节点疏散到同国家的其他面板（后台执行，可重复执行以恢复中断的疏散）"""
+        from users.migration_planner import evacuate_panel, get_evacuation_progress, is_evacuation_running
+        if request.user.user_type not in ['admin', 'agent_l1']:
+            return Response({
+                'code': 403,
+                'message': '没有权限疏散面板',
+                'data': None
+            }, status=status.HTTP_403_FORBIDDEN)
+        try:
+            panel = self.get_object()
+            progress = get_evacuation_progress(panel.id)
+            # 心跳过期的 running 状态说明执行疏散的进程已经中断，允许重新执行以恢复
+            if is_evacuation_running(progress):
+                return Response({
+                    'code': 400,
+                    'message': '该面板正在疏散中',
+                    'data': progress
+                }, status=status.HTTP_400_BAD_REQUEST)
+
+            target_ids = request.data.get('target_panel_ids') or None
+            batch_size = request.data.get('batch_size')
+            batch_size = int(batch_size) if batch_size else None
+
+            thread = Thread(target=evacuate_panel, args=(panel,), kwargs={
+                'batch_size': batch_size,
+                'target_ids': target_ids,
+            })
+            thread.daemon = True
+            thread.start()
+
+            return Response({
+                'code': 200,
+                'message': '面板疏散任务已提交，请稍后查看疏散进度',
+                'data': {
+                    'panel_id': panel.id,
+                    'nodes_count': NodeInfo.objects.filter(panel_id=panel.id, status='active').count()
+                }
+            })
+        except Exception as e:
+            print(f"提交面板疏散任务失败: {str(e)}")
+            return Response({
+                'code': 500,
+                'message': f'提交面板疏散任务失败: {str(e)}',
+                'data': None
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    @action(detail=True, methods=['get'], permission_classes=[IsAuthenticated])
+    def evacuation_progress(self, request, pk=None):
+        """获取面板疏散进度，stale 为 true 表示执行疏散的进程已中断，可以重新提交疏散以恢复"""
+        from users.migration_planner import get_evacuation_progress, is_evacuation_running
+        if request.user.user_type not in ['admin', 'agent_l1']:
+            return Response({
+                'code': 403,
+                'message': '没有权限查看疏散进度',
+                'data': None
+            }, status=status.HTTP_403_FORBIDDEN)
+        panel = self.get_object()
+        progress = get_evacuation_progress(panel.id)
+        if progress is None:
+            return Response({
+                'code': 404,
+                'message': '该面板没有疏散任务',
+                'data': None
+            }, status=status.HTTP_404_NOT_FOUND)
+        progress['stale'] = progress.get('status') == 'running' and not is_evacuation_running(progress)
+        return Response({
+            'code': 200,
+            'message': '获取疏散进度成功',
+            'data': progress
+        })
+
     @action(detail=True, methods=['post'])
     def restart_xray(self, request, pk=None):
         """重启 Xray 服务"""
@@ -1407,6 +1521,9 @@ class AgentPanelViewSet(viewsets.ModelViewSet):
                 try:
                     result = response.json()
                     if result.get('success', False):
+                        # 手动重启后不再执行已登记的合并重启
+                        record_restart(panel.id)
+                        xray_restart_scheduler.cancel(panel.id)
                         return Response({
                             'code': 200,
                             'message': '重启Xray服务成功',
@@ -1527,6 +1644,7 @@ class AgentPanelViewSet(viewsets.ModelViewSet):
             else:
                 host_config = json.loads(node_info.host_config)
                 panel = AgentPanel.objects.get(id=host_config.get('id'))
+                # 入站索引可能已过期（入站在面板上被删除），激活状态只以面板返回的入站列表为准
                 headers = {
                         'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
                         'host': f'{panel.ip_address.split("/")[0]}',
@@ -1545,6 +1663,7 @@ class AgentPanelViewSet(viewsets.ModelViewSet):
                     if list_response.status_code == 200:
                         list_result = list_response.json()
                         if list_result.get('success'):
+                            rebuild_inbound_index(panel.id, list_result.get('obj') or [])
                                 # 遍历节点列表查找匹配的端口
                             for inbound in list_result.get('obj', []):
                                 if str(inbound.get('port')) ==  str(node_info.port):
@@ -1560,7 +1679,7 @@ class AgentPanelViewSet(viewsets.ModelViewSet):
                                     })
                     
                     # 动态导入migrate_node函数
-                    from users.views import migrate_node
+                    from users.node_migration import migrate_node
                     thread = Thread(target=migrate_node, args=(node_info, panel))
                     thread.start()
                     return Response({
@@ -1584,6 +1703,7 @@ class AgentPanelViewSet(viewsets.ModelViewSet):
                     if list_response.status_code == 200:
                         list_result = list_response.json()
                         if list_result.get('success'):
+                            rebuild_inbound_index(panel.id, list_result.get('obj') or [])
                                 # 遍历节点列表查找匹配的端口
                             for inbound in list_result.get('obj', []):
                                 
@@ -1600,7 +1720,7 @@ class AgentPanelViewSet(viewsets.ModelViewSet):
                                     })
                             
                     # 动态导入migrate_node函数
-                    from users.views import migrate_node
+                    from users.node_migration import migrate_node
                     thread = Thread(target=migrate_node, args=(node_info, panel))
                     thread.start()
                     return Response({
@@ -0,0 +1,14 @@
+from django.contrib import admin
+from .models import SalesDailyRollup, RollupWatermark
+
+
+@admin.register(SalesDailyRollup)
+class SalesDailyRollupAdmin(admin.ModelAdmin):
+    list_display = ('date', 'agent', 'node_type', 'country', 'order_count', 'node_count', 'amount')
+    list_filter = ('date', 'node_type', 'country')
+    search_fields = ('agent__username',)
+
+
+@admin.register(RollupWatermark)
+class RollupWatermarkAdmin(admin.ModelAdmin):
+    list_display = ('name', 'last_processed_at', 'updated_at')
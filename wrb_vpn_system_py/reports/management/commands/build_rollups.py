@@ -0,0 +1,24 @@
+"""
+增量构建销售汇总表
+
+使用方法：
+    python manage.py build_rollups          # 只处理上次构建后有变动的订单所在日期
+    python manage.py build_rollups --full   # 重建全部日期
+
+可加入 crontab 定期执行，例如每5分钟：
+    */5 * * * * cd /path/to/wrb_vpn_system_py && python manage.py build_rollups
+"""
+from django.core.management.base import BaseCommand
+
+from reports.services import build_sales_rollups
+
+
+class Command(BaseCommand):
+    help = '增量构建销售汇总表'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='忽略水位，重建全部日期')
+
+    def handle(self, *args, **options):
+        result = build_sales_rollups(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(f"销售汇总构建完成: {result['dates']} 天, {result['rows']} 行"))
@@ -0,0 +1,51 @@
+# Generated by Django 5.2 on 2026-10-19 15:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='汇总名称')),
+                ('last_processed_at', models.DateTimeField(blank=True, null=True, verbose_name='已处理到')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+            ],
+            options={
+                'verbose_name': '汇总进度',
+                'verbose_name_plural': '汇总进度',
+            },
+        ),
+        migrations.CreateModel(
+            name='SalesDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='日期')),
+                ('node_type', models.CharField(blank=True, default='', max_length=20, verbose_name='节点类型')),
+                ('country', models.CharField(blank=True, default='', max_length=100, verbose_name='节点国家')),
+                ('order_count', models.IntegerField(default=0, verbose_name='订单数')),
+                ('node_count', models.IntegerField(default=0, verbose_name='节点数')),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='销售金额')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+                ('agent', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='sales_rollups', to=settings.AUTH_USER_MODEL, verbose_name='代理')),
+            ],
+            options={
+                'verbose_name': '每日销售汇总',
+                'verbose_name_plural': '每日销售汇总',
+                'ordering': ['-date'],
+                'indexes': [models.Index(fields=['agent', 'date'], name='reports_sal_agent_i_bc5a35_idx')],
+                'unique_together': {('date', 'agent', 'node_type', 'country')},
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+from django.db import models
+from django.conf import settings
+
+
+class SalesDailyRollup(models.Model):
+    """按天、代理、节点类型、地区汇总的销售数据（只统计支付成功的订单）"""
+    date = models.DateField(verbose_name='日期')
+    agent = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True,
+                              related_name='sales_rollups', verbose_name='代理')
+    node_type = models.CharField(max_length=20, blank=True, default='', verbose_name='节点类型')
+    country = models.CharField(max_length=100, blank=True, default='', verbose_name='节点国家')
+    order_count = models.IntegerField(default=0, verbose_name='订单数')
+    node_count = models.IntegerField(default=0, verbose_name='节点数')
+    amount = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name='销售金额')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
+
+    class Meta:
+        verbose_name = '每日销售汇总'
+        verbose_name_plural = '每日销售汇总'
+        ordering = ['-date']
+        unique_together = ['date', 'agent', 'node_type', 'country']
+        indexes = [
+            models.Index(fields=['agent', 'date']),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.agent_id} {self.node_type} {self.country}"
+
+
+class RollupWatermark(models.Model):
+    """汇总任务的处理进度，记录上次处理到的订单更新时间"""
+    name = models.CharField(max_length=50, unique=True, verbose_name='汇总名称')
+    last_processed_at = models.DateTimeField(null=True, blank=True, verbose_name='已处理到')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
+
+    class Meta:
+        verbose_name = '汇总进度'
+        verbose_name_plural = '汇总进度'
+
+    def __str__(self):
+        return f"{self.name}: {self.last_processed_at}"
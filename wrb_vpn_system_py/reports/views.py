@@ -0,0 +1,145 @@
+from datetime import timedelta
+
+from django.db.models import Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from rest_framework import viewsets
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAuthenticated
+
+from cdk.utils import api_response
+from panels.models import AgentPanel
+from .models import SalesDailyRollup
+
+# 未指定日期范围时默认统计的天数
+DEFAULT_REPORT_DAYS = 30
+
+
+class ReportViewSet(viewsets.ViewSet):
+    """
+    销售报表，数据来自每日销售汇总表
+
+    接口只读汇总表，不在请求中构建；汇总表由 build_rollups 管理命令定期增量构建，数据最多延迟一个构建周期
+
+    查询参数:
+    - start_date / end_date: 日期范围（YYYY-MM-DD），默认最近30天
+    - agent_id: 按代理筛选（仅管理员和一级代理）
+    - node_type / country: 按节点类型、地区筛选
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get_rollups(self, request):
+        user = request.user
+
+        end_date = parse_date(request.query_params.get('end_date') or '') or timezone.localdate()
+        start_date = parse_date(request.query_params.get('start_date') or '') or end_date - timedelta(days=DEFAULT_REPORT_DAYS - 1)
+        queryset = SalesDailyRollup.objects.filter(date__gte=start_date, date__lte=end_date)
+
+        if user.user_type == 'agent_l2':
+            queryset = queryset.filter(agent=user)
+        else:
+            agent_id = request.query_params.get('agent_id')
+            if agent_id:
+                queryset = queryset.filter(agent_id=agent_id)
+
+        node_type = request.query_params.get('node_type')
+        if node_type:
+            queryset = queryset.filter(node_type=node_type)
+        country = request.query_params.get('country')
+        if country:
+            queryset = queryset.filter(country=country)
+        return queryset, start_date, end_date
+
+    def check_report_permission(self, request):
+        return request.user.user_type in ['admin', 'agent_l1', 'agent_l2']
+
+    def forbidden(self):
+        return api_response(code=403, message='无权查看报表', data=None)
+
+    @staticmethod
+    def totals(queryset):
+        result = queryset.aggregate(order_count=Sum('order_count'), node_count=Sum('node_count'), amount=Sum('amount'))
+        return {
+            'order_count': result['order_count'] or 0,
+            'node_count': result['node_count'] or 0,
+            'amount': str(result['amount'] or 0),
+        }
+
+    @staticmethod
+    def group_rows(queryset, *fields):
+        rows = queryset.values(*fields).annotate(
+            order_total=Sum('order_count'), node_total=Sum('node_count'), amount_total=Sum('amount')
+        ).order_by('-amount_total')
+        return [
+            {
+                **{field: row[field] for field in fields},
+                'order_count': row['order_total'],
+                'node_count': row['node_total'],
+                'amount': str(row['amount_total'] or 0),
+            }
+            for row in rows
+        ]
+
+    @action(detail=False, methods=['get'])
+    def summary(self, request):
+        """销售总览：合计与每日趋势"""
+        if not self.check_report_permission(request):
+            return self.forbidden()
+        queryset, start_date, end_date = self.get_rollups(request)
+        daily = self.group_rows(queryset, 'date')
+        daily.sort(key=lambda row: row['date'])
+        return api_response(code=200, message='获取销售总览成功', data={
+            'start_date': start_date,
+            'end_date': end_date,
+            'totals': self.totals(queryset),
+            'daily': daily,
+        })
+
+    @action(detail=False, methods=['get'])
+    def agents(self, request):
+        """按代理统计销售额"""
+        if not self.check_report_permission(request):
+            return self.forbidden()
+        queryset, start_date, end_date = self.get_rollups(request)
+        return api_response(code=200, message='获取代理销售统计成功', data={
+            'start_date': start_date,
+            'end_date': end_date,
+            'results': self.group_rows(queryset, 'agent_id', 'agent__username'),
+        })
+
+    @action(detail=False, methods=['get'])
+    def countries(self, request):
+        """按地区统计订单"""
+        if not self.check_report_permission(request):
+            return self.forbidden()
+        queryset, start_date, end_date = self.get_rollups(request)
+        return api_response(code=200, message='获取地区销售统计成功', data={
+            'start_date': start_date,
+            'end_date': end_date,
+            'results': self.group_rows(queryset, 'country'),
+        })
+
+    @action(detail=False, methods=['get'])
+    def node_types(self, request):
+        """按节点类型统计订单"""
+        if not self.check_report_permission(request):
+            return self.forbidden()
+        queryset, start_date, end_date = self.get_rollups(request)
+        return api_response(code=200, message='获取节点类型销售统计成功', data={
+            'start_date': start_date,
+            'end_date': end_date,
+            'results': self.group_rows(queryset, 'node_type'),
+        })
+
+    @action(detail=False, methods=['get'])
+    def panels(self, request):
+        """各面板节点数（由面板轮询维护的 nodes_count，不扫描节点表）"""
+        if request.user.user_type not in ['admin', 'agent_l1']:
+            return self.forbidden()
+        panels = AgentPanel.objects.filter(is_active=True).values(
+            'id', 'ip_address', 'country', 'panel_type', 'nodes_count', 'is_online'
+        ).order_by('-nodes_count')
+        return api_response(code=200, message='获取面板节点统计成功', data={
+            'total_nodes': sum(panel['nodes_count'] for panel in panels),
+            'results': list(panels),
+        })
@@ -0,0 +1,109 @@
+"""
+中转域名映射
+
+节点列表需要把UDP中转主机的IP替换为代理配置的域名。每个代理的 {IP: 域名} 映射
+整体缓存，列表接口一次取出后在内存中查找，save_domain/delete_domain 修改后清除缓存。
+节点属于多个代理时用 get_agent_domain_maps 一次取出所有代理的映射。
+"""
+from django.core.cache import cache
+
+from .models import TransitDomain
+
+# 代理域名映射缓存时间（秒），域名变更时会主动清除
+DOMAIN_MAP_CACHE_TTL = 10 * 60
+
+
+def get_domain_map_cache_key(agent_id):
+    return f'transit_domain_map:{agent_id}'
+
+
+def get_agent_domain_map(agent_id):
+    """
+    获取代理的中转域名映射
+
+    返回:
+    - {IP: 域名} 字典，同一IP配置多个域名时使用最新创建的一个
+    """
+    if not agent_id:
+        return {}
+    cache_key = get_domain_map_cache_key(agent_id)
+    domain_map = cache.get(cache_key)
+    if domain_map is None:
+        # 按创建时间升序写入字典，较新的记录覆盖较旧的
+        domain_map = dict(
+            TransitDomain.objects.filter(agent_id=agent_id).order_by('created_at').values_list('ip', 'domain')
+        )
+        cache.set(cache_key, domain_map, DOMAIN_MAP_CACHE_TTL)
+    return domain_map
+
+
+def get_agent_domain_maps(agent_ids):
+    """
+    批量获取多个代理的中转域名映射，缓存一次批量读取，未缓存的代理一次查询
+
+    返回:
+    - {代理ID: {IP: 域名}}
+    """
+    agent_ids = {agent_id for agent_id in agent_ids if agent_id}
+    if not agent_ids:
+        return {}
+    cache_keys = {get_domain_map_cache_key(agent_id): agent_id for agent_id in agent_ids}
+    cached = cache.get_many(list(cache_keys))
+    domain_maps = {cache_keys[key]: domain_map for key, domain_map in cached.items()}
+
+    missing = agent_ids - set(domain_maps)
+    if missing:
+        loaded = {agent_id: {} for agent_id in missing}
+        # 按创建时间升序写入字典，较新的记录覆盖较旧的
+        for agent_id, ip, domain in TransitDomain.objects.filter(
+            agent_id__in=missing
+        ).order_by('created_at').values_list('agent_id', 'ip', 'domain'):
+            loaded[agent_id][ip] = domain
+        cache.set_many({get_domain_map_cache_key(agent_id): domain_map for agent_id, domain_map in loaded.items()},
+                       DOMAIN_MAP_CACHE_TTL)
+        domain_maps.update(loaded)
+    return domain_maps
+
+
+def invalidate_agent_domain_map(agent_id):
+    """代理的中转域名变更后清除缓存"""
+    cache.delete(get_domain_map_cache_key(agent_id))
+
+
+def get_udp_host_domain(node, agent=None, domain_map=None):
+    """
+    获取UDP主机域名映射
+    
+    参数:
+    - node: NodeInfo对象
+    - agent: 代理用户对象，如果不提供则从node.user.parent获取
+    - domain_map: 代理的 {IP: 域名} 映射，不提供时从缓存中获取代理的映射
+    
+    返回:
+    - 映射后的域名字符串，如果没有映射则返回原始udp_host，如果udp_host为空则返回空字符串
+    """
+    if not node.udp_host:
+        return ''
+    
+    # 从udp_host中提取IP地址（格式通常是 ip:port）
+    try:
+        host_ip = node.udp_host.split(':')[0]
+    except (AttributeError, IndexError):
+        return node.udp_host
+    
+    # 在映射中查找IP对应的域名
+    if domain_map is not None:
+        domain = domain_map.get(host_ip)
+        if not domain:
+            return node.udp_host
+        port = node.udp_host.split(':')[1] if ':' in node.udp_host else ''
+        return f"{domain}:{port}" if port else domain
+
+    # 获取代理的域名映射（跨请求缓存）
+    if not agent:
+        agent = node.user.parent if node.user and hasattr(node.user, 'parent') else None
+    
+    if not agent:
+        return node.udp_host
+    
+    return get_udp_host_domain(node, domain_map=get_agent_domain_map(agent.id))
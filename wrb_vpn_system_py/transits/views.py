@@ -31,6 +31,7 @@ class IsAdminOrAgentL2(BasePermission):
         return request.user.is_staff
 
 from .models import TransitAccount, TransitDomain
+from .services import invalidate_agent_domain_map
 from .serializers import (
     TransitAccountSerializer, 
     TransitAccountCreateSerializer,
@@ -1079,6 +1080,7 @@ class TransitAccountViewSet(viewsets.ModelViewSet):
                 domain_record.ip = validated_data.get('ip')
                 domain_record.domain = validated_data.get('domain')
                 domain_record.save()
+                invalidate_agent_domain_map(user.id)
                 
                 # 返回更新后的域名信息
                 response_serializer = TransitDomainSerializer(domain_record)
@@ -1120,6 +1122,7 @@ class TransitAccountViewSet(viewsets.ModelViewSet):
                     domain=domain,
                     agent=user
                 )
+                invalidate_agent_domain_map(user.id)
                 
                 # 返回创建的域名信息
                 response_serializer = TransitDomainSerializer(domain_record)
@@ -1242,6 +1245,7 @@ class TransitAccountViewSet(viewsets.ModelViewSet):
             # 记录删除信息
             domain_name = domain_record.name
             domain_record.delete()
+            invalidate_agent_domain_map(user.id)
             
             logger.info(f"域名已删除: ID={domain_id}, Name={domain_name}, Agent={user.username}")
             
@@ -0,0 +1,171 @@
+"""
+登录审计
+
+登录接口不再同步写 LoginRecord 和用户的最后登录信息，而是调用 record_login 把事件放入进程内队列，
+由后台线程攒够 LOGIN_AUDIT_BATCH_SIZE 条或每隔 LOGIN_AUDIT_FLUSH_INTERVAL 毫秒批量写入：
+- LoginRecord 使用 bulk_create 一次插入
+- 同一批内每个用户只保留最后一次登录，用 bulk_update 更新 last_login、last_login_ip、ip_address
+
+队列满时丢弃审计事件并记录日志，登录本身不受影响。进程退出时会尽量写完队列中的事件。
+prune_login_records 按保留天数分批删除旧的登录记录。
+"""
+import atexit
+import logging
+import queue
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .models import User, LoginRecord
+
+logger = logging.getLogger(__name__)
+
+LOGIN_AUDIT_BATCH_SIZE = getattr(settings, 'LOGIN_AUDIT_BATCH_SIZE', 200)
+# 最长刷新间隔（毫秒）
+LOGIN_AUDIT_FLUSH_INTERVAL = getattr(settings, 'LOGIN_AUDIT_FLUSH_INTERVAL', 500)
+LOGIN_AUDIT_QUEUE_SIZE = getattr(settings, 'LOGIN_AUDIT_QUEUE_SIZE', 10000)
+LOGIN_RECORD_RETENTION_DAYS = getattr(settings, 'LOGIN_RECORD_RETENTION_DAYS', 180)
+
+
+def get_client_ip(request):
+    """优先从X-Real-IP头获取IP，其次从X-Forwarded-For获取，最后使用REMOTE_ADDR"""
+    return request.META.get('HTTP_X_REAL_IP') or \
+        request.META.get('HTTP_X_FORWARDED_FOR', '').split(',')[0].strip() or \
+        request.META.get('REMOTE_ADDR', '')
+
+
+class LoginAuditWriter:
+    """登录事件缓冲写入器"""
+
+    def __init__(self, batch_size=LOGIN_AUDIT_BATCH_SIZE, flush_interval=LOGIN_AUDIT_FLUSH_INTERVAL,
+                 max_size=LOGIN_AUDIT_QUEUE_SIZE):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval / 1000
+        self.queue = queue.Queue(maxsize=max_size)
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def start(self):
+        with self.lock:
+            if self.thread and self.thread.is_alive():
+                return
+            self.thread = threading.Thread(target=self.run, name='login-audit-writer')
+            self.thread.daemon = True
+            self.thread.start()
+
+    def submit(self, event):
+        self.start()
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            logger.warning(f"登录审计队列已满，丢弃用户 {event['user_id']} 的登录记录")
+
+    def collect(self):
+        """等待第一条事件，然后在刷新间隔内尽量攒满一批"""
+        events = [self.queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(events) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                events.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return events
+
+    def run(self):
+        while True:
+            events = self.collect()
+            try:
+                close_old_connections()
+                self.write(events)
+            except Exception as e:
+                logger.error(f"写入登录记录失败({len(events)} 条): {str(e)}")
+            finally:
+                close_old_connections()
+
+    def write(self, events):
+        LoginRecord.objects.bulk_create([
+            LoginRecord(
+                user_id=event['user_id'],
+                ip_address=event['ip_address'],
+                login_time=event['login_time'],
+                device_info=event['device_info'],
+            )
+            for event in events
+        ])
+
+        latest = {}
+        for event in events:
+            latest[event['user_id']] = event
+        User.objects.bulk_update([
+            User(
+                id=user_id,
+                last_login=event['login_time'],
+                last_login_ip=event['ip_address'],
+                ip_address=event['ip_address'],
+            )
+            for user_id, event in latest.items()
+        ], ['last_login', 'last_login_ip', 'ip_address'])
+
+    def flush(self):
+        """同步写入队列中剩余的事件（进程退出时调用）"""
+        events = []
+        while True:
+            try:
+                events.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        for i in range(0, len(events), self.batch_size):
+            try:
+                self.write(events[i:i + self.batch_size])
+            except Exception as e:
+                logger.error(f"写入登录记录失败: {str(e)}")
+
+
+login_audit_writer = LoginAuditWriter()
+atexit.register(login_audit_writer.flush)
+
+
+def record_login(user, request):
+    """
+    记录一次登录
+
+    立即更新 user 对象上的最后登录信息供本次响应使用，数据库写入由后台线程批量完成
+    """
+    now = timezone.now()
+    ip_address = get_client_ip(request)[:50] or '127.0.0.1'
+    user.last_login = now
+    user.last_login_ip = ip_address
+    user.ip_address = ip_address
+    login_audit_writer.submit({
+        'user_id': user.id,
+        'ip_address': ip_address,
+        'login_time': now,
+        'device_info': request.META.get('HTTP_USER_AGENT', '')[:255] or None,
+    })
+
+
+def prune_login_records(days=LOGIN_RECORD_RETENTION_DAYS, batch_size=5000):
+    """
+    删除超过保留天数的登录记录
+
+    按 login_time 索引分批删除，避免一次删除大量数据长时间锁表
+
+    返回:
+    - 删除的记录数
+    """
+    cutoff = timezone.now() - timedelta(days=days)
+    deleted = 0
+    while True:
+        ids = list(LoginRecord.objects.filter(login_time__lt=cutoff).order_by().values_list('id', flat=True)[:batch_size])
+        if not ids:
+            break
+        deleted += LoginRecord.objects.filter(id__in=ids).delete()[0]
+    logger.info(f"已清理 {days} 天前的登录记录 {deleted} 条")
+    return deleted
@@ -0,0 +1,134 @@
+"""
+停用、启用、删除用户时同步处理面板上的入站
+
+用户的节点（停用、启用代理时包括其下级代理和客户的节点）按面板分组，通过 run_fleet 在各面板上并发处理，
+每个面板只登录一次，在同一会话中批量操作：
+- disable: 停用入站（enable=false），节点状态改为 disabled
+- enable: 重新启用被停用的入站，已过期的节点不启用，状态改为 expired；
+  下级中被单独停用的代理、客户（is_active 为 False）及其下级的节点保持停用
+- delete: 删除入站，批量释放端口并移除入站索引，节点状态改为 deleted，节点记录随用户一起删除
+
+面板操作失败（面板离线、熔断中）的节点保持原状态并在结果中列出，可以重新执行，操作是幂等的；
+删除时只要有失败的节点，调用方就不删除用户，以便之后重试。
+"""
+import logging
+from collections import defaultdict
+
+from django.utils import timezone
+
+from panels.drivers import run_fleet
+from panels.inbound_index import unindex_inbounds
+from panels.models import AgentPanel
+from .migration_planner import release_ports
+from .models import NodeInfo, User
+
+logger = logging.getLogger(__name__)
+
+ENFORCEMENT_OPERATIONS = {
+    # 操作: (处理的节点状态, 面板操作)
+    'disable': (['active', 'orphaned'], 'set_inbounds_enabled'),
+    'enable': (['disabled'], 'set_inbounds_enabled'),
+    'delete': (['active', 'inactive', 'expired', 'pending', 'orphaned', 'disabled'], 'delete_inbounds'),
+}
+
+
+def get_user_tree_ids(user, active_only=False):
+    """
+    用户自身及其下级代理、客户的ID
+
+    参数:
+    - active_only: 为 True 时跳过已停用的下级用户及其整个下级
+    """
+    user_ids = [user.id]
+    parent_ids = [user.id]
+    while parent_ids:
+        children = User.objects.filter(parent_id__in=parent_ids)
+        if active_only:
+            children = children.filter(is_active=True)
+        parent_ids = list(children.values_list('id', flat=True))
+        user_ids.extend(parent_ids)
+    return user_ids
+
+
+def enforce_user_nodes(user, operation):
+    """
+    把用户状态的变化同步到面板
+
+    参数:
+    - operation: 'disable'、'enable' 或 'delete'
+
+    返回:
+    - {'nodes', 'panels', 'updated', 'expired', 'failed': [{'node_id', 'panel_id', 'error'}]}
+    """
+    statuses, panel_operation = ENFORCEMENT_OPERATIONS[operation]
+    now = timezone.now()
+    # 删除用户时下级用户会保留（parent 置空），只处理用户自己的节点
+    # 启用时单独停用的下级用户不随上级一起启用
+    user_ids = [user.id] if operation == 'delete' else get_user_tree_ids(user, active_only=operation == 'enable')
+    nodes = list(NodeInfo.objects.filter(
+        user_id__in=user_ids, status__in=statuses
+    ).only('id', 'panel_id', 'panel_node_id', 'port', 'status', 'expiry_time'))
+
+    summary = {'nodes': len(nodes), 'panels': 0, 'updated': 0, 'expired': 0, 'failed': []}
+    expired = []
+    nodes_by_panel = defaultdict(list)
+    local_only = []
+    for node in nodes:
+        if operation == 'enable' and node.expiry_time and node.expiry_time <= now:
+            # 已过期的节点不再启用
+            node.status = 'expired'
+            expired.append(node)
+        elif node.panel_id and node.panel_node_id:
+            nodes_by_panel[node.panel_id].append(node)
+        else:
+            local_only.append(node)
+
+    panels = list(AgentPanel.objects.filter(id__in=list(nodes_by_panel)))
+    summary['panels'] = len(panels)
+    for panel_id in set(nodes_by_panel) - {panel.id for panel in panels}:
+        # 面板已被删除，入站已不存在
+        local_only.extend(nodes_by_panel.pop(panel_id))
+
+    panel_args = {}
+    for panel in panels:
+        inbound_ids = [node.panel_node_id for node in nodes_by_panel[panel.id]]
+        panel_args[panel.id] = (inbound_ids, operation == 'enable') if operation != 'delete' else (inbound_ids,)
+    outcomes = run_fleet(panels, panel_operation, panel_args=panel_args) if panels else {}
+
+    succeeded = list(local_only)
+    for panel in panels:
+        result, error = outcomes[panel.id]
+        panel_nodes = nodes_by_panel[panel.id]
+        if error is not None:
+            logger.error(f"面板 {panel.id} 处理用户 {user.id} 的节点失败: {str(error)}")
+            summary['failed'].extend({'node_id': node.id, 'panel_id': panel.id, 'error': str(error)} for node in panel_nodes)
+            continue
+        done = set(result['done']) | set(result['missing'])
+        panel_succeeded = []
+        for node in panel_nodes:
+            if node.panel_node_id in done:
+                panel_succeeded.append(node)
+            else:
+                summary['failed'].append({
+                    'node_id': node.id, 'panel_id': panel.id,
+                    'error': result['failed'].get(node.panel_node_id, '未知错误'),
+                })
+        succeeded.extend(panel_succeeded)
+
+        if operation == 'delete' and panel_succeeded:
+            try:
+                unindex_inbounds(panel.id, [node.panel_node_id for node in panel_succeeded])
+                release_ports(panel, [node.port for node in panel_succeeded])
+            except Exception as e:
+                logger.error(f"释放面板 {panel.id} 端口失败: {str(e)}")
+
+    # 删除成功的节点标记为 deleted，重试删除时不会再次释放已经可能分配给其他节点的端口
+    new_status = {'disable': 'disabled', 'enable': 'active', 'delete': 'deleted'}[operation]
+    for node in succeeded:
+        node.status = new_status
+    NodeInfo.objects.bulk_update(succeeded + expired, ['status'], batch_size=1000)
+    summary['updated'] = len(succeeded)
+    summary['expired'] = len(expired)
+    logger.info(f"用户 {user.id} {operation} 节点处理完成: 共 {summary['nodes']} 个，成功 {summary['updated']} 个，"
+                f"失败 {len(summary['failed'])} 个")
+    return summary
@@ -0,0 +1,188 @@
+"""
+接口幂等
+
+余额下单等会扣款、开通节点的接口用 idempotent 装饰，同一用户同一幂等键的请求只执行一次：
+- 幂等键优先取请求头 Idempotency-Key，其次取请求体 idempotencyKey；
+  客户端没有提供时按 用户 + 请求内容 + IDEMPOTENCY_DERIVED_WINDOW 秒的时间窗口派生，
+  用来拦截重复点击和超时后的自动重试
+- 第一次请求在 IdempotencyRecord 中占用幂等键（数据库唯一约束保证并发请求只有一个能占用），
+  成功（2xx）后保存响应，之后的重试只查询一次数据库并直接返回保存的响应（响应头 Idempotent-Replayed: true）
+- 第一次请求还在处理时，重试返回 409；同一幂等键用于内容不同的请求时返回 422
+- 接口在扣款等不可撤销的操作完成后调用 mark_side_effect(request)：
+  - 标记之前返回 4xx/5xx 或抛出异常时释放幂等键，例如余额不足充值后、临时错误后可以直接重试
+  - 标记之后失败的响应同样保存并重放，抛出异常时保存一个 500 响应，避免重试时重复扣款
+
+prune_idempotency_records 按保留时间分批删除旧记录。
+"""
+import hashlib
+import json
+import logging
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyRecord
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_KEY_HEADER = 'HTTP_IDEMPOTENCY_KEY'
+IDEMPOTENCY_KEY_FIELD = 'idempotencyKey'
+# 客户端没有提供幂等键时，多少秒内内容相同的请求视为重复提交
+IDEMPOTENCY_DERIVED_WINDOW = getattr(settings, 'IDEMPOTENCY_DERIVED_WINDOW', 30)
+IDEMPOTENCY_RETENTION_HOURS = getattr(settings, 'IDEMPOTENCY_RETENTION_HOURS', 24)
+SIDE_EFFECT_ATTR = 'idempotency_side_effect'
+
+
+def get_request_hash(request):
+    """请求内容的摘要（不含幂等键本身）"""
+    data = request.data.dict() if hasattr(request.data, 'dict') else dict(request.data)
+    data.pop(IDEMPOTENCY_KEY_FIELD, None)
+    payload = json.dumps(data, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def get_client_key(request):
+    """客户端提供的幂等键，超长时取摘要"""
+    key = request.META.get(IDEMPOTENCY_KEY_HEADER) or request.data.get(IDEMPOTENCY_KEY_FIELD)
+    if not key:
+        return None
+    key = str(key).strip()
+    if len(key) > 100:
+        key = hashlib.sha256(key.encode()).hexdigest()
+    return key
+
+
+def derived_key(request_hash, bucket):
+    return f"auto:{bucket}:{request_hash[:40]}"
+
+
+def replay_response(record, request_hash):
+    """根据已有记录返回重试的响应"""
+    if record.request_hash != request_hash:
+        return Response({
+            'code': 422,
+            'message': '幂等键已用于其他请求',
+            'data': None
+        }, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+    if record.status != 'completed':
+        return Response({
+            'code': 409,
+            'message': '订单正在处理中，请勿重复提交',
+            'data': None
+        }, status=status.HTTP_409_CONFLICT)
+    return Response(json.loads(record.response), status=record.status_code, headers={'Idempotent-Replayed': 'true'})
+
+
+def mark_side_effect(request):
+    """标记本次请求已产生不可撤销的操作（如已扣款），之后失败也不再释放幂等键"""
+    setattr(request, SIDE_EFFECT_ATTR, True)
+
+
+def save_response(record, status_code, data):
+    record.status = 'completed'
+    record.status_code = status_code
+    record.response = json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False)
+    record.save(update_fields=['status', 'status_code', 'response', 'updated_at'])
+
+
+def claim_key(user, scope, key, request_hash):
+    """
+    占用幂等键
+
+    返回:
+    - (记录, None): 占用成功，继续执行接口
+    - (None, 响应): 幂等键已被占用，直接返回该响应
+    """
+    for _ in range(2):
+        try:
+            with transaction.atomic():
+                return IdempotencyRecord.objects.create(user=user, scope=scope, key=key, request_hash=request_hash), None
+        except IntegrityError:
+            record = IdempotencyRecord.objects.filter(user=user, scope=scope, key=key).first()
+            if record is not None:
+                return None, replay_response(record, request_hash)
+            # 占用的请求刚刚失败并释放了幂等键，重新占用
+    return None, Response({
+        'code': 409,
+        'message': '订单正在处理中，请勿重复提交',
+        'data': None
+    }, status=status.HTTP_409_CONFLICT)
+
+
+def idempotent(scope):
+    """
+    接口幂等装饰器，放在 api_view / permission_classes 之下
+
+    参数:
+    - scope: 接口名称，不同接口的幂等键互不影响
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            user = request.user
+            request_hash = get_request_hash(request)
+            key = get_client_key(request)
+            if key is None:
+                now = timezone.now()
+                bucket = int(now.timestamp()) // IDEMPOTENCY_DERIVED_WINDOW
+                key = derived_key(request_hash, bucket)
+                # 时间窗口边界两侧的重复提交也要拦截
+                previous = IdempotencyRecord.objects.filter(
+                    user=user, scope=scope, key=derived_key(request_hash, bucket - 1),
+                    created_at__gte=now - timedelta(seconds=IDEMPOTENCY_DERIVED_WINDOW)
+                ).first()
+                if previous is not None:
+                    logger.info(f"用户 {user.id} 重复提交 {scope}，返回已有结果")
+                    return replay_response(previous, request_hash)
+
+            record, replay = claim_key(user, scope, key, request_hash)
+            if replay is not None:
+                logger.info(f"用户 {user.id} 重复提交 {scope}（幂等键 {key}），返回已有结果")
+                return replay
+
+            try:
+                response = view(request, *args, **kwargs)
+            except Exception:
+                if getattr(request, SIDE_EFFECT_ATTR, False):
+                    save_response(record, status.HTTP_500_INTERNAL_SERVER_ERROR, {
+                        'code': 500,
+                        'message': '订单处理异常，请联系管理员',
+                        'data': None
+                    })
+                else:
+                    record.delete()
+                raise
+
+            if not 200 <= response.status_code < 300 and not getattr(request, SIDE_EFFECT_ATTR, False):
+                # 没有产生副作用的失败响应不保存，释放幂等键允许重试
+                record.delete()
+                return response
+
+            save_response(record, response.status_code, response.data)
+            return response
+        return wrapper
+    return decorator
+
+
+def prune_idempotency_records(hours=IDEMPOTENCY_RETENTION_HOURS, batch_size=5000):
+    """
+    删除超过保留时间的幂等记录
+
+    返回:
+    - 删除的记录数
+    """
+    cutoff = timezone.now() - timedelta(hours=hours)
+    deleted = 0
+    while True:
+        ids = list(IdempotencyRecord.objects.filter(created_at__lt=cutoff).order_by().values_list('id', flat=True)[:batch_size])
+        if not ids:
+            break
+        deleted += IdempotencyRecord.objects.filter(id__in=ids).delete()[0]
+    logger.info(f"已清理 {hours} 小时前的幂等记录 {deleted} 条")
+    return deleted
@@ -0,0 +1,101 @@
+"""
+余额账本
+
+所有余额变动都通过 change_balance 完成：
+- 在数据库中用 F() 表达式原子更新余额，扣款时附带余额条件，避免并发请求读到旧余额后重复扣款
+- 每次变动写入一条 BalanceTransaction 流水，记录变动后余额
+- reconcile_balances 定期核对用户余额与流水是否一致
+"""
+import logging
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F, Sum
+
+from .models import User, BalanceTransaction
+
+logger = logging.getLogger(__name__)
+
+
+class InsufficientBalance(Exception):
+    """余额不足"""
+    pass
+
+
+def change_balance(user, amount, transaction_type, order_no=None, operator=None, remark=None, allow_negative=False):
+    """
+    原子修改用户余额并记录流水
+
+    参数:
+    - user: 用户对象，成功后会同步更新其 balance 属性
+    - amount: 变动金额，正数为增加，负数为减少
+    - transaction_type: 流水类型，见 BalanceTransaction.TRANSACTION_TYPE_CHOICES
+    - allow_negative: 是否允许扣款后余额为负（代理成本扣除沿用原有逻辑，允许为负）
+
+    返回:
+    - BalanceTransaction 流水对象
+
+    异常:
+    - InsufficientBalance: 余额不足且不允许为负
+    """
+    amount = Decimal(str(amount)).quantize(Decimal('0.01'))
+    with transaction.atomic():
+        queryset = User.objects.filter(id=user.id)
+        if amount < 0 and not allow_negative:
+            queryset = queryset.filter(balance__gte=-amount)
+        if not queryset.update(balance=F('balance') + amount):
+            raise InsufficientBalance('余额不足')
+        # UPDATE 已持有行锁，事务内读取到的就是本次变动后的余额
+        balance_after = User.objects.filter(id=user.id).values_list('balance', flat=True).get()
+        record = BalanceTransaction.objects.create(
+            user_id=user.id,
+            amount=amount,
+            balance_after=balance_after,
+            transaction_type=transaction_type,
+            order_no=order_no,
+            operator=operator,
+            remark=remark,
+        )
+    user.balance = balance_after
+    return record
+
+
+def reconcile_balances(user_ids=None):
+    """
+    核对用户余额与流水
+
+    对每个有流水的用户检查：
+    - 当前余额是否等于最后一条流水的变动后余额（发现绕过账本的修改）
+    - 流水金额之和是否等于首尾余额之差（发现流水缺失或被篡改）
+
+    返回:
+    - 不一致的用户列表，每项为 {'user_id', 'username', 'balance', 'ledger_balance', 'reason'}
+    """
+    mismatches = []
+    users = User.objects.filter(balance_transactions__isnull=False).distinct()
+    if user_ids:
+        users = users.filter(id__in=user_ids)
+
+    for user in users.only('id', 'username', 'balance').iterator(chunk_size=500):
+        records = BalanceTransaction.objects.filter(user_id=user.id).order_by('id')
+        first = records.first()
+        last = records.last()
+        total = records.aggregate(total=Sum('amount'))['total'] or Decimal('0')
+        opening_balance = first.balance_after - first.amount
+
+        reason = None
+        if user.balance != last.balance_after:
+            reason = '余额与最后一条流水不一致'
+        elif opening_balance + total != last.balance_after:
+            reason = '流水金额之和与余额变化不一致'
+
+        if reason:
+            logger.warning(f"用户 {user.username} 余额核对失败: {reason}，余额 {user.balance}，流水余额 {last.balance_after}")
+            mismatches.append({
+                'user_id': user.id,
+                'username': user.username,
+                'balance': user.balance,
+                'ledger_balance': last.balance_after,
+                'reason': reason,
+            })
+    return mismatches
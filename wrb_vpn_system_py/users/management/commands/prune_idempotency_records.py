@@ -0,0 +1,25 @@
+"""
+清理过期的接口幂等记录
+
+使用方法：
+    python manage.py prune_idempotency_records
+    python manage.py prune_idempotency_records --hours 48
+
+可加入 crontab 定期执行，例如每小时一次：
+    15 * * * * cd /path/to/wrb_vpn_system_py && python manage.py prune_idempotency_records
+"""
+from django.core.management.base import BaseCommand
+
+from users.idempotency import prune_idempotency_records, IDEMPOTENCY_RETENTION_HOURS
+
+
+class Command(BaseCommand):
+    help = '清理超过保留时间的接口幂等记录'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=IDEMPOTENCY_RETENTION_HOURS, help='保留小时数')
+        parser.add_argument('--batch-size', type=int, default=5000, help='每批删除的记录数')
+
+    def handle(self, *args, **options):
+        deleted = prune_idempotency_records(hours=options['hours'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"已删除 {deleted} 条幂等记录"))
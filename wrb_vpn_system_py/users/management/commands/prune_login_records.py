@@ -0,0 +1,25 @@
+"""
+清理过期的登录记录
+
+使用方法：
+    python manage.py prune_login_records
+    python manage.py prune_login_records --days 90
+
+可加入 crontab 定期执行，例如每天凌晨：
+    30 3 * * * cd /path/to/wrb_vpn_system_py && python manage.py prune_login_records
+"""
+from django.core.management.base import BaseCommand
+
+from users.audit import prune_login_records, LOGIN_RECORD_RETENTION_DAYS
+
+
+class Command(BaseCommand):
+    help = '清理超过保留天数的登录记录'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=LOGIN_RECORD_RETENTION_DAYS, help='保留天数')
+        parser.add_argument('--batch-size', type=int, default=5000, help='每批删除的记录数')
+
+    def handle(self, *args, **options):
+        deleted = prune_login_records(days=options['days'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"已删除 {deleted} 条登录记录"))
@@ -0,0 +1,33 @@
+"""
+核对用户余额与余额流水
+
+使用方法：
+    python manage.py reconcile_balances
+    python manage.py reconcile_balances --user 12 15
+
+可加入 crontab 定期执行，例如每天凌晨：
+    0 3 * * * cd /path/to/wrb_vpn_system_py && python manage.py reconcile_balances
+"""
+from django.core.management.base import BaseCommand
+
+from users.ledger import reconcile_balances
+
+
+class Command(BaseCommand):
+    help = '核对用户余额与余额流水是否一致'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, nargs='*', help='只核对指定用户ID')
+
+    def handle(self, *args, **options):
+        mismatches = reconcile_balances(options['user'])
+        if not mismatches:
+            self.stdout.write(self.style.SUCCESS('余额核对完成，未发现不一致'))
+            return
+
+        for item in mismatches:
+            self.stdout.write(self.style.WARNING(
+                f"用户 {item['username']}(ID:{item['user_id']}) {item['reason']}："
+                f"余额 {item['balance']}，流水余额 {item['ledger_balance']}"
+            ))
+        self.stdout.write(self.style.ERROR(f"共 {len(mismatches)} 个用户余额不一致"))
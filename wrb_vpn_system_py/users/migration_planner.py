@@ -0,0 +1,607 @@
+"""
+节点批量迁移计划器
+
+change_order_panel 等批量迁移场景下：
+- 每个目标面板只探测一次版本/出站能力（x-ui 的xray版本、3x-ui 的socks出站标签）
+- 每个目标面板一次性为所有节点预留端口，只写一次 used_ports
+- 在有界线程池中执行迁移，同一面板的节点共享一个登录会话，并按面板限流
+- 迁移结束后每个目标面板只登记一次 xray 重启，由重启调度器合并执行
+- 单个节点迁移失败时回滚该节点的数据库记录并释放预留端口
+- 迁移进度写入缓存，可通过 migration_progress 接口查询
+"""
+import json
+import random
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from panels.inbound_index import unindex_inbound
+from panels.models import AgentPanel
+from .models import NodeInfo
+from .node_migration import migrate_node
+from .panel_session import get_login_cookie, make_request_with_cookie, update_single_panel
+from .restarts import schedule_xray_restart
+
+logger = logging.getLogger(__name__)
+
+# 线程池大小和单个目标面板的并发上限，可在settings中覆盖
+MIGRATION_MAX_WORKERS = getattr(settings, 'MIGRATION_MAX_WORKERS', 8)
+MIGRATION_PER_PANEL_LIMIT = getattr(settings, 'MIGRATION_PER_PANEL_LIMIT', 4)
+# 整面板疏散时每批迁移的节点数量
+EVACUATION_BATCH_SIZE = getattr(settings, 'EVACUATION_BATCH_SIZE', 50)
+# 进度信息在缓存中的保留时间（秒）
+MIGRATION_PROGRESS_TTL = 24 * 60 * 60
+# 疏散进行中每隔多少秒刷新一次心跳，超过多少秒没有心跳视为执行疏散的进程已经退出，可以重新执行
+EVACUATION_HEARTBEAT_INTERVAL = getattr(settings, 'EVACUATION_HEARTBEAT_INTERVAL', 30)
+EVACUATION_STALE_SECONDS = getattr(settings, 'EVACUATION_STALE_SECONDS', 300)
+
+# 迁移时需要快照并在失败时回滚的节点字段
+ROLLBACK_FIELDS = ['host', 'host_config', 'port', 'panel_id', 'panel_node_id', 'status', 'config_text', 'udp_config']
+
+PANEL_HEADERS = {
+    'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
+    'Accept': 'application/json, text/plain, */*',
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/134.0.0.0 Safari/537.36',
+}
+
+
+def get_panel_info(panel):
+    """构建面板登录信息"""
+    return {
+        'ip': panel.ip_address,
+        'username': panel.username,
+        'password': panel.password,
+        'panel_type': panel.panel_type
+    }
+
+
+def parse_used_ports(used_ports):
+    """将逗号分隔的端口字符串解析为整数列表"""
+    if not used_ports:
+        return []
+    return [int(port) for port in used_ports.split(',') if port.strip().isdigit()]
+
+
+def reserve_ports(panel, wanted_ports):
+    """
+    为一批节点一次性预留端口
+
+    参数:
+    - panel: 目标面板
+    - wanted_ports: 期望使用的端口列表（通常是节点原端口），被占用时随机分配新端口
+
+    返回:
+    - 与 wanted_ports 一一对应的实际端口列表
+    """
+    with transaction.atomic():
+        locked_panel = AgentPanel.objects.select_for_update().get(id=panel.id)
+        used_ports = parse_used_ports(locked_panel.used_ports)
+        used_set = set(used_ports)
+        reserved = []
+        for port in wanted_ports:
+            random_port = port
+            while not random_port or random_port in used_set:
+                random_port = random.randint(1, 65534)
+            used_set.add(random_port)
+            used_ports.append(random_port)
+            reserved.append(random_port)
+        locked_panel.used_ports = ','.join(map(str, used_ports))
+        locked_panel.save(update_fields=['used_ports'])
+    panel.used_ports = locked_panel.used_ports
+    return reserved
+
+
+def release_ports(panel, ports):
+    """释放预留但未使用的端口"""
+    if not ports:
+        return
+    release_set = set(int(port) for port in ports)
+    with transaction.atomic():
+        locked_panel = AgentPanel.objects.select_for_update().get(id=panel.id)
+        used_ports = [port for port in parse_used_ports(locked_panel.used_ports) if port not in release_set]
+        locked_panel.used_ports = ','.join(map(str, used_ports))
+        locked_panel.save(update_fields=['used_ports'])
+    panel.used_ports = locked_panel.used_ports
+
+
+def get_progress_key(job_id):
+    return f'migration_progress:{job_id}'
+
+
+def get_migration_progress(job_id):
+    """获取迁移任务进度，不存在时返回None"""
+    return cache.get(get_progress_key(job_id))
+
+
+class MigrationPlanner:
+    """
+    节点批量迁移计划器
+
+    用法:
+        planner = MigrationPlanner()
+        planner.add(node, new_panel)
+        planner.prepare()
+        planner.start()  # 后台执行，或 planner.execute() 同步执行
+    """
+
+    def __init__(self, job_id=None, max_workers=None, per_panel_limit=None):
+        self.job_id = job_id or uuid.uuid4().hex
+        self.max_workers = max_workers or MIGRATION_MAX_WORKERS
+        self.per_panel_limit = per_panel_limit or MIGRATION_PER_PANEL_LIMIT
+        # 待迁移的 (节点, 目标面板)
+        self.assignments = []
+        # 准备完成后的迁移任务
+        self.tasks = []
+        # 按目标面板ID缓存的能力信息、面板对象、锁和信号量
+        self.capabilities = {}
+        self.panels = {}
+        self.xray_locks = {}
+        self.panel_semaphores = {}
+        self.progress_lock = threading.Lock()
+        self.progress = {
+            'job_id': self.job_id,
+            'status': 'pending',
+            'total': 0,
+            'succeeded': 0,
+            'failed': 0,
+            'skipped': 0,
+            'rolled_back': 0,
+            'nodes': {},
+            'started_at': None,
+            'finished_at': None,
+        }
+
+    def add(self, node, new_panel):
+        """添加一个待迁移节点"""
+        self.panels.setdefault(new_panel.id, new_panel)
+        self.assignments.append((node, self.panels[new_panel.id]))
+
+    def add_prepared(self, node, panel):
+        """
+        添加一个已经完成准备（端口和配置已写入）但未执行的节点，用于中断后恢复
+
+        这类节点没有迁移前的快照，失败时不回滚，只标记为失败
+        """
+        panel = self.panels.setdefault(panel.id, panel)
+        self.init_panel_sync(panel.id)
+        self.tasks.append({'node': node, 'panel': panel, 'snapshot': None, 'port': node.port})
+        self.progress['nodes'][node.id] = 'pending'
+
+    def init_panel_sync(self, panel_id):
+        """初始化目标面板的xray配置锁和并发信号量"""
+        self.xray_locks.setdefault(panel_id, threading.Lock())
+        self.panel_semaphores.setdefault(panel_id, threading.Semaphore(self.per_panel_limit))
+
+    def probe_capabilities(self, panel, need_version=False):
+        """
+        探测目标面板能力，每个面板只请求一次
+
+        返回:
+        - {'xray_version': 版本号或None, 'servers': socks出站列表}，探测失败返回None
+        """
+        if panel.id in self.capabilities:
+            return self.capabilities[panel.id]
+
+        panel_info = get_panel_info(panel)
+        capabilities = {'xray_version': None, 'servers': []}
+        try:
+            # 建立共享会话，后续所有迁移复用该cookie
+            if not panel.cookie and not get_login_cookie(panel, panel_info):
+                logger.error(f"无法获取面板 {panel.id} 的cookie")
+                self.capabilities[panel.id] = None
+                return None
+
+            if panel.panel_type == 'x-ui':
+                if need_version:
+                    response = make_request_with_cookie(
+                        panel, panel_info, f"http://{panel.ip_address}/server/status", dict(PANEL_HEADERS), method='post'
+                    )
+                    if response.status_code != 200:
+                        logger.error(f"面板 {panel.id} 版本检查失败，状态码: {response.status_code}")
+                        panel.is_online = False
+                        panel.save(update_fields=['is_online'])
+                        self.capabilities[panel.id] = None
+                        return None
+                    capabilities['xray_version'] = response.json().get('obj').get('xray').get('version')
+            else:
+                headers = dict(PANEL_HEADERS)
+                headers.update({
+                    'host': f'{panel.ip_address.split("/")[0]}',
+                    'Origin': f'http://{panel.ip_address.split("/")[0]}',
+                    'Referer': f'http://{panel.ip_address}/panel/'
+                })
+                response = make_request_with_cookie(
+                    panel, panel_info, f"http://{panel.ip_address}/panel/xray/", headers, method='post'
+                )
+                if response.status_code == 200:
+                    result = response.json()
+                    if result.get('success'):
+                        xray_setting = json.loads(result['obj'])['xraySetting']
+                        capabilities['servers'] = self.extract_socks_servers(xray_setting)
+                if not capabilities['servers']:
+                    logger.error(f"面板 {panel.id} 没有可用的socks出站")
+                    self.capabilities[panel.id] = None
+                    return None
+                random.shuffle(capabilities['servers'])
+        except Exception as e:
+            logger.error(f"探测面板 {panel.id} 能力失败: {str(e)}")
+            capabilities = None
+
+        self.capabilities[panel.id] = capabilities
+        return capabilities
+
+    @staticmethod
+    def extract_socks_servers(xray_setting):
+        """从xray配置中提取所有socks出站服务器"""
+        servers = []
+        for outbound in xray_setting.get('outbounds', []):
+            try:
+                if outbound.get('protocol') != 'socks':
+                    continue
+                outbound_settings = outbound.get('settings', {})
+                if isinstance(outbound_settings, str):
+                    outbound_settings = json.loads(outbound_settings)
+                servers_data = outbound_settings.get('servers', [])
+                if isinstance(servers_data, str):
+                    servers_data = json.loads(servers_data)
+                if not isinstance(servers_data, list):
+                    continue
+                for server in servers_data:
+                    users = server.get('users', [])
+                    if isinstance(users, str):
+                        users = json.loads(users)
+                    if users:
+                        servers.append({
+                            'address': server.get('address'),
+                            'port': server.get('port'),
+                            'user': users[0].get('user'),
+                            'pass': users[0].get('pass'),
+                            'tag': outbound.get('tag', '')
+                        })
+            except Exception as e:
+                logger.error(f"处理outbound数据时出错: {str(e)}")
+                continue
+        return servers
+
+    def prepare(self):
+        """
+        按目标面板分组探测能力、预留端口并更新节点记录
+
+        返回:
+        - 已准备好迁移的节点数量
+        """
+        grouped = {}
+        for node, panel in self.assignments:
+            grouped.setdefault(panel.id, []).append(node)
+
+        for panel_id, nodes in grouped.items():
+            panel = self.panels[panel_id]
+            need_version = panel.panel_type == 'x-ui' and any(node.protocol in ('vless', 'Vless') for node in nodes)
+            capabilities = self.probe_capabilities(panel, need_version=need_version)
+            if capabilities is None:
+                for node in nodes:
+                    self.progress['nodes'][node.id] = 'skipped'
+                    self.progress['skipped'] += 1
+                continue
+
+            ports = reserve_ports(panel, [node.port for node in nodes])
+            server_index = 0
+            prepared = []
+            for node, port in zip(nodes, ports):
+                snapshot = {field: getattr(node, field) for field in ROLLBACK_FIELDS}
+                new_config = json.loads(node.config_text)
+                new_host_config = {
+                    'id': panel.id,
+                    'ip': panel.ip_address,
+                    'username': panel.username,
+                    'password': panel.password,
+                    'panel_type': panel.panel_type,
+                    # 记录迁移来源面板，迁移中断后可据此找回未完成的节点
+                    'migrate_from': snapshot['panel_id'],
+                    'tag': '',
+                }
+                if panel.panel_type == 'x-ui':
+                    if node.protocol in ('vless', 'Vless'):
+                        if capabilities['xray_version'] == '25.3.6':
+                            new_config['settings']['clients'][0]['flow'] = ""
+                        else:
+                            new_config['settings']['clients'][0]['flow'] = "xtls-rprx-direct"
+                else:
+                    servers = capabilities['servers']
+                    new_host_config['tag'] = servers[server_index].get('tag', '')
+                    server_index = (server_index + 1) % len(servers)
+                    if new_config['protocol'] in ('vless', 'shadowsocks', 'vmess'):
+                        new_config['settings']['clients'][0]['email'] = new_config['settings']['clients'][0]['email'] + str(random.randint(1000, 9000))
+
+                new_config['port'] = port
+                node.port = port
+                node.host = panel.ip
+                node.host_config = json.dumps(new_host_config)
+                node.panel_node_id = None  # 清除旧的面板节点ID
+                node.status = 'pending'  # 设置为待处理状态
+                node.config_text = json.dumps(new_config)
+                node.panel_id = panel.id
+                prepared.append(node)
+                self.tasks.append({'node': node, 'panel': panel, 'snapshot': snapshot, 'port': port})
+                self.progress['nodes'][node.id] = 'pending'
+
+            NodeInfo.objects.bulk_update(
+                prepared, ['host_config', 'host', 'panel_id', 'panel_node_id', 'port', 'status', 'config_text']
+            )
+            self.init_panel_sync(panel_id)
+
+        self.progress['total'] = len(self.tasks) + self.progress['skipped']
+        self.save_progress()
+        return len(self.tasks)
+
+    def save_progress(self):
+        cache.set(get_progress_key(self.job_id), self.progress, MIGRATION_PROGRESS_TTL)
+
+    def update_progress(self, node_id, state):
+        with self.progress_lock:
+            self.progress['nodes'][node_id] = state
+            if state == 'success':
+                self.progress['succeeded'] += 1
+            elif state in ('failed', 'rolled_back'):
+                self.progress['failed'] += 1
+                if state == 'rolled_back':
+                    self.progress['rolled_back'] += 1
+            self.save_progress()
+
+    def rollback(self, task):
+        """
+        回滚单个节点：删除新面板上已创建的入站，恢复原记录并释放预留端口
+
+        入站ID优先使用 migrate_node 返回的值（x-ui 只有迁移成功时才写入节点记录），
+        其次使用节点记录上新写入的ID。入站删除失败时不释放端口，避免端口被重复分配。
+        """
+        node, panel, snapshot = task['node'], task['panel'], task['snapshot']
+        inbound_id = task.get('created_inbound_id')
+        if inbound_id is None:
+            node.refresh_from_db(fields=['panel_node_id'])
+            if node.panel_node_id and node.panel_node_id != snapshot['panel_node_id']:
+                inbound_id = node.panel_node_id
+
+        inbound_removed = True
+        if inbound_id is not None:
+            try:
+                if panel.panel_type == 'x-ui':
+                    url = f"http://{panel.ip_address}/xui/inbound/del/{inbound_id}"
+                else:
+                    url = f"http://{panel.ip_address}/panel/inbound/del/{inbound_id}"
+                make_request_with_cookie(panel, get_panel_info(panel), url, dict(PANEL_HEADERS), method='post')
+                unindex_inbound(panel.id, inbound_id)
+            except Exception as e:
+                inbound_removed = False
+                logger.error(f"删除节点 {node.id} 在面板 {panel.id} 上的入站 {inbound_id} 失败: {str(e)}")
+
+        for field, value in snapshot.items():
+            setattr(node, field, value)
+        node.save(update_fields=ROLLBACK_FIELDS)
+        if not inbound_removed:
+            logger.warning(f"面板 {panel.id} 上的入站 {inbound_id} 未删除，保留端口 {task['port']}")
+            return
+        try:
+            release_ports(panel, [task['port']])
+        except Exception as e:
+            logger.error(f"释放面板 {panel.id} 端口 {task['port']} 失败: {str(e)}")
+
+    def run_task(self, task):
+        node, panel = task['node'], task['panel']
+        with self.panel_semaphores[panel.id]:
+            self.update_progress(node.id, 'running')
+            task['created_inbound_id'] = migrate_node(
+                node, panel,
+                xray_lock=self.xray_locks[panel.id],
+                restart_xray=False,
+                refresh_panel=False,
+            )
+            if node.status == 'active':
+                self.update_progress(node.id, 'success')
+                return True
+            if task['snapshot'] is None:
+                self.update_progress(node.id, 'failed')
+                return False
+            try:
+                self.rollback(task)
+                self.update_progress(node.id, 'rolled_back')
+            except Exception as e:
+                logger.error(f"回滚节点 {node.id} 失败: {str(e)}")
+                self.update_progress(node.id, 'failed')
+            return False
+
+    def finalize(self, results):
+        """迁移结束后每个目标面板只登记一次xray重启并刷新一次节点数量"""
+        succeeded_panels = {task['panel'].id for task, ok in zip(self.tasks, results) if ok}
+        for panel_id in self.xray_locks:
+            panel = self.panels[panel_id]
+            if panel_id in succeeded_panels:
+                schedule_xray_restart(panel, f'批量迁移 {self.job_id}')
+            update_single_panel(panel)
+
+    def execute(self):
+        """在有界线程池中执行所有迁移任务"""
+        self.progress['status'] = 'running'
+        self.progress['started_at'] = timezone.now().isoformat()
+        self.save_progress()
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                results = list(executor.map(self.safe_run_task, self.tasks))
+            self.finalize(results)
+        finally:
+            with self.progress_lock:
+                self.progress['status'] = 'finished'
+                self.progress['finished_at'] = timezone.now().isoformat()
+                self.save_progress()
+        return self.progress
+
+    def safe_run_task(self, task):
+        try:
+            return self.run_task(task)
+        except Exception as e:
+            logger.error(f"迁移节点 {task['node'].id} 时出错: {str(e)}")
+            self.update_progress(task['node'].id, 'failed')
+            return False
+
+    def start(self):
+        """在后台线程中执行迁移"""
+        thread = threading.Thread(target=self.execute)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+
+def get_evacuation_key(panel_id):
+    return f'panel_evacuation:{panel_id}'
+
+
+def get_evacuation_progress(panel_id):
+    """获取面板疏散进度，不存在时返回None"""
+    return cache.get(get_evacuation_key(panel_id))
+
+
+def is_evacuation_running(progress):
+    """疏散是否仍在进行：状态为 running 且心跳没有过期"""
+    if not progress or progress.get('status') != 'running':
+        return False
+    heartbeat = progress.get('heartbeat_at')
+    return bool(heartbeat) and time.time() - heartbeat < EVACUATION_STALE_SECONDS
+
+
+def get_evacuation_targets(panel, target_ids=None):
+    """获取可接收疏散节点的目标面板：同国家、已启用且在线"""
+    targets = AgentPanel.objects.filter(
+        is_active=True, is_online=True, country=panel.country
+    ).exclude(id=panel.id)
+    if target_ids:
+        targets = targets.filter(id__in=target_ids)
+    return list(targets)
+
+
+def get_stranded_nodes(panel, targets):
+    """
+    查找上次疏散中断后遗留的节点：已写入目标面板配置但尚未在目标面板创建
+    """
+    stranded = []
+    candidates = NodeInfo.objects.filter(
+        status='pending', panel_node_id__isnull=True, panel_id__in=[target.id for target in targets]
+    )
+    for node in candidates:
+        try:
+            if json.loads(node.host_config).get('migrate_from') == panel.id:
+                stranded.append(node)
+        except (TypeError, ValueError):
+            continue
+    return stranded
+
+
+def evacuate_panel(panel, batch_size=None, target_ids=None, max_workers=None, per_panel_limit=None, batch_interval=2):
+    """
+    将面板上所有活跃节点迁移到同国家的其他面板
+
+    - 按目标面板当前节点数量（含本次已分配）选择负载最低的面板
+    - 分批迁移，每批使用一个迁移计划器，按目标面板限流
+    - 可重复执行：已迁移的节点不再属于该面板，上次中断遗留的节点会先被恢复
+
+    返回:
+    - 疏散进度字典
+    """
+    batch_size = batch_size or EVACUATION_BATCH_SIZE
+    progress = {
+        'panel_id': panel.id,
+        'status': 'running',
+        'total': NodeInfo.objects.filter(panel_id=panel.id, status='active').count(),
+        'succeeded': 0,
+        'failed': 0,
+        'skipped': 0,
+        'resumed': 0,
+        'batches': 0,
+        'current_job_id': None,
+        'started_at': timezone.now().isoformat(),
+        'finished_at': None,
+        'heartbeat_at': None,
+        'message': '',
+    }
+    progress_lock = threading.Lock()
+    stopped = threading.Event()
+
+    def save_progress():
+        with progress_lock:
+            progress['heartbeat_at'] = time.time()
+            cache.set(get_evacuation_key(panel.id), dict(progress), MIGRATION_PROGRESS_TTL)
+
+    def heartbeat():
+        # 单批迁移可能持续数分钟，后台定期刷新心跳，进程退出后心跳停止，疏散可被重新执行
+        while not stopped.wait(EVACUATION_HEARTBEAT_INTERVAL):
+            save_progress()
+
+    def run_planner(planner):
+        progress['current_job_id'] = planner.job_id
+        progress['batches'] += 1
+        save_progress()
+        planner.prepare()
+        result = planner.execute()
+        progress['succeeded'] += result['succeeded']
+        progress['failed'] += result['failed']
+        progress['skipped'] += result['skipped']
+        save_progress()
+
+    save_progress()
+    heartbeat_thread = threading.Thread(target=heartbeat, name=f'evacuation-heartbeat-{panel.id}')
+    heartbeat_thread.daemon = True
+    heartbeat_thread.start()
+
+    try:
+        targets = get_evacuation_targets(panel, target_ids)
+        if not targets:
+            progress['message'] = '没有同国家的可用目标面板'
+            return progress
+
+        # 恢复上次中断遗留的节点
+        stranded = get_stranded_nodes(panel, targets)
+        if stranded:
+            target_map = {target.id: target for target in targets}
+            planner = MigrationPlanner(max_workers=max_workers, per_panel_limit=per_panel_limit)
+            for node in stranded:
+                planner.add_prepared(node, target_map[node.panel_id])
+            progress['resumed'] = len(stranded)
+            progress['total'] += len(stranded)
+            run_planner(planner)
+
+        # 目标面板负载：当前节点数量 + 本次已分配数量
+        load = {target.id: target.nodes_count or 0 for target in targets}
+        attempted = set()
+        while True:
+            nodes = list(
+                NodeInfo.objects.filter(panel_id=panel.id, status='active')
+                .exclude(id__in=attempted)
+                .order_by('id')[:batch_size]
+            )
+            if not nodes:
+                break
+            planner = MigrationPlanner(max_workers=max_workers, per_panel_limit=per_panel_limit)
+            for node in nodes:
+                attempted.add(node.id)
+                target = min(targets, key=lambda t: load[t.id])
+                load[target.id] += 1
+                planner.add(node, target)
+            run_planner(planner)
+            # 批次之间稍作等待，避免目标面板压力过大
+            if batch_interval:
+                time.sleep(batch_interval)
+    except Exception as e:
+        logger.error(f"疏散面板 {panel.id} 失败: {str(e)}")
+        progress['message'] = str(e)
+    finally:
+        stopped.set()
+        progress['status'] = 'finished'
+        progress['finished_at'] = timezone.now().isoformat()
+        save_progress()
+    return progress
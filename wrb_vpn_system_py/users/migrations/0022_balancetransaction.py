@@ -0,0 +1,35 @@
+# Generated by Django 5.2 on 2026-10-19 12:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0021_user_last_login_ip_alter_user_ip_address'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BalanceTransaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='变动金额')),
+                ('balance_after', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='变动后余额')),
+                ('transaction_type', models.CharField(choices=[('recharge', '后台充值'), ('deduct', '后台扣除'), ('payment', '余额支付'), ('renewal', '余额续费'), ('agent_cost', '代理成本扣除'), ('refund', '退款')], max_length=20, verbose_name='变动类型')),
+                ('order_no', models.CharField(blank=True, db_index=True, max_length=100, null=True, verbose_name='关联订单号')),
+                ('remark', models.CharField(blank=True, max_length=255, null=True, verbose_name='备注')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('operator', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='operated_balance_transactions', to=settings.AUTH_USER_MODEL, verbose_name='操作人')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_transactions', to=settings.AUTH_USER_MODEL, verbose_name='用户')),
+            ],
+            options={
+                'verbose_name': '余额流水',
+                'verbose_name_plural': '余额流水',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['user', 'created_at'], name='users_balan_user_id_85b3c1_idx')],
+            },
+        ),
+    ]
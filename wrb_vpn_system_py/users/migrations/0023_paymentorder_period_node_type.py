@@ -0,0 +1,62 @@
+# Generated by Django 5.2 on 2026-10-19 13:20
+
+import json
+
+from django.db import migrations, models
+
+
+def backfill_param_fields(apps, schema_editor):
+    """从param中回填付费周期、节点类型，并补充为空的地区和协议"""
+    PaymentOrder = apps.get_model('users', 'PaymentOrder')
+    batch = []
+    fields = ['period', 'node_type', 'country', 'node_protocol']
+    for order in PaymentOrder.objects.exclude(param__isnull=True).exclude(param='').iterator(chunk_size=1000):
+        try:
+            param = json.loads(order.param)
+        except (TypeError, ValueError):
+            continue
+        if not isinstance(param, dict):
+            continue
+        order.period = (param.get('period') or '')[:20]
+        order.node_type = (param.get('nodeType') or '')[:20]
+        if not order.country:
+            order.country = param.get('region') or param.get('country') or order.country
+        if not order.node_protocol:
+            order.node_protocol = (param.get('protocol') or '')[:20] or order.node_protocol
+        batch.append(order)
+        if len(batch) >= 1000:
+            PaymentOrder.objects.bulk_update(batch, fields)
+            batch = []
+    if batch:
+        PaymentOrder.objects.bulk_update(batch, fields)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0022_balancetransaction'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paymentorder',
+            name='period',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=20, verbose_name='付费周期'),
+        ),
+        migrations.AddField(
+            model_name='paymentorder',
+            name='node_type',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=20, verbose_name='节点类型'),
+        ),
+        migrations.AlterField(
+            model_name='paymentorder',
+            name='country',
+            field=models.CharField(blank=True, db_index=True, max_length=100, null=True, verbose_name='节点国家'),
+        ),
+        migrations.AlterField(
+            model_name='paymentorder',
+            name='node_protocol',
+            field=models.CharField(blank=True, db_index=True, max_length=20, null=True, verbose_name='节点协议'),
+        ),
+        migrations.RunPython(backfill_param_fields, migrations.RunPython.noop),
+    ]
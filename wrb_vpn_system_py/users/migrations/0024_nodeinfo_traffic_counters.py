@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-19 15:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0023_paymentorder_period_node_type'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='nodeinfo',
+            name='traffic_up',
+            field=models.BigIntegerField(default=0, verbose_name='上次采样上行流量(字节)'),
+        ),
+        migrations.AddField(
+            model_name='nodeinfo',
+            name='traffic_down',
+            field=models.BigIntegerField(default=0, verbose_name='上次采样下行流量(字节)'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-19 16:05
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0024_nodeinfo_traffic_counters'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='loginrecord',
+            name='login_time',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='登录时间'),
+        ),
+        migrations.AddIndex(
+            model_name='loginrecord',
+            index=models.Index(fields=['user', 'login_time'], name='users_login_user_id_627bd2_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-19 19:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0026_alter_nodeinfo_status'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='nodeinfo',
+            name='status',
+            field=models.CharField(choices=[('active', '活跃'), ('inactive', '不活跃'), ('expired', '已过期'), ('deleted', '已删除'), ('pending', '待处理'), ('orphaned', '面板上已不存在'), ('disabled', '已停用')], default='active', max_length=20, verbose_name='节点状态'),
+        ),
+    ]
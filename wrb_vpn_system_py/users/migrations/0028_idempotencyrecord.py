@@ -0,0 +1,36 @@
+# Generated by Django 5.2 on 2026-10-19 20:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0027_alter_nodeinfo_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdempotencyRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(max_length=50, verbose_name='接口')),
+                ('key', models.CharField(max_length=100, verbose_name='幂等键')),
+                ('request_hash', models.CharField(max_length=64, verbose_name='请求摘要')),
+                ('status', models.CharField(choices=[('processing', '处理中'), ('completed', '已完成')], default='processing', max_length=20, verbose_name='状态')),
+                ('status_code', models.IntegerField(blank=True, null=True, verbose_name='响应状态码')),
+                ('response', models.TextField(blank=True, null=True, verbose_name='响应内容')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='idempotency_records', to=settings.AUTH_USER_MODEL, verbose_name='用户')),
+            ],
+            options={
+                'verbose_name': '幂等记录',
+                'verbose_name_plural': '幂等记录',
+                'indexes': [models.Index(fields=['created_at'], name='users_idemp_created_46d8ce_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'scope', 'key'), name='unique_idempotency_key')],
+            },
+        ),
+    ]
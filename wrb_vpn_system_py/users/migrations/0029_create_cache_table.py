@@ -0,0 +1,20 @@
+# Generated by Django 5.2 on 2026-10-19 21:10
+
+from django.core.management import call_command
+from django.db import migrations
+
+
+def create_cache_table(apps, schema_editor):
+    # 使用数据库缓存（未配置 REDIS_URL）时创建缓存表，表已存在或使用其他缓存后端时不做任何操作
+    call_command('createcachetable', database=schema_editor.connection.alias, verbosity=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0028_idempotencyrecord'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_cache_table, migrations.RunPython.noop),
+    ]
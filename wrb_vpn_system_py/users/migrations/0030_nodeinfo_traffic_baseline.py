@@ -0,0 +1,30 @@
+# Generated by Django 5.2 on 2026-10-19 21:25
+
+from django.db import migrations, models
+
+
+def clear_unsampled_counters(apps, schema_editor):
+    # 还没有采样过的节点计数为 0，改为空，下一次采样只记录基准
+    NodeInfo = apps.get_model('users', 'NodeInfo')
+    NodeInfo.objects.filter(traffic_up=0, traffic_down=0).update(traffic_up=None, traffic_down=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0029_create_cache_table'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='nodeinfo',
+            name='traffic_up',
+            field=models.BigIntegerField(blank=True, default=None, null=True, verbose_name='上次采样上行流量(字节)'),
+        ),
+        migrations.AlterField(
+            model_name='nodeinfo',
+            name='traffic_down',
+            field=models.BigIntegerField(blank=True, default=None, null=True, verbose_name='上次采样下行流量(字节)'),
+        ),
+        migrations.RunPython(clear_unsampled_counters, migrations.RunPython.noop),
+    ]
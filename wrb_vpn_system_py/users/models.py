@@ -1,7 +1,9 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.utils import timezone
 from panels.models import AgentPanel
 from datetime import datetime
+import json
 import random
 import string
 
@@ -159,13 +161,17 @@ class LoginRecord(models.Model):
     """登录记录"""
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='login_records', verbose_name='用户')
     ip_address = models.CharField(max_length=50, verbose_name='IP地址')
-    login_time = models.DateTimeField(auto_now_add=True, verbose_name='登录时间')
+    # 登录记录由后台批量写入，使用事件发生时间而不是写入时间
+    login_time = models.DateTimeField(default=timezone.now, db_index=True, verbose_name='登录时间')
     device_info = models.CharField(max_length=255, blank=True, null=True, verbose_name='设备信息')
     
     class Meta:
         verbose_name = '登录记录'
         verbose_name_plural = '登录记录'
         ordering = ['-login_time']
+        indexes = [
+            models.Index(fields=['user', 'login_time']),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - {self.login_time}"
@@ -227,9 +233,12 @@ class PaymentOrder(models.Model):
     amount = models.DecimalField(max_digits=10, decimal_places=2, verbose_name='商品金额')
     status = models.CharField(max_length=20, choices=PAYMENT_STATUS_CHOICES, default='pending', verbose_name='支付状态')
     param = models.TextField(blank=True, null=True, verbose_name='业务扩展参数')
-    country = models.CharField(max_length=100, blank=True, null=True, verbose_name='节点国家')
+    country = models.CharField(max_length=100, blank=True, null=True, db_index=True, verbose_name='节点国家')
     node_count = models.IntegerField(default=1, verbose_name='节点数量')
-    node_protocol = models.CharField(max_length=20, blank=True, null=True, verbose_name='节点协议')
+    node_protocol = models.CharField(max_length=20, blank=True, null=True, db_index=True, verbose_name='节点协议')
+    # 从param中提取的常用字段，便于筛选和展示，保存时自动同步
+    period = models.CharField(max_length=20, blank=True, default='', db_index=True, verbose_name='付费周期')
+    node_type = models.CharField(max_length=20, blank=True, default='', db_index=True, verbose_name='节点类型')
     is_processed = models.BooleanField(default=False, verbose_name='是否已处理')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
@@ -242,6 +251,44 @@ class PaymentOrder(models.Model):
     def __str__(self):
         return f"{self.out_trade_no}: {self.product_name} ({self.amount})"
 
+    def sync_param_fields(self):
+        """
+        从param中同步付费周期、节点类型、地区和协议字段
+
+        返回:
+        - 被修改的字段名列表
+        """
+        try:
+            param = json.loads(self.param) if self.param else {}
+        except (TypeError, ValueError):
+            return []
+        if not isinstance(param, dict):
+            return []
+
+        changed = []
+        values = {
+            'period': param.get('period'),
+            'node_type': param.get('nodeType'),
+            'country': param.get('region') or param.get('country'),
+            'node_protocol': param.get('protocol'),
+        }
+        for field, value in values.items():
+            # 地区和协议以已有字段为准，只在为空时补充
+            if field in ('country', 'node_protocol') and getattr(self, field):
+                continue
+            if value and getattr(self, field) != value:
+                setattr(self, field, value)
+                changed.append(field)
+        return changed
+
+    def save(self, *args, **kwargs):
+        """保存时同步param中的字段，读取时无需再解析JSON"""
+        changed = self.sync_param_fields()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'param' in update_fields and changed:
+            kwargs['update_fields'] = list(set(update_fields) | set(changed))
+        super().save(*args, **kwargs)
+
 
 class NodeInfo(models.Model):
     """节点信息模型"""
@@ -259,6 +306,8 @@ class NodeInfo(models.Model):
         ('expired', '已过期'),
         ('deleted', '已删除'),
         ('pending', '待处理'),
+        ('orphaned', '面板上已不存在'),
+        ('disabled', '已停用'),
     ]
     
     order = models.ForeignKey(PaymentOrder, on_delete=models.CASCADE, related_name='nodes', verbose_name='关联订单')
@@ -281,6 +330,9 @@ class NodeInfo(models.Model):
     udp = models.BooleanField(default=False, verbose_name='是否支持UDP')
     udp_config = models.TextField(blank=True, null=True, verbose_name='UDP配置信息')
     udp_host = models.CharField(max_length=255, blank=True, null=True, verbose_name='UDP中转主机')
+    # 为空表示还没有采样过，第一次采样只记录基准
+    traffic_up = models.BigIntegerField(null=True, blank=True, default=None, verbose_name='上次采样上行流量(字节)')
+    traffic_down = models.BigIntegerField(null=True, blank=True, default=None, verbose_name='上次采样下行流量(字节)')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
     
@@ -303,6 +355,69 @@ class NodeInfo(models.Model):
         super().save(*args, **kwargs)
 
 
+class BalanceTransaction(models.Model):
+    """余额流水，每次余额变动都记录一条"""
+    TRANSACTION_TYPE_CHOICES = [
+        ('recharge', '后台充值'),
+        ('deduct', '后台扣除'),
+        ('payment', '余额支付'),
+        ('renewal', '余额续费'),
+        ('agent_cost', '代理成本扣除'),
+        ('refund', '退款'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='balance_transactions', verbose_name='用户')
+    amount = models.DecimalField(max_digits=10, decimal_places=2, verbose_name='变动金额')  # 正数为增加，负数为减少
+    balance_after = models.DecimalField(max_digits=10, decimal_places=2, verbose_name='变动后余额')
+    transaction_type = models.CharField(max_length=20, choices=TRANSACTION_TYPE_CHOICES, verbose_name='变动类型')
+    order_no = models.CharField(max_length=100, blank=True, null=True, db_index=True, verbose_name='关联订单号')
+    operator = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='operated_balance_transactions', verbose_name='操作人')
+    remark = models.CharField(max_length=255, blank=True, null=True, verbose_name='备注')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
+
+    class Meta:
+        verbose_name = '余额流水'
+        verbose_name_plural = '余额流水'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} {self.amount} -> {self.balance_after}"
+
+
+class IdempotencyRecord(models.Model):
+    """接口幂等记录，同一用户同一幂等键的请求只执行一次，重试时返回保存的响应"""
+    STATUS_CHOICES = [
+        ('processing', '处理中'),
+        ('completed', '已完成'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='idempotency_records', verbose_name='用户')
+    scope = models.CharField(max_length=50, verbose_name='接口')
+    key = models.CharField(max_length=100, verbose_name='幂等键')
+    request_hash = models.CharField(max_length=64, verbose_name='请求摘要')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='processing', verbose_name='状态')
+    status_code = models.IntegerField(null=True, blank=True, verbose_name='响应状态码')
+    response = models.TextField(null=True, blank=True, verbose_name='响应内容')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
+
+    class Meta:
+        verbose_name = '幂等记录'
+        verbose_name_plural = '幂等记录'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'scope', 'key'], name='unique_idempotency_key'),
+        ]
+        indexes = [
+            models.Index(fields=['created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} {self.scope} {self.key} ({self.status})"
+
+
 class Invoice(models.Model):
     """发票模型"""
     INVOICE_STATUS_CHOICES = [
@@ -0,0 +1,357 @@
+"""
+单个节点迁移
+
+migrate_node 把节点迁移到新面板：在新面板创建入站、绑定出站路由、更新节点记录和中转配置。
+旧面板上的入站不在这里删除，由调用方处理；批量迁移由 migration_planner 调度，失败时按返回的入站ID回滚。
+"""
+import json
+from django.conf import settings
+import random
+from panels.inbound_index import resolve_added_inbound_id
+import requests
+import logging
+import time
+from contextlib import nullcontext
+from transits.models import TransitAccount
+from .restarts import schedule_xray_restart
+from .panel_session import get_login_cookie, make_request_with_cookie, update_single_panel
+
+logger = logging.getLogger(__name__)
+
+
+def migrate_node(node, new_panel, xray_lock=None, restart_xray=True, refresh_panel=True):
+    """
+    迁移节点到新面板的异步处理函数
+
+    参数:
+    - xray_lock: 批量迁移时用于串行化同一面板xray配置读写的锁
+    - restart_xray: 是否在添加路由后登记重启xray，批量迁移时由计划器统一登记
+    - refresh_panel: 是否在迁移后刷新面板节点数量和已用端口，批量迁移时由计划器统一刷新
+
+    返回:
+    - 在新面板上创建的入站ID，没有创建或无法获取时返回None；迁移失败时调用方据此删除入站
+    """
+    panel_node_id = None
+    try:
+        print(f"开始迁移节点 {node.id} 到面板 {new_panel.id}")
+        
+        # 解析节点配置
+        form_data = json.loads(node.config_text)
+        host_config = json.loads(node.host_config)
+        # 构建请求头
+        if new_panel.panel_type == 'x-ui':
+            url = f"http://{new_panel.ip_address}/xui/inbound/add"
+            headers = {
+                'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
+                'Accept': 'application/json, text/plain, */*',
+                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/96.0.4664.45 Safari/537.36',
+            }
+            
+        else:  # 3x-ui
+            url = f"http://{new_panel.ip_address}/panel/api/inbounds/add"
+            headers = {
+                'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
+                'Accept': 'application/json, text/plain, */*',
+                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/96.0.4664.45 Safari/537.36',
+            }
+        
+        # 获取登录cookie，已有会话时直接复用（批量迁移共享同一会话）
+        cookie = new_panel.cookie or get_login_cookie(new_panel, host_config)
+        if not cookie:
+            logger.error(f"获取面板登录cookie失败")
+            node.status = 'inactive'
+            node.save(update_fields=['status'])
+            return None
+        
+        # 解析config_text为JSON对象
+        form_data = json.loads(node.config_text)
+        
+        # 调整form_data格式，将嵌套对象转为字符串
+        nested_fields = ['settings', 'streamSettings', 'sniffing', 'allocate']
+        for field in nested_fields:
+            if field in form_data and isinstance(form_data[field], (dict, list)):
+                # 将对象转为JSON字符串
+                form_data[field] = json.dumps(form_data[field])
+        
+        
+        print('==form_data==',form_data)
+        response = make_request_with_cookie(new_panel,host_config, url, headers, method='post_params', 
+                            data=form_data)
+        
+        panel_node_id = None
+        
+        if response.status_code == 200:
+            try:
+                result = response.json()
+                
+                if result.get('success', False):
+                    logger.info(f"节点 {node.id} 在新面板创建成功")
+                    
+                    # 获取面板节点ID
+                    # 优先从添加接口的响应中获取入站ID，x-ui 旧版本不返回时再查询入站列表
+                    panel_node_id = resolve_added_inbound_id(new_panel, form_data, result)
+                    if new_panel.panel_type == '3x-ui':
+                        tag = result.get('obj', {}).get('tag')
+                        
+                        headers = {
+                                            'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
+                                            'host': f'{new_panel.ip_address.split("/")[0]}',
+                                            'Accept': 'application/json, text/plain, */*',
+                                            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/134.0.0.0 Safari/537.36',
+                                            'Origin': f'http://{new_panel.ip_address.split("/")[0]}',
+                                            'Referer': f'http://{new_panel.ip_address}/panel/'
+                                        }
+                                        
+                                        # 获取xray配置
+                        # 同一面板的xray配置读改写需要串行，避免并发迁移时互相覆盖路由规则
+                        with (xray_lock or nullcontext()):
+                            url = f"http://{new_panel.ip_address}/panel/xray/"
+                            response = make_request_with_cookie(new_panel, {
+                                                'ip': new_panel.ip_address,
+                                                'username': new_panel.username,
+                                                'password': new_panel.password,
+                                                'panel_type': new_panel.panel_type
+                                            }, url, headers, method='post')
+                        
+                            if response.status_code == 200:
+                                result = response.json()
+                                if result.get('success'):
+                                    # 获取xray配置
+                                    xraySetting = json.loads(result.get('obj', {}))
+                                    # 创建绑定出站规则和路由规则
+                                    # outbound_rules = 
+                                    xraySetting['xraySetting']['routing']['rules'].append({
+                                        "type": "field",
+                                        "outboundTag": host_config.get('tag'),
+                                        "inboundTag": [
+                                            tag
+                                        ]
+                                    })
+                                    update_data = {
+                                        'xraySetting': json.dumps(xraySetting.get('xraySetting'))
+                                    }
+                                    # 发送更新请求
+                                    update_response = make_request_with_cookie(
+                                        new_panel,
+                                        host_config,
+                                        f"http://{new_panel.ip_address}/panel/xray/update",
+                                        {
+                                            'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
+                                            'Accept': 'application/json, text/plain, */*',
+                                            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/134.0.0.0 Safari/537.36',
+                                        },
+                                        method='post',
+                                        data=update_data
+                                    )
+                                    if update_response.status_code == 200:
+                                        print(f"更新xray配置成功")
+                                    else:
+                                        print(f"更新xray配置失败: {update_response.text}")
+
+                        if restart_xray:
+                            schedule_xray_restart(new_panel, f'迁移节点 {node.id}')
+                        node.status = 'active'
+                        node.panel_node_id = panel_node_id
+                        node.save(update_fields=['status', 'panel_node_id'])
+                    if node.udp:
+                        print('==中转配置==',node.udp_config)
+                        try:
+                            # 解析 JSON 字符串
+                            udp_config_json = json.loads(node.udp_config)
+                            print('==旧的中转配置==',node.udp_config)
+                            # 获取配置信息
+                            udp_zhanghao = udp_config_json.get('config', {})
+                            udp_peizhi = udp_config_json.get('udpConfig', {})
+                            udp_search_dest_ip = json.loads(udp_peizhi.get('config')).get('dest')[0]
+                            udp_peizhi['config'] = json.dumps({
+                                            "dest": [f"{new_panel.ip}:{node.port}"]
+                                        })
+                            node.udp_config = json.dumps(
+                                {
+                                    'config': udp_zhanghao,
+                                    'udpConfig': udp_peizhi
+                                }
+                            )
+                            node.save(update_fields=['udp_config'])
+                            
+                            print('==新的中转配置==',node.udp_config)
+                            # 中转登录
+                            transit_account = TransitAccount.objects.get(id=udp_zhanghao.get('id'))
+                            auth_token = transit_account.token
+                            if not auth_token:
+                                print('==未登录，进入登录逻辑==')
+                                login_url = f"{settings.API_BASE_URL}/api/v1/auth/login"
+                                login_data = {
+                                    "username": udp_zhanghao.get('username'),
+                                    "password": udp_zhanghao.get('password')
+                                }
+                                headers_nyanpass = {
+                                    "Content-Type": "text/plain;charset=UTF-8",
+                                    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+                                    "Accept": "*/*",
+                                    "Origin": settings.API_BASE_URL,
+                                }
+                                login_response = requests.post(login_url, json=login_data, headers=headers_nyanpass)
+                                if login_response.status_code == 200:
+                                    login_result = login_response.json()
+                                    auth_token = login_result.get('data', {})
+                                    transit_account.token = auth_token
+                                    transit_account.save(update_fields=['token'])
+                            try:
+                                if auth_token:
+                                    # 创建转发
+                                    forward_headers = {
+                                        "Authorization": f"{auth_token}",
+                                        "Content-Type": "application/json"
+                                    }
+                                    
+                                    # 执行中转注册，添加重试机制
+                                    retry_count = 0
+                                    max_retries = 4  # 最大重试次数，加上首次请求总共尝试2次
+                                    forward_success = False
+
+                                    
+                                    search_rules_url = f"{settings.API_BASE_URL}/api/v1/user/forward/search_rules"
+                                    search_rules_data = {
+                                        "gid": 0,
+                                        "gid_in": 0,
+                                        "gid_out": 0,
+                                        "name": "",
+                                        "dest": udp_search_dest_ip,
+                                        "listen_port": 0
+                                    }
+                                    print('==search_rules_data==',search_rules_data)
+
+                                    while retry_count <= max_retries and not forward_success:
+                                        search_rules_response = requests.post(
+                                            search_rules_url,
+                                            headers=forward_headers,
+                                            json=search_rules_data
+                                        )
+                                        print('==search_rules_response==',search_rules_response.json())
+                                        print('==search_rules_response.status_code==',search_rules_response.status_code)
+                                        print('==search_rules_response.json().get("code")==',search_rules_response.json().get('code'))
+                                        if search_rules_response.status_code == 200 and search_rules_response.json().get('code') == 0:
+                                            search_rules_data = search_rules_response.json()
+                                            if search_rules_data.get('code') == 0 and search_rules_data.get('data'):
+                                                pass_data = search_rules_data.get('data')
+                                                print("===========pass_data============",pass_data)
+                                                for pass_item in pass_data:
+                                                    pass_item["config"] = json.dumps({
+                                                        "dest": [f"{new_panel.ip}:{node.port}"]
+                                                    })
+                                                    forward_headers = {
+                                                        "Authorization": f"{auth_token}",
+                                                        "Content-Type": "application/json"
+                                                    }
+                                                    print('==pass_item==',pass_item)
+                                                    res_change_forward = requests.post(
+                                                        f"{settings.API_BASE_URL}/api/v1/user/forward/{pass_item.get('id')}",
+                                                        headers=forward_headers,
+                                                        json=pass_item
+                                                    )
+                                                    retry_count_change_forward = 0
+                                                    max_retries_change_forward = 4
+                                                    forward_success_change_forward = False
+                                                    while retry_count_change_forward <= max_retries_change_forward and not forward_success_change_forward:
+                                                        if res_change_forward.status_code == 200 and res_change_forward.json().get('code') != 403:
+                                                            forward_success_change_forward = True
+                                                            break
+                                                        elif res_change_forward.status_code == 403 or res_change_forward.json().get('code') == 403:
+                                                            retry_count_change_forward+=1
+                                                            login_url = f"{settings.API_BASE_URL}/api/v1/auth/login"
+                                                            login_data = {
+                                                                "username": udp_zhanghao.get('username'),
+                                                                "password": udp_zhanghao.get('password')
+                                                            }
+                                                            headers_nyanpass = {
+                                                                "Content-Type": "text/plain;charset=UTF-8",
+                                                                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+                                                                "Accept": "*/*",
+                                                                "Origin": settings.API_BASE_URL,
+                                                            }
+                                                            login_response = requests.post(login_url, json=login_data, headers=headers_nyanpass)
+                                                            if login_response.status_code == 200:
+                                                                login_result = login_response.json()
+                                                                auth_token = login_result.get('data', {})
+                                                                transit_account.token = auth_token
+                                                                transit_account.save(update_fields=['token'])
+                                                                forward_headers = {
+                                                                    "Authorization": f"{auth_token}",
+                                                                    "Content-Type": "application/json"
+                                                                }
+                                                        else:
+                                                            retry_count_change_forward += 1
+                                                            if retry_count_change_forward <= max_retries_change_forward:
+                                                                time.sleep(random.uniform(3, 7))
+                                                                
+                                                forward_success = True
+                                                break
+                                        elif search_rules_response.status_code == 403 or search_rules_response.json().get('code') == 403 or retry_count==3:
+                                            print('==search_rules_response登录逻辑==',search_rules_response.status_code)
+                                            retry_count += 1
+                                            login_url = f"{settings.API_BASE_URL}/api/v1/auth/login"
+                                            login_data = {
+                                                "username": udp_zhanghao.get('username'),
+                                                "password": udp_zhanghao.get('password')
+                                            }
+                                            headers_nyanpass = {
+                                                "Content-Type": "text/plain;charset=UTF-8",
+                                                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+                                                "Accept": "*/*",
+                                                "Origin": settings.API_BASE_URL,
+                                            }
+                                            login_response = requests.post(login_url, json=login_data, headers=headers_nyanpass)
+                                            if login_response.status_code == 200:
+                                                login_result = login_response.json()
+                                                auth_token = login_result.get('data', {})
+                                                transit_account.token = auth_token
+                                                transit_account.save(update_fields=['token'])
+                                                forward_headers = {
+                                                        "Authorization": f"{auth_token}",
+                                                        "Content-Type": "application/json"
+                                                    }
+                                        else:
+                                            retry_count += 1
+                                            if retry_count <= max_retries:
+                                                # 随机等待0.5到1秒后重试
+                                                wait_time = random.uniform(5, 15)
+                                                logger.info(f"UDP转发更新失败，等待{wait_time:.2f}秒后进行第{retry_count+1}次尝试")
+                                                time.sleep(wait_time)
+                                            else:
+                                                logger.error(f"UDP转发更新失败，已重试{max_retries}次仍失败")
+                                else:
+                                    logger.error(f"中转登录失败: {login_response.text}")
+                            
+                            except Exception as e:
+                                logger.error(f"处理UDP中转配置时出错: {str(e)}")
+                        except Exception as e:
+                            logger.error(f"处理UDP配置时出错: {str(e)}")
+                # 更新节点状态
+                    if refresh_panel:
+                        update_single_panel(new_panel)
+                    if panel_node_id:
+                        node.panel_node_id = panel_node_id
+                    node.status = 'active'
+                    node.save()
+                    
+                    
+                else:
+                    error_msg = result.get('msg', '未知错误')
+                    logger.error(f"创建节点失败: {error_msg}")
+                    node.status = 'inactive'
+                    node.save(update_fields=['status'])
+            except json.JSONDecodeError:
+                logger.error(f"解析面板响应失败: {response.text}")
+                node.status = 'inactive'
+                node.save(update_fields=['status'])
+        else:
+            logger.error(f"面板返回错误状态码: {response.status_code}, 响应: {response.text}")
+            node.status = 'inactive'
+            node.save(update_fields=['status'])
+        
+    except Exception as e:
+        logger.error(f"迁移节点 {node.id} 到面板 {new_panel.id} 时出错: {str(e)}")
+        node.status = 'inactive'
+        node.save(update_fields=['status'])
+    return panel_node_id
@@ -0,0 +1,145 @@
+"""
+游标（keyset）分页
+
+页码分页翻到后面时数据库需要先扫描并丢弃 OFFSET 之前的所有行，数据量越大越慢，
+每次请求还要额外执行一次 COUNT(*)。游标分页按 (created_at, id) 或 id 这类唯一有序的键，
+用 WHERE (created_at, id) < (上一页最后一行) 直接定位下一页，任意深度的翻页代价都相同。
+
+列表接口默认仍使用页码分页，请求带 pagination=cursor 或 cursor 参数时切换为游标分页：
+- cursor: 上一页返回的 next_cursor，不传表示第一页
+- page_size: 每页条数
+- with_count: 为 false 时不返回总数；总数按查询条件短时缓存，不在每次翻页时重新统计
+"""
+import base64
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param, remove_query_param
+
+# 总数缓存时间（秒）
+KEYSET_COUNT_CACHE_TTL = 60
+
+
+def use_keyset_pagination(request):
+    """请求是否选择了游标分页"""
+    return request.query_params.get('pagination') == 'cursor' or 'cursor' in request.query_params
+
+
+class KeysetPagination(BasePagination):
+    """按排序键定位的游标分页，只支持向后翻页"""
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+
+    def __init__(self, ordering=('-created_at', '-id')):
+        # 所有排序字段方向必须一致，最后一个字段必须唯一（通常为id）
+        self.ordering = tuple(ordering)
+        self.descending = self.ordering[0].startswith('-')
+        self.fields = [field.lstrip('-') for field in self.ordering]
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def encode_cursor(self, instance):
+        values = []
+        for field in self.fields:
+            value = getattr(instance, field)
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def decode_cursor(self, cursor, model):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+            if not isinstance(values, list) or len(values) != len(self.fields):
+                raise ValueError
+            decoded = []
+            for field, value in zip(self.fields, values):
+                internal_type = model._meta.get_field(field).get_internal_type()
+                if internal_type == 'DateTimeField':
+                    value = parse_datetime(value)
+                elif internal_type == 'DateField':
+                    value = parse_date(value)
+                if value is None:
+                    raise ValueError
+                decoded.append(value)
+            return decoded
+        except (TypeError, ValueError, UnicodeDecodeError, json.JSONDecodeError):
+            raise NotFound('无效的分页游标')
+
+    def build_cursor_filter(self, values):
+        """生成 (f1, f2, ...) 严格小于（倒序）或大于（正序）游标值的条件"""
+        lookup = 'lt' if self.descending else 'gt'
+        condition = Q()
+        for index, field in enumerate(self.fields):
+            part = Q(**{f'{field}__{lookup}': values[index]})
+            for prev_field, prev_value in zip(self.fields[:index], values[:index]):
+                part &= Q(**{prev_field: prev_value})
+            condition |= part
+        return condition
+
+    def get_count(self, queryset):
+        """按SQL缓存总数，同一查询条件在缓存期内翻页不再重复COUNT"""
+        try:
+            sql = str(queryset.order_by().query)
+        except Exception:
+            return queryset.count()
+        cache_key = f'keyset_count:{hashlib.md5(sql.encode()).hexdigest()}'
+        count = cache.get(cache_key)
+        if count is None:
+            count = queryset.count()
+            cache.set(cache_key, count, KEYSET_COUNT_CACHE_TTL)
+        return count
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        with_count = request.query_params.get('with_count', 'true').lower() != 'false'
+        self.count = self.get_count(queryset) if with_count else None
+
+        queryset = queryset.order_by(*self.ordering)
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            queryset = queryset.filter(self.build_cursor_filter(self.decode_cursor(cursor, queryset.model)))
+
+        # 多取一行判断是否还有下一页
+        results = list(queryset[:page_size + 1])
+        self.has_next = len(results) > page_size
+        results = results[:page_size]
+        self.next_cursor = self.encode_cursor(results[-1]) if self.has_next else None
+        return results
+
+    def get_next_link(self):
+        if not self.next_cursor:
+            return None
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, 'page')
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'count': self.count,
+            'next': self.get_next_link(),
+            'previous': None,
+            'next_cursor': self.next_cursor,
+            'results': data,
+        })
+
+
+class CustomPagination(PageNumberPagination):
+    """自定义分页类"""
+    page_size = 10  # 默认每页显示10条
+    page_size_query_param = 'page_size'  # 每页显示条数的参数名
+    max_page_size = 100  # 每页最大显示条数
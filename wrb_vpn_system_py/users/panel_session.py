@@ -0,0 +1,239 @@
+"""
+面板登录会话
+
+get_login_cookie 登录面板并把 cookie 保存到面板记录上，make_request_with_cookie 携带 cookie 请求面板接口，
+cookie 失效时重新登录一次，整体受面板熔断器保护。update_single_panel 拉取单个面板的入站列表并同步清单。
+"""
+from panels.breaker import with_circuit_breaker
+from panels.inventory import sync_panel_inventories
+import requests
+import logging
+from .traffic import ingest_panel_traffic
+
+logger = logging.getLogger(__name__)
+
+
+def get_login_cookie(panel, panel_info):
+    """获取或刷新登录cookie"""
+    try:
+        login_data = {
+            'username': panel_info['username'],
+            'password': panel_info['password']
+        }
+        
+        # 构建登录请求头
+        if panel_info['panel_type'] == 'x-ui':
+            headers_login = {
+                'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
+                'host': f'{panel_info['ip']}',
+                'Accept': 'application/json, text/plain, */*',
+                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/134.0.0.0 Safari/537.36',
+                'Origin': f'http://{panel_info['ip']}',
+                'Referer': f'http://{panel_info['ip']}/'
+            }
+        else:  # 3x-ui面板
+            headers_login = {
+                'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
+                'host': f'{panel_info['ip'].split('/')[0]}',
+                'Accept': 'application/json, text/plain, */*',
+                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/134.0.0.0 Safari/537.36',
+                'Origin': f'http://{panel_info['ip'].split('/')[0]}',
+                'Referer': f'http://{panel_info['ip']}/'
+            }
+
+        # 发送登录请求
+        response_login = requests.post(
+            f'http://{panel_info['ip']}/login', 
+            data=login_data,
+            headers=headers_login,
+            timeout=10,
+            verify=False
+        )
+        
+        # 获取新的cookie
+        login_cookie = response_login.headers.get('Set-Cookie')
+        if login_cookie:
+            # 更新数据库中的cookie
+            panel.cookie = login_cookie
+            panel.save(update_fields=['cookie'])
+            return login_cookie
+        
+        return None
+        
+    except Exception as e:
+        print(f"登录获取cookie失败: {str(e)}")
+        return None
+
+
+@with_circuit_breaker()
+def make_request_with_cookie(panel, panel_info, url, headers, method='post', data=None):
+    """使用cookie发送请求，如果失败则尝试刷新cookie重试"""
+    response = None
+    try:
+        # 如果存在cookie，添加到请求头中
+        if panel.cookie:
+            headers['cookie'] = panel.cookie
+        
+        if method.lower() == 'post':
+            response = requests.post(url, headers=headers, data=data, timeout=10, verify=False)
+        elif method.lower() == 'post_params':
+            response = requests.post(url, headers=headers, params=data, timeout=10, verify=False)
+        else:
+            response = requests.get(url, headers=headers, timeout=10, verify=False)
+        
+        # 检查响应是否成功或是否需要重新登录
+        cookie_expired = False
+        
+        # 检查HTTP状态码
+        if response.status_code == 404 or response.status_code == 401:
+            cookie_expired = True
+        
+        # 检查响应内容是否包含需要重新登录的信息
+        try:
+            result = response.json()
+            if 'success' in result and not result['success']:
+                if 'msg' in result and ('请重新登录' in result['msg'] or '登录已过期' in result['msg']):
+                    cookie_expired = True
+        except Exception:
+            # 尝试检查响应文本
+            if '请重新登录' in response.text or '登录已过期' in response.text:
+                cookie_expired = True
+        
+        # 如果cookie已过期，尝试刷新
+        if cookie_expired:
+            print(f"Cookie已过期或无效，尝试重新登录获取新cookie")
+            new_cookie = get_login_cookie(panel, panel_info)
+            if new_cookie:
+                headers['cookie'] = new_cookie
+                if method.lower() == 'post':
+                    response = requests.post(url, headers=headers, data=data, timeout=10, verify=False)
+                elif method.lower() == 'post_params':
+                    response = requests.post(url, headers=headers, params=data, timeout=10, verify=False)
+                else:
+                    response = requests.get(url, headers=headers, timeout=10, verify=False)
+            else:
+                # 获取新cookie失败，由熔断器记录失败
+                raise Exception("尝试重新登录失败，无法获取有效cookie")
+        
+        return response
+        
+    except (requests.exceptions.ConnectionError, 
+            requests.exceptions.Timeout, 
+            requests.exceptions.ReadTimeout, 
+            requests.exceptions.RequestException) as req_error:
+        print(f"请求失败: {str(req_error)}")
+        # 尝试刷新cookie
+        try:
+            new_cookie = get_login_cookie(panel, panel_info)
+            if new_cookie:
+                headers['cookie'] = new_cookie
+                if method.lower() == 'post':
+                    return requests.post(url, headers=headers, data=data, timeout=10, verify=False)
+                elif method.lower() == 'post_params':
+                    return requests.post(url, headers=headers, params=data, timeout=10, verify=False)
+                else:
+                    return requests.get(url, headers=headers, timeout=10, verify=False)
+            else:
+                # 获取新cookie失败，由熔断器记录失败
+                raise Exception(f"获取Cookie失败，节点可能离线: {str(req_error)}")
+        except Exception as login_error:
+            # 重新登录也失败，记录错误
+            print(f"重新登录失败: {str(login_error)}")
+            raise Exception(f"重新登录失败，节点离线: {str(login_error)}")
+    
+    except Exception as e:
+        # 其他所有异常情况，连续失败时由熔断器将面板标记为离线
+        print(f"请求处理过程中出错: {str(e)}")
+        
+        # 如果已经有响应但处理失败，返回该响应
+        if response:
+            return response
+            
+        raise Exception(f"请求节点失败，节点可能离线: {str(e)}")
+
+
+def update_single_panel(panel):
+        """更新单个面板的节点数量和状态"""
+        result = {
+            'panel_id': panel.id,
+            'panel_ip': panel.ip_address,
+            'success': False,
+            'error': None
+        }
+        
+        try:
+            # 设置单个面板处理的参数
+            panel_info = {
+                'ip': panel.ip_address,
+                'port': panel.port,
+                'username': panel.username,
+                'password': panel.password,
+                'panel_type': panel.panel_type
+            }
+            
+            # 如果没有cookie，先获取cookie
+            if not panel.cookie:
+                get_login_cookie(panel, panel_info)
+            
+            # 构建请求头和URL
+            if panel_info['panel_type'] == 'x-ui':
+                headers = {
+                    'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
+                    'host': f'{panel_info['ip']}',
+                    'Accept': 'application/json, text/plain, */*',
+                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/134.0.0.0 Safari/537.36',
+                    'Origin': f'http://{panel_info['ip']}',
+                    'x-requested-with': 'XMLHttpRequest',
+                    'Referer': f'http://{panel_info['ip']}/xui/inbounds'
+                }
+                url = f"http://{panel_info['ip']}/xui/inbound/list"
+            else:
+                headers = {
+                    'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
+                    'host': f'{panel_info['ip'].split('/')[0]}',
+                    'Accept': 'application/json, text/plain, */*',
+                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/134.0.0.0 Safari/537.36',
+                    'Origin': f'http://{panel_info['ip'].split('/')[0]}',
+                    'Referer': f'http://{panel_info['ip']}/panel/inbounds'
+                }
+                url = f"http://{panel_info['ip']}/panel/inbound/list"
+
+            # 发送请求获取节点列表，设置较短的超时时间
+            try:
+                response = make_request_with_cookie(panel, panel_info, url, headers, method='post')
+                
+                # 尝试解析响应
+                try:
+                    result_json = response.json()
+                    if not result_json.get('success', False):
+                        # 请求成功但返回失败状态，在线状态由熔断器维护，这里只返回错误
+                        result['error'] = f"获取节点列表失败: {result_json.get('msg', '未知错误')}"
+                        return result
+                    
+                    nodes_data = result_json.get('obj', [])
+                    
+                    # 按入站清单哈希增量更新，清单没有变化时不写数据库；有变化时同步节点记录
+                    sync_panel_inventories([(panel, nodes_data)])
+
+                    # 记录各入站的流量增量，失败不影响面板状态更新
+                    try:
+                        ingest_panel_traffic(panel, nodes_data)
+                    except Exception as traffic_error:
+                        logger.error(f"面板 {panel.id} 流量采样失败: {str(traffic_error)}")
+                    
+                    result['success'] = True
+                    return result
+                    
+                except ValueError as json_error:
+                    # JSON解析失败
+                    result['error'] = f"解析节点列表响应失败: {str(json_error)}"
+                    return result
+            except Exception as req_error:
+                # 请求过程中出错（包括熔断中的 PanelUnavailable），连续失败由熔断器标记离线
+                result['error'] = f"请求节点列表失败: {str(req_error)}"
+                return result
+        
+        except Exception as e:
+            # 更新节点列表失败，在线状态由熔断器维护
+            result['error'] = str(e)
+            return result
@@ -0,0 +1,33 @@
+"""
+价格计算，下单、续费和价格接口共用
+"""
+
+
+def get_price_or_parent(agent, field_name, user=None):
+    """
+    获取价格的优先级：
+    1. 如果提供了用户且用户有自定义价格，使用用户的自定义价格
+    2. 如果代理设置了自定义价格，使用代理的自定义价格
+    3. 使用代理的标准价格
+    
+    :param agent: 代理对象
+    :param field_name: 价格字段名
+    :param user: 用户对象（可选）
+    :return: 价格值
+    """
+    # 如果提供了用户，先检查用户的自定义价格
+    if user:
+        custom_user_field = 'custom_' + field_name
+        user_price = getattr(user, custom_user_field, None)
+        if user_price is not None and user_price > 0:
+            return user_price
+    
+    # 检查代理的自定义价格
+    custom_field_name = 'custom_' + field_name
+    custom_price = getattr(agent, custom_field_name, None)
+    if custom_price is not None and custom_price > 0:
+        return custom_price
+    
+    # 获取代理的标准价格
+    standard_price = getattr(agent, field_name, 0)
+    return standard_price if standard_price is not None else 0
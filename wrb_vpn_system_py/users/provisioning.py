@@ -0,0 +1,1176 @@
+"""
+节点开通
+
+- process_successful_payment: 在线支付回调成功后为订单创建节点，创建失败的节点退款
+- process_node_creation: 余额下单后在后台线程中完成节点的中转配置并登记 xray 重启
+- process_node_creation_time: 续费后同步面板上入站的到期时间
+"""
+import json
+from django.conf import settings
+import random
+from .models import NodeInfo
+from panels.models import AgentPanel
+from panels.inbound_index import resolve_added_inbound_id
+import requests
+import logging
+import time
+from transits.models import TransitAccount
+from .ledger import change_balance
+from .restarts import schedule_xray_restart
+from .panel_session import get_login_cookie, make_request_with_cookie, update_single_panel
+
+logger = logging.getLogger(__name__)
+
+
+def process_successful_payment(order):
+    """
+    处理支付成功后的业务逻辑
+    此函数将在订单支付成功后被调用
+    
+    :param order: 支付成功的订单对象
+    """
+    try:
+        # 用于收集需要重启的面板
+        panels_to_restart = set()
+        # 用于收集最终失败的节点（需要退款）
+        failed_nodes_for_refund = []
+        # 用于记录已扣除的代理余额（用于退款时回退）
+        agent_balance_deducted = {}
+        
+        # 查找订单关联的节点信息记录
+        nodes = NodeInfo.objects.filter(order=order)
+        if not nodes.exists():
+            logger.warning(f"订单 {order.out_trade_no} 没有关联的节点信息")
+            return
+            
+        logger.info(f"为订单 {order.out_trade_no} 创建 {nodes.count()} 个节点")
+        
+        # 扣除代理余额
+        try:
+            # 获取订单用户
+            user = order.user
+            # 如果用户是客户，且有上级代理
+            if user.user_type == 'customer' and user.parent:
+                # 获取上级代理
+                agent = user.parent
+                # 扣除代理余额（原子更新并记录流水）
+                change_balance(agent, -order.amount, 'agent_cost', order_no=order.out_trade_no, allow_negative=True)
+                # 记录已扣除的代理余额，用于可能的退款
+                agent_balance_deducted[agent.id] = {
+                    'agent': agent,
+                    'amount': order.amount
+                }
+                logger.info(f"从代理 {agent.username} 的余额中扣除 {order.amount} 元，当前余额: {agent.balance}")
+        except Exception as e:
+            logger.error(f"扣除代理余额时出错: {str(e)}")
+            # 继续处理节点创建，不中断流程
+        
+        # 遍历所有节点信息
+        for node in nodes:
+            try:
+                # 解析host_config
+                if node.host_config:
+                    if isinstance(node.host_config, dict):
+                        # 如果是字典，直接使用
+                        host_config = node.host_config
+                    else:
+                        # 如果是字符串，转换为字典
+                        host_config = json.loads(node.host_config)
+                    logger.info(f"处理节点 {node.id}, 面板: {host_config}")
+                    
+                    # 获取面板信息
+                    panel_id = host_config.get('id')
+                    if not panel_id:
+                        logger.error(f"节点 {node.id} 的host_config中没有panel_id")
+                        continue
+                        
+                    try:
+                        panel = AgentPanel.objects.get(id=panel_id)
+                    except AgentPanel.DoesNotExist:
+                        logger.error(f"找不到ID为 {panel_id} 的面板")
+                        continue
+                    
+                    # 解析config_text获取节点配置
+                    if not node.config_text:
+                        logger.error(f"节点 {node.id} 没有config_text数据")
+                        continue
+                        
+                    # 解析config_text为JSON对象
+                    form_data = json.loads(node.config_text)
+                    
+                    # 调整form_data格式，将嵌套对象转为字符串
+                    nested_fields = ['settings', 'streamSettings', 'sniffing', 'allocate']
+                    for field in nested_fields:
+                        if field in form_data and isinstance(form_data[field], (dict, list)):
+                            # 将对象转为JSON字符串
+                            form_data[field] = json.dumps(form_data[field])
+                    
+                    
+                    # 构建请求头
+                    if panel.panel_type == 'x-ui':
+                        url = f"http://{panel.ip_address}/xui/inbound/add"
+                        headers = {
+                            'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
+                            'Accept': 'application/json, text/plain, */*',
+                            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/96.0.4664.45 Safari/537.36',
+                        }
+                    else:  # 3x-ui
+                        url = f"http://{panel.ip_address}/panel/api/inbounds/add"
+                        headers = {
+                            'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
+                            'Accept': 'application/json, text/plain, */*',
+                            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/96.0.4664.45 Safari/537.36',
+                        }
+                        panels_to_restart.add(panel)
+                    
+                    # 尝试获取cookie
+                    if not panel.cookie:
+                        logger.info(f"面板 {panel_id} 无cookie，尝试登录获取")
+                        cookie = get_login_cookie(panel, host_config)
+                        if not cookie:
+                            logger.error(f"无法获取面板 {panel_id} 的cookie")
+                            continue
+                    
+                    # 发送创建节点请求
+                    try:
+                        # 使用封装的请求函数，自动处理cookie过期问题
+                        response = make_request_with_cookie(
+                            panel, 
+                            host_config, 
+                            url, 
+                            headers, 
+                            method='post_params', 
+                            data=form_data
+                        )
+                        # 检查响应
+                        if response.status_code == 200:
+                            try:
+                                result = response.json()
+                                success = result.get('success', False)
+                                if success:
+                                    # 获取新创建的节点ID
+                                    # 优先从添加接口的响应中获取入站ID，x-ui 旧版本不返回时再查询入站列表
+                                    panel_node_id = resolve_added_inbound_id(panel, form_data, result)
+                                    if panel.panel_type == '3x-ui':
+                                        #创建绑定出站规则和路由规则
+                                        tag = result.get('obj', {}).get('tag')
+                                        headers = {
+                                            'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
+                                            'host': f'{panel.ip_address.split("/")[0]}',
+                                            'Accept': 'application/json, text/plain, */*',
+                                            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/134.0.0.0 Safari/537.36',
+                                            'Origin': f'http://{panel.ip_address.split("/")[0]}',
+                                            'Referer': f'http://{panel.ip_address}/panel/'
+                                        }
+                                        
+                                        # 获取xray配置
+                                        url = f"http://{panel.ip_address}/panel/xray/"
+                                        response = make_request_with_cookie(panel, {
+                                            'ip': panel.ip_address,
+                                            'username': panel.username,
+                                            'password': panel.password,
+                                            'panel_type': panel.panel_type
+                                        }, url, headers, method='post')
+                                        
+                                        if response.status_code == 200:
+                                            result = response.json()
+                                            if result.get('success'):
+                                                # 获取xray配置
+                                                xraySetting = json.loads(result.get('obj', {}))
+                                                # 创建绑定出站规则和路由规则
+                                                # outbound_rules = 
+                                                xraySetting['xraySetting']['routing']['rules'].append({
+                                                    "type": "field",
+                                                    "outboundTag": host_config.get('tag'),
+                                                    "inboundTag": [
+                                                        tag
+                                                    ]
+                                                })
+                                                update_data = {
+                                                    'xraySetting': json.dumps(xraySetting.get('xraySetting'))
+                                                }
+                                                # 发送更新请求
+                                                update_response = make_request_with_cookie(
+                                                    panel,
+                                                    host_config,
+                                                    f"http://{panel.ip_address}/panel/xray/update",
+                                                    {
+                                                        'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
+                                                        'Accept': 'application/json, text/plain, */*',
+                                                        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/134.0.0.0 Safari/537.36',
+                                                    },
+                                                    method='post',
+                                                    data=update_data
+                                                )
+                                                if update_response.status_code == 200:
+                                                    print(f"更新xray配置成功")
+                                                else:
+                                                    print(f"更新xray配置失败: {update_response.text}")
+                                            
+                                        # 重启面板/server/restartXrayService
+                                        # url_restart = f"http://{panel.ip_address}/server/restartXrayService"
+                                        # response = make_request_with_cookie(panel, {
+                                        #     'ip': panel.ip_address,
+                                        #     'username': panel.username,
+                                        #     'password': panel.password,
+                                        #     'panel_type': panel.panel_type
+                                        # }, url_restart, headers, method='get')
+                                        # if response.status_code == 200:
+                                        #     print(f"重启面板成功")
+                                        # else:
+                                        #     print(f"重启面板失败: {response.text}")
+                                    # 更新节点状态和面板节点ID
+                                    node.status = 'active'
+                                    node.panel_node_id = panel_node_id
+                                    if node.udp:
+                                        try:
+                                            # 解析 JSON 字符串
+                                            udp_config_json = json.loads(node.udp_config)
+                                            
+                                            # 获取配置信息
+                                            udp_zhanghao = udp_config_json.get('config', {})
+                                            udp_peizhi = udp_config_json.get('udpConfig', {})
+                                            transit_account = TransitAccount.objects.get(id=udp_zhanghao.get('id'))
+                                            auth_token = transit_account.token
+                                            if not auth_token:
+                                                login_url = f"{settings.API_BASE_URL}/api/v1/auth/login"
+                                                login_data = {
+                                                    "username": udp_zhanghao.get('username'),
+                                                    "password": udp_zhanghao.get('password')
+                                                }
+                                                headers_nyanpass = {
+                                                    "Content-Type": "text/plain;charset=UTF-8",
+                                                    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+                                                    "Accept": "*/*",
+                                                    "Origin": settings.API_BASE_URL,
+                                                }
+                                                login_response = requests.post(login_url, json=login_data, headers=headers_nyanpass)
+                                                if login_response.status_code == 200:
+                                                    login_result = login_response.json()
+                                                    auth_token = login_result.get('data', {})
+                                                    transit_account.token = auth_token
+                                                    transit_account.save(update_fields=['token'])
+                                            
+                                            # 中转登录
+                                            try:
+                                                
+                                                login_result = login_response.json()
+                                                auth_token = login_result.get('data', {})
+                                                
+                                                if auth_token:
+                                                    # 创建转发
+                                                    forward_url = f"{settings.API_BASE_URL}/api/v1/user/forward"
+                                                    forward_headers = {
+                                                        "Authorization": f"{auth_token}",
+                                                        "Content-Type": "application/json"
+                                                    }
+                                                    
+                                                    # 执行中转注册，添加重试机制
+                                                    retry_count = 0
+                                                    max_retries = 4  # 最大重试次数，加上首次请求总共尝试2次
+                                                    forward_success = False
+                                                    
+                                                    while retry_count <= max_retries and not forward_success:
+                                                        forward_response = requests.put(forward_url, headers=forward_headers, json=udp_peizhi)
+                                                        if forward_response.status_code == 200 and forward_response.json().get('code') != 403:
+                                                            forward_success = True
+                                                        elif forward_response.status_code == 403 or search_rules_response.json().get('code') == 403 or retry_count==3:
+                                                            retry_count += 1
+                                                            login_url = f"{settings.API_BASE_URL}/api/v1/auth/login"
+                                                            login_data = {
+                                                                "username": udp_zhanghao.get('username'),
+                                                                "password": udp_zhanghao.get('password')
+                                                            }
+                                                            headers_nyanpass = {
+                                                                "Content-Type": "text/plain;charset=UTF-8",
+                                                                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+                                                                "Accept": "*/*",
+                                                                "Origin": settings.API_BASE_URL,
+                                                            }
+                                                            login_response = requests.post(login_url, json=login_data, headers=headers_nyanpass)
+                                                            if login_response.status_code == 200:
+                                                                login_result = login_response.json()
+                                                                auth_token = login_result.get('data', {})
+                                                                transit_account.token = auth_token
+                                                                transit_account.save(update_fields=['token'])
+                                                                forward_headers = {
+                                                                    "Authorization": f"{auth_token}",
+                                                                    "Content-Type": "application/json"
+                                                                }
+                                                        else:
+                                                            retry_count += 1
+                                                            if retry_count <= max_retries:
+                                                                # 随机等待0.5到1秒后重试
+                                                                wait_time = random.uniform(5, 15)
+                                                                logger.info(f"UDP转发创建失败，等待{wait_time:.2f}秒后进行第{retry_count+1}次尝试")
+                                                                time.sleep(wait_time)
+                                                            else:
+                                                                logger.error(f"UDP转发创建失败，已重试{max_retries}次: {forward_response.text}")
+                                                    
+                                                    if forward_success:                                                       
+                                                        # 获取转发规则
+                                                        search_rules_url = f"{settings.API_BASE_URL}/api/v1/user/forward/search_rules"
+                                                        search_rules_data = {
+                                                            "gid": 0,
+                                                            "gid_in": 0,
+                                                            "gid_out": 0,
+                                                            "name": "",
+                                                            "dest": json.loads(udp_peizhi.get('config')).get('dest')[0],
+                                                            "listen_port": 0
+                                                        }
+                                                        search_rules_response = requests.post(
+                                                            search_rules_url,
+                                                            headers=forward_headers,
+                                                            json=search_rules_data
+                                                        )
+                                                        
+                                                        if search_rules_response.status_code == 200:
+
+                                                            search_rules_data = search_rules_response.json()
+                                                            if search_rules_data.get('code') == 0 and search_rules_data.get('data'):
+                                                                # 获取监听端口
+                                                                listen_port = search_rules_data['data'][0]['listen_port']
+                                                                
+                                                                # 获取设备组信息
+                                                                device_group_url = f"{settings.API_BASE_URL}/api/v1/user/devicegroup"
+                                                                device_group_response = requests.get(
+                                                                    device_group_url,
+                                                                    headers=forward_headers
+                                                                )
+                                                                
+                                                                if device_group_response.status_code == 200:
+                                                                    device_group_data = device_group_response.json()
+                                                                    if device_group_data.get('code') == 0 and device_group_data.get('data'):
+                                                                        # 查找匹配的设备组
+                                                                        for group in device_group_data['data']:
+                                                                            if group['id'] == search_rules_data['data'][0]['device_group_in']:
+                                                                                # 拼装 UDP 主机地址
+                                                                                udp_host = f"{group['id']}:{listen_port}"
+                                                                                # 更新 NodeInfo 的 udp_host 字段
+                                                                                node.udp_host = udp_host
+                                                                                node.save(update_fields=['udp_host'])
+                                                                                break
+                                                    else:
+                                                        logger.error(f"UDP转发创建失败，已重试{max_retries}次仍失败")
+                                                else:
+                                                    logger.error(f"中转登录失败: {login_response.text}")
+                                            
+                                            except Exception as e:
+                                                logger.error(f"处理UDP中转配置时出错: {str(e)}")
+                                        except Exception as e:
+                                            logger.error(f"处理UDP配置时出错: {str(e)}")
+                                    
+                                    node.save(update_fields=['status', 'panel_node_id', 'udp_config'])
+                                else:
+                                    error_msg = result.get('msg', '未知错误')
+                                    logger.error(f"创建节点失败: {error_msg}")
+                                    node.status = 'inactive'
+                                    node.save(update_fields=['status'])
+                            except json.JSONDecodeError:
+                                logger.error(f"解析面板响应失败: {response.text}")
+                                node.status = 'inactive'
+                                node.save(update_fields=['status'])
+                        else:
+                            logger.error(f"面板返回错误状态码: {response.status_code}, 响应: {response.text}")
+                            node.status = 'inactive'
+                            node.save(update_fields=['status'])
+                        
+
+                    except Exception as e:
+                        error_msg = str(e)
+                        logger.error(f"发送创建节点请求时出错: {error_msg}")
+                        
+                        # 检查是否是连接类型的错误（面板可能离线）
+                        is_connection_error = (
+                            'ConnectionError' in error_msg or
+                            'Timeout' in error_msg or
+                            'ReadTimeout' in error_msg or
+                            'RequestException' in error_msg or
+                            '连接失败' in error_msg or
+                            '节点离线' in error_msg or
+                            '离线' in error_msg
+                        )
+                        
+                        if is_connection_error:
+                            logger.warning(f"面板 {panel_id} 可能离线，尝试查找替代面板")
+                            
+                            # 1. 确保面板被标记为离线
+                            panel.is_online = False
+                            panel.save(update_fields=['is_online'])
+                            
+                            # 2. 查找该国家下其他在线的面板
+                            alternative_panels = AgentPanel.objects.filter(
+                                country=panel.country,
+                                is_online=True,
+                                panel_type=panel.panel_type,
+                                is_active=True
+                            ).exclude(id=panel.id).order_by('nodes_count')
+                            
+                            # 3. 如果找到替代面板，使用新面板重新创建节点
+                            if alternative_panels.exists():
+                                new_panel = alternative_panels.first()
+                                logger.info(f"找到替代面板 {new_panel.id}，尝试重新创建节点")
+                                
+                                try:
+                                    # 更新 host_config 中的面板信息
+                                    host_config['id'] = new_panel.id
+                                    host_config['ip'] = new_panel.ip_address
+                                    host_config['username'] = new_panel.username
+                                    host_config['password'] = new_panel.password
+                                    
+                                    # 更新节点的 host_config
+                                    node.host_config = json.dumps(host_config)
+                                    node.save(update_fields=['host_config'])
+                                    
+                                    # 更新使用新的面板对象
+                                    panel = new_panel
+                                    
+                                    # 尝试获取新面板的 cookie
+                                    if not new_panel.cookie:
+                                        cookie = get_login_cookie(new_panel, host_config)
+                                        if not cookie:
+                                            logger.error(f"无法获取新面板 {new_panel.id} 的cookie")
+                                            failed_nodes_for_refund.append({
+                                                'node': node,
+                                                'reason': f'无法获取替代面板 {new_panel.id} 的登录凭证',
+                                                'panel_country': new_panel.country
+                                            })
+                                            node.status = 'inactive'
+                                            node.save(update_fields=['status'])
+                                            continue
+                                    
+                                    # 重新发送创建节点请求
+                                    logger.info(f"使用替代面板 {new_panel.id} 重新创建节点 {node.id}")
+                                    response = make_request_with_cookie(
+                                        panel, 
+                                        host_config, 
+                                        url, 
+                                        headers, 
+                                        method='post_params', 
+                                        data=form_data
+                                    )
+                                    
+                                    # 处理响应（简化版本，不处理UDP等复杂逻辑）
+                                    if response.status_code == 200:
+                                        result = response.json()
+                                        if result.get('success', False):
+                                            # 获取新创建的节点ID
+                                            if panel.panel_type == 'x-ui':
+                                                panel_node_id = None  # x-ui 需要通过列表查找
+                                            else:  # 3x-ui
+                                                panel_node_id = result.get('obj', {}).get('id')
+                                            
+                                            # 更新节点状态
+                                            node.status = 'active'
+                                            if panel_node_id:
+                                                node.panel_node_id = panel_node_id
+                                            node.save(update_fields=['status', 'panel_node_id'])
+                                            logger.info(f"使用替代面板成功创建节点 {node.id}")
+                                            continue
+                                        else:
+                                            error_msg = result.get('msg', '未知错误')
+                                            logger.error(f"替代面板创建节点失败: {error_msg}")
+                                            failed_nodes_for_refund.append({
+                                                'node': node,
+                                                'reason': f'替代面板创建失败: {error_msg}',
+                                                'panel_country': new_panel.country
+                                            })
+                                            node.status = 'inactive'
+                                            node.save(update_fields=['status'])
+                                            continue
+                                    else:
+                                        logger.error(f"替代面板返回错误状态码: {response.status_code}")
+                                        failed_nodes_for_refund.append({
+                                            'node': node,
+                                            'reason': f'替代面板返回错误状态码: {response.status_code}',
+                                            'panel_country': new_panel.country
+                                        })
+                                        node.status = 'inactive'
+                                        node.save(update_fields=['status'])
+                                        continue
+                                        
+                                except Exception as retry_error:
+                                    logger.error(f"使用替代面板重新创建节点失败: {str(retry_error)}")
+                                    failed_nodes_for_refund.append({
+                                        'node': node,
+                                        'reason': f'替代面板重新创建失败: {str(retry_error)}',
+                                        'panel_country': new_panel.country
+                                    })
+                                    node.status = 'inactive'
+                                    node.save(update_fields=['status'])
+                                    continue
+                            else:
+                                # 没有找到替代面板，记录为需要退款
+                                logger.error(f"节点 {node.id} 所属国家 {panel.country} 下无其他可用面板，需要退款")
+                                failed_nodes_for_refund.append({
+                                    'node': node,
+                                    'reason': f'国家 {panel.country} 下无可用面板',
+                                    'panel_country': panel.country
+                                })
+                                node.status = 'inactive'
+                                node.save(update_fields=['status'])
+                                continue
+                        else:
+                            # 非连接错误，直接标记为失败
+                            logger.error(f"非连接错误，节点创建失败: {error_msg}")
+                            node.status = 'inactive'
+                            node.save(update_fields=['status'])
+                            failed_nodes_for_refund.append({
+                                'node': node,
+                                'reason': error_msg,
+                                'panel_country': panel.country if panel else '未知'
+                            })
+                            continue
+                else:
+                    logger.error(f"节点 {node.id} 没有有效的host_config")
+                    node.status = 'inactive'
+                    node.save(update_fields=['status'])
+                    failed_nodes_for_refund.append({
+                        'node': node,
+                        'reason': '没有有效的host_config',
+                        'panel_country': '未知'
+                    })
+                
+            except Exception as e:
+                logger.error(f"处理节点 {node.id} 时出错: {str(e)}")
+                failed_nodes_for_refund.append({
+                    'node': node,
+                    'reason': f'处理节点时异常: {str(e)}',
+                    'panel_country': '未知'
+                })
+                continue
+                
+                
+        # 处理失败的节点（需要退款的情况）
+        if failed_nodes_for_refund:
+            logger.warning(f"订单 {order.out_trade_no} 有 {len(failed_nodes_for_refund)} 个节点创建失败，需要退款")
+            
+            # 回退代理余额
+            if agent_balance_deducted:
+                for agent_id, deduction_info in agent_balance_deducted.items():
+                    try:
+                        agent = deduction_info['agent']
+                        refund_amount = deduction_info['amount']
+                        change_balance(agent, refund_amount, 'refund', order_no=order.out_trade_no, remark='节点创建失败退款')
+                        logger.info(f"已退款 {refund_amount} 元到代理 {agent.username}，当前余额: {agent.balance}")
+                    except Exception as refund_error:
+                        logger.error(f"退款给代理 {agent_id} 时出错: {str(refund_error)}")
+            
+            # 更新订单状态
+            order.is_processed = True
+            order.save(update_fields=['is_processed'])
+            logger.warning(f"订单 {order.out_trade_no} 处理完成（部分节点创建失败，已退款）")
+        else:
+            # 所有节点创建成功
+            order.is_processed = True
+            order.save(update_fields=['is_processed'])
+            logger.info(f"订单 {order.out_trade_no} 处理完成")
+
+        # 所有节点处理完成后，登记重启所有使用到的面板，由调度器合并后在后台执行
+        logger.info(f"所有节点创建完成，登记重启 {len(panels_to_restart)} 个面板")
+        for panel in panels_to_restart:
+            schedule_xray_restart(panel, f'订单 {order.out_trade_no}')
+    
+        
+    except Exception as e:
+        logger.error(f"处理支付成功后的业务逻辑时出错: {str(e)}")
+        # 不抛出异常，避免影响回调处理流程
+
+
+def process_node_creation(nodes):
+    """
+    异步处理节点创建和中转配置的函数
+    """
+    print('==开始处理节点创建和中转配置==')
+    try:
+        # 用于收集需要重启的面板
+        panels_to_restart = set()
+        
+        # 遍历所有节点信息
+        for node in nodes:
+            try:
+                # 解析host_config
+                print('==host_config==',node.host_config)
+                if node.host_config:
+                    if isinstance(node.host_config, dict):
+                        host_config = node.host_config
+                    else:
+                        host_config = json.loads(node.host_config)
+                    logger.info(f"处理节点 {node.id}, 面板: {host_config}")
+                    
+                    # 获取面板信息
+                    panel_id = host_config.get('id')
+                    if not panel_id:
+                        logger.error(f"节点 {node.id} 的host_config中没有panel_id")
+                        continue
+                        
+                    try:
+                        panel = AgentPanel.objects.get(id=panel_id)
+                    except AgentPanel.DoesNotExist:
+                        logger.error(f"找不到ID为 {panel_id} 的面板")
+                        continue
+                    
+                    # 解析config_text获取节点配置
+                    if not node.config_text:
+                        logger.error(f"节点 {node.id} 没有config_text数据")
+                        continue
+                        
+                    # 解析config_text为JSON对象
+                    form_data = json.loads(node.config_text)
+                    
+                    # 调整form_data格式，将嵌套对象转为字符串
+                    nested_fields = ['settings', 'streamSettings', 'sniffing', 'allocate']
+                    for field in nested_fields:
+                        if field in form_data and isinstance(form_data[field], (dict, list)):
+                            # 将对象转为JSON字符串
+                            form_data[field] = json.dumps(form_data[field])
+                    
+                    
+                    # 构建请求头
+                    if panel.panel_type == 'x-ui':
+                        url = f"http://{panel.ip_address}/xui/inbound/add"
+                        headers = {
+                            'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
+                            'Accept': 'application/json, text/plain, */*',
+                            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/96.0.4664.45 Safari/537.36',
+                        }
+                    else:  # 3x-ui
+                        url = f"http://{panel.ip_address}/panel/api/inbounds/add"
+                        headers = {
+                            'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
+                            'Accept': 'application/json, text/plain, */*',
+                            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/96.0.4664.45 Safari/537.36',
+                        }
+                        panels_to_restart.add(panel)
+                    
+                    # 尝试获取cookie
+                    if not panel.cookie:
+                        logger.info(f"面板 {panel_id} 无cookie，尝试登录获取")
+                        cookie = get_login_cookie(panel, host_config)
+                        if not cookie:
+                            logger.error(f"无法获取面板 {panel_id} 的cookie")
+                            continue
+                    
+                    # 发送创建节点请求
+                    try:
+                        # 使用封装的请求函数，自动处理cookie过期问题
+                        response = make_request_with_cookie(
+                            panel, 
+                            host_config, 
+                            url, 
+                            headers, 
+                            method='post_params', 
+                            data=form_data
+                        )
+                        # 检查响应
+                        if response.status_code == 200:
+                            try:
+                                result = response.json()
+                                success = result.get('success', False)
+                                if success:
+                                    # 获取新创建的节点ID
+                                    # 优先从添加接口的响应中获取入站ID，x-ui 旧版本不返回时再查询入站列表
+                                    panel_node_id = resolve_added_inbound_id(panel, form_data, result)
+                                    if panel.panel_type == '3x-ui':
+                                        #创建绑定出站规则和路由规则
+                                        tag = result.get('obj', {}).get('tag')
+                                        print('==tag==',tag)
+                                        headers = {
+                                            'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
+                                            'host': f'{panel.ip_address.split("/")[0]}',
+                                            'Accept': 'application/json, text/plain, */*',
+                                            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/134.0.0.0 Safari/537.36',
+                                            'Origin': f'http://{panel.ip_address.split("/")[0]}',
+                                            'Referer': f'http://{panel.ip_address}/panel/'
+                                        }
+                                        
+                                        # 获取xray配置
+                                        url = f"http://{panel.ip_address}/panel/xray/"
+                                        response = make_request_with_cookie(panel, {
+                                            'ip': panel.ip_address,
+                                            'username': panel.username,
+                                            'password': panel.password,
+                                            'panel_type': panel.panel_type
+                                        }, url, headers, method='post')
+                                        
+                                        if response.status_code == 200:
+                                            result = response.json()
+                                            if result.get('success'):
+                                                print('==result==',host_config)
+                                                # 获取xray配置
+                                                xraySetting = json.loads(result.get('obj', {}))
+                                                # 创建绑定出站规则和路由规则
+                                                # outbound_rules = 
+                                                xraySetting['xraySetting']['routing']['rules'].append({
+                                                    "type": "field",
+                                                    "outboundTag": host_config.get('tag'),
+                                                    "inboundTag": [
+                                                        tag
+                                                    ]
+                                                })
+                                                update_data = {
+                                                    'xraySetting': json.dumps(xraySetting.get('xraySetting'))
+                                                }
+                                                # 发送更新请求
+                                                update_response = make_request_with_cookie(
+                                                    panel,
+                                                    host_config,
+                                                    f"http://{panel.ip_address}/panel/xray/update",
+                                                    {
+                                                        'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
+                                                        'Accept': 'application/json, text/plain, */*',
+                                                        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/134.0.0.0 Safari/537.36',
+                                                    },
+                                                    method='post',
+                                                    data=update_data
+                                                )
+                                                if update_response.status_code == 200:
+                                                    print(f"更新xray配置成功")
+                                                else:
+                                                    print(f"更新xray配置失败: {update_response.text}")
+                                            
+                                        # # 重启面板/server/restartXrayService
+                                        # url_restart = f"http://{panel.ip_address}/server/restartXrayService"
+                                        # response = make_request_with_cookie(panel, {
+                                        #     'ip': panel.ip_address,
+                                        #     'username': panel.username,
+                                        #     'password': panel.password,
+                                        #     'panel_type': panel.panel_type
+                                        # }, url_restart, headers, method='get')
+                                        # if response.status_code == 200:
+                                        #     print(f"重启面板成功")
+                                        # else:
+                                        #     print(f"重启面板失败: {response.text}")
+                                    # 更新节点状态和面板节点ID
+                                    update_single_panel(panel)
+                                    node.status = 'active'
+                                    node.panel_node_id = panel_node_id
+                                    if node.udp:
+                                        try:
+                                            # 解析 JSON 字符串
+                                            udp_config_json = json.loads(node.udp_config)
+                                            
+                                            # 获取配置信息
+                                            udp_zhanghao = udp_config_json.get('config', {})
+                                            udp_peizhi = udp_config_json.get('udpConfig', {})
+                                            transit_account = TransitAccount.objects.get(id=udp_zhanghao.get('id'))
+                                            auth_token = transit_account.token
+                                            if not auth_token:
+                                                login_url = f"{settings.API_BASE_URL}/api/v1/auth/login"
+                                                login_data = {
+                                                    "username": udp_zhanghao.get('username'),
+                                                    "password": udp_zhanghao.get('password')
+                                                }
+                                                headers_nyanpass = {
+                                                    "Content-Type": "text/plain;charset=UTF-8",
+                                                    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+                                                    "Accept": "*/*",
+                                                    "Origin": settings.API_BASE_URL,
+                                                }
+                                                login_response = requests.post(login_url, json=login_data, headers=headers_nyanpass)
+                                                if login_response.status_code == 200:
+                                                    login_result = login_response.json()
+                                                    auth_token = login_result.get('data', {})
+                                                    transit_account.token = auth_token
+                                                    transit_account.save(update_fields=['token'])
+                                            print('==中转配置==',udp_peizhi)
+                                            udp_peizhi['config'] = json.dumps({
+                                                        "dest": [f"{panel.ip}:{node.port}"]
+                                                    })
+                                            
+                                            # 中转登录
+                                            print('==处理后的中转配置==',udp_peizhi)
+                                            try:
+                                                login_url = f"{settings.API_BASE_URL}/api/v1/auth/login"
+                                                login_data = {
+                                                    "username": udp_zhanghao.get('username'),
+                                                    "password": udp_zhanghao.get('password')
+                                                }
+                                                headers_nyanpass = {
+                                                    "Content-Type": "text/plain;charset=UTF-8",
+                                                    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+                                                    "Accept": "*/*",
+                                                    "Origin": settings.API_BASE_URL,
+                                                }
+                                                # login_response = requests.post(login_url, json=login_data, headers=headers_nyanpass)
+                                            
+                                                
+                                                if auth_token:
+                                                    # 创建转发
+                                                    forward_url = f"{settings.API_BASE_URL}/api/v1/user/forward"
+                                                    forward_headers = {
+                                                        "Authorization": f"{auth_token}",
+                                                        "Content-Type": "application/json"
+                                                    }
+                                                    
+                                                    # 执行中转注册，添加重试机制
+                                                    retry_count = 0
+                                                    max_retries = 4  # 最大重试次数，加上首次请求总共尝试4次
+                                                    forward_success = False
+                                                    
+                                                    while retry_count <= max_retries and not forward_success:
+                                                        forward_response = requests.put(forward_url, headers=forward_headers, json=udp_peizhi)
+                                                        if forward_response.status_code == 200:
+                                                            forward_success = True
+                                                        elif forward_response.status_code == 403 or retry_count==3:
+                                                            login_url = f"{settings.API_BASE_URL}/api/v1/auth/login"
+                                                            login_data = {
+                                                                "username": udp_zhanghao.get('username'),
+                                                                "password": udp_zhanghao.get('password')
+                                                            }
+                                                            headers_nyanpass = {
+                                                                "Content-Type": "text/plain;charset=UTF-8",
+                                                                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+                                                                "Accept": "*/*",
+                                                                "Origin": settings.API_BASE_URL,
+                                                            }
+                                                            login_response = requests.post(login_url, json=login_data, headers=headers_nyanpass)
+                                                            if login_response.status_code == 200:
+                                                                login_result = login_response.json()
+                                                                auth_token = login_result.get('data', {})
+                                                                transit_account.token = auth_token
+                                                                transit_account.save(update_fields=['token'])
+                                                                forward_headers = {
+                                                                    "Authorization": f"{auth_token}",
+                                                                    "Content-Type": "application/json"
+                                                                }
+                                                        else:
+                                                            retry_count += 1
+                                                            if retry_count <= max_retries:
+                                                                # 随机等待0.5到1秒后重试
+                                                                wait_time = random.uniform(5, 15)
+                                                                logger.info(f"UDP转发创建失败，等待{wait_time:.2f}秒后进行第{retry_count+1}次尝试")
+                                                                time.sleep(wait_time)
+                                                            else:
+                                                                logger.error(f"UDP转发创建失败，已重试{max_retries}次: {forward_response.text}")
+                                                    
+                                                    if forward_success:                                                       
+                                                        # 获取转发规则
+                                                        search_rules_url = f"{settings.API_BASE_URL}/api/v1/user/forward/search_rules"
+                                                        search_rules_data = {
+                                                            "gid": 0,
+                                                            "gid_in": 0,
+                                                            "gid_out": 0,
+                                                            "name": "",
+                                                            "dest": json.loads(udp_peizhi.get('config')).get('dest')[0],
+                                                            "listen_port": 0
+                                                        }
+                                                        search_rules_response = requests.post(
+                                                            search_rules_url,
+                                                            headers=forward_headers,
+                                                            json=search_rules_data
+                                                        )
+                                                        
+                                                        if search_rules_response.status_code == 200:
+
+                                                            search_rules_data = search_rules_response.json()
+                                                            if search_rules_data.get('code') == 0 and search_rules_data.get('data'):
+                                                                # 获取监听端口
+                                                                listen_port = search_rules_data['data'][0]['listen_port']
+                                                                
+                                                                # 获取设备组信息
+                                                                device_group_url = f"{settings.API_BASE_URL}/api/v1/user/devicegroup"
+                                                                device_group_response = requests.get(
+                                                                    device_group_url,
+                                                                    headers=forward_headers
+                                                                )
+                                                                
+                                                                if device_group_response.status_code == 200:
+                                                                    device_group_data = device_group_response.json()
+                                                                    if device_group_data.get('code') == 0 and device_group_data.get('data'):
+                                                                        # 查找匹配的设备组
+                                                                        for group in device_group_data['data']:
+                                                                            if group['id'] == search_rules_data['data'][0]['device_group_in']:
+                                                                                # 拼装 UDP 主机地址
+                                                                                udp_host = f"{group['id']}:{listen_port}"
+                                                                                # 更新 NodeInfo 的 udp_host 字段
+                                                                                node.udp_host = udp_host
+                                                                                node.save(update_fields=['udp_host'])
+                                                                                break
+                                                    else:
+                                                        logger.error(f"UDP转发创建失败，已重试{max_retries}次仍失败")
+                                                else:
+                                                    logger.error(f"中转登录失败: {login_response.text}")
+                                            
+                                            except Exception as e:
+                                                logger.error(f"处理UDP中转配置时出错: {str(e)}")
+                                        except Exception as e:
+                                            logger.error(f"处理UDP配置时出错: {str(e)}")
+                                    
+                                    node.save(update_fields=['status', 'panel_node_id', 'udp_config'])
+                                else:
+                                    error_msg = result.get('msg', '未知错误')
+                                    logger.error(f"创建节点失败: {error_msg}")
+                                    node.status = 'inactive'
+                                    node.save(update_fields=['status'])
+                            except json.JSONDecodeError:
+                                logger.error(f"解析面板响应失败: {response.text}")
+                                node.status = 'inactive'
+                                node.save(update_fields=['status'])
+                        else:
+                            logger.error(f"面板返回错误状态码: {response.status_code}, 响应: {response.text}")
+                            node.status = 'inactive'
+                            node.save(update_fields=['status'])
+                        
+
+                    except Exception as e:
+                        logger.error(f"发送创建节点请求时出错: {str(e)}")
+                        node.status = 'inactive'
+                        node.save(update_fields=['status'])
+                else:
+                    logger.error(f"节点 {node.id} 没有有效的host_config")
+                    node.status = 'inactive'
+                    node.save(update_fields=['status'])
+                
+            except Exception as e:
+                logger.error(f"处理节点 {node.id} 时出错: {str(e)}")
+                continue
+                
+        # 所有节点处理完成后，登记重启所有使用到的面板，由调度器合并后在后台执行
+        logger.info(f"所有节点创建完成，登记重启 {len(panels_to_restart)} 个面板")
+        for panel in panels_to_restart:
+            schedule_xray_restart(panel, '节点创建')
+    
+    except Exception as e:
+        logger.error(f"节点创建过程中发生错误: {str(e)}")
+
+
+def process_node_creation_time(node):
+    """
+    异步处理节点创建和中转配置的函数
+    单节点续费操作
+    订单续费操作也是传递订单下所有节点调用这个函数
+    通过修改节点到期时间来实现
+    """
+    print('==开始处理节点创建，修改节点到期时间来实现==')
+    try:
+        # 遍历所有节点信息
+        try:
+                # 解析host_config
+            print('==host_config==',node.host_config)
+            if node.host_config:
+                if isinstance(node.host_config, dict):
+                    host_config = node.host_config
+                else:
+                    host_config = json.loads(node.host_config)
+                logger.info(f"处理节点 {node.id}, 面板: {host_config}")
+                
+                # 获取面板信息
+                panel_id = host_config.get('id')
+                if not panel_id:
+                    logger.error(f"节点 {node.id} 的host_config中没有panel_id")
+                    
+                    
+                try:
+                    panel = AgentPanel.objects.get(id=panel_id)
+                except AgentPanel.DoesNotExist:
+                    logger.error(f"找不到ID为 {panel_id} 的面板")
+                    
+                
+                # 解析config_text获取节点配置
+                if not node.config_text:
+                    logger.error(f"节点 {node.id} 没有config_text数据")
+                    
+                    
+                # 解析config_text为JSON对象
+                form_data = json.loads(node.config_text)
+                
+                # 调整form_data格式，将嵌套对象转为字符串
+                nested_fields = ['settings', 'streamSettings', 'sniffing', 'allocate']
+                for field in nested_fields:
+                    if field in form_data and isinstance(form_data[field], (dict, list)):
+                        # 将对象转为JSON字符串
+                        form_data[field] = json.dumps(form_data[field])
+                
+                
+                # 构建请求头
+                if panel.panel_type == 'x-ui':
+                    url = f"http://{panel.ip_address}/xui/inbound/update/{node.panel_node_id}"
+                    headers = {
+                        'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
+                        'Accept': 'application/json, text/plain, */*',
+                        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/96.0.4664.45 Safari/537.36',
+                    }
+                else:  # 3x-ui
+                    url = f"http://{panel.ip_address}/panel/inbound/update/{node.panel_node_id}"
+                    headers = {
+                        'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
+                        'Accept': 'application/json, text/plain, */*',
+                        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/96.0.4664.45 Safari/537.36',
+                    }
+                
+                # 尝试获取cookie
+                if not panel.cookie:
+                    logger.info(f"面板 {panel_id} 无cookie，尝试登录获取")
+                    cookie = get_login_cookie(panel, host_config)
+                    if not cookie:
+                        logger.error(f"无法获取面板 {panel_id} 的cookie")
+                        
+                
+                # 发送创建节点请求
+                try:
+                    # 使用封装的请求函数，自动处理cookie过期问题
+                    response = make_request_with_cookie(
+                        panel, 
+                        host_config, 
+                        url, 
+                        headers, 
+                        method='post_params', 
+                        data=form_data
+                    )
+                    # 检查响应
+                    if response.status_code == 200:
+                        logger.info(f"节点 {node.id} 续费更新成功")
+                    else:
+                        logger.error(f"面板返回错误状态码: {response.status_code}, 响应: {response.text}")
+                        node.status = 'inactive'
+                        node.save(update_fields=['status'])
+                    
+                    if node.udp:
+                        udp_config_json = json.loads(node.udp_config)
+                        udp_zhanghao = udp_config_json.get('config', {})
+                        udp_peizhi = udp_config_json.get('udpConfig', {})
+                        udp_search_dest_ip = json.loads(udp_peizhi.get('config')).get('dest')[0]
+                        print("+++++++++续费udp+udp_search_dest_ip++++++++",udp_search_dest_ip)
+                        transit_account = TransitAccount.objects.get(id=udp_zhanghao.get('id'))
+                        auth_token = transit_account.token
+                        if not auth_token:
+                            login_url = f"{settings.API_BASE_URL}/api/v1/auth/login"
+                            login_data = {
+                                "username": udp_zhanghao.get('username'),
+                                "password": udp_zhanghao.get('password')
+                            }
+                            headers_nyanpass = {
+                                "Content-Type": "text/plain;charset=UTF-8",
+                                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+                                "Accept": "*/*",
+                                "Origin": settings.API_BASE_URL,
+                            }
+                            login_response = requests.post(login_url, json=login_data, headers=headers_nyanpass)
+                            if login_response.status_code == 200:
+                                login_result = login_response.json()
+                                auth_token = login_result.get('data', {})
+                                transit_account.token = auth_token
+                                transit_account.save(update_fields=['token'])
+
+                        if auth_token:
+                            forward_headers = {
+                                        "Authorization": f"{auth_token}",
+                                        "Content-Type": "application/json"
+                                    }
+                            retry_count = 0
+                            max_retries = 4  # 最大重试次数，加上首次请求总共尝试2次
+                            forward_success = False
+                            search_rules_url = f"{settings.API_BASE_URL}/api/v1/user/forward/search_rules"
+                            search_rules_data = {
+                                "gid": 0,
+                                "gid_in": 0,
+                                "gid_out": 0,
+                                "name": "",
+                                "dest": udp_search_dest_ip,
+                                "listen_port": 0
+                            }
+                            while retry_count <= max_retries and not forward_success:
+                                search_rules_response = requests.post(
+                                            search_rules_url,
+                                            headers=forward_headers,
+                                            json=search_rules_data
+                                        )
+                                if search_rules_response.status_code == 200 and search_rules_response.json().get('code') != 403:
+                                    search_rules_data = search_rules_response.json()
+                                    if search_rules_data.get('code') == 0 and search_rules_data.get('data'):
+                                        pass_data = search_rules_data.get('data')
+                                        for pass_item in pass_data:
+                                            pass_item["name"] = udp_peizhi.get('name')
+                                            print("+++++++++续费udp+pass_item++++++++",pass_item)
+                                            forward_headers = {
+                                                        "Authorization": f"{auth_token}",
+                                                        "Content-Type": "application/json"
+                                                    }
+                                            res_change_forward = requests.post(
+                                                        f"{settings.API_BASE_URL}/api/v1/user/forward/{pass_item.get('id')}",
+                                                        headers=forward_headers,
+                                                        json=pass_item
+                                                    )
+                                            retry_count_change_forward = 0
+                                            max_retries_change_forward = 4
+                                            forward_success_change_forward = False
+                                            while retry_count_change_forward <= max_retries_change_forward and not forward_success_change_forward:
+                                                if res_change_forward.status_code == 200 and res_change_forward.json().get('code') == 0:
+                                                    forward_success_change_forward = True
+                                                    break
+                                                elif res_change_forward.status_code == 403 or res_change_forward.json().get('code') == 403 or retry_count_change_forward==3:
+                                                    retry_count_change_forward+=1
+                                                    login_url = f"{settings.API_BASE_URL}/api/v1/auth/login"
+                                                    login_data = {
+                                                        "username": udp_zhanghao.get('username'),
+                                                        "password": udp_zhanghao.get('password')
+                                                    }
+                                                    headers_nyanpass = {
+                                                        "Content-Type": "text/plain;charset=UTF-8",
+                                                        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+                                                        "Accept": "*/*",
+                                                        "Origin": settings.API_BASE_URL,
+                                                    }
+                                                    login_response = requests.post(login_url, json=login_data, headers=headers_nyanpass)
+                                                    if login_response.status_code == 200:
+                                                        login_result = login_response.json()
+                                                        auth_token = login_result.get('data', {})
+                                                        transit_account.token = auth_token
+                                                        transit_account.save(update_fields=['token'])
+                                                        forward_headers = {
+                                                            "Authorization": f"{auth_token}",
+                                                            "Content-Type": "application/json"
+                                                        }
+                                                else:
+                                                    retry_count_change_forward += 1
+                                                    if retry_count_change_forward <= max_retries_change_forward:
+                                                        time.sleep(random.uniform(3, 7))
+                                        forward_success = True
+                                        break
+                                elif search_rules_response.status_code == 403 or search_rules_response.json().get('code') == 403 or retry_count==3:
+                                    retry_count += 1
+                                    login_url = f"{settings.API_BASE_URL}/api/v1/auth/login"
+                                    login_data = {
+                                        "username": udp_zhanghao.get('username'),
+                                        "password": udp_zhanghao.get('password')
+                                    }
+                                    headers_nyanpass = {
+                                        "Content-Type": "text/plain;charset=UTF-8",
+                                        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+                                        "Accept": "*/*",
+                                        "Origin": settings.API_BASE_URL,
+                                    }
+                                    login_response = requests.post(login_url, json=login_data, headers=headers_nyanpass)
+                                    if login_response.status_code == 200:
+                                        login_result = login_response.json()
+                                        auth_token = login_result.get('data', {})
+                                        transit_account.token = auth_token
+                                        transit_account.save(update_fields=['token'])
+                                        forward_headers = {
+                                            "Authorization": f"{auth_token}",
+                                            "Content-Type": "application/json"
+                                        }
+                                else:
+                                    retry_count += 1
+                                    if retry_count <= max_retries:
+                                        # 随机等待0.5到1秒后重试
+                                        wait_time = random.uniform(5, 15)
+                                        logger.info(f"UDP转发更新失败，等待{wait_time:.2f}秒后进行第{retry_count+1}次尝试")
+                                        time.sleep(wait_time)
+                                    else:
+                                        logger.error(f"UDP转发更新失败，已重试{max_retries}次仍失败")
+
+                except Exception as e:
+                    logger.error(f"发送创建节点请求时出错: {str(e)}")
+                    node.status = 'inactive'
+                    node.save(update_fields=['status'])
+            else:
+                logger.error(f"节点 {node.id} 没有有效的host_config")
+                node.status = 'inactive'
+                node.save(update_fields=['status'])
+            
+        except Exception as e:
+            logger.error(f"处理节点 {node.id} 时出错: {str(e)}")
+    except Exception as e:
+        logger.error(f"节点创建过程中发生错误: {str(e)}")
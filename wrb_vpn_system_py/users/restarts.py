@@ -0,0 +1,193 @@
+"""
+xray 重启调度
+
+开通、迁移节点后需要重启面板的 xray 才能生效，但每次重启都会断开该面板上所有用户的连接。
+各业务流程不再自己发送重启请求，而是调用 schedule_xray_restart 登记，由后台线程统一执行：
+- 同一面板在 XRAY_RESTART_DEBOUNCE 秒内的多次登记合并为一次重启，
+  持续有新登记时最多推迟 XRAY_RESTART_MAX_DELAY 秒
+- 每个面板每小时最多重启 XRAY_RESTART_MAX_PER_HOUR 次，超出时推迟到额度恢复后再执行，不会丢弃
+- 重启历史保存在缓存中，多个进程共享缓存时，登记之后其他进程已经完成的重启会被视为已覆盖本次登记
+
+只有 3x-ui 面板支持重启 xray，其他类型的面板登记时直接忽略。
+进程退出时会立即执行还未到期的重启。
+"""
+import atexit
+import heapq
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+
+from panels.drivers import PanelClient
+from panels.models import AgentPanel
+
+logger = logging.getLogger(__name__)
+
+# 合并窗口（秒）
+XRAY_RESTART_DEBOUNCE = getattr(settings, 'XRAY_RESTART_DEBOUNCE', 10)
+# 从第一次登记起最长推迟时间（秒）
+XRAY_RESTART_MAX_DELAY = getattr(settings, 'XRAY_RESTART_MAX_DELAY', 60)
+XRAY_RESTART_MAX_PER_HOUR = getattr(settings, 'XRAY_RESTART_MAX_PER_HOUR', 6)
+XRAY_RESTART_HISTORY_KEY = 'xray_restart_history:{panel_id}'
+
+
+def get_restart_history(panel_id, now=None):
+    """最近一小时内的重启时间戳列表"""
+    now = now or time.time()
+    history = cache.get(XRAY_RESTART_HISTORY_KEY.format(panel_id=panel_id)) or []
+    return [ts for ts in history if ts > now - 3600]
+
+
+def record_restart(panel_id, now=None):
+    now = now or time.time()
+    history = get_restart_history(panel_id, now)
+    history.append(now)
+    cache.set(XRAY_RESTART_HISTORY_KEY.format(panel_id=panel_id), history, 3600)
+
+
+def restart_panel_xray(panel):
+    """立即重启面板的 xray，失败时重试一次，返回是否成功"""
+    client = PanelClient(panel)
+    for attempt in range(2):
+        try:
+            client.restart_xray()
+            logger.info(f"重启面板 {panel.id} 成功")
+            return True
+        except Exception as e:
+            logger.error(f"重启面板 {panel.id} 第{attempt + 1}次失败: {str(e)}")
+    return False
+
+
+class XrayRestartScheduler:
+    """按面板合并 xray 重启请求"""
+
+    def __init__(self, debounce=XRAY_RESTART_DEBOUNCE, max_delay=XRAY_RESTART_MAX_DELAY,
+                 max_per_hour=XRAY_RESTART_MAX_PER_HOUR):
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.max_per_hour = max_per_hour
+        # panel_id -> {'first': 第一次登记时间, 'due': 计划执行时间, 'reasons': 登记原因}
+        self.pending = {}
+        self.heap = []
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def start(self):
+        with self.condition:
+            if self.thread and self.thread.is_alive():
+                return
+            self.thread = threading.Thread(target=self.run, name='xray-restart-scheduler')
+            self.thread.daemon = True
+            self.thread.start()
+
+    def schedule(self, panel, reason=''):
+        """登记面板需要重启，返回是否已登记"""
+        if panel.panel_type != '3x-ui':
+            return False
+        self.start()
+        now = time.time()
+        with self.condition:
+            entry = self.pending.get(panel.id)
+            if entry is None:
+                entry = self.pending[panel.id] = {'first': now, 'due': None, 'reasons': set()}
+            if reason:
+                entry['reasons'].add(reason)
+            entry['due'] = max(entry['due'] or 0, min(now + self.debounce, entry['first'] + self.max_delay))
+            heapq.heappush(self.heap, (entry['due'], panel.id))
+            self.condition.notify()
+        logger.info(f"面板 {panel.id} 登记重启xray({reason})，计划于 {entry['due'] - now:.0f} 秒后执行")
+        return True
+
+    def cancel(self, panel_id):
+        """面板已经手动重启过，取消还未执行的登记"""
+        with self.condition:
+            self.pending.pop(panel_id, None)
+
+    def next_due(self):
+        """等待并取出下一个到期的面板，堆中过期的旧计划直接跳过"""
+        with self.condition:
+            while True:
+                while self.heap:
+                    due, panel_id = self.heap[0]
+                    entry = self.pending.get(panel_id)
+                    if entry is None or entry['due'] != due:
+                        heapq.heappop(self.heap)
+                        continue
+                    break
+                if not self.heap:
+                    self.condition.wait()
+                    continue
+                wait = self.heap[0][0] - time.time()
+                if wait > 0:
+                    self.condition.wait(wait)
+                    continue
+                _, panel_id = heapq.heappop(self.heap)
+                return panel_id, self.pending[panel_id]
+
+    def defer(self, panel_id, entry, due):
+        with self.condition:
+            # 等待期间如果有新登记，保留新登记的计划
+            if self.pending.get(panel_id) is entry:
+                entry['due'] = due
+                heapq.heappush(self.heap, (due, panel_id))
+
+    def run(self):
+        while True:
+            panel_id, entry = self.next_due()
+            try:
+                close_old_connections()
+                self.execute(panel_id, entry)
+            except Exception as e:
+                logger.error(f"执行面板 {panel_id} xray重启失败: {str(e)}")
+            finally:
+                close_old_connections()
+
+    def execute(self, panel_id, entry, force=False):
+        now = time.time()
+        history = get_restart_history(panel_id, now)
+        if history and history[-1] >= entry['first']:
+            # 登记之后已经有其他进程或手动操作重启过
+            logger.info(f"面板 {panel_id} 在登记后已重启过，跳过本次重启")
+            self.finish(panel_id, entry)
+            return
+        if not force and len(history) >= self.max_per_hour:
+            due = history[len(history) - self.max_per_hour] + 3600
+            logger.warning(f"面板 {panel_id} 最近一小时已重启 {len(history)} 次，推迟 {due - now:.0f} 秒后再重启")
+            self.defer(panel_id, entry, due)
+            return
+
+        # 先从待执行列表中移除，执行期间的新登记会单独安排下一次重启
+        self.finish(panel_id, entry)
+        panel = AgentPanel.objects.filter(id=panel_id).first()
+        if panel is None or not panel.is_active:
+            return
+        logger.info(f"重启面板 {panel.id} ({panel.ip_address})，合并了 {', '.join(sorted(entry['reasons'])) or '未注明'}")
+        record_restart(panel_id, now)
+        restart_panel_xray(panel)
+
+    def finish(self, panel_id, entry):
+        with self.condition:
+            if self.pending.get(panel_id) is entry:
+                del self.pending[panel_id]
+
+    def flush(self):
+        """立即执行所有未到期的重启（进程退出时调用）"""
+        with self.condition:
+            items = list(self.pending.items())
+        for panel_id, entry in items:
+            try:
+                self.execute(panel_id, entry, force=True)
+            except Exception as e:
+                logger.error(f"执行面板 {panel_id} xray重启失败: {str(e)}")
+
+
+xray_restart_scheduler = XrayRestartScheduler()
+atexit.register(xray_restart_scheduler.flush)
+
+
+def schedule_xray_restart(panel, reason=''):
+    """登记面板需要重启 xray，由后台线程合并后执行"""
+    return xray_restart_scheduler.schedule(panel, reason)
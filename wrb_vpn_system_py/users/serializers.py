@@ -50,6 +50,8 @@ class UserSerializer(serializers.ModelSerializer):
             'is_email_verified', 'package',
             'created_at', 'updated_at', 'cdk_count'
         ]
+        # 余额只能通过 update_balance 接口（change_balance）修改，保证每次变动都有流水
+        read_only_fields = ['balance']
         extra_kwargs = {
             'password': {'write_only': True},
         }
@@ -191,7 +193,8 @@ class AgentSerializer(serializers.ModelSerializer):
                   'transit_monthly_price', 'transit_quarterly_price', 'transit_half_yearly_price', 'transit_yearly_price',
                   'default_transit_account',
                   'is_active', 'date_joined', 'last_login']
-        read_only_fields = ['id', 'date_joined', 'last_login']
+        # 余额只能通过 update_balance 接口（change_balance）修改，保证每次变动都有流水
+        read_only_fields = ['id', 'date_joined', 'last_login', 'balance']
     
     def validate(self, attrs):
         # 验证password和confirm_password
@@ -257,7 +260,7 @@ class CustomerSerializer(serializers.ModelSerializer):
             'is_active', 'date_joined', 'last_login', 'balance',
             'agent_username'
         ]
-        read_only_fields = ['id', 'date_joined', 'last_login']
+        read_only_fields = ['id', 'date_joined', 'last_login', 'balance']
     
     def get_agent_username(self, obj):
         """获取代理用户名"""
@@ -416,8 +419,6 @@ class PaymentOrderSerializer(serializers.ModelSerializer):
     username = serializers.CharField(source='user.username', read_only=True)
     email = serializers.CharField(source='user.email', read_only=True)
     agent_username = serializers.SerializerMethodField()
-    period = serializers.SerializerMethodField()
-    node_type = serializers.SerializerMethodField()
     
     class Meta:
         model = PaymentOrder
@@ -430,27 +431,10 @@ class PaymentOrderSerializer(serializers.ModelSerializer):
         read_only_fields = fields
     
     def get_agent_username(self, obj):
-        """获取代理用户名"""
+        """获取代理用户名（列表查询已 select_related('user__parent')）"""
         if obj.user.parent:
             return obj.user.parent.username
         return None
-        
-    def get_period(self, obj):
-        """获取支付周期"""
-        try:
-            param = json.loads(obj.param) if obj.param else {}
-            period = param.get('period', '')
-            return period
-        except:
-            return ''
-            
-    def get_node_type(self, obj):
-        """获取节点类型"""
-        try:
-            param = json.loads(obj.param) if obj.param else {}
-            return param.get('nodeType', '')
-        except:
-            return ''
 
 class ContactInfoSerializer(serializers.ModelSerializer):
     """联系方式序列化器"""
@@ -1,3 +1,14 @@
-from django.test import TestCase
+from django.conf import settings
+from django.test import SimpleTestCase
 
-# Create your tests here.
+from benchmarks.importtime import measure_import_time, median_total
+
+
+class ImportTimeBudgetTest(SimpleTestCase):
+    """URL 配置的导入耗时不超过 IMPORT_TIME_BUDGET_MS，避免 worker 启动随代码增长变慢"""
+
+    def test_urlconf_import_time_within_budget(self):
+        budget = getattr(settings, 'IMPORT_TIME_BUDGET_MS', 1500)
+        runs = [measure_import_time('vpncms.urls') for _ in range(3)]
+        median = median_total(runs)
+        self.assertLessEqual(median, budget, f'导入 vpncms.urls 耗时 {median}ms，超出预算 {budget}ms')
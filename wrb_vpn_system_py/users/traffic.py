@@ -0,0 +1,99 @@
+"""
+流量统计
+
+面板的入站列表中每个入站都带有累计的 up/down 字节数，面板轮询（update_single_panel）
+拿到列表后调用 ingest_panel_traffic：
+- 按 (panel_id, panel_node_id) 将入站对应到 NodeInfo
+- 与 NodeInfo 上保存的上次采样值相减得到增量；计数比上次小说明面板重置过计数或节点刚迁移，
+  此时本次计数整体作为增量
+- 节点还没有采样值（traffic_up/traffic_down 为空）时只记录本次计数作为基准，不计入流量，
+  避免把入站的历史累计流量记到当天
+- 按客户汇总增量，用 F('traffic_used') + 增量 累加到当天的 TrafficRecord
+- 整个过程在事务中进行，节点记录用 select_for_update 锁定，并发采样同一面板时不会重复计数
+"""
+import logging
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import NodeInfo, TrafficRecord
+
+logger = logging.getLogger(__name__)
+
+
+def parse_counter(value):
+    try:
+        return max(int(value or 0), 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def ingest_panel_traffic(panel, inbounds):
+    """
+    根据面板入站列表记录流量
+
+    参数:
+    - panel: 面板对象
+    - inbounds: 面板 inbound/list 返回的 obj 列表
+
+    返回:
+    - 本次记录的总流量（字节）
+    """
+    counters = {}
+    for inbound in inbounds:
+        inbound_id = inbound.get('id')
+        if inbound_id is None:
+            continue
+        counters[int(inbound_id)] = (parse_counter(inbound.get('up')), parse_counter(inbound.get('down')))
+    if not counters:
+        return 0
+
+    today = timezone.localdate()
+    customer_usage = {}
+    changed_nodes = []
+    with transaction.atomic():
+        # 锁定节点记录：面板轮询和手动刷新可能同时采样同一个面板，后到的一方等待后读到新的采样值，
+        # 不会对同一段流量重复计算增量
+        nodes = {}
+        for node in NodeInfo.objects.select_for_update().filter(
+            panel_id=panel.id, panel_node_id__in=counters.keys()
+        ).exclude(status='deleted').only('id', 'user_id', 'panel_node_id', 'traffic_up', 'traffic_down').order_by('id'):
+            # 同一个面板节点ID只取最新的一条节点记录
+            nodes[node.panel_node_id] = node
+
+        for panel_node_id, node in nodes.items():
+            up, down = counters[panel_node_id]
+            if node.traffic_up is None or node.traffic_down is None:
+                node.traffic_up = up
+                node.traffic_down = down
+                changed_nodes.append(node)
+                continue
+            delta_up = up - node.traffic_up if up >= node.traffic_up else up
+            delta_down = down - node.traffic_down if down >= node.traffic_down else down
+            if up == node.traffic_up and down == node.traffic_down:
+                continue
+            node.traffic_up = up
+            node.traffic_down = down
+            changed_nodes.append(node)
+            if delta_up + delta_down > 0:
+                customer_usage[node.user_id] = customer_usage.get(node.user_id, 0) + delta_up + delta_down
+
+        if not changed_nodes:
+            return 0
+
+        if customer_usage:
+            # 先补齐当天缺少的记录，再在数据库中原子累加，不依赖读出的旧值
+            TrafficRecord.objects.bulk_create(
+                [TrafficRecord(customer_id=customer_id, date=today, traffic_used=0) for customer_id in customer_usage],
+                ignore_conflicts=True,
+            )
+            for customer_id, used in customer_usage.items():
+                TrafficRecord.objects.filter(customer_id=customer_id, date=today).update(
+                    traffic_used=F('traffic_used') + used
+                )
+        NodeInfo.objects.bulk_update(changed_nodes, ['traffic_up', 'traffic_down'], batch_size=500)
+
+    total = sum(customer_usage.values())
+    logger.info(f"面板 {panel.id} 流量采样完成: {len(changed_nodes)} 个节点, {len(customer_usage)} 个客户, 共 {total} 字节")
+    return total
@@ -1,8 +1,9 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import TokenRefreshView
-from . import views
-from .views import (
+from vpncms.lazy import lazy_view
+# 注册在路由器上的 ViewSet 需要在构建路由时导入类本身，accounts 无法延迟导入
+from .views.accounts import (
     UserViewSet,
     CustomTokenObtainPairView,
     PasswordResetView,
@@ -14,14 +15,7 @@ from .views import (
     CustomerPackageViewSet,
     WebsiteTemplateViewSet,
     CustomerLoginView,
-    payment_callback,
-    payment_status,
     AgentContactView,
-    AgentPricingView,
-    UpdateCustomPricingView,
-    UpdateUserPricingView,
-    change_node_panel,
-    change_order_panel,
 )
 from django.views.decorators.csrf import csrf_exempt
 
@@ -43,17 +37,18 @@ urlpatterns = [
     path('customer/login/', CustomerLoginView.as_view(), name='customer-login'),
     path('update_profile/', UserViewSet.as_view({'put': 'update_profile'}), name='update-profile'),
     path('change_password/', UserViewSet.as_view({'put': 'change_password'}), name='change-password'),
-    path('payment/callback/', payment_callback, name='payment-callback'),
-    path('payment/submit/', views.payment_submit, name='payment-submit'),
-    path('payment/status/', payment_status, name='payment-status'),
-    path('coupon/validate/', views.validate_coupon, name='validate-coupon'),
-    path('prices/', views.get_prices, name='get-prices'),
+    path('payment/callback/', lazy_view('users.views.payment.payment_callback'), name='payment-callback'),
+    path('payment/submit/', lazy_view('users.views.payment.payment_submit'), name='payment-submit'),
+    path('payment/status/', lazy_view('users.views.payment.payment_status'), name='payment-status'),
+    path('coupon/validate/', lazy_view('users.views.payment.validate_coupon'), name='validate-coupon'),
+    path('prices/', lazy_view('users.views.pricing.get_prices'), name='get-prices'),
     path('agent-contact/', AgentContactView.as_view(), name='agent-contact'),
-    path('agent/pricing/', AgentPricingView.as_view(), name='agent-pricing'),
-    path('agent/pricing/update/', UpdateCustomPricingView.as_view(), name='update-custom-pricing'),
-    path('agent/pricing/update-user/', UpdateUserPricingView.as_view(), name='update-user-pricing'),
-    path('change-node-panel/', change_node_panel, name='change-node-panel'),
-    path('change-order-panel/', change_order_panel, name='change-order-panel'),
-    path('node/renewal/', views.node_renewal, name='node-renewal'),
-    path('order/renewal/', views.order_renewal, name='order-renewal'),
+    path('agent/pricing/', lazy_view('users.views.pricing.AgentPricingView'), name='agent-pricing'),
+    path('agent/pricing/update/', lazy_view('users.views.pricing.UpdateCustomPricingView'), name='update-custom-pricing'),
+    path('agent/pricing/update-user/', lazy_view('users.views.pricing.UpdateUserPricingView'), name='update-user-pricing'),
+    path('change-node-panel/', lazy_view('users.views.migration.change_node_panel'), name='change-node-panel'),
+    path('change-order-panel/', lazy_view('users.views.migration.change_order_panel'), name='change-order-panel'),
+    path('migration/progress/', lazy_view('users.views.migration.migration_progress'), name='migration-progress'),
+    path('node/renewal/', lazy_view('users.views.renewal.node_renewal'), name='node-renewal'),
+    path('order/renewal/', lazy_view('users.views.renewal.order_renewal'), name='order-renewal'),
 ] 
\ No newline at end of file
@@ -0,0 +1,14 @@
+"""
+users 应用的接口
+
+- accounts: 登录、用户、代理、客户、套餐、联系方式
+- orders: 订单查询
+- payment: 在线支付、支付回调、余额下单
+- pricing: 价格查询和设置
+- migration: 节点迁移
+- renewal: 续费
+
+accounts 和 orders 中的 ViewSet 注册在路由器上，导入 URL 配置时就会加载；
+其余模块由 URL 配置通过 vpncms.lazy.lazy_view 在第一次请求时才导入，
+worker 启动和管理命令不再需要加载下单、迁移等大模块及其依赖。
+"""
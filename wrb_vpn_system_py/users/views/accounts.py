@@ -0,0 +1,2280 @@
+"""
+用户、代理、客户相关接口
+
+这里的 ViewSet 注册在路由器上，随 URL 配置一起导入；下单、价格、迁移、续费接口在各自的模块中，
+由 URL 配置通过 lazy_view 在第一次请求时才导入。
+"""
+from rest_framework import viewsets, status
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.response import Response
+from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
+from rest_framework.views import APIView
+from django.contrib.auth import get_user_model
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.views import TokenObtainPairView
+from ..serializers import CustomTokenObtainPairSerializer, PasswordResetSerializer, AvatarSerializer, AgentSerializer, CustomerSerializer, PackageSerializer, CustomerPackageSerializer, LoginRecordSerializer, TrafficRecordSerializer, CustomerDetailSerializer, ResetPasswordSerializer, WebsiteTemplateSerializer, UserRegisterSerializer, ContactInfoSerializer
+from django.core.mail import send_mail
+from django.conf import settings
+import random
+import string
+from django.core.cache import cache
+from django.views.decorators.csrf import csrf_exempt
+from django.utils.decorators import method_decorator
+from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
+from ..utils import api_response
+from decimal import Decimal
+from django.db.models import Q, F, Window
+from django.db.models.functions import RowNumber
+from datetime import datetime
+from ..models import NodeInfo, Package, CustomerPackage, LoginRecord, TrafficRecord, WebsiteTemplate, PaymentOrder, ContactInfo
+from ..permissions import IsAgentL2, IsAgentOrAdmin
+import logging
+from transits.services import get_agent_domain_map, get_udp_host_domain
+from ..ledger import change_balance, InsufficientBalance
+from ..exports import get_export_format, stream_export
+from ..pagination import KeysetPagination, use_keyset_pagination, CustomPagination
+from ..enforcement import enforce_user_nodes
+from ..audit import record_login
+
+User = get_user_model()
+
+logger = logging.getLogger(__name__)
+
+
+class LoginView(APIView):
+    permission_classes = []  # 登录接口不需要认证
+    authentication_classes = []  # 登录接口不需要认证
+
+    def post(self, request):
+        login = request.data.get('username')
+        password = request.data.get('password')
+
+        if not login or not password:
+            return Response({
+                'detail': '用户名/邮箱和密码不能为空'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        # 尝试使用用户名或邮箱登录
+        user = None
+        if '@' in login:
+            try:
+                user = User.objects.get(email=login)
+            except User.DoesNotExist:
+                return Response({
+                    'detail': '邮箱不存在'
+                }, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            try:
+                user = User.objects.get(username=login)
+            except User.DoesNotExist:
+                return Response({
+                    'detail': '用户名不存在'
+                }, status=status.HTTP_400_BAD_REQUEST)
+
+        if not user.check_password(password):
+            return Response({
+                'detail': '密码错误'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        # 生成JWT Token
+        refresh = RefreshToken.for_user(user)
+        record_login(user, request)
+        
+        # 返回登录成功的响应
+        return Response({
+            'code': 200,
+            'message': '登录成功',
+            'data': {
+                'access': str(refresh.access_token),
+                'refresh': str(refresh),
+                'user': {
+                    'id': user.id,
+                    'username': user.username,
+                    'email': user.email,
+                    'user_type': user.user_type,
+                    'balance': user.balance  # 增加余额字段
+                }
+            }
+        })
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class CustomTokenObtainPairView(TokenObtainPairView):
+    serializer_class = CustomTokenObtainPairSerializer
+    permission_classes = [AllowAny]
+
+    def post(self, request, *args, **kwargs):
+        try:
+            # 获取用户名或邮箱
+            username = request.data.get('username')
+            password = request.data.get('password')
+
+            if not username or not password:
+                return Response({
+                    'code': 400,
+                    'message': '用户名/邮箱和密码不能为空',
+                    'data': None
+                }, status=status.HTTP_400_BAD_REQUEST)
+
+            # 判断是否是邮箱格式
+            if '@' in username:
+                try:
+                    user = User.objects.get(email=username)
+                    # 将邮箱对应的用户名赋值给请求数据
+                    request.data['username'] = user.username
+                except User.DoesNotExist:
+                    return Response({
+                        'code': 400,
+                        'message': '该邮箱未注册',
+                        'data': None
+                    }, status=status.HTTP_400_BAD_REQUEST)
+            
+            # 调用父类的 post 方法进行实际的登录验证
+            response = super().post(request, *args, **kwargs)
+            
+            if response.status_code == 200:
+                # 获取用户信息
+                user = User.objects.get(username=request.data['username'])
+                record_login(user, request)
+                data = {
+                    'access': response.data['access'],
+                    'refresh': response.data['refresh'],
+                    'user': {
+                        'user_type': user.user_type,
+                        'id': user.id,
+                        'username': user.username,
+                        'email': user.email,
+                        'name': user.name,
+                        'avatar': user.avatar.url if user.avatar else None
+                    }
+                }
+                return Response({
+                    'code': 200,
+                    'message': '登录成功',
+                    'data': data
+                })
+            return response
+
+        except Exception as e:
+            return Response({
+                'code': 400,
+                'message': str(e),
+                'data': None
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class PasswordResetView(APIView):
+    permission_classes = [AllowAny]
+    serializer_class = PasswordResetSerializer
+
+    def generate_verification_code(self):
+        """生成6位数字验证码"""
+        return ''.join(random.choices(string.digits, k=6))
+
+    def post(self, request):
+        serializer = self.serializer_class(data=request.data)
+        if serializer.is_valid():
+            email = serializer.validated_data['email']
+            try:
+                user = User.objects.get(email=email)
+                # 生成验证码
+                code = self.generate_verification_code()
+                # 存储验证码到缓存（5分钟有效）
+                cache_key = f'reset_password_{email}'
+                cache.set(cache_key, code, timeout=300)  # 5分钟 = 300秒
+
+                # 发送验证码邮件
+                subject = '后台管理系统 - 重置密码验证码'
+                message = f'您的验证码是：{code}\n该验证码5分钟内有效。'
+                try:
+                    send_mail(
+                        subject,
+                        message,
+                        settings.EMAIL_HOST_USER,
+                        [email],
+                        fail_silently=False,
+                    )
+                    return Response({
+                        'code': 200,
+                        'message': '验证码已发送到您的邮箱'
+                    }, status=status.HTTP_200_OK)
+                except Exception as e:
+                    print(f"邮件发送错误: {str(e)}")
+                    return Response({
+                        'message': f'发送验证码失败: {str(e)}'
+                    }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            except User.DoesNotExist:
+                return Response({
+                    'message': '该邮箱未注册'
+                }, status=status.HTTP_400_BAD_REQUEST)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class VerifyCodeView(APIView):
+    permission_classes = [AllowAny]
+
+    def post(self, request):
+        email = request.data.get('email')
+        code = request.data.get('code')
+
+        if not email or not code:
+            return Response({
+                'message': '邮箱和验证码不能为空'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        cache_key = f'reset_password_{email}'
+        stored_code = cache.get(cache_key)
+
+        if not stored_code:
+            return Response({
+                'message': '验证码已过期'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        if code != stored_code:
+            return Response({
+                'message': '验证码错误'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'code': 200,
+            'message': '验证码正确'
+        })
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class ResetPasswordView(APIView):
+    permission_classes = [AllowAny]
+
+    def post(self, request):
+        email = request.data.get('email')
+        code = request.data.get('code')
+        new_password = request.data.get('new_password')
+
+        if not all([email, code, new_password]):
+            return Response({
+                'message': '邮箱、验证码和新密码不能为空'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        # 验证验证码
+        cache_key = f'reset_password_{email}'
+        stored_code = cache.get(cache_key)
+
+        if not stored_code:
+            return Response({
+                'message': '验证码已过期'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        if code != stored_code:
+            return Response({
+                'message': '验证码错误'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            user = User.objects.get(email=email)
+            user.set_password(new_password)
+            user.save()
+            
+            # 清除验证码缓存
+            cache.delete(cache_key)
+            
+            return Response({
+                'code': 200,
+                'message': '密码重置成功'
+            })
+        except User.DoesNotExist:
+            return Response({
+                'message': '用户不存在'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+
+class UserViewSet(viewsets.ModelViewSet):
+    queryset = User.objects.all()
+    serializer_class = UserRegisterSerializer
+    permission_classes = [AllowAny]  # 允许未认证用户访问
+
+    def get_permissions(self):
+        """根据不同的action设置不同的权限"""
+        if self.action in ['register', 'login']:
+            return [AllowAny()]
+        return [IsAuthenticated()]
+
+    @action(detail=False, methods=['post'])
+    def register(self, request):
+        """用户注册接口"""
+        try:
+            # 获取当前请求的域名
+            current_domain = request.META.get('HTTP_HOST', '')
+
+            referer_domain = ''
+            requesting_domain = request.META.get('HTTP_HOST', '')
+            origin = request.META.get('HTTP_ORIGIN', '')    # 获取请求的源域名
+            referer = request.META.get('HTTP_REFERER', '')  # 获取请求的来源URL
+            if referer and '://' in referer:
+                referer_parts = referer.split('://', 1)[1]
+                if '/' in referer_parts:
+                    referer_domain = referer_parts.split('/', 1)[0]
+                else:
+                    referer_domain = referer_parts
+            
+            # 尝试从HTTP_ORIGIN中提取域名
+            origin_domain = ''
+            if origin and '://' in origin:
+                origin_domain = origin.split('://', 1)[1]
+            
+            
+            # 使用多种方法尝试获取源地址
+            source_domain = referer_domain or origin_domain or requesting_domain
+                
+
+            matched_agent = None
+            agents = User.objects.filter(user_type='agent_l2')
+            
+            print(f"当前请求的域名: {current_domain}")
+            if not current_domain:
+                return Response({
+                    'code': 400,
+                    'message': '无法获取当前域名',
+                    'data': None
+                }, status=status.HTTP_400_BAD_REQUEST)
+
+            # 获取所有二级代理的域名
+            agents = User.objects.filter(user_type='agent_l2')
+            print(f"所有二级代理的域名: {[{'id': agent.id, 'domain': agent.domain} for agent in agents]}")
+            matched_agent = None
+
+            # 遍历代理，查找匹配的域名
+            for agent in agents:
+                if agent.domain and source_domain.endswith(agent.domain):
+                    matched_agent = agent
+                    print(f"找到匹配的代理: {agent.id}, 域名: {agent.domain}")
+                    break
+
+            if not matched_agent:
+                return Response({
+                    'code': 400,
+                    'message': '未找到匹配的代理',
+                    'data': None
+                }, status=status.HTTP_400_BAD_REQUEST)
+
+            # 打印请求数据
+            print(f"请求数据: {request.data}")
+
+            # 创建序列化器实例
+            serializer = self.get_serializer(data=request.data)
+            if not serializer.is_valid():
+                print(f"序列化器验证错误: {serializer.errors}")
+                return Response({
+                    'code': 400,
+                    'message': '数据验证失败',
+                    'data': serializer.errors
+                }, status=status.HTTP_400_BAD_REQUEST)
+
+            # 添加代理和域名信息
+            validated_data = serializer.validated_data
+            validated_data['parent'] = matched_agent  # 设置父级代理
+            validated_data['domain'] = current_domain  # 设置域名
+
+            # 创建用户
+            user = serializer.create(validated_data)
+
+            return Response({
+                'code': 200,
+                'message': '注册成功',
+                'data': {
+                    'username': user.username,
+                    'email': user.email,
+                    'agent': matched_agent.id
+                }
+            })
+
+        except Exception as e:
+            print(f"注册失败: {str(e)}")
+            return Response({
+                'code': 500,
+                'message': f'注册失败: {str(e)}',
+                'data': None
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    def get_object(self):
+        return self.request.user
+
+    @action(detail=False, methods=['get'])
+    def profile(self, request):
+        """获取当前用户信息"""
+        serializer = self.get_serializer(request.user)
+        return Response({
+            'code': 200,
+            'message': '获取用户信息成功',
+            'data': serializer.data
+        })
+
+    @action(detail=False, methods=['put'])
+    def update_profile(self, request):
+        """修改个人信息
+        可以修改用户名和手机号
+        """
+        try:
+            user = request.user
+            if not user:
+                return Response({
+                    'code': 401,
+                    'message': '未登录',
+                    'data': None
+                }, status=status.HTTP_401_UNAUTHORIZED)
+
+            # 获取要修改的数据
+            username = request.data.get('username')
+            phone = request.data.get('phone')
+
+            # 验证用户名是否重复
+            if username and username != user.username:
+                if User.objects.filter(username=username).exists():
+                    return Response({
+                        'code': 400,
+                        'message': '用户名已存在',
+                        'data': None
+                    }, status=status.HTTP_400_BAD_REQUEST)
+                user.username = username
+
+            # 更新手机号
+            if phone:
+                user.phone = phone
+
+            user.save()
+
+            return Response({
+                'code': 200,
+                'message': '修改成功',
+                'data': {
+                    'username': user.username,
+                    'phone': user.phone
+                }
+            })
+
+        except Exception as e:
+            print(f"修改个人信息失败: {str(e)}")
+            return Response({
+                'code': 500,
+                'message': f'修改失败: {str(e)}',
+                'data': None
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    @action(detail=False, methods=['put'])
+    def change_password(self, request):
+        """修改密码"""
+        try:
+            user = request.user
+            if not user:
+                return Response({
+                    'code': 401,
+                    'message': '未登录',
+                    'data': None
+                }, status=status.HTTP_401_UNAUTHORIZED)
+
+            # 获取新旧密码
+            old_password = request.data.get('old_password')
+            new_password = request.data.get('new_password')
+            confirm_password = request.data.get('confirm_password')
+
+            if not all([old_password, new_password, confirm_password]):
+                return Response({
+                    'code': 400,
+                    'message': '请填写完整信息',
+                    'data': None
+                }, status=status.HTTP_400_BAD_REQUEST)
+
+            # 验证旧密码
+            if not user.check_password(old_password):
+                return Response({
+                    'code': 400,
+                    'message': '原密码错误',
+                    'data': None
+                }, status=status.HTTP_400_BAD_REQUEST)
+
+            # 验证新密码
+            if new_password != confirm_password:
+                return Response({
+                    'code': 400,
+                    'message': '两次输入的新密码不一致',
+                    'data': None
+                }, status=status.HTTP_400_BAD_REQUEST)
+
+            # 设置新密码
+            user.set_password(new_password)
+            user.save()
+
+            return Response({
+                'code': 200,
+                'message': '密码修改成功',
+                'data': None
+            })
+
+        except Exception as e:
+            print(f"修改密码失败: {str(e)}")
+            return Response({
+                'code': 500,
+                'message': f'修改失败: {str(e)}',
+                'data': None
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+    @action(detail=True, methods=['post'])
+    def disable_user(self, request, pk=None):
+        """停用用户接口"""
+        try:
+            # 获取目标用户
+            try:
+                user = User.objects.get(id=pk)
+            except User.DoesNotExist:
+                return Response({
+                    'code': 404,
+                    'message': '用户不存在',
+                    'data': None
+                }, status=status.HTTP_404_NOT_FOUND)
+            
+            # 检查权限
+            if not request.user.is_staff and not request.user.is_superuser:
+                return Response({
+                    'code': 403,
+                    'message': '没有权限执行此操作',
+                    'data': None
+                }, status=status.HTTP_403_FORBIDDEN)
+            
+            # 不允许停用超级管理员
+            if user.is_superuser:
+                return Response({
+                    'code': 400,
+                    'message': '不能停用超级管理员账户',
+                    'data': None
+                }, status=status.HTTP_400_BAD_REQUEST)
+            
+            # 更新用户状态
+            user.is_active = False
+            user.save(update_fields=['is_active'])
+
+            # 停用用户在面板上的入站
+            summary = enforce_user_nodes(user, 'disable')
+            
+            return Response({
+                'code': 200,
+                'message': '用户已停用',
+                'data': summary
+            })
+            
+        except Exception as e:
+            return Response({
+                'code': 500,
+                'message': f'停用用户失败: {str(e)}',
+                'data': None
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    @action(detail=True, methods=['post'])
+    def start_user(self, request, pk=None):
+        """启用用户接口"""
+        try:
+            # 获取目标用户
+            try:
+                user = User.objects.get(id=pk)
+            except User.DoesNotExist:
+                return Response({
+                    'code': 404,
+                    'message': '用户不存在',
+                    'data': None
+                }, status=status.HTTP_404_NOT_FOUND)
+            
+            # 检查权限
+            if not request.user.is_staff and not request.user.is_superuser:
+                return Response({
+                    'code': 403,
+                    'message': '没有权限执行此操作',
+                    'data': None
+                }, status=status.HTTP_403_FORBIDDEN)
+            
+            # 不允许停用超级管理员
+            if user.is_superuser:
+                return Response({
+                    'code': 400,
+                    'message': '不能停用超级管理员账户',
+                    'data': None
+                }, status=status.HTTP_400_BAD_REQUEST)
+            
+            # 更新用户状态
+            user.is_active = True
+            user.save(update_fields=['is_active'])
+
+            # 重新启用停用时关闭的入站
+            summary = enforce_user_nodes(user, 'enable')
+            
+            return Response({
+                'code': 200,
+                'message': '用户已启用',
+                'data': summary
+            })
+            
+        except Exception as e:
+            return Response({
+                'code': 500,
+                'message': f'停用用户失败: {str(e)}',
+                'data': None
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    @action(detail=True, methods=['delete'])
+    def delete_user(self, request, pk=None):
+        """删除用户接口"""
+        try:
+            # 获取目标用户
+            try:
+                user = User.objects.get(id=pk)
+            except User.DoesNotExist:
+                return Response({
+                    'code': 404,
+                    'message': '用户不存在',
+                    'data': None
+                }, status=status.HTTP_404_NOT_FOUND)
+            
+            # 检查权限
+            if not request.user.is_staff and not request.user.is_superuser:
+                return Response({
+                    'code': 403,
+                    'message': '没有权限执行此操作',
+                    'data': None
+                }, status=status.HTTP_403_FORBIDDEN)
+            
+            # 不允许删除超级管理员
+            if user.is_superuser:
+                return Response({
+                    'code': 400,
+                    'message': '不能删除超级管理员账户',
+                    'data': None
+                }, status=status.HTTP_400_BAD_REQUEST)
+            
+            # 先删除面板上的入站并释放端口，节点记录随用户一起删除
+            summary = enforce_user_nodes(user, 'delete')
+            if summary['failed']:
+                # 有面板操作失败时保留用户和节点记录以便重试删除，先停用用户
+                if user.is_active:
+                    user.is_active = False
+                    user.save(update_fields=['is_active'])
+                return Response({
+                    'code': 500,
+                    'message': f"{len(summary['failed'])} 个节点的入站删除失败，用户已停用，请稍后重试删除",
+                    'data': summary
+                }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+            # 删除用户
+            user.delete()
+            
+            return Response({
+                'code': 200,
+                'message': '用户已删除',
+                'data': summary
+            })
+            
+        except Exception as e:
+            return Response({
+                'code': 500,
+                'message': f'删除用户失败: {str(e)}',
+                'data': None
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+    @action(detail=False, methods=['post'], serializer_class=AvatarSerializer)
+    def upload_avatar(self, request):
+        """上传头像"""
+        serializer = AvatarSerializer(request.user, data=request.data, partial=True)
+        if serializer.is_valid():
+            # 如果存在旧头像，删除它
+            if request.user.avatar:
+                request.user.avatar.delete(save=False)
+            
+            serializer.save()
+            return Response({
+                'code': 200,
+                "message": "头像上传成功",
+                "url": request.build_absolute_uri(request.user.avatar.url)
+            })
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    def get_queryset(self):
+        return User.objects.filter(id=self.request.user.id)
+
+    @action(detail=False, methods=['post'])
+    def create_sub_agent(self, request):
+        if request.user.user_type != 'agent_l1':
+            return Response({'message': '只有一级代理可以创建二级代理'}, 
+                          status=status.HTTP_403_FORBIDDEN)
+        
+        data = request.data.copy()
+        data['user_type'] = 'agent_l2'
+        data['parent'] = request.user.id
+        
+        serializer = self.get_serializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    def generate_verification_code(self):
+        """生成6位数字验证码"""
+        return ''.join(random.choices(string.digits, k=6))
+
+    @action(detail=False, methods=['post'])
+    def forgot_password(self, request):
+        """发送重置密码验证码"""
+        email = request.data.get('email')
+        if not email:
+            return Response({'message': '请提供邮箱地址'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            user = User.objects.get(email=email)
+        except User.DoesNotExist:
+            return Response({'message': '该邮箱未注册'}, status=status.HTTP_404_NOT_FOUND)
+
+        # 生成验证码并存储在缓存中（5分钟有效）
+        code = self.generate_verification_code()
+        cache_key = f'reset_password_{email}'
+        cache.set(cache_key, code, timeout=300)  # 5分钟 = 300秒
+
+        # 发送验证码邮件
+        subject = 'VPN管理系统 - 重置密码验证码'
+        message = f'您的验证码是：{code}\n该验证码5分钟内有效。'
+        try:
+            send_mail(
+                subject,
+                message,
+                settings.EMAIL_HOST_USER,
+                [email],
+                fail_silently=False,
+            )
+            return Response({'code': 200,'message': '验证码已发送到您的邮箱'})
+        except Exception as e:
+            print(f"邮件发送错误: {str(e)}")
+            return Response({'message': f'发送验证码失败: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    @action(detail=False, methods=['post'])
+    def verify_code(self, request):
+        """验证重置密码验证码"""
+        email = request.data.get('email')
+        code = request.data.get('code')
+
+        if not email or not code:
+            return Response({'message': '请提供邮箱和验证码'}, status=status.HTTP_400_BAD_REQUEST)
+
+        cache_key = f'reset_password_{email}'
+        stored_code = cache.get(cache_key)
+
+        if not stored_code:
+            return Response({'message': '验证码已过期'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if code != stored_code:
+            return Response({'message': '验证码错误'}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({'code': 200,'message': '验证码正确'})
+
+    @action(detail=False, methods=['post'])
+    def reset_password(self, request):
+        """重置密码"""
+        email = request.data.get('email')
+        password = request.data.get('password')
+
+        if not email or not password:
+            return Response({'message': '请提供邮箱和新密码'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            user = User.objects.get(email=email)
+        except User.DoesNotExist:
+            return Response({'message': '用户不存在'}, status=status.HTTP_404_NOT_FOUND)
+
+        # 验证是否通过了验证码验证
+        cache_key = f'reset_password_{email}'
+        if not cache.get(cache_key):
+            return Response({'message': '请先验证邮箱验证码'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # 更新密码
+        user.set_password(password)
+        user.save()
+
+        # 清除验证码缓存
+        cache.delete(cache_key)
+
+        return Response({'code': 200,'message': '密码重置成功'})
+
+
+class AgentViewSet(viewsets.ModelViewSet):
+    queryset = User.objects.filter(is_agent=True)
+    serializer_class = AgentSerializer
+    permission_classes = [IsAuthenticated, IsAdminUser]
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        search = self.request.query_params.get('search')
+        if search:
+            queryset = queryset.filter(
+                username__icontains=search
+            ) | queryset.filter(
+                name__icontains=search
+            ) | queryset.filter(
+                email__icontains=search
+            )
+        return queryset
+
+    def perform_create(self, serializer):
+        """创建代理时，自动设置当前用户为其上级代理"""
+        user = self.request.user
+        # 只有一级代理和管理员能创建二级代理
+        if user.user_type == 'agent_l1' or user.user_type == 'admin':
+            serializer.save(parent=user)
+        else:
+            serializer.save()
+
+    def retrieve(self, request, *args, **kwargs):
+        """获取单个代理详情"""
+        instance = self.get_object()
+        serializer = self.get_serializer(instance)
+        
+        # 确保返回的数据包含新的价格字段，如果字段为空，则设置默认值0
+        data = serializer.data
+        
+        # 设置默认值为0，如果字段不存在或为null
+        price_fields = [
+            'normal_monthly_price', 'normal_quarterly_price', 'normal_half_yearly_price', 'normal_yearly_price',
+            'live_monthly_price', 'live_quarterly_price', 'live_half_yearly_price', 'live_yearly_price',
+            'transit_monthly_price', 'transit_quarterly_price', 'transit_half_yearly_price', 'transit_yearly_price'
+        ]
+        
+        for field in price_fields:
+            if field not in data or data[field] is None:
+                data[field] = 0
+        
+        return api_response(
+            code=200,
+            message="获取代理详情成功",
+            data=data
+        )
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.get_queryset()
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return api_response(
+                code=200,
+                message="获取代理列表成功",
+                data=self.get_paginated_response(serializer.data).data
+            )
+        serializer = self.get_serializer(queryset, many=True)
+        return api_response(
+            code=200,
+            message="获取代理列表成功",
+            data={"results": serializer.data}
+        )
+
+    def create(self, request, *args, **kwargs):
+        # 处理请求数据格式，支持前端传递的data封装和直接传递数据两种方式
+        data = request.data.get('data', request.data)
+        
+        serializer = self.get_serializer(data=data)
+        try:
+            serializer.is_valid(raise_exception=True)
+            self.perform_create(serializer)
+            return api_response(
+                code=200,
+                message="创建代理成功",
+                data=serializer.data
+            )
+        except Exception as e:
+            return api_response(
+                code=400,
+                message=str(e),
+                data=serializer.errors
+            )
+
+    def update(self, request, *args, **kwargs):
+        partial = kwargs.pop('partial', False)
+        instance = self.get_object()
+        
+        # 处理请求数据格式，支持前端传递的data封装和直接传递数据两种方式
+        data = request.data.get('data', request.data)
+        
+        serializer = self.get_serializer(instance, data=data, partial=partial)
+        try:
+            serializer.is_valid(raise_exception=True)
+            self.perform_update(serializer)
+            
+            # 获取更新后的数据，并设置默认值
+            response_data = serializer.data
+            price_fields = [
+                'normal_monthly_price', 'normal_quarterly_price', 'normal_half_yearly_price', 'normal_yearly_price',
+                'live_monthly_price', 'live_quarterly_price', 'live_half_yearly_price', 'live_yearly_price',
+                'transit_monthly_price', 'transit_quarterly_price', 'transit_half_yearly_price', 'transit_yearly_price'
+            ]
+            
+            for field in price_fields:
+                if field not in response_data or response_data[field] is None:
+                    response_data[field] = 0
+            
+            return api_response(
+                code=200,
+                message="更新代理信息成功",
+                data=response_data
+            )
+        except Exception as e:
+            return api_response(
+                code=400,
+                message=str(e),
+                data=serializer.errors
+            )
+
+    def destroy(self, request, *args, **kwargs):
+        instance = self.get_object()
+        try:
+            self.perform_destroy(instance)
+            return api_response(
+                code=200,
+                message="删除代理成功",
+                data={}
+            )
+        except Exception as e:
+            return api_response(
+                code=400,
+                message=str(e),
+                data={}
+            )
+
+    @action(detail=True, methods=['post'])
+    def update_balance(self, request, pk=None):
+        """修改代理余额"""
+        instance = self.get_object()
+        data = request.data.get('data', request.data)
+        amount = data.get('amount')
+        operation_type = data.get('type')
+
+        if not amount or not operation_type:
+            return api_response(
+                code=400,
+                message="金额和操作类型不能为空",
+                data={}
+            )
+
+        try:
+            amount = Decimal(str(amount))
+        except (TypeError, ValueError, ArithmeticError):
+            return api_response(
+                code=400,
+                message="金额格式不正确",
+                data={}
+            )
+
+        if amount <= 0:
+            return api_response(
+                code=400,
+                message="金额必须大于0",
+                data={}
+            )
+
+        if operation_type not in ['increase', 'decrease']:
+            return api_response(
+                code=400,
+                message="操作类型不正确",
+                data={}
+            )
+
+        # 原子修改余额并记录流水，扣除时余额不足直接失败
+        try:
+            if operation_type == 'increase':
+                change_balance(instance, amount, 'recharge', operator=request.user)
+            else:
+                change_balance(instance, -amount, 'deduct', operator=request.user)
+        except InsufficientBalance:
+            return api_response(
+                code=400,
+                message="扣除金额不能大于当前余额",
+                data={}
+            )
+
+        serializer = self.get_serializer(instance)
+        return api_response(
+            code=200,
+            message="修改余额成功",
+            data=serializer.data
+        )
+
+    @action(detail=True, methods=['post'])
+    def update_domain(self, request, pk=None):
+        """更新代理域名"""
+        instance = self.get_object()
+        domain = request.data.get('domain')
+        
+        if not domain:
+            return api_response(
+                code=400,
+                message="域名不能为空",
+                data={}
+            )
+            
+        instance.domain = domain
+        instance.save()
+        
+        return api_response(
+            code=200,
+            message="更新域名成功",
+            data=self.get_serializer(instance).data
+        )
+
+    @action(detail=True, methods=['post'])
+    def update_template(self, request, pk=None):
+        """更新网站模板"""
+        instance = self.get_object()
+        template = request.data.get('template')
+        
+        if not template or template not in ['web_1', 'web_2', 'web_3', 'web_4']:
+            return api_response(
+                code=400,
+                message="无效的模板选择",
+                data={}
+            )
+            
+        instance.template = template
+        instance.save()
+        
+        return api_response(
+            code=200,
+            message="更新网站模板成功",
+            data=self.get_serializer(instance).data
+        )
+
+    @action(detail=True, methods=['post'])
+    def update_pricing(self, request, pk=None):
+        """更新价格设置"""
+        instance = self.get_object()
+        
+        try:
+            # 获取请求数据
+            data = request.data.get('data', request.data)
+            
+            # 更新普通类型价格
+            normal_fields = [
+                'normal_monthly_price', 'normal_quarterly_price', 
+                'normal_half_yearly_price', 'normal_yearly_price'
+            ]
+            
+            # 更新直播类型价格
+            live_fields = [
+                'live_monthly_price', 'live_quarterly_price', 
+                'live_half_yearly_price', 'live_yearly_price'
+            ]
+            
+            # 更新中转类型价格
+            transit_fields = [
+                'transit_monthly_price', 'transit_quarterly_price', 
+                'transit_half_yearly_price', 'transit_yearly_price'
+            ]
+            
+            # 更新所有价格字段
+            for field in normal_fields + live_fields + transit_fields:
+                value = data.get(field)
+                if value is not None:
+                    setattr(instance, field, Decimal(str(value)))
+            
+            instance.save()
+            return api_response(
+                code=200,
+                message="更新价格成功",
+                data=self.get_serializer(instance).data
+            )
+        except Exception as e:
+            return api_response(
+                code=400,
+                message=str(e),
+                data={}
+            )
+
+    @action(detail=True, methods=['post'])
+    def change_password(self, request, pk=None):
+        """修改代理密码"""
+        instance = self.get_object()
+        data = request.data.get('data', request.data)
+        
+        if 'password' not in data or 'confirm_password' not in data:
+            return api_response(
+                code=400,
+                message="密码和确认密码不能为空",
+                data={}
+            )
+            
+        if data['password'] != data['confirm_password']:
+            return api_response(
+                code=400,
+                message="两次输入的密码不一致",
+                data={}
+            )
+        
+        try:
+            # 验证密码复杂度
+            from django.contrib.auth.password_validation import validate_password
+            validate_password(data['password'])
+            
+            # 设置新密码
+            instance.set_password(data['password'])
+            instance.save()
+            
+            return api_response(
+                code=200,
+                message="密码修改成功",
+                data={}
+            )
+        except Exception as e:
+            return api_response(
+                code=400,
+                message=str(e),
+                data={}
+            )
+
+
+# 新增视图类
+class CustomerViewSet(viewsets.ModelViewSet):
+    """客户视图集"""
+    queryset = User.objects.filter(user_type='customer')
+    serializer_class = CustomerSerializer
+    permission_classes = [IsAuthenticated]  # 修改为只需要认证即可访问
+    pagination_class = CustomPagination
+    
+    def get_queryset(self):
+        user = self.request.user
+        queryset = User.objects.filter(user_type='customer')
+        
+        # 基础权限过滤
+        if user.user_type == 'admin':
+            queryset = User.objects.filter(user_type='customer')
+        elif user.user_type == 'agent_l1':
+            queryset = User.objects.filter(user_type='customer')
+        elif user.user_type == 'agent_l2':
+            queryset = User.objects.filter(user_type='customer', parent=user)
+        elif user.user_type == 'customer':
+            queryset = User.objects.filter(id=user.id)
+        else:
+            queryset = User.objects.none()
+        
+        # 用户名模糊搜索
+        username = self.request.query_params.get('username', None)
+        if username:
+            queryset = queryset.filter(username__icontains=username)
+        
+        return queryset
+    
+    def list(self, request, *args, **kwargs):
+        try:
+            queryset = self.filter_queryset(self.get_queryset())
+
+            # 游标分页（pagination=cursor 或携带 cursor 参数时启用）
+            if use_keyset_pagination(request):
+                paginator = KeysetPagination(ordering=('-created_at', '-id'))
+                page = paginator.paginate_queryset(queryset, request, self)
+                serializer = self.get_serializer(page, many=True)
+                return Response({
+                    'code': 200,
+                    'message': '获取客户列表成功',
+                    'data': paginator.get_paginated_response(serializer.data).data
+                })
+        
+            # 检查是否需要分页
+            page = request.query_params.get('page')
+            page_size = request.query_params.get('page_size')
+            
+            if page is None and page_size is None:
+                # 不分页，返回所有数据
+                serializer = self.get_serializer(queryset, many=True)
+                return Response({
+                    'code': 200,
+                    'message': '获取客户列表成功',
+                    'data': {
+                        'results': serializer.data,
+                        'count': len(serializer.data)
+                    }
+                })
+            else:
+                # 使用分页
+                page = self.paginate_queryset(queryset)
+                serializer = self.get_serializer(page, many=True)
+                paginated_data = self.get_paginated_response(serializer.data).data
+                return Response({
+                    'code': 200,
+                    'message': '获取客户列表成功',
+                    'data': paginated_data
+                })
+        except Exception as e:
+            logger.error(f"获取客户列表失败: {str(e)}")
+            return Response({
+                'code': 500,
+                'message': f'获取客户列表失败: {str(e)}'
+            }, status=500)
+    
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """流式导出客户列表（export_format=csv|ndjson）"""
+        export_format = get_export_format(request)
+        if not export_format:
+            return Response({
+                'code': 400,
+                'message': '不支持的导出格式',
+                'data': None
+            }, status=status.HTTP_400_BAD_REQUEST)
+        queryset = self.filter_queryset(self.get_queryset()).order_by('id')
+        fields = [
+            'id', 'username', 'name', 'email', 'phone', 'balance', 'parent__username',
+            'is_active', 'last_login', 'last_login_ip', 'date_joined',
+        ]
+        return stream_export(queryset, fields, export_format, 'customers')
+
+    @action(detail=False, methods=['get'])
+    def export_nodes(self, request):
+        """流式导出可见客户的节点（export_format=csv|ndjson，可按status筛选）"""
+        export_format = get_export_format(request)
+        if not export_format:
+            return Response({
+                'code': 400,
+                'message': '不支持的导出格式',
+                'data': None
+            }, status=status.HTTP_400_BAD_REQUEST)
+        queryset = NodeInfo.objects.filter(user__in=self.get_queryset().values('id'))
+        node_status = request.query_params.get('status')
+        if node_status:
+            queryset = queryset.filter(status=node_status)
+        fields = [
+            'id', 'user__username', 'order__out_trade_no', 'order__node_type', 'remark', 'remark_custom',
+            'protocol', 'host', 'port', 'panel_id', 'status', 'udp', 'udp_host', 'expiry_time', 'created_at',
+        ]
+        return stream_export(queryset.order_by('id'), fields, export_format, 'nodes')
+
+    @action(detail=True, methods=['post'])
+    def update_balance(self, request, pk=None):
+        """修改客户余额"""
+        try:
+            customer = self.get_object()
+            amount = request.data.get('amount')
+            action = request.data.get('action')  # 'add' 或 'subtract'
+            
+            if not amount or not action:
+                return Response({
+                    'code': 400,
+                    'message': '缺少必要参数'
+                }, status=400)
+            
+            try:
+                amount = Decimal(str(amount))
+                if amount <= 0:
+                    raise ValueError('金额必须大于0')
+            except (ValueError, TypeError, ArithmeticError):
+                return Response({
+                    'code': 400,
+                    'message': '金额格式不正确'
+                }, status=400)
+            
+            if action not in ['add', 'subtract']:
+                return Response({
+                    'code': 400,
+                    'message': '操作类型不正确'
+                }, status=400)
+            
+            # 检查权限
+            if request.user.user_type == 'agent_l2' and customer.parent != request.user:
+                return Response({
+                    'code': 403,
+                    'message': '无权修改该客户的余额'
+                }, status=403)
+            
+            # 执行余额修改（原子更新并记录流水）
+            try:
+                if action == 'add':
+                    change_balance(customer, amount, 'recharge', operator=request.user)
+                else:  # subtract
+                    change_balance(customer, -amount, 'deduct', operator=request.user)
+            except InsufficientBalance:
+                return Response({
+                    'code': 400,
+                    'message': '客户余额不足'
+                }, status=400)
+            
+            return Response({
+                'code': 200,
+                'message': '修改余额成功',
+                'data': {
+                    'customer_id': customer.id,
+                    'username': customer.username,
+                    'new_balance': float(customer.balance)  # 转换为float类型
+                }
+            })
+            
+        except User.DoesNotExist:
+            return Response({
+                'code': 404,
+                'message': '客户不存在'
+            }, status=404)
+        except Exception as e:
+            logger.error(f"修改客户余额失败: {str(e)}")
+            return Response({
+                'code': 500,
+                'message': f'修改客户余额失败: {str(e)}'
+            }, status=500)
+
+    def retrieve(self, request, *args, **kwargs):
+        """获取客户详情"""
+        instance = self.get_object()
+        serializer = CustomerDetailSerializer(instance)
+        return api_response(
+            code=200,
+            message="获取客户详情成功",
+            data=serializer.data
+        )
+
+    def create(self, request, *args, **kwargs):
+        """创建客户"""
+        # 如果没有提供代理ID，则使用当前用户作为代理
+        data = request.data.copy()
+        if not data.get('agent_id') and request.user.is_agent:
+            data['agent_id'] = request.user.id
+        
+        serializer = self.get_serializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        self.perform_create(serializer)
+        return api_response(
+            code=201,
+            message="创建客户成功",
+            data=serializer.data
+        )
+
+    def update(self, request, *args, **kwargs):
+        """更新客户信息"""
+        partial = kwargs.pop('partial', False)
+        instance = self.get_object()
+        serializer = self.get_serializer(instance, data=request.data, partial=partial)
+        serializer.is_valid(raise_exception=True)
+        self.perform_update(serializer)
+        return api_response(
+            code=200,
+            message="更新客户成功",
+            data=serializer.data
+        )
+
+    def destroy(self, request, *args, **kwargs):
+        """删除客户"""
+        instance = self.get_object()
+        self.perform_destroy(instance)
+        return api_response(
+            code=200,
+            message="删除客户成功",
+            data={}
+        )
+
+    @action(detail=True, methods=['post'])
+    def reset_password(self, request, pk=None):
+        """重置客户密码"""
+        instance = self.get_object()
+        serializer = ResetPasswordSerializer(data=request.data.get('data', request.data))
+        serializer.is_valid(raise_exception=True)
+        
+        instance.set_password(serializer.validated_data['password'])
+        instance.save()
+        
+        return api_response(
+            code=200,
+            message="密码重置成功",
+            data={}
+        )
+
+
+    @action(detail=False, methods=['get'])
+    def login_records(self, request, pk=None):
+        """获取客户登录记录"""
+        instance = self.get_object()
+        records = LoginRecord.objects.filter(user=instance).order_by('-login_time')
+
+        if use_keyset_pagination(request):
+            paginator = KeysetPagination(ordering=('-login_time', '-id'))
+            page = paginator.paginate_queryset(records, request, self)
+            serializer = LoginRecordSerializer(page, many=True)
+            return api_response(
+                code=200,
+                message="获取登录记录成功",
+                data=paginator.get_paginated_response(serializer.data).data
+            )
+        
+        # 分页处理
+        page = self.paginate_queryset(records)
+        if page is not None:
+            serializer = LoginRecordSerializer(page, many=True)
+            return api_response(
+                code=200,
+                message="获取登录记录成功",
+                data=serializer.data
+            )
+        
+        serializer = LoginRecordSerializer(records, many=True)
+        return api_response(
+            code=200,
+            message="获取登录记录成功",
+            data=serializer.data
+        )
+
+    @action(detail=True, methods=['get'])
+    def traffic_records(self, request, pk=None):
+        """获取客户流量使用记录"""
+        instance = self.get_object()
+        records = TrafficRecord.objects.filter(customer=instance).order_by('-date')
+
+        if use_keyset_pagination(request):
+            paginator = KeysetPagination(ordering=('-date', '-id'))
+            page = paginator.paginate_queryset(records, request, self)
+            serializer = TrafficRecordSerializer(page, many=True)
+            return api_response(
+                code=200,
+                message="获取流量记录成功",
+                data=paginator.get_paginated_response(serializer.data).data
+            )
+        
+        # 分页处理
+        page = self.paginate_queryset(records)
+        if page is not None:
+            serializer = TrafficRecordSerializer(page, many=True)
+            return api_response(
+                code=200,
+                message="获取流量记录成功",
+                data=serializer.data
+            )
+        
+        serializer = TrafficRecordSerializer(records, many=True)
+        return api_response(
+            code=200,
+            message="获取流量记录成功",
+            data=serializer.data
+        )
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
+    def nodes(self, request):
+        """获取用户的所有节点信息
+        
+        支持的查询参数：
+        - order_no: 订单号筛选（支持trade_no或out_trade_no）
+        - start_date: 开始时间筛选（格式：YYYY-MM-DD，基于订单下单时间）
+        - end_date: 结束时间筛选（格式：YYYY-MM-DD，基于订单下单时间）
+        - country: 国家筛选（筛选指定国家的节点）
+        - page: 页码
+        - page_size: 每页数量
+        
+        筛选条件可以单独使用，也可以组合使用。
+        """
+        try:
+            # 获取当前用户
+            user = request.user
+            
+            # 获取查询参数
+            order_no = request.query_params.get('order_no')     # 订单号筛选
+            start_date = request.query_params.get('start_date')  # 开始时间筛选
+            end_date = request.query_params.get('end_date')      # 结束时间筛选
+            country = request.query_params.get('country')       # 国家筛选
+            
+            # 构建查询条件
+            query = {'user': user}
+            
+            # 添加订单号筛选
+            if order_no:
+                # 查找匹配的订单（支持trade_no或out_trade_no）
+                matching_orders = PaymentOrder.objects.filter(
+                    Q(trade_no=order_no) | Q(out_trade_no=order_no),
+                    user=user
+                ).values_list('id', flat=True)
+                if matching_orders:
+                    query['order_id__in'] = matching_orders
+                else:
+                    # 如果没有找到匹配的订单号，返回空结果
+                    return Response({
+                        'code': 200,
+                        'message': '获取节点列表成功',
+                        'data': {
+                            'results': [],
+                            'count': 0,
+                            'next': None,
+                            'previous': None
+                        }
+                    })
+            
+            # 添加时间筛选（基于订单下单时间）
+            if start_date or end_date:
+                # 首先获取符合时间条件的订单ID
+                order_query = Q()
+                if start_date:
+                    try:
+                        start_datetime = datetime.strptime(start_date, '%Y-%m-%d')
+                        order_query &= Q(created_at__gte=start_datetime)
+                    except ValueError:
+                        return Response({
+                            'code': 400,
+                            'message': '开始时间格式错误，请使用YYYY-MM-DD格式',
+                            'data': None
+                        }, status=status.HTTP_400_BAD_REQUEST)
+                
+                if end_date:
+                    try:
+                        end_datetime = datetime.strptime(end_date, '%Y-%m-%d')
+                        # 设置为当天的最后一秒
+                        end_datetime = end_datetime.replace(hour=23, minute=59, second=59, microsecond=999999)
+                        order_query &= Q(created_at__lte=end_datetime)
+                    except ValueError:
+                        return Response({
+                            'code': 400,
+                            'message': '结束时间格式错误，请使用YYYY-MM-DD格式',
+                            'data': None
+                        }, status=status.HTTP_400_BAD_REQUEST)
+                
+                # 获取符合时间条件的订单ID列表
+                filtered_order_ids = PaymentOrder.objects.filter(order_query, user=user).values_list('id', flat=True)
+                
+                # 如果同时有订单号筛选，需要取交集
+                if 'order_id__in' in query:
+                    # 取两个筛选条件的交集
+                    existing_order_ids = set(query['order_id__in'])
+                    time_filtered_order_ids = set(filtered_order_ids)
+                    query['order_id__in'] = list(existing_order_ids.intersection(time_filtered_order_ids))
+                else:
+                    query['order_id__in'] = filtered_order_ids
+            
+            # 添加国家筛选
+            if country:
+                # 先查询指定国家的面板ID列表
+                from panels.models import AgentPanel
+                country_panel_ids = AgentPanel.objects.filter(country=country).values_list('id', flat=True)
+                if country_panel_ids:
+                    query['panel_id__in'] = country_panel_ids
+                else:
+                    # 如果没有找到指定国家的面板，返回空结果
+                    return Response({
+                        'code': 200,
+                        'message': '获取节点列表成功',
+                        'data': {
+                            'results': [],
+                            'count': 0,
+                            'next': None,
+                            'previous': None
+                        }
+                    })
+            
+            # 在数据库中按host+port去重，只保留每组中过期时间最晚的节点
+            nodes = NodeInfo.objects.filter(**query).annotate(
+                host_port_rank=Window(
+                    expression=RowNumber(),
+                    partition_by=[F('host'), F('port')],
+                    order_by=[F('expiry_time').desc(nulls_last=True), F('created_at').desc()]
+                )
+            ).filter(host_port_rank=1).select_related('order').order_by('-created_at')
+            
+            # 先分页，只处理当前页的节点
+            paginator = CustomPagination()
+            page_nodes = paginator.paginate_queryset(nodes, request)
+            
+            # 批量查询当前页节点的面板国家
+            from panels.models import AgentPanel
+            panel_ids = {node.panel_id for node in page_nodes if node.panel_id}
+            panel_country_map = dict(AgentPanel.objects.filter(id__in=panel_ids).values_list('id', 'country'))
+            
+            # 代理的中转域名映射（跨请求缓存）
+            domain_map = get_agent_domain_map(user.parent_id)
+            
+            # 序列化节点数据
+            nodes_data = []
+            for node in page_nodes:
+                # 节点类型直接取订单字段，无需解析param
+                order = node.order
+                node_type = (order.node_type or '') if order else ''
+                
+                # 获取面板国家
+                country = panel_country_map.get(node.panel_id, '未知') if node.panel_id else '未知'
+                node_data = {
+                    'id': node.id,
+                    'remark': node.remark,
+                    'remark_custom': node.remark_custom,
+                    'protocol': node.protocol,
+                    'host': node.host,
+                    'port': node.port,
+                    'uuid': node.uuid,
+                    'host_config': node.host_config,
+                    'node_user': node.node_user,
+                    'node_password': node.node_password,
+                    'status': node.status,
+                    'expiry_time': node.expiry_time,
+                    'created_at': node.created_at,
+                    'updated_at': node.updated_at,
+                    'order_id': order.id if order else None,
+                    'trade_no': order.trade_no if order else None,
+                    'out_trade_no': order.out_trade_no if order else None,
+                    'node_type': node_type,  # 添加节点类型字段
+                    'udp': node.udp,  # 添加udp字段
+                    'panel_node_id': node.panel_node_id,  # 添加面板节点ID字段
+                    'udp_host': node.udp_host,  # 添加udp_host字段
+                    'udp_host_domain': get_udp_host_domain(node, domain_map=domain_map),  # 添加udp_host_domain字段
+                    'country': country,  # 添加面板国家字段
+                    'panel_id': node.panel_id  # 添加面板ID字段
+                }
+                nodes_data.append(node_data)
+            
+            return paginator.get_paginated_response({
+                'code': 200,
+                'message': '获取节点列表成功',
+                'data': nodes_data
+            })
+            
+        except Exception as e:
+            print(f"获取节点列表失败: {str(e)}")
+            return Response({
+                'code': 500,
+                'message': f'获取节点列表失败: {str(e)}',
+                'data': None
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
+    def update_node_remark(self, request, pk=None):
+        """修改节点自定义备注"""
+        try:
+            # 获取当前用户
+            user = request.user
+            
+            # 获取节点
+            try:
+                node = NodeInfo.objects.get(id=pk, user=user)
+            except NodeInfo.DoesNotExist:
+                return Response({
+                    'code': 404,
+                    'message': '节点不存在或无权访问',
+                    'data': None
+                }, status=status.HTTP_404_NOT_FOUND)
+            
+            # 获取新的备注内容
+            remark_custom = request.data.get('remark_custom')
+            if remark_custom is None:
+                return Response({
+                    'code': 400,
+                    'message': '缺少备注内容',
+                    'data': None
+                }, status=status.HTTP_400_BAD_REQUEST)
+            
+            # 更新备注
+            node.remark_custom = remark_custom
+            node.save(update_fields=['remark_custom'])
+            
+            return Response({
+                'code': 200,
+                'message': '修改节点备注成功',
+                'data': {
+                    'id': node.id,
+                    'remark_custom': node.remark_custom
+                }
+            })
+            
+        except Exception as e:
+            print(f"修改节点备注失败: {str(e)}")
+            return Response({
+                'code': 500,
+                'message': f'修改节点备注失败: {str(e)}',
+                'data': None
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class PackageViewSet(viewsets.ModelViewSet):
+    """套餐管理视图集"""
+    queryset = Package.objects.all()
+    serializer_class = PackageSerializer
+    permission_classes = [IsAuthenticated, IsAdminUser]
+    
+    def list(self, request, *args, **kwargs):
+        queryset = self.get_queryset()
+        serializer = self.get_serializer(queryset, many=True)
+        return api_response(
+            code=200,
+            message="获取套餐列表成功",
+            data=serializer.data
+        )
+    
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        serializer = self.get_serializer(instance)
+        return api_response(
+            code=200,
+            message="获取套餐详情成功",
+            data=serializer.data
+        )
+    
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        self.perform_create(serializer)
+        return api_response(
+            code=201,
+            message="创建套餐成功",
+            data=serializer.data
+        )
+    
+    def update(self, request, *args, **kwargs):
+        partial = kwargs.pop('partial', False)
+        instance = self.get_object()
+        serializer = self.get_serializer(instance, data=request.data, partial=partial)
+        serializer.is_valid(raise_exception=True)
+        self.perform_update(serializer)
+        return api_response(
+            code=200,
+            message="更新套餐成功",
+            data=serializer.data
+        )
+    
+    def destroy(self, request, *args, **kwargs):
+        instance = self.get_object()
+        self.perform_destroy(instance)
+        return api_response(
+            code=200,
+            message="删除套餐成功",
+            data={}
+        )
+
+
+class CustomerPackageViewSet(viewsets.ModelViewSet):
+    """客户套餐管理视图集"""
+    serializer_class = CustomerPackageSerializer
+    permission_classes = [IsAuthenticated, IsAgentOrAdmin]
+    
+    def get_queryset(self):
+        user = self.request.user
+        
+        # 基础查询
+        queryset = CustomerPackage.objects.all()
+        
+        # 权限过滤
+        if user.user_type == 'agent_l2':
+            queryset = queryset.filter(customer__agent=user)
+        elif user.user_type == 'agent_l1':
+            agent_ids = User.objects.filter(
+                Q(parent=user) | 
+                Q(id=user.id)
+            ).values_list('id', flat=True)
+            queryset = queryset.filter(customer__agent__id__in=agent_ids)
+        elif user.user_type == 'customer':
+            queryset = queryset.filter(customer=user)
+        
+        # 过滤条件
+        customer_id = self.request.query_params.get('customer_id')
+        if customer_id and customer_id.isdigit():
+            queryset = queryset.filter(customer_id=int(customer_id))
+            
+        is_active = self.request.query_params.get('is_active')
+        if is_active in ['true', 'false']:
+            queryset = queryset.filter(is_active=is_active == 'true')
+            
+        return queryset
+    
+    def list(self, request, *args, **kwargs):
+        queryset = self.get_queryset()
+        serializer = self.get_serializer(queryset, many=True)
+        return api_response(
+            code=200,
+            message="获取客户套餐列表成功",
+            data=serializer.data
+        )
+    
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        serializer = self.get_serializer(instance)
+        return api_response(
+            code=200,
+            message="获取客户套餐详情成功",
+            data=serializer.data
+        )
+    
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        self.perform_create(serializer)
+        return api_response(
+            code=201,
+            message="创建客户套餐成功",
+            data=serializer.data
+        )
+    
+    def update(self, request, *args, **kwargs):
+        partial = kwargs.pop('partial', False)
+        instance = self.get_object()
+        serializer = self.get_serializer(instance, data=request.data, partial=partial)
+        serializer.is_valid(raise_exception=True)
+        self.perform_update(serializer)
+        return api_response(
+            code=200,
+            message="更新客户套餐成功",
+            data=serializer.data
+        )
+    
+    def destroy(self, request, *args, **kwargs):
+        instance = self.get_object()
+        self.perform_destroy(instance)
+        return api_response(
+            code=200,
+            message="删除客户套餐成功",
+            data={}
+        )
+
+
+class WebsiteTemplateViewSet(viewsets.GenericViewSet):
+    """网站模板设置视图集"""
+    serializer_class = WebsiteTemplateSerializer
+    permission_classes = [IsAuthenticated, IsAgentL2]  # 只允许二级代理访问
+    parser_classes = [MultiPartParser, FormParser, JSONParser]
+    
+    def get_object(self):
+        """获取当前用户的网站模板设置，如果不存在则创建"""
+        user = self.request.user
+        template, created = WebsiteTemplate.objects.get_or_create(agent=user)
+        return template
+    
+    @action(detail=False, methods=['get'])
+    def get_template(self, request):
+        """获取网站模板设置"""
+        instance = self.get_object()
+        serializer = self.get_serializer(instance, context={'request': request})
+        return api_response(
+            code=200,
+            message="获取网站模板设置成功",
+            data=serializer.data
+        )
+    
+    @action(detail=False, methods=['post'])
+    def update_template(self, request):
+        """创建或更新网站模板设置"""
+        instance = self.get_object()
+        
+        # 处理网站名称
+        website_name = request.data.get('website_name')
+        if website_name:
+            instance.website_name = website_name
+        
+        # 处理Logo上传
+        if 'logo' in request.FILES:
+            logo = request.FILES['logo']
+            # 验证文件大小（最大2MB）
+            if logo.size > 2 * 1024 * 1024:
+                return api_response(
+                    code=400,
+                    message="Logo图片不能超过2MB",
+                    data={}
+                )
+            # 如果存在旧Logo，删除它
+            if instance.logo:
+                instance.logo.delete(save=False)
+            instance.logo = logo
+        
+        # 处理背景图上传
+        if 'background' in request.FILES:
+            background = request.FILES['background']
+            # 验证文件大小（最大4MB）
+            if background.size > 4 * 1024 * 1024:
+                return api_response(
+                    code=400,
+                    message="背景图片不能超过4MB",
+                    data={}
+                )
+            # 如果存在旧背景图，删除它
+            if instance.background:
+                instance.background.delete(save=False)
+            instance.background = background
+        
+        instance.save()
+        serializer = self.get_serializer(instance, context={'request': request})
+        return api_response(
+            code=200,
+            message="更新网站模板设置成功",
+            data=serializer.data
+        )
+
+
+class CustomerLoginView(APIView):
+    """客户登录视图"""
+    permission_classes = [AllowAny]  # 允许未认证用户访问
+
+    def post(self, request):
+        """客户登录接口"""
+        try:
+            # 获取登录凭证（用户名或邮箱）和密码
+            login = request.data.get('username')
+            password = request.data.get('password')
+
+            if not login or not password:
+                return Response({
+                    'code': 400,
+                    'message': '用户名/邮箱和密码不能为空',
+                    'data': None
+                }, status=status.HTTP_400_BAD_REQUEST)
+            
+                
+            # 尝试使用用户名或邮箱查找用户
+            user = None
+            if '@' in login:
+                try:
+                    user = User.objects.get(email=login, user_type='customer')
+                except User.DoesNotExist:
+                    return Response({
+                        'code': 400,
+                        'message': '邮箱不存在或不是客户用户',
+                        'data': None
+                    }, status=status.HTTP_400_BAD_REQUEST)
+            else:
+                try:
+                    user = User.objects.get(username=login, user_type='customer')
+                except User.DoesNotExist:
+                    return Response({
+                        'code': 400,
+                        'message': '用户名不存在或不是客户用户',
+                        'data': None
+                    }, status=status.HTTP_400_BAD_REQUEST)
+
+            # 验证密码
+            # 验证用户是否被停用
+            if not user.is_active:
+                return Response({
+                    'code': 400,
+                    'message': '该账户已被停用，请联系管理员',
+                    'data': None
+                }, status=status.HTTP_400_BAD_REQUEST)
+            if not user.check_password(password):
+                return Response({
+                    'code': 400,
+                    'message': '密码错误',
+                    'data': None
+                }, status=status.HTTP_400_BAD_REQUEST)
+                
+            # 验证用户所属代理商的域名与请求源域名是否匹配
+            # 获取请求域名
+            requesting_domain = request.META.get('HTTP_HOST', '')
+            origin = request.META.get('HTTP_ORIGIN', '')
+            referer = request.META.get('HTTP_REFERER', '')
+            
+            # 尝试从HTTP_REFERER中提取域名
+            referer_domain = ''
+            if referer and '://' in referer:
+                referer_parts = referer.split('://', 1)[1]
+                if '/' in referer_parts:
+                    referer_domain = referer_parts.split('/', 1)[0]
+                else:
+                    referer_domain = referer_parts
+            
+            # 尝试从HTTP_ORIGIN中提取域名
+            origin_domain = ''
+            if origin and '://' in origin:
+                origin_domain = origin.split('://', 1)[1]
+            
+            # 使用多种方法尝试获取源地址
+            source_domain = referer_domain or origin_domain or requesting_domain
+            
+            if not source_domain:
+                return Response({
+                    'code': 400,
+                    'message': '无法获取请求域名',
+                    'data': None
+                }, status=status.HTTP_400_BAD_REQUEST)
+            
+            # 获取用户所属代理
+            if not user.parent_id:
+                logger.warning(f"用户 {user.username} 没有关联代理")
+                # 如果没有关联代理，尝试查找匹配域名的代理
+                agent = None
+                agents = User.objects.filter(user_type='agent_l2')
+                for potential_agent in agents:
+                    if potential_agent.domain and source_domain.endswith(potential_agent.domain):
+                        agent = potential_agent
+                        break
+                        
+                if not agent:
+                    return Response({
+                        'code': 400,
+                        'message': '您所使用的网站域名未关联到有效代理',
+                        'data': None
+                    }, status=status.HTTP_400_BAD_REQUEST)
+            else:
+                # 用户已关联代理，验证域名是否匹配
+                agent = user.parent
+                if not agent.domain or not source_domain.endswith(agent.domain):
+                    logger.warning(f"域名不匹配: 用户域名 {agent.domain}, 请求域名 {source_domain}")
+                    return Response({
+                        'code': 400,
+                        'message': '您无法在当前网站登录，请使用关联代理的官方网站',
+                        'data': None
+                    }, status=status.HTTP_400_BAD_REQUEST)
+
+            # 生成JWT Token
+            refresh = RefreshToken.for_user(user)
+            access_token = str(refresh.access_token)
+
+            # 更新用户的登录信息，登录记录和最后登录IP由后台批量写入
+            record_login(user, request)
+
+            return Response({
+                'code': 200,
+                'message': '登录成功',
+                'data': {
+                    'access_token': access_token,
+                    'refresh_token': str(refresh),
+                    'user': {
+                        'id': user.id,
+                        'username': user.username,
+                        'email': user.email,
+                        'user_type': user.user_type,
+                        'balance': user.balance,  # 增加余额字段
+                        'last_login': user.last_login,  # 添加最后登录时间
+                        'last_login_ip': user.last_login_ip  # 添加最后登录IP
+                    }
+                }
+            })
+
+        except Exception as e:
+            logger.error(f"登录失败: {str(e)}")
+            return Response({
+                'code': 500,
+                'message': f'登录失败: {str(e)}',
+                'data': None
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class ContactInfoViewSet(viewsets.ModelViewSet):
+    """联系方式视图集"""
+    serializer_class = ContactInfoSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        """根据用户类型返回不同的查询集"""
+        user = self.request.user
+        if user.user_type == 'customer':
+            # 客户只能查看自己的联系方式
+            return ContactInfo.objects.filter(user=user)
+        elif user.user_type == 'agent_l2':
+            # 二级代理可以查看自己客户的联系方式
+            return ContactInfo.objects.filter(user__parent=user)
+        # 一级代理和管理员可以查看所有联系方式
+        return ContactInfo.objects.all()
+
+    def get_object(self):
+        """获取当前用户的联系方式"""
+        try:
+            return ContactInfo.objects.get(user=self.request.user)
+        except ContactInfo.DoesNotExist:
+            # 如果不存在，创建一个新的联系方式记录
+            return ContactInfo.objects.create(user=self.request.user)
+
+    def perform_create(self, serializer):
+        """创建联系方式时自动关联当前用户"""
+        serializer.save(user=self.request.user)
+
+    def perform_update(self, serializer):
+        """更新联系方式时自动关联当前用户"""
+        serializer.save(user=self.request.user)
+
+    @action(detail=False, methods=['get'])
+    def my_contact(self, request):
+        """获取当前用户的联系方式"""
+        try:
+            contact_info = ContactInfo.objects.get(user=request.user)
+            serializer = self.get_serializer(contact_info)
+            return Response({
+                'code': 200,
+                'message': '获取联系方式成功',
+                'data': serializer.data
+            })
+        except ContactInfo.DoesNotExist:
+            # 如果不存在，创建一个新的联系方式记录
+            contact_info = ContactInfo.objects.create(user=request.user)
+            serializer = self.get_serializer(contact_info)
+            return Response({
+                'code': 200,
+                'message': '创建联系方式成功',
+                'data': serializer.data
+            })
+        except Exception as e:
+            return Response({
+                'code': 500,
+                'message': f'获取联系方式失败: {str(e)}',
+                'data': None
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class AgentContactView(APIView):
+    """获取和修改二级代理联系方式"""
+    permission_classes = [AllowAny]  # 允许任何人访问
+    
+    def get(self, request):
+        try:
+            agent = None
+            contact_info = None
+            
+            # 如果用户已登录
+            if request.user.is_authenticated:
+                user = request.user
+                # 如果是二级代理，直接获取自己的联系信息
+                if user.user_type == 'agent_l2':
+                    agent = user
+                # 如果是客户，获取其所属二级代理的联系信息
+                elif user.user_type == 'customer' and user.parent:
+                    agent = user.parent
+            
+            # 如果未登录或未找到代理，尝试通过域名查找
+            if not agent:
+                # 获取请求的域名，按优先级尝试多种方式
+                requesting_domain = request.META.get('HTTP_HOST', '')
+                origin = request.META.get('HTTP_ORIGIN', '')    # 获取请求的源域名
+                referer = request.META.get('HTTP_REFERER', '')  # 获取请求的来源URL
+                
+                # 尝试从HTTP_REFERER中提取域名
+                referer_domain = ''
+                if referer and '://' in referer:
+                    referer_parts = referer.split('://', 1)[1]
+                    if '/' in referer_parts:
+                        referer_domain = referer_parts.split('/', 1)[0]
+                    else:
+                        referer_domain = referer_parts
+                
+                # 尝试从HTTP_ORIGIN中提取域名
+                origin_domain = ''
+                if origin and '://' in origin:
+                    origin_domain = origin.split('://', 1)[1]
+                
+                # 使用多种方法尝试获取源地址
+                domain = referer_domain or origin_domain or requesting_domain
+                
+                if not domain:
+                    return Response({
+                        'code': 400,
+                        'message': '无法获取请求域名'
+                    }, status=status.HTTP_400_BAD_REQUEST)
+                
+                # 查找匹配的二级代理
+                agent = User.objects.filter(
+                    user_type='agent_l2',
+                    domain=domain,
+                    is_active=True
+                ).first()
+            
+            if not agent:
+                return Response({
+                    'code': 404,
+                    'message': '未找到对应的二级代理'
+                }, status=status.HTTP_404_NOT_FOUND)
+            
+            # 获取联系方式信息
+            contact_info = ContactInfo.objects.filter(user=agent).first()
+            
+            # 返回联系方式
+            return Response({
+                'code': 200,
+                'message': '获取成功',
+                'data': {
+                    'qq': contact_info.qq if contact_info else None,
+                    'wechat': contact_info.wechat if contact_info else None,
+                    'phone': contact_info.phone if contact_info else None,
+                    'qq_qrcode_url': request.build_absolute_uri(contact_info.qq_qrcode.url) if contact_info and contact_info.qq_qrcode else None,
+                    'wechat_qrcode_url': request.build_absolute_uri(contact_info.wechat_qrcode.url) if contact_info and contact_info.wechat_qrcode else None
+                }
+            })
+            
+        except Exception as e:
+            logger.error(f"获取二级代理联系方式失败: {str(e)}")
+            return Response({
+                'code': 500,
+                'message': '获取失败',
+                'error': str(e)
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    
+    def post(self, request):
+        """修改二级代理联系方式"""
+        try:
+            # 验证用户是否登录且是二级代理
+            if not request.user.is_authenticated or request.user.user_type != 'agent_l2':
+                return Response({
+                    'code': 403,
+                    'message': '无权限修改联系方式'
+                }, status=status.HTTP_403_FORBIDDEN)
+            
+            agent = request.user
+            data = request.data
+            
+            # 获取或创建联系方式信息
+            contact_info, created = ContactInfo.objects.get_or_create(user=agent)
+            
+            # 更新联系方式
+            if 'qq' in data:
+                contact_info.qq = data['qq']
+            if 'wechat' in data:
+                contact_info.wechat = data['wechat']
+            if 'phone' in data:
+                contact_info.phone = data['phone']
+            
+            # 处理QQ二维码上传
+            if 'qq_qrcode' in request.FILES:
+                qr_code = request.FILES['qq_qrcode']
+                if qr_code.size > 2 * 1024 * 1024:  # 2MB
+                    return Response({
+                        'code': 400,
+                        'message': 'QQ二维码图片不能超过2MB'
+                    }, status=status.HTTP_400_BAD_REQUEST)
+                if contact_info.qq_qrcode:
+                    contact_info.qq_qrcode.delete(save=False)
+                contact_info.qq_qrcode = qr_code
+            
+            # 处理微信二维码上传
+            if 'wechat_qrcode' in request.FILES:
+                qr_code = request.FILES['wechat_qrcode']
+                if qr_code.size > 2 * 1024 * 1024:  # 2MB
+                    return Response({
+                        'code': 400,
+                        'message': '微信二维码图片不能超过2MB'
+                    }, status=status.HTTP_400_BAD_REQUEST)
+                if contact_info.wechat_qrcode:
+                    contact_info.wechat_qrcode.delete(save=False)
+                contact_info.wechat_qrcode = qr_code
+            
+            contact_info.save()
+            
+            return Response({
+                'code': 200,
+                'message': '更新成功',
+                'data': {
+                    'qq': contact_info.qq,
+                    'wechat': contact_info.wechat,
+                    'phone': contact_info.phone,
+                    'qq_qrcode_url': request.build_absolute_uri(contact_info.qq_qrcode.url) if contact_info.qq_qrcode else None,
+                    'wechat_qrcode_url': request.build_absolute_uri(contact_info.wechat_qrcode.url) if contact_info.wechat_qrcode else None
+                }
+            })
+            
+        except Exception as e:
+            logger.error(f"更新二级代理联系方式失败: {str(e)}")
+            return Response({
+                'code': 500,
+                'message': '更新失败',
+                'error': str(e)
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_user_balance(request):
+    """获取当前用户的余额信息"""
+    try:
+        user = request.user
+        
+        return Response({
+            'code': 200,
+            'message': '获取余额成功',
+            'data': {
+                'balance': float(user.balance)
+            }
+        })
+        
+    except Exception as e:
+        logger.error(f"获取余额失败: {str(e)}")
+        return Response({
+            'code': 500,
+            'message': f'获取余额失败: {str(e)}',
+            'data': None
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -0,0 +1,382 @@
+"""
+节点迁移接口
+"""
+import json
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.response import Response
+from rest_framework.permissions import IsAuthenticated
+import random
+from ..models import NodeInfo, PaymentOrder
+from panels.models import AgentPanel
+import logging
+from threading import Thread
+from ..migration_planner import MigrationPlanner, get_migration_progress
+from ..panel_session import get_login_cookie, make_request_with_cookie
+from ..node_migration import migrate_node
+
+logger = logging.getLogger(__name__)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def change_node_panel(request):
+    """
+    修改节点所属面板接口
+    将节点迁移到新的面板，并重新创建配置
+    """
+    try:
+        # 获取请求数据
+        node_id = request.data.get('node_id')
+        new_panel_id = request.data.get('panel_id')
+        
+        if not node_id or not new_panel_id:
+            return Response({
+                'code': 400,
+                'message': '节点ID和面板ID不能为空',
+                'data': None
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        # 查询节点和面板
+        try:
+            node = NodeInfo.objects.get(id=node_id)
+        except NodeInfo.DoesNotExist:
+            return Response({
+                'code': 404,
+                'message': '节点不存在',
+                'data': None
+            }, status=status.HTTP_404_NOT_FOUND)
+            
+        try:
+            new_panel = AgentPanel.objects.get(id=new_panel_id)
+        except AgentPanel.DoesNotExist:
+            return Response({
+                'code': 404,
+                'message': '面板不存在',
+                'data': None
+            }, status=status.HTTP_404_NOT_FOUND)
+        
+        # 解析当前节点配置
+        if not node.config_text:
+            return Response({
+                'code': 400,
+                'message': '节点配置信息不完整',
+                'data': None
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        
+        # 创建新的host_config
+        new_host_config = {
+            'id': new_panel.id,
+            'ip': new_panel.ip_address,
+            'username': new_panel.username,
+            'password': new_panel.password,
+            'panel_type': new_panel.panel_type,
+            'tag': '',
+        }
+        
+        new_config = json.loads(node.config_text)
+        if new_panel.panel_type == 'x-ui':
+            if node.protocol == 'vless' or node.protocol == 'Vless':
+                url_version = f"http://{new_panel.ip_address}/server/status"
+                headers = {
+                    'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
+                    'Accept': 'application/json, text/plain, */*',
+                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/96.0.4664.45 Safari/537.36',
+                }
+                response_version = make_request_with_cookie(
+                            new_panel, 
+                            new_host_config, 
+                            url_version, 
+                            headers, 
+                            method='post', 
+                            data=None
+                        )
+                # 获取系统版本
+                if response_version.status_code != 200:
+                    logger.error(f"面板 {new_panel.id} 版本检查失败，状态码: {response_version.status_code}")
+                    new_panel.is_online = False
+                    new_panel.save()
+                    return Response({
+                        'code': 500,
+                        'message': f'处理失败: {str(e)}',
+                        'data': None
+                    }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+                else:
+                    version = response_version.json().get('obj').get('xray').get('version')
+                    if version == '25.3.6':
+                        new_config['settings']['clients'][0]['flow'] = ""
+                    else:
+                        new_config['settings']['clients'][0]['flow'] = "xtls-rprx-direct"
+                    
+                print('==处理后的配置==',new_config)
+            # 确保端口不在已使用列表中
+            used_ports = []
+            if new_panel.used_ports:
+                used_ports = [int(port) for port in new_panel.used_ports.split(',') if port.strip().isdigit()]
+            
+            random_port = node.port
+            print('==随机端口==',random_port)
+            print('==已使用端口==',used_ports)
+            # 检查端口是否已被使用
+            while True:
+                if random_port not in used_ports:
+                    node.port = random_port
+                    new_config['port'] = random_port
+                    print('==更新后的端口==',new_config)
+                    # 更新used_ports列表
+                    used_ports.append(random_port)
+                    new_panel.used_ports = ','.join(map(str, used_ports))
+                    new_panel.save(update_fields=['used_ports'])
+                    break
+                else:
+                    # 生成新的随机端口
+                    random_port = random.randint(1, 65534)
+                    
+            if not new_panel.cookie:
+                cookie = get_login_cookie(new_panel, new_host_config)
+                if not cookie:
+                    logger.error(f"无法获取面板 {new_panel.id} 的cookie")
+                    
+        else:
+            headers = {
+                    'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
+                    'host': f'{new_panel.ip_address.split("/")[0]}',
+                    'Accept': 'application/json, text/plain, */*',
+                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/134.0.0.0 Safari/537.36',
+                    'Origin': f'http://{new_panel.ip_address.split("/")[0]}',
+                    'Referer': f'http://{new_panel.ip_address}/panel/'
+                }
+            url = f"http://{new_panel.ip_address}/panel/xray/"
+            response = make_request_with_cookie(new_panel, {
+                    'ip': new_panel.ip_address,
+                    'username': new_panel.username,
+                    'password': new_panel.password,
+                    'panel_type': new_panel.panel_type
+                }, url, headers, method='post')
+            if response.status_code == 200:
+                    result = response.json()
+                    if result.get('success'):
+                        xray_setting = json.loads(result['obj'])['xraySetting']
+                        servers = []
+                        # 提取所有可用的servers节点
+                        for outbound in xray_setting.get('outbounds', []):
+                            try:
+                                if outbound.get('protocol') == 'socks':
+                                    settings = outbound.get('settings', {})
+                                    # 检查settings是否是字符串，如果是则需要解析
+                                    if isinstance(settings, str):
+                                        settings = json.loads(settings)
+                                    
+                                    # 获取servers数组
+                                    servers_data = settings.get('servers', [])
+                                    # 如果servers是字符串，需要解析
+                                    if isinstance(servers_data, str):
+                                        servers_data = json.loads(servers_data)
+                                    
+                                    # 确保servers_data是列表
+                                    if isinstance(servers_data, list):
+                                        for server in servers_data:
+                                            # 获取users数组
+                                            users = server.get('users', [])
+                                            # 如果users是字符串，需要解析
+                                            if isinstance(users, str):
+                                                users = json.loads(users)
+                                            
+                                            # 确保至少有一个用户
+                                            if users and len(users) > 0:
+                                                user = users[0]  # 获取第一个用户
+                                                servers.append({
+                                                    'address': server.get('address'),
+                                                    'port': server.get('port'),
+                                                    'user': user.get('user'),
+                                                    'pass': user.get('pass'),
+                                                    'tag': outbound.get('tag', '')
+                                                })
+                            except Exception as e:
+                                logger.error(f"处理outbound数据时出错: {str(e)}")
+                                continue
+
+                        if servers:
+                            random.shuffle(servers)
+                            panel_servers = servers
+            
+
+            # 确保端口不在已使用列表中
+            
+            used_ports = []
+            if new_panel.used_ports:
+                used_ports = [int(port) for port in new_panel.used_ports.split(',') if port.strip().isdigit()]
+            
+            random_port = node.port
+            new_host_config['tag']=panel_servers[0].get('tag', '')
+            if new_config['protocol'] == 'vless' or new_config['protocol'] == 'shadowsocks' or new_config['protocol'] == 'vmess':
+                new_config['settings']['clients'][0]['email'] = new_config['settings']['clients'][0]['email'] + str(random.randint(1000, 9000))
+            # 检查端口是否已被使用
+            while True:
+                if random_port not in used_ports:
+                    node.port = random_port
+                    new_config['port'] = random_port
+                    # 更新used_ports列表
+                    used_ports.append(random_port)
+                    new_panel.used_ports = ','.join(map(str, used_ports))
+                    new_panel.save(update_fields=['used_ports'])
+                    break
+                else:
+                    # 生成新的随机端口
+                    random_port = random.randint(1, 65534)
+                    
+        
+        
+        # 更新节点host_config
+        node.host = new_panel.ip
+        node.host_config = json.dumps(new_host_config)
+        node.panel_node_id = None  # 清除旧的面板节点ID
+        node.status = 'pending'  # 设置为待处理状态
+        node.config_text = json.dumps(new_config)
+        node.panel_id = new_panel.id
+        node.save(update_fields=['host_config','host','panel_id', 'panel_node_id','port', 'status', 'config_text'])
+        
+        # 异步处理节点迁移
+        thread = Thread(target=migrate_node, args=(node, new_panel))
+        thread.start()
+        
+        return Response({
+            'code': 200,
+            'message': '节点面板修改任务已提交，请稍后查看节点状态',
+            'data': None
+        })
+            
+    except Exception as e:
+        logger.error(f"修改节点面板失败: {str(e)}")
+        return Response({
+            'code': 500,
+            'message': f'处理失败: {str(e)}',
+            'data': None
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def change_order_panel(request):
+    """
+    修改订单下所有节点的面板
+    """
+    try:
+        # 获取请求数据
+        order_id = request.data.get('order_id')
+        new_panel_id = request.data.get('panel_id')
+        print('==order_id==',order_id)
+        print('==new_panel_id==',new_panel_id)
+        
+        if not order_id or not new_panel_id:
+            return Response({
+                'code': 400,
+                'message': '订单ID和面板ID不能为空',
+                'data': None
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        # 查询订单
+        try:
+            payment_order = PaymentOrder.objects.get(id=order_id)
+        except PaymentOrder.DoesNotExist:
+            return Response({
+                'code': 404,
+                'message': '订单不存在',
+                'data': None
+            }, status=status.HTTP_404_NOT_FOUND)
+        
+        # 查询新面板
+        try:
+            new_panel = AgentPanel.objects.get(id=new_panel_id)
+            if not new_panel.is_active or not new_panel.is_online:
+                return Response({
+                    'code': 400,
+                    'message': '所选面板不可用',
+                    'data': None
+                }, status=status.HTTP_400_BAD_REQUEST)
+        except AgentPanel.DoesNotExist:
+            return Response({
+                'code': 404,
+                'message': '面板不存在',
+                'data': None
+            }, status=status.HTTP_404_NOT_FOUND)
+        
+        # 获取订单下的所有节点
+        nodes = NodeInfo.objects.filter(order=payment_order)
+        
+        if not nodes.exists():
+            return Response({
+                'code': 404,
+                'message': '该订单下没有节点',
+                'data': None
+            }, status=status.HTTP_404_NOT_FOUND)
+        # 通过迁移计划器批量迁移：目标面板能力只探测一次，端口一次性预留，有界线程池执行
+        planner = MigrationPlanner()
+        for node in nodes:
+            planner.add(node, new_panel)
+        if not planner.prepare():
+            return Response({
+                'code': 400,
+                'message': '目标面板检测失败，无法迁移节点',
+                'data': None
+            }, status=status.HTTP_400_BAD_REQUEST)
+        planner.start()
+        
+        payment_order.country = new_panel.country
+        param_old = json.loads(payment_order.param)
+        param_old['country'] = new_panel.country
+        payment_order.param = json.dumps(param_old)
+        payment_order.save(update_fields=['country', 'param'])
+        return Response({
+            'code': 200,
+            'message': '订单节点迁移任务已提交，请稍后查看节点状态',
+            'data': {
+                'order_id': payment_order.id,
+                'nodes_count': nodes.count(),
+                'new_panel_id': new_panel.id,
+                'new_panel_ip': new_panel.ip_address,
+                'job_id': planner.job_id
+            }
+        })
+            
+    except Exception as e:
+        logger.error(f"修改订单内节点失败: {str(e)}")
+        return Response({
+            'code': 500,
+            'message': f'处理失败: {str(e)}',
+            'data': None
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def migration_progress(request):
+    """
+    查询节点迁移任务进度
+    """
+    if request.user.user_type not in ['admin', 'agent_l1']:
+        return Response({
+            'code': 403,
+            'message': '没有权限查看迁移进度',
+            'data': None
+        }, status=status.HTTP_403_FORBIDDEN)
+    job_id = request.query_params.get('job_id')
+    if not job_id:
+        return Response({
+            'code': 400,
+            'message': '任务ID不能为空',
+            'data': None
+        }, status=status.HTTP_400_BAD_REQUEST)
+    progress = get_migration_progress(job_id)
+    if progress is None:
+        return Response({
+            'code': 404,
+            'message': '迁移任务不存在或已过期',
+            'data': None
+        }, status=status.HTTP_404_NOT_FOUND)
+    return Response({
+        'code': 200,
+        'message': '获取迁移进度成功',
+        'data': progress
+    })
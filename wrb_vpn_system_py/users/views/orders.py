@@ -0,0 +1,256 @@
+"""
+订单查询接口
+"""
+from rest_framework import viewsets, status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from rest_framework.permissions import IsAuthenticated
+from ..serializers import PaymentOrderSerializer
+from ..models import NodeInfo, PaymentOrder
+import logging
+from transits.services import get_agent_domain_maps, get_udp_host_domain
+from ..exports import get_export_format, stream_export
+from ..pagination import KeysetPagination, use_keyset_pagination, CustomPagination
+
+logger = logging.getLogger(__name__)
+
+
+class PaymentOrderViewSet(viewsets.ReadOnlyModelViewSet):
+    """订单视图集"""
+    serializer_class = PaymentOrderSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = CustomPagination
+
+    def get_queryset(self):
+        """根据用户类型返回不同的订单查询集"""
+        user = self.request.user
+        queryset = PaymentOrder.objects.select_related('user__parent')
+
+        # 根据用户类型过滤订单
+        if user.user_type == 'customer':
+            # 客户只能查看自己的订单
+            queryset = queryset.filter(user=user)
+        elif user.user_type == 'agent_l2':
+            # 二级代理只能查看自己客户的订单
+            queryset = queryset.filter(user__parent=user)
+        # 一级代理和管理员可以查看所有订单
+
+        # 添加搜索和筛选功能
+        # 1. 通过代理商名字搜索（仅限一级代理）
+        agent_username = self.request.query_params.get('agent_username', None)
+        if agent_username and user.user_type == 'agent_l1':
+            queryset = queryset.filter(user__parent__username__icontains=agent_username)
+
+        # 2. 通过客户名搜索
+        customer_username = self.request.query_params.get('customer_username', None)
+        if customer_username:
+            queryset = queryset.filter(user__username__icontains=customer_username)
+
+        # 3. 通过支付方式筛选
+        payment_type = self.request.query_params.get('payment_type', None)
+        if payment_type:
+            queryset = queryset.filter(payment_type=payment_type)
+
+        # 4. 通过订单号筛选
+        trade_no = self.request.query_params.get('trade_no', None)
+        if trade_no:
+            queryset = queryset.filter(trade_no__icontains=trade_no)
+
+        # 5. 通过时间范围筛选
+        start_date = self.request.query_params.get('start_date', None)
+        end_date = self.request.query_params.get('end_date', None)
+        if start_date:
+            queryset = queryset.filter(created_at__gte=start_date)
+        if end_date:
+            queryset = queryset.filter(created_at__lte=end_date)
+
+        # 6. 通过订单状态筛选
+        status = self.request.query_params.get('status', None)
+        if status:
+            queryset = queryset.filter(status=status)
+
+        # 7. 通过付费周期、节点类型、协议筛选
+        period = self.request.query_params.get('period', None)
+        if period:
+            queryset = queryset.filter(period=period)
+        node_type = self.request.query_params.get('node_type', None)
+        if node_type:
+            queryset = queryset.filter(node_type=node_type)
+        protocol = self.request.query_params.get('protocol', None)
+        if protocol:
+            queryset = queryset.filter(node_protocol=protocol)
+
+        # 8. 通过国家筛选
+        country = self.request.query_params.get('country', None)
+        if country:
+            # 通过节点关联的面板国家筛选订单
+            from panels.models import AgentPanel
+            # 先找到匹配国家的面板ID列表
+            matching_panels = AgentPanel.objects.filter(country__icontains=country).values_list('id', flat=True)
+            if matching_panels:
+                # 找到使用这些面板的节点的订单ID
+                from users.models import NodeInfo
+                matching_order_ids = NodeInfo.objects.filter(
+                    panel_id__in=matching_panels
+                ).values_list('order_id', flat=True).distinct()
+                # 只返回包含匹配国家节点的订单
+                queryset = queryset.filter(id__in=matching_order_ids)
+            else:
+                # 如果没有找到匹配的面板，返回空查询集
+                queryset = queryset.none()
+
+        # 按创建时间倒序排序
+        return queryset.order_by('-created_at')
+
+    def list(self, request, *args, **kwargs):
+        """获取订单列表"""
+        try:
+            queryset = self.filter_queryset(self.get_queryset())
+
+            # 游标分页（pagination=cursor 或携带 cursor 参数时启用）
+            if use_keyset_pagination(request):
+                paginator = KeysetPagination(ordering=('-created_at', '-id'))
+                page = paginator.paginate_queryset(queryset, request, self)
+                serializer = self.get_serializer(page, many=True)
+                return Response({
+                    'code': 200,
+                    'message': '获取订单列表成功',
+                    'data': paginator.get_paginated_response(serializer.data).data
+                })
+
+            page = self.paginate_queryset(queryset)
+            
+            if page is not None:
+                serializer = self.get_serializer(page, many=True)
+                paginated_data = self.get_paginated_response(serializer.data).data
+                return Response({
+                    'code': 200,
+                    'message': '获取订单列表成功',
+                    'data': paginated_data
+                })
+            
+            serializer = self.get_serializer(queryset, many=True)
+            return Response({
+                'code': 200,
+                'message': '获取订单列表成功',
+                'data': {
+                    'results': serializer.data,
+                    'count': len(serializer.data),
+                    'next': None,
+                    'previous': None
+                }
+            })
+        except Exception as e:
+            logger.error(f"获取订单列表失败: {str(e)}")
+            return Response({
+                'code': 500,
+                'message': f'获取订单列表失败: {str(e)}',
+                'data': None
+            }, status=500)
+
+    def retrieve(self, request, *args, **kwargs):
+        """获取订单详情"""
+        try:
+            instance = self.get_object()
+            serializer = self.get_serializer(instance)
+            return Response({
+                'code': 200,
+                'message': '获取订单详情成功',
+                'data': serializer.data
+            })
+        except Exception as e:
+            logger.error(f"获取订单详情失败: {str(e)}")
+            return Response({
+                'code': 500,
+                'message': f'获取订单详情失败: {str(e)}',
+                'data': None
+            }, status=500)
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """按当前筛选条件流式导出订单（export_format=csv|ndjson）"""
+        export_format = get_export_format(request)
+        if not export_format:
+            return Response({
+                'code': 400,
+                'message': '不支持的导出格式',
+                'data': None
+            }, status=status.HTTP_400_BAD_REQUEST)
+        queryset = self.filter_queryset(self.get_queryset()).order_by('id')
+        fields = [
+            'id', 'out_trade_no', 'trade_no', 'user__username', 'user__parent__username', 'payment_type',
+            'product_name', 'amount', 'status', 'country', 'node_count', 'node_protocol', 'period',
+            'node_type', 'is_processed', 'created_at',
+        ]
+        return stream_export(queryset, fields, export_format, 'orders')
+
+    @action(detail=True, methods=['get'])
+    def node_info(self, request, pk=None):
+        """获取订单关联的节点详情"""
+        try:
+            # 直接通过订单ID查询NodeInfo表
+            nodes = list(NodeInfo.objects.filter(order_id=pk).select_related('user'))
+            if not nodes:
+                return Response({
+                    'code': 404,
+                    'message': '该订单未关联节点信息',
+                    'data': None
+                }, status=404)
+
+            # 获取节点关联的所有面板ID
+            panel_ids = [node.panel_id for node in nodes if node.panel_id]
+            
+            # 查询这些面板信息
+            from panels.models import AgentPanel
+            panels = AgentPanel.objects.filter(id__in=panel_ids)
+            
+            # 创建面板ID到国家的映射
+            panel_country_map = {panel.id: panel.country for panel in panels}
+            # 一次取出所有节点所属代理的中转域名映射
+            domain_maps = get_agent_domain_maps(node.user.parent_id for node in nodes)
+
+            # 返回所有关联的节点信息
+            node_data = []
+            
+            for node in nodes:
+                # 获取面板国家
+                country = panel_country_map.get(node.panel_id, '未知') if node.panel_id else '未知'
+                
+                node_dict = {
+                    'id': node.id,
+                    'order_id': node.order_id,
+                    'user_id': node.user_id,
+                    'remark': node.remark,
+                    'remark_custom': node.remark_custom,
+                    'protocol': node.protocol,
+                    'host_config': node.host_config,
+                    'host': node.host,
+                    'port': node.port,
+                    'uuid': node.uuid,
+                    'node_user': node.node_user,
+                    'node_password': node.node_password,
+                    'panel_id': node.panel_id,
+                    'panel_node_id': node.panel_node_id,
+                    'status': node.status,
+                    'expiry_time': node.expiry_time.isoformat() if node.expiry_time else None,
+                    'config_text': node.config_text,
+                    'udp': node.udp,
+                    'udp_host': node.udp_host,
+                    'udp_host_domain': get_udp_host_domain(node, domain_map=domain_maps.get(node.user.parent_id, {})),
+                    'udp_config': node.udp_config,
+                    'country': country  # 添加国家字段
+                }
+                node_data.append(node_dict)
+
+            return Response({
+                'code': 200,
+                'message': '获取节点详情成功',
+                'data': node_data
+            })
+        except Exception as e:
+            logger.error(f"获取节点详情失败: {str(e)}")
+            return Response({
+                'code': 500,
+                'message': f'获取节点详情失败: {str(e)}',
+                'data': None
+            }, status=500)
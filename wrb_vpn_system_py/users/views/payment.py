@@ -0,0 +1,2330 @@
+"""
+支付接口：在线支付下单、支付回调、订单状态、优惠券校验和余额下单
+"""
+import json
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.response import Response
+from rest_framework.permissions import IsAuthenticated, AllowAny
+from django.contrib.auth import get_user_model
+import random
+from decimal import Decimal
+from django.utils import timezone
+from datetime import timedelta, datetime
+from ..models import NodeInfo, PaymentOrder
+from panels.models import AgentPanel
+import requests
+import logging
+import hashlib
+from cdk.services import get_coupon_snapshot, is_coupon_valid_for_domain, redeem_coupon, release_coupon
+from panels.views import AgentPanelViewSet
+from threading import Thread
+from ..ledger import change_balance, InsufficientBalance
+from ..idempotency import idempotent, mark_side_effect
+from ..panel_session import get_login_cookie, make_request_with_cookie
+from ..pricing import get_price_or_parent
+from ..provisioning import process_node_creation, process_successful_payment
+
+User = get_user_model()
+
+logger = logging.getLogger(__name__)
+
+
+# 创建AgentPanelViewSet实例，以便调用其方法
+agent_panel_viewset = AgentPanelViewSet()
+
+
+def generate_sign(params):
+    """
+    生成MD5签名
+    :param params: 参数字典
+    :return: 签名
+    """
+    # 不再过滤参数，直接使用传入的所有参数
+    filtered_params = params
+    
+    # 按照参数名ASCII码从小到大排序
+    sorted_params = sorted(filtered_params.items(), key=lambda x: x[0])
+    
+    # 拼接成URL键值对格式
+    param_str = '&'.join([f"{k}={v}" for k, v in sorted_params])
+    
+    # 拼接商户密钥
+    sign_str = param_str + '00m306t35efm526dmDtTeM052t5e6KEN'
+    
+    # 生成MD5签名
+    return hashlib.md5(sign_str.encode('utf-8')).hexdigest()
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def payment_callback(request):
+    """
+    支付异步回调接口
+    """
+    try:
+        # 获取所有参数
+        params = request.GET.dict()
+        
+        
+        # 验证支付状态
+        trade_status = params.get('trade_status')
+        trade_no = params.get('trade_no')
+        out_trade_no = params.get('out_trade_no')
+        
+        if not out_trade_no:
+            return Response({"success": False, "message": "订单号为空"})
+        
+        # 查找订单
+        try:
+            order = PaymentOrder.objects.get(out_trade_no=out_trade_no)
+        except PaymentOrder.DoesNotExist:
+            return Response({"success": False, "message": "订单不存在"})
+        
+        # 检查是否已处理
+        if order.is_processed:
+            return Response({"success": True, "message": "订单已处理"})
+        
+        # 验证支付状态为成功
+        if trade_status == 'TRADE_SUCCESS':
+            # 更新订单信息
+            order.trade_no = trade_no
+            order.status = 'success'
+            order.is_processed = True
+            order.save()
+            
+            # 预留：订单支付成功后的业务处理逻辑
+            # 1. 激活用户购买的服务
+            # 2. 为用户创建节点
+            # 3. 更新相关统计数据
+            try:
+                # 这里可以添加支付成功后的业务逻辑处理
+                process_successful_payment(order)
+            except Exception as e:
+                logger.error(f"处理支付成功后的业务逻辑时出错: {str(e)}")
+                # 不抛出异常，继续处理后续逻辑
+        
+        # 返回成功响应
+        return Response({"success": True})
+    
+    except Exception as e:
+        logger.error(f"处理支付回调出错: {str(e)}")
+        return Response({"success": False, "message": str(e)})
+
+
+@api_view(['POST'])
+def payment_submit(request): 
+    """
+    支付接口
+    """
+    return Response({
+        'code': 200,
+        'message': '支付功能限制，请使用余额支付',
+        'data': None
+    }, status=status.HTTP_200_OK)
+    
+    redeemed_coupon = None
+    try:
+        # 获取请求参数并转换为普通字典，同时将列表值转换为字符串
+        data = request.data
+        node_user = request.data.get('username')
+        node_password = request.data.get('password')
+        country = request.data.get('region')
+        node_count = request.data.get('quantity', 1)  # 默认创建1个节点
+        if not country:
+            return Response({
+                'code': 400,
+                'message': '国家参数不能为空',
+                'data': None
+            }, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            node_count = int(node_count)
+            if node_count < 1:
+                node_count = 1
+        except (TypeError, ValueError):
+            node_count = 1
+
+
+        # 创建节点参数，先缓存到节点表中，支付成功后，在通过xui接口创建节点
+
+
+        # 验证必要参数
+        data['pid']= 1207
+        required_fields = ['region','nodeType', 'protocol','period', 'quantity', 'paymentMethod']
+        for field in required_fields:
+            if field not in data:
+                return Response({
+                    'code': 0,
+                    'msg': f'缺少必要参数: {field}'
+                }, status=status.HTTP_400_BAD_REQUEST)
+        # 获取请求域名
+        requesting_domain = request.META.get('HTTP_HOST', '')
+        origin = request.META.get('HTTP_ORIGIN', '')    # 获取请求的源域名
+        referer = request.META.get('HTTP_REFERER', '')  # 获取请求的来源URL
+        
+        # 尝试从HTTP_REFERER中提取域名
+        referer_domain = ''
+        if referer and '://' in referer:
+            referer_parts = referer.split('://', 1)[1]
+            if '/' in referer_parts:
+                referer_domain = referer_parts.split('/', 1)[0]
+            else:
+                referer_domain = referer_parts
+        
+        # 尝试从HTTP_ORIGIN中提取域名
+        origin_domain = ''
+        if origin and '://' in origin:
+            origin_domain = origin.split('://', 1)[1]
+        
+        
+        # 使用多种方法尝试获取源地址
+        source_domain = referer_domain or origin_domain or requesting_domain
+        data['clientip'] = source_domain
+        # 添加设备类型
+        user_agent = request.META.get('HTTP_USER_AGENT', '').lower()
+        if 'micromessenger' in user_agent:
+            device = 'wechat'
+        elif 'android' in user_agent:
+            device = 'android'
+        elif 'iphone' in user_agent or 'ipad' in user_agent:
+            device = 'ios'
+        else:
+            device = 'pc'
+        data['device'] = device
+        
+        # 设置通知地址
+        data['notify_url'] = 'http://23.27.28.122:8008/api/payment/callback/'
+        
+        # 从token获取用户信息
+        user = None
+        if request.user and request.user.is_authenticated:
+            user = request.user
+            print(f"已从token中获取到用户ID: {user.id}, 用户名: {user.username}")
+        else:
+            print("请求中未包含有效的认证token，无法获取用户信息")
+            
+        # 计算价格和过期时间
+        money = 0
+        expiry_time = 0
+        now = timezone.now()  # 获取当前时间
+        
+        # 通过请求域名查找匹配的二级代理
+        matched_agent = None
+        agents = User.objects.filter(user_type='agent_l2')
+        
+        for agent in agents:
+            if agent.domain and source_domain.endswith(agent.domain):
+                matched_agent = agent
+                break
+        
+        if not matched_agent:
+            return Response({
+                'code': 404,
+                'message': '未找到匹配的代理',
+                'data': None
+            }, status=status.HTTP_404_NOT_FOUND)
+        
+        # 获取节点类型和付费周期
+        node_type = data.get('nodeType', '').lower()  # 'normal' 或 'live' 或 'transit'
+        period = data.get('period', '').lower()  # 'monthly', 'quarterly', 'half_yearly', 'yearly'
+        
+        # 根据节点类型和付费周期获取对应的价格
+        if node_type == 'normal':
+            # 先检查是否有自定义价格，如果没有则使用普通价格
+            if period == 'monthly':
+                field_name = 'normal_monthly_price'
+                days = 30
+            elif period == 'quarterly':
+                field_name = 'normal_quarterly_price'
+                days = 90
+            elif period == 'half_yearly':
+                field_name = 'normal_half_yearly_price'
+                days = 180
+            elif period == 'yearly':
+                field_name = 'normal_yearly_price'
+                days = 365
+            else:
+                return Response({
+                    'code': 400,
+                    'message': f'无效的付费周期: {period}',
+                    'data': None
+                }, status=status.HTTP_400_BAD_REQUEST)
+        elif node_type == 'live':
+            # 先检查是否有自定义价格，如果没有则使用普通价格
+            if period == 'monthly':
+                field_name = 'live_monthly_price'
+                days = 30
+            elif period == 'quarterly':
+                field_name = 'live_quarterly_price'
+                days = 90
+            elif period == 'half_yearly':
+                field_name = 'live_half_yearly_price'
+                days = 180
+            elif period == 'yearly':
+                field_name = 'live_yearly_price'
+                days = 365
+            else:
+                return Response({
+                    'code': 400,
+                    'message': f'无效的付费周期: {period}',
+                    'data': None
+                }, status=status.HTTP_400_BAD_REQUEST)
+        elif node_type == 'transit':
+            # 获取中转节点价格
+            if period == 'monthly':
+                field_name = 'transit_monthly_price'
+                days = 30
+            elif period == 'quarterly':
+                field_name = 'transit_quarterly_price'
+                days = 90
+            elif period == 'half_yearly':
+                field_name = 'transit_half_yearly_price'
+                days = 180
+            elif period == 'yearly':
+                field_name = 'transit_yearly_price'
+                days = 365
+            else:
+                return Response({
+                    'code': 400,
+                    'message': f'无效的付费周期: {period}',
+                    'data': None
+                }, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            return Response({
+                'code': 400,
+                'message': f'无效的节点类型: {node_type}',
+                'data': None
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        # 获取价格（优先使用自定义价格）
+        money = get_price_or_parent(matched_agent, field_name, user if user else None)
+        
+        # 处理优惠券代码
+        coupon_code = data.get('coupon')
+        discount = 0
+        if coupon_code:
+            print('处理优惠券:', coupon_code)
+            try:
+                coupon = get_coupon_snapshot(coupon_code)
+                if not coupon:
+                    print('优惠券不存在')
+                elif not is_coupon_valid_for_domain(coupon, source_domain):
+                    print('优惠券不适用于此网站')
+                elif redeem_coupon(coupon_code):
+                    # 核销成功（条件更新保证不会超过使用上限）后应用折扣
+                    discount = coupon['discount']
+                    redeemed_coupon = coupon_code
+                    print(f'应用优惠券折扣: {discount}%')
+                else:
+                    print('优惠券无效(过期/未生效/已达使用上限)')
+            except Exception as e:
+                print(f'验证优惠券时出错: {str(e)}')
+        
+        # 应用折扣
+        if discount > 0:
+            # 将 discount/100 转换为 Decimal 类型以避免类型不匹配
+            discount_factor = Decimal(str(1 - discount / 100))
+            money = money * discount_factor
+            print(f'折扣后金额: {money}')
+        
+        # 计算过期时间（当前时间 + 天数）
+        expiry_time = int((now + timedelta(days=days)).timestamp() * 1000)  # 转换为毫秒级时间戳
+        
+        # 设置订单金额
+        data['money'] = float(money) * int(node_count)  # 价格乘以节点数量
+                
+        # 发送请求到第三方支付接口前，先生成订单编号
+        # 订单编号由年月日+时间戳+6位随机数组成
+        order_no = f"{timezone.now().strftime('%Y%m%d')}{int(timezone.now().timestamp())}{random.randint(100000, 999999)}"
+        # 生成签名
+        sign_data = {
+            'pid': '1207',
+            'out_trade_no': order_no,
+            'type': data['paymentMethod'],
+            'notify_url': data['notify_url'],
+            'name': f'代理订单：{node_type}-{period}-{node_count}节点',
+            'money': data['money'],
+            'clientip': data['clientip'],
+            'device': data['device'],
+            'param': f'代理信息：{data["region"]}-{data["nodeType"]}-{data["protocol"]}-{data["period"]}',
+            'trade_status': 'TRADE_SUCCESS',
+        }
+        
+        # 生成签名
+        sign_data['sign'] = generate_sign(sign_data)
+        sign_data['sign_type'] = 'MD5'
+        
+        # 查询在线的代理面板，按国家筛选（不区分大小写）
+        panels_3x_ui = AgentPanel.objects.filter(
+            is_online=True,
+            country__iexact=country,
+            panel_type='3x-ui'
+        ).order_by('nodes_count')
+
+        panels_x_ui = AgentPanel.objects.filter(
+            is_online=True,
+            country__iexact=country,
+            panel_type='x-ui'
+        ).order_by('nodes_count')
+        
+        
+        if not panels_3x_ui.exists() and not panels_x_ui.exists():
+            if redeemed_coupon:
+                release_coupon(redeemed_coupon)
+            return Response({
+                'code': 404,
+                'message': f'未找到国家为 {country} 的可用代理面板',
+                'data': None
+            }, status=status.HTTP_404_NOT_FOUND)
+
+
+        # 获取所有可用面板列表
+        panel_servers = {}
+        for panel in panels_3x_ui:
+            try:
+                # 构建请求头
+                headers = {
+                    'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
+                    'host': f'{panel.ip_address.split("/")[0]}',
+                    'Accept': 'application/json, text/plain, */*',
+                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/134.0.0.0 Safari/537.36',
+                    'Origin': f'http://{panel.ip_address.split("/")[0]}',
+                    'Referer': f'http://{panel.ip_address}/panel/'
+                }
+                
+                # 获取xray配置
+                url = f"http://{panel.ip_address}/panel/xray/"
+                response = make_request_with_cookie(panel, {
+                    'ip': panel.ip_address,
+                    'username': panel.username,
+                    'password': panel.password,
+                    'panel_type': panel.panel_type
+                }, url, headers, method='post')
+                
+                if response.status_code == 200:
+                    result = response.json()
+                    if result.get('success'):
+                        xray_setting = json.loads(result['obj'])['xraySetting']
+                        servers = []
+                        # 提取所有可用的servers节点
+                        for outbound in xray_setting.get('outbounds', []):
+                            try:
+                                if outbound.get('protocol') == 'socks':
+                                    settings = outbound.get('settings', {})
+                                    # 检查settings是否是字符串，如果是则需要解析
+                                    if isinstance(settings, str):
+                                        settings = json.loads(settings)
+                                    
+                                    # 获取servers数组
+                                    servers_data = settings.get('servers', [])
+                                    # 如果servers是字符串，需要解析
+                                    if isinstance(servers_data, str):
+                                        servers_data = json.loads(servers_data)
+                                    
+                                    # 确保servers_data是列表
+                                    if isinstance(servers_data, list):
+                                        for server in servers_data:
+                                            # 获取users数组
+                                            users = server.get('users', [])
+                                            # 如果users是字符串，需要解析
+                                            if isinstance(users, str):
+                                                users = json.loads(users)
+                                            
+                                            # 确保至少有一个用户
+                                            if users and len(users) > 0:
+                                                user = users[0]  # 获取第一个用户
+                                                servers.append({
+                                                    'address': server.get('address'),
+                                                    'port': server.get('port'),
+                                                    'user': user.get('user'),
+                                                    'pass': user.get('pass'),
+                                                    'tag': outbound.get('tag', '')
+                                                })
+                            except Exception as e:
+                                logger.error(f"处理outbound数据时出错: {str(e)}")
+                                continue
+
+                        if servers:
+                            random.shuffle(servers)
+                            panel_servers[panel.id] = servers
+            except Exception as e:
+                logger.error(f"获取面板 {panel.id} 的servers配置失败: {str(e)}")
+                continue
+
+            # 修改节点创建逻辑
+        remaining_nodes = node_count
+        node_info_list = []
+        # 创建节点的参数
+        node_data = request.data
+        # 获取协议类型
+        protocol = node_data.get('protocol', 'vmess')
+        for panel in panels_3x_ui:
+            print(f"开始创建3x-ui节点: {panel.id}")
+            if remaining_nodes <= 0:
+                break
+            available_servers = panel_servers.get(panel.id, [])
+            while True:
+                skip_remaining_iterations = False
+                for server in available_servers:
+                    if remaining_nodes <= 0:
+                        skip_remaining_iterations = True
+                        break
+                
+                    try:
+                        # 生成随机未使用端口
+                        random_port = agent_panel_viewset.generate_random_port(panel)
+                        
+                        # 始终生成新的UUID
+                        client_id = agent_panel_viewset.generate_uuid()
+                        
+                        # 生成随机subId
+                        sub_id = agent_panel_viewset.generate_sub_id()
+                        
+                        # 3x-ui的节点创建数据结构，与x-ui类似但可能有所不同
+                        three_x_ui_create_node_data = {
+                            'up': 0,
+                            'down': 0,
+                            'total': 0,
+                            'remark': node_data.get('remark', '自动创建'),
+                            'enable': True,
+                            'expiryTime': expiry_time,  # 使用计算好的过期时间
+                            'listen':'',
+                            'port': random_port,
+                            'protocol': protocol.lower(),
+                            'settings': {},
+                            'streamSettings': {
+                                "network": "tcp",
+                                "security": "none",
+                                "externalProxy": [],
+                                "tcpSettings": {
+                                    "acceptProxyProtocol": False,
+                                    "header": {
+                                        "type": "none"
+                                    }
+                                }
+                            },
+                            'sniffing': {
+                                "enabled": False,
+                                "destOverride": [
+                                    "http",
+                                    "tls",
+                                    "quic",
+                                    "fakedns"
+                                ],
+                                "metadataOnly": False,
+                                "routeOnly": False
+                            },
+                            'allocate': {
+                                "strategy": "always",
+                                "refresh": 5,
+                                "concurrency": 3
+                                }
+                        }
+                        
+                        if protocol == 'vmess' or protocol == 'Vmess':
+                            three_x_ui_create_node_data['settings'] = {
+                                "clients": [
+                                    {
+                                    "id": client_id,
+                                    "security": "auto",
+                                    "email": sub_id+str(random_port),
+                                    "limitIp": 0,
+                                    "totalGB": 0,
+                                    "expiryTime": 0,
+                                    "enable": True,
+                                    "tgId": "",
+                                    "subId": sub_id,
+                                    "comment": "",
+                                    "reset": 0
+                                    }
+                                ],
+                            }
+                        elif protocol == 'vless' or protocol == 'Vless':
+                            three_x_ui_create_node_data['settings'] = {
+                                "clients": [
+                                    {
+                                    "id": client_id,  # 使用生成的UUID
+                                    "flow": "",
+                                    "email": sub_id+str(random_port),
+                                    "limitIp": 0,
+                                    "totalGB": 0,
+                                    "expiryTime": 0,
+                                    "enable": True,
+                                    "tgId": "",
+                                    "subId": sub_id,
+                                    "comment": "",
+                                    "reset": 0
+                                    }
+                                ],
+                                "decryption": "none",
+                                "fallbacks": []
+                            }
+                        elif protocol == 'shadowsocks' or protocol == 'Shadowsocks':
+                            three_x_ui_create_node_data['settings'] = {
+                                "method": "aes-256-gcm",
+                                "password": node_password,
+                                "network": "tcp,udp",
+                                # 如果是 2022blankasc加密需要删除下面的method的内容
+                                "clients": [
+                                    {
+                                    "method": "aes-256-gcm",
+                                    "password": node_password,
+                                    "email": sub_id+str(random_port),
+                                    "limitIp": 0,
+                                    "totalGB": 0,
+                                    "expiryTime": 0,
+                                    "enable": True,
+                                    "tgId": "",
+                                    "subId": sub_id,
+                                    "comment": "",
+                                    "reset": 0
+                                    }
+                                ],
+                                "ivCheck": False
+                            }
+                        elif protocol == 'socks' or protocol == 'Socks':
+                            three_x_ui_create_node_data['streamSettings']=""
+                            three_x_ui_create_node_data['settings'] = {
+                                "auth": "password",
+                                "accounts": [
+                                    {
+                                    "user": node_user,
+                                    "pass": node_password
+                                    }
+                                ],
+                                "udp": False,
+                                "ip": "127.0.0.1"
+                            }
+                            three_x_ui_create_node_data['sniffing'] = {}
+                        elif protocol == 'http' or protocol == 'Http':
+                            three_x_ui_create_node_data['streamSettings']=""
+                            three_x_ui_create_node_data['settings'] = {
+                                "accounts": [
+                                    {
+                                    "user": node_user,
+                                    "pass": node_password
+                                    }
+                                ],
+                                "allowTransparent": False
+                            }
+                        
+                        # 确保端口不在已使用列表中
+                        used_ports = []
+                        if panel.used_ports:
+                            used_ports = [int(port) for port in panel.used_ports.split(',') if port.strip().isdigit()]
+                        
+                        # 检查端口是否已被使用
+                        while True:
+                            if random_port not in used_ports:
+                                three_x_ui_create_node_data['port'] = random_port
+                                # 更新used_ports列表
+                                used_ports.append(random_port)
+                                panel.used_ports = ','.join(map(str, used_ports))
+                                panel.save()
+                                break
+                            else:
+                                # 生成新的随机端口
+                                random_port = random.randint(1, 65534)
+                        
+                        # 设置为节点数据
+                        node_data = three_x_ui_create_node_data
+                        # 创建FormData格式的数据
+                        form_data = {
+                            'up': node_data.get('up', 0),
+                            'down': node_data.get('down', 0),
+                            'total': node_data.get('total', 0),
+                            'remark': node_data.get('remark', '自动创建'),
+                            'enable': node_data.get('enable', True),
+                            'expiryTime': node_data.get('expiryTime', 0),
+                            'listen': node_data.get('listen', ''),
+                            'port': node_data.get('port', random_port),
+                            'protocol': node_data.get('protocol', 'vmess'),
+                            'settings': node_data.get('settings', {}),
+                            'streamSettings': node_data.get('streamSettings', {}),
+                            'sniffing': node_data.get('sniffing', {}),
+                            'allocate': node_data.get('allocate', {})
+                        }
+
+                        # 创建节点
+                        panel_info = {
+                            'tag': server.get('tag', ''),
+                            'type': '3x-ui',
+                            'id': panel.id,
+                            'ip': panel.ip_address,
+                            'port': panel.port,
+                            'username': panel.username,
+                            'password': panel.password,
+                            'panel_type': panel.panel_type
+                        }
+                        port = form_data.get('port')
+                        protocol = form_data.get('protocol')
+                        host_config = json.dumps(panel_info, ensure_ascii=False, indent=4)
+                        remark = f"自助下单-{timezone.now().strftime('%Y%m%d%H%M%S')}"
+                        
+                        # 获取节点设置信息
+                        settings = form_data.get('settings', {})
+                        # 获取特定协议的配置信息
+                        uuid_str = None
+                        node_user = None
+                        node_password = None
+                        
+                        if protocol in ['vmess', 'vless', 'Vmess', 'Vless']:
+                            # vmess和vless只使用uuid，没有用户名和密码
+                            clients = settings.get('clients', [{}])
+                            if clients:
+                                uuid_str = clients[0].get('id')
+                        elif protocol == 'shadowsocks' or protocol == 'Shadowsocks':
+                            # shadowsocks没有用户名和uuid，只有密码
+                            if panel.panel_type == 'x-ui':
+                                node_password = settings.get('password')
+                            else:  # 3x-ui
+                                clients = settings.get('clients', [{}])
+                                if clients:
+                                    node_password = clients[0].get('password')
+                        elif protocol in ['socks', 'http', 'Socks', 'Http']:
+                            # socks和http使用用户名和密码，没有uuid
+                            accounts = settings.get('accounts', [{}])
+                            if accounts:
+                                node_user = accounts[0].get('user', '')
+                                node_password = accounts[0].get('pass', '')
+                        # 创建节点信息字典，但不立即保存
+                        
+                        node_info_dict = {
+                            'user': request.user,
+                            'protocol': protocol,
+                            'host_config': host_config,
+                            'remark': remark,
+                            'remark_custom': '',
+                            'host': panel.ip or panel.ip_address,
+                            'port': port,
+                            'uuid': uuid_str,
+                            'udp': data.get('udpForward', False),
+                            'node_user': node_user,
+                            'node_password': node_password,
+                            'panel_id': panel.id,
+                            'panel_node_id': None,
+                            'config_text': json.dumps(form_data, ensure_ascii=False, indent=4),
+                            'status': 'pending',
+                            'expiry_time': datetime.fromtimestamp(form_data.get('expiryTime', 0)/1000),  # 从毫秒转换为datetime对象
+                            'form_data': form_data
+                        }
+
+
+                        udp_config = None  # 初始化 udp_config 变量
+                        if data.get('udpForward', False):
+                            try:
+                                # 获取登录账户的二级代理
+                                agent = request.user.parent if request.user.parent else None
+                                if agent and agent.user_type == 'agent_l2':
+                                    # 获取中转账号信息
+                                    transit_account = agent.default_transit_account
+                                    if transit_account:
+                                        # 获取默认入口和出口
+                                        default_in = transit_account.default_inbound
+                                        default_out = transit_account.default_outbound
+                                        
+                                        # 构建中转配置
+                                        udp_config =  {
+                                            "config": {
+                                                "id": transit_account.id,
+                                                "username": transit_account.username,
+                                                "password": transit_account.password,
+                                            },
+                                            "udpConfig": {
+                                                "device_group_in": json.loads(default_in).get('id'),
+                                                "device_group_out": json.loads(default_out).get('id'),
+                                                "config": json.dumps({
+                                                    "dest": [f"{panel.ip}:{form_data['port']}"]
+                                                }),
+                                                "name": f"{country}-{datetime.fromtimestamp(expiry_time / 1000).strftime('%Y/%m/%d')}-{order_no}"
+                                            }
+                                        }
+                                        
+                                        # 更新 NodeInfo 表的 udp_config 字段
+                                        print(f"最终生成的udp_config: {udp_config}")
+                                    else:
+                                        print("transit_account 不存在")
+                                else:
+                                    print("用户没有关联的二级代理或代理不是二级代理")
+                            except Exception as e:
+                                logger.error(f"处理UDP中转配置失败: {str(e)}")
+                                udp_config = None  # 发生错误时设置为 None
+                        node_info_dict['udp_config'] = json.dumps(udp_config)
+                        # 添加到节点信息列表
+                        node_info_list.append(node_info_dict)
+
+                        # 更新剩余节点数
+                        remaining_nodes -= 1
+                    except Exception as e:
+                        logger.error(f"获取面板 {panel.id} 的节点信息失败: {str(e)}")
+                        continue
+                if skip_remaining_iterations:
+                    break
+                if list(panels_3x_ui):
+                    break
+
+        
+        if remaining_nodes > 0:
+            x_ui_list = list(panels_x_ui)
+            for i in range(remaining_nodes):
+                if remaining_nodes <= 0:
+                    break
+                panel_index = i % len(x_ui_list)
+                panel = x_ui_list[panel_index]
+                # 获取面板连接信息
+                panel_info = {
+                    'type': 'x-ui',
+                    'id': panel.id,
+                    'ip': panel.ip_address,
+                    'port': panel.port,
+                    'username': panel.username,
+                    'password': panel.password,
+                    'panel_type': panel.panel_type
+                }
+                
+                form_data = None
+                try:
+                    random_port = agent_panel_viewset.generate_random_port(panel)
+                    # 始终生成新的UUID
+                    client_id = agent_panel_viewset.generate_uuid()
+                    
+                    # 生成随机subId
+                    sub_id = agent_panel_viewset.generate_sub_id()
+                    
+                    x_ui_create_node_data = {
+                        'up': 0,
+                        'down': 0,
+                        'total': 0,
+                        'remark': node_data.get('remark', '自动创建'),
+                        'enable': True,
+                        'expiryTime': expiry_time,  # 使用计算好的过期时间
+                        'listen':'',
+                        'port': random_port,  # 使用生成的随机端口
+                        'protocol': protocol.lower(),
+                        'settings': {},
+                        'streamSettings': {
+                            "network": "tcp",
+                            "security": "none",
+                            "tcpSettings": {
+                                "header": {
+                                "type": "none"
+                                }
+                            }
+                        },
+                        'sniffing': {
+                            "enabled": True,
+                            "destOverride": [
+                                "http",
+                                "tls",
+                                "quic"
+                            ]
+                        }
+                    }
+                    if protocol == 'vmess' or protocol == 'Vmess':
+                        x_ui_create_node_data['sniffing'] = {
+                            "enabled": True,
+                            "destOverride": [
+                                "http",
+                                "tls"
+                            ]
+                        }
+                        x_ui_create_node_data['settings'] = {
+                            "clients": [
+                                {
+                                "id": client_id,  # 使用生成的UUID
+                                "alterId": 0
+                                }
+                            ],
+                            "disableInsecureEncryption": False
+                        }
+                    elif protocol == 'vless' or protocol == 'Vless':
+                        # 尝试获取cookie
+                        if not panel.cookie:
+                            cookie = get_login_cookie(panel, panel_info)
+                            if not cookie:
+                                logger.error(f"无法获取面板 {panel_id} 的cookie")
+                                continue
+                        url_version = f"http://{panel.ip_address}/server/status"
+                        headers = {
+                            'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
+                            'Accept': 'application/json, text/plain, */*',
+                            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/96.0.4664.45 Safari/537.36',
+                        }
+                        response_version = make_request_with_cookie(
+                                    panel, 
+                                    panel_info, 
+                                    url_version, 
+                                    headers, 
+                                    method='post', 
+                                    data=None
+                                )
+                        # 添加状态码检查
+                        if response_version.status_code != 200:
+                            logger.error(f"面板 {panel.id} 版本检查失败，状态码: {response_version.status_code}")
+                            panel.is_online = False
+                            panel.save()
+                            continue
+                        # 获取系统版本
+                        version = response_version.json().get('obj').get('xray').get('version')
+                        
+                        x_ui_create_node_data['sniffing'] = {
+                            "enabled": True,
+                            "destOverride": [
+                                "http",
+                                "tls"
+                            ]
+                        }
+                        if version == '25.3.6':
+                            x_ui_create_node_data['settings'] = {
+                                "clients": [
+                                    {
+                                    "id": client_id,  # 使用生成的UUID
+                                    "flow": ""
+                                    }
+                                ],
+                                "decryption": "none",
+                                "fallbacks": []
+                            }
+                        else:
+                            x_ui_create_node_data['settings'] = {
+                                "clients": [
+                                    {
+                                    "id": client_id,  # 使用生成的UUID
+                                    "flow": "xtls-rprx-direct"
+                                    }
+                                ],
+                                "decryption": "none",
+                                "fallbacks": []
+                            }
+                    elif protocol == 'shadowsocks' or protocol == 'Shadowsocks':
+                        x_ui_create_node_data['sniffing'] = {
+                            "enabled": True,
+                            "destOverride": [
+                                "http",
+                                "tls"
+                            ]
+                        }
+                        x_ui_create_node_data['settings'] = {
+                            "method": "aes-256-gcm",
+                            "password": node_password,
+                            "network": "tcp,udp"
+                        }
+                    elif protocol == 'socks' or protocol == 'Socks':
+                        x_ui_create_node_data['sniffing'] = {}
+                        x_ui_create_node_data['settings'] = {
+                            "auth": "password",
+                            "accounts": [
+                                {
+                                "user": node_user,
+                                "pass": node_password
+                                }
+                            ],
+                            "udp": False,
+                            "ip": "127.0.0.1"
+                        }
+                    elif protocol == 'http' or protocol == 'Http':
+                        x_ui_create_node_data['sniffing'] = {}
+                        x_ui_create_node_data['settings'] = {
+                            "accounts": [
+                                {
+                                "user": node_user,
+                                "pass": node_password
+                                }
+                            ]    
+                        }    
+                    # 确保端口不在已使用列表中
+                    used_ports = []
+                    if panel.used_ports:
+                        used_ports = [int(port) for port in panel.used_ports.split(',') if port.strip().isdigit()]
+                    
+                    # 检查端口是否已被使用
+                    while True:
+                        if random_port not in used_ports:
+                            x_ui_create_node_data['port'] = random_port
+                            # 更新used_ports列表
+                            used_ports.append(random_port)
+                            panel.used_ports = ','.join(map(str, used_ports))
+                            panel.save()
+                            break
+                        else:
+                            # 生成新的随机端口
+                            random_port = random.randint(1, 65534)
+                    
+                    # 设置为节点数据
+                    node_data = x_ui_create_node_data
+                    
+                    # 创建FormData格式的数据
+                    form_data = {
+                        'up': node_data.get('up', 0),
+                        'down': node_data.get('down', 0),
+                        'total': node_data.get('total', 0),
+                        'remark': node_data.get('remark', '自动创建'),
+                        'enable': node_data.get('enable', True),
+                        'expiryTime': node_data.get('expiryTime', 0),
+                        'listen': node_data.get('listen', ''),
+                        'port': node_data.get('port', random_port),
+                        'protocol': node_data.get('protocol', 'vmess'),
+                        'settings': node_data.get('settings', {}),
+                        'streamSettings': node_data.get('streamSettings', {}),
+                        'sniffing': node_data.get('sniffing', {})
+                    }
+                    # 获取节点基本信息
+                    port = form_data.get('port')
+                    protocol = form_data.get('protocol')
+                    host_config = json.dumps(panel_info, ensure_ascii=False, indent=4)
+                    remark = f"自助下单-{timezone.now().strftime('%Y%m%d%H%M%S')}"
+                    
+                    # 获取节点设置信息
+                    settings = form_data.get('settings', {})
+                    
+                    # 获取特定协议的配置信息
+                    uuid_str = None
+                    node_user = None
+                    node_password = None
+                    
+                    if protocol in ['vmess', 'vless', 'Vmess', 'Vless']:
+                        # vmess和vless只使用uuid，没有用户名和密码
+                        clients = settings.get('clients', [{}])
+                        if clients:
+                            uuid_str = clients[0].get('id')
+                    elif protocol == 'shadowsocks' or protocol == 'Shadowsocks':
+                        # shadowsocks没有用户名和uuid，只有密码
+                        if panel.panel_type == 'x-ui':
+                            node_password = settings.get('password')
+                        else:  # 3x-ui
+                            clients = settings.get('clients', [{}])
+                            if clients:
+                                node_password = clients[0].get('password')
+                    elif protocol in ['socks', 'http', 'Socks', 'Http']:
+                        # socks和http使用用户名和密码，没有uuid
+                        accounts = settings.get('accounts', [{}])
+                        if accounts:
+                            node_user = accounts[0].get('user', '')
+                            node_password = accounts[0].get('pass', '')
+                    # 创建节点信息字典，但不立即保存
+                    
+                    node_info_dict = {
+                        'user': request.user,
+                        'protocol': protocol,
+                        'host_config': host_config,
+                        'remark': remark,
+                        'remark_custom': '',
+                        'host': panel.ip or panel.ip_address,
+                        'port': port,
+                        'uuid': uuid_str,
+                        'udp': data.get('udpForward', False),
+                        'node_user': node_user,
+                        'node_password': node_password,
+                        'panel_id': panel.id,
+                        'panel_node_id': None,
+                        'config_text': json.dumps(form_data, ensure_ascii=False, indent=4),
+                        'status': 'pending',
+                        'expiry_time': datetime.fromtimestamp(form_data.get('expiryTime', 0)/1000),  # 从毫秒转换为datetime对象
+                        'form_data': form_data
+                    }
+                    udp_config = None  # 初始化 udp_config 变量
+                    if data.get('udpForward', False):
+                        try:
+                            # 获取登录账户的二级代理
+                            agent = request.user.parent if request.user.parent else None
+                            if agent and agent.user_type == 'agent_l2':
+                                # 获取中转账号信息
+                                transit_account = agent.default_transit_account
+                                if transit_account:
+                                    # 获取默认入口和出口
+                                    default_in = transit_account.default_inbound
+                                    default_out = transit_account.default_outbound
+                                    
+                                    # 构建中转配置
+                                    udp_config =  {
+                                        "config": {
+                                            "id": transit_account.id,
+                                            "username": transit_account.username,
+                                            "password": transit_account.password,
+                                        },
+                                        "udpConfig": {
+                                            "device_group_in": json.loads(default_in).get('id'),
+                                            "device_group_out": json.loads(default_out).get('id'),
+                                            "config": json.dumps({
+                                                "dest": [f"{panel.ip}:{form_data['port']}"]
+                                            }),
+                                            "name": f"{country}-{datetime.fromtimestamp(expiry_time / 1000).strftime('%Y/%m/%d')}-{order_no}"
+                                        }
+                                    }
+                                    
+                                    # 更新 NodeInfo 表的 udp_config 字段
+                                else:
+                                    print("transit_account 不存在")
+                            else:
+                                print("用户没有关联的二级代理或代理不是二级代理")
+                        except Exception as e:
+                            logger.error(f"处理UDP中转配置失败: {str(e)}")
+                            udp_config = None  # 发生错误时设置为 None
+                    node_info_dict['udp_config'] = json.dumps(udp_config)
+                    # 添加到节点信息列表
+                    node_info_list.append(node_info_dict)
+                    # ... 原有的x-ui节点创建逻辑 ...
+                    
+                    remaining_nodes -= 1
+                    
+                except Exception as e:
+                    logger.error(f"使用x-ui面板创建节点失败: {str(e)}")
+                    continue
+        
+        # 发送请求到第三方支付接口
+        try:
+            response = requests.post('https://pototapay.com/mapi.php', data=sign_data, timeout=30)
+            logger.info(f"支付请求响应码: {response.status_code}")
+            
+            # 记录响应内容（仅用于调试）
+            
+            try:
+                response_data = response.json()
+            except json.JSONDecodeError as e:
+                logger.error(f"解析支付接口响应失败: {str(e)}, 响应内容: {response.text}")
+                if redeemed_coupon:
+                    release_coupon(redeemed_coupon)
+                return Response({
+                    'code': 0,
+                    'msg': f'解析支付接口响应失败，请联系管理员',
+                    'debug_info': {
+                        'error': str(e),
+                        'response_content': response.text
+                    }
+                }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            
+            # 将订单号添加到响应数据中
+            response_data['order_no'] = order_no
+            
+            # 只有当支付接口返回code=1时才保存订单和节点信息
+            if response_data.get('code') == 1:
+                logger.info(f"支付请求成功，开始创建订单和节点信息")
+                
+                # 创建支付订单
+                payment_order = PaymentOrder(
+                    user=request.user,
+                    out_trade_no=order_no,
+                    payment_type=data['paymentMethod'],
+                    product_name=f"{node_type}-{period}-{node_count}节点",
+                    amount=Decimal(str(data['money'])),
+                    status='pending',
+                    param=json.dumps({
+                        'region': country,
+                        'nodeType': node_type,
+                        'protocol': data.get('protocol', 'vmess'),
+                        'period': period
+                    }),
+                    country=country,
+                    node_count=node_count,
+                    node_protocol=data.get('protocol', 'vmess')
+                )
+                payment_order.save()
+                logger.info(f"订单已创建: {payment_order.out_trade_no}")
+                # 优惠码已计入订单，之后的异常不再归还
+                redeemed_coupon = None
+                
+                # 如果响应数据中包含易支付订单号(trade_no)，更新到支付订单表中
+                if 'trade_no' in response_data:
+                    payment_order.trade_no = response_data['trade_no']
+                    payment_order.save(update_fields=['trade_no'])
+                
+                # 保存所有节点信息
+                for node_info_dict in node_info_list:
+                    try:
+                        # 从字典中移除表单数据
+                        form_data = node_info_dict.pop('form_data', None)
+                        
+                        
+                        # 创建NodeInfo实例并设置订单
+                        print(node_info_dict)
+                        # 创建NodeInfo实例
+                        node_info = NodeInfo(
+                            order=payment_order,
+                            **node_info_dict
+                        )
+                        
+                        # 保存节点信息
+                        node_info.save()
+                        logger.info(f"节点信息已保存: {node_info.id}")
+                        
+                            
+                    except Exception as e:
+                        logger.error(f"保存节点信息失败: {str(e)}")
+            else:
+                logger.warning(f"支付接口返回非成功响应: {response_data}")
+                # 没有创建订单，归还优惠码使用次数
+                if redeemed_coupon:
+                    release_coupon(redeemed_coupon)
+            
+            # 返回第三方接口的响应
+            return Response(response_data)
+        
+        except requests.exceptions.RequestException as e:
+            logger.error(f"请求第三方支付接口失败: {str(e)}")
+            if redeemed_coupon:
+                release_coupon(redeemed_coupon)
+            return Response({
+                'code': 0,
+                'msg': f'请求支付接口失败: {str(e)}'
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    except Exception as e:
+        logger.error(f"支付处理异常: {str(e)}")
+        if redeemed_coupon:
+            release_coupon(redeemed_coupon)
+        return Response({
+            'code': 0,
+            'msg': f'支付处理异常: {str(e)}'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def validate_coupon(request):
+    """
+    验证优惠码 (CDK)
+    """
+    coupon_code = request.data.get('coupon_code')
+    if not coupon_code:
+        return Response({
+            'valid': False,
+            'message': '请输入优惠码'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    # 获取请求来源域名
+    # 获取请求域名
+    requesting_domain = request.META.get('HTTP_HOST', '')
+    origin = request.META.get('HTTP_ORIGIN', '')    # 获取请求的源域名
+    referer = request.META.get('HTTP_REFERER', '')  # 获取请求的来源URL
+    
+    # 尝试从HTTP_REFERER中提取域名
+    referer_domain = ''
+    if referer and '://' in referer:
+        referer_parts = referer.split('://', 1)[1]
+        if '/' in referer_parts:
+            referer_domain = referer_parts.split('/', 1)[0]
+        else:
+            referer_domain = referer_parts
+    
+    # 尝试从HTTP_ORIGIN中提取域名
+    origin_domain = ''
+    if origin and '://' in origin:
+        origin_domain = origin.split('://', 1)[1]
+    
+    
+    # 使用多种方法尝试获取源地址
+    requesting_domain = referer_domain or origin_domain or requesting_domain
+    if not requesting_domain:
+        logger.warning("无法获取请求来源域名")
+
+    try:
+        # 1. 先根据 code 查找优惠码（短时缓存，避免每次校验都查询数据库）
+        coupon = get_coupon_snapshot(coupon_code)
+        if not coupon:
+            return Response({
+                'valid': False,
+                'message': '优惠码不存在' 
+            })
+
+        # 2. 检查优惠码的有效性条件
+        now = timezone.now()
+        if not coupon['is_active']:
+            return Response({'valid': False, 'message': '优惠码已失效'})
+        if coupon['valid_from'] > now:
+            return Response({'valid': False, 'message': '优惠码尚未生效'})
+        if coupon['valid_until'] < now:
+            return Response({'valid': False, 'message': '优惠码已过期'})
+        if coupon['used_count'] >= coupon['max_uses']:
+             return Response({'valid': False, 'message': '优惠码已达使用上限'})
+
+        # 3. 验证创建者和域名
+        if coupon['creator_type'] not in ['agent_l1', 'agent_l2']:
+            logger.warning(f"优惠码 {coupon_code} 由未知类型用户 {coupon['creator_username']} 创建")
+            return Response({
+                'valid': False,
+                'message': '优惠码类型无效'
+            })
+        if is_coupon_valid_for_domain(coupon, requesting_domain):
+            return Response({
+                'valid': True,
+                'discount': coupon['discount']
+            })
+        return Response({
+            'valid': False,
+            'message': '优惠码不适用于此网站'
+        })
+
+    except Exception as e:
+        logger.error(f"验证优惠码时出错: {str(e)}")
+        return Response({
+            'valid': False,
+            'message': '验证优惠码时发生错误'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def payment_status(request):
+    """
+    获取订单支付状态
+    """
+    try:
+        # 从查询参数获取订单号
+        order_no = request.GET.get('order_no')
+        if not order_no:
+            return Response({
+                'code': 400,
+                'message': '订单号不能为空',
+                'data': None
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        # 查找订单
+        try:
+            order = PaymentOrder.objects.get(out_trade_no=order_no)
+        except PaymentOrder.DoesNotExist:
+            return Response({
+                'code': 404,
+                'message': '订单不存在',
+                'data': None
+            }, status=status.HTTP_404_NOT_FOUND)
+        
+        # 构建响应数据
+        order_data = {
+            'order_no': order.out_trade_no,
+            'trade_no': order.trade_no,
+            'status': order.status,
+            'product_name': order.product_name,
+            'amount': float(order.amount),
+            'payment_type': order.payment_type,
+            'created_at': order.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+            'is_processed': order.is_processed
+        }
+        
+        return Response({
+            'code': 200,
+            'message': '获取订单状态成功',
+            'data': order_data
+        })
+    
+    except Exception as e:
+        logger.error(f"获取订单状态出错: {str(e)}")
+        return Response({
+            'code': 500,
+            'message': f'获取订单状态出错: {str(e)}',
+            'data': None
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@idempotent('balance_payment')
+def balance_payment(request):
+    # update_panel = 'http://127.0.0.1:8008/api/agent-panel/update_all_nodes_count/'
+    # headers = {
+    #     'Content-Type': 'application/json'
+    # }
+    # response = requests.post(update_panel, headers=headers)
+    # print(f'刷新面板的在线情况: {response.json()}')
+    try:
+        # 从token中获取当前用户
+        user = request.user
+        
+        # 获取请求数据
+        data = request.data
+        node_user = request.data.get('username')
+        node_password = request.data.get('password')
+        country = request.data.get('region')
+        node_count = request.data.get('quantity', 1)  # 默认创建1个节点
+        
+        # 验证请求数据
+        required_fields = ['region','nodeType', 'protocol','period', 'quantity', 'paymentMethod']
+        for field in required_fields:
+            if field not in data:
+                return Response({
+                    'code': 0,
+                    'msg': f'缺少必要参数: {field}'
+                }, status=status.HTTP_400_BAD_REQUEST)
+        requesting_domain = request.META.get('HTTP_HOST', '')
+        origin = request.META.get('HTTP_ORIGIN', '')    # 获取请求的源域名
+        referer = request.META.get('HTTP_REFERER', '')  # 获取请求的来源URL
+        # 尝试从HTTP_REFERER中提取域名
+        referer_domain = ''
+        if referer and '://' in referer:
+            referer_parts = referer.split('://', 1)[1]
+            if '/' in referer_parts:
+                referer_domain = referer_parts.split('/', 1)[0]
+            else:
+                referer_domain = referer_parts
+        
+        # 尝试从HTTP_ORIGIN中提取域名
+        origin_domain = ''
+        if origin and '://' in origin:
+            origin_domain = origin.split('://', 1)[1]
+        
+        
+        # 使用多种方法尝试获取源地址
+        source_domain = referer_domain or origin_domain or requesting_domain
+            
+        # 计算价格和过期时间
+        money = 0
+        expiry_time = 0
+        now = timezone.now()  # 获取当前时间
+# 通过请求域名查找匹配的二级代理
+        matched_agent = None
+        agents = User.objects.filter(user_type='agent_l2')
+        
+        for agent in agents:
+            if agent.domain and source_domain.endswith(agent.domain):
+                matched_agent = agent
+                break
+        
+        if not matched_agent:
+            return Response({
+                'code': 404,
+                'message': '未找到匹配的代理',
+                'data': None
+            }, status=status.HTTP_404_NOT_FOUND)
+
+        node_type = data.get('nodeType', '').lower()  # 'normal' 或 'live' 或 'transit'
+        period = data.get('period', '').lower()  # 'monthly', 'quarterly', 'half_yearly', 'yearly'
+        
+        # 根据节点类型和付费周期获取对应的价格
+        if node_type == 'normal':
+            # 先检查是否有自定义价格，如果没有则使用普通价格
+            if period == 'monthly':
+                field_name = 'normal_monthly_price'
+                days = 30
+            elif period == 'quarterly':
+                field_name = 'normal_quarterly_price'
+                days = 90
+            elif period == 'half_yearly':
+                field_name = 'normal_half_yearly_price'
+                days = 180
+            elif period == 'yearly':
+                field_name = 'normal_yearly_price'
+                days = 365
+            else:
+                return Response({
+                    'code': 400,
+                    'message': f'无效的付费周期: {period}',
+                    'data': None
+                }, status=status.HTTP_400_BAD_REQUEST)
+        elif node_type == 'live':
+            # 先检查是否有自定义价格，如果没有则使用普通价格
+            if period == 'monthly':
+                field_name = 'live_monthly_price'
+                days = 30
+            elif period == 'quarterly':
+                field_name = 'live_quarterly_price'
+                days = 90
+            elif period == 'half_yearly':
+                field_name = 'live_half_yearly_price'
+                days = 180
+            elif period == 'yearly':
+                field_name = 'live_yearly_price'
+                days = 365
+            else:
+                return Response({
+                    'code': 400,
+                    'message': f'无效的付费周期: {period}',
+                    'data': None
+                }, status=status.HTTP_400_BAD_REQUEST)
+        elif node_type == 'transit':
+            # 获取中转节点价格
+            if period == 'monthly':
+                field_name = 'transit_monthly_price'
+                days = 30
+            elif period == 'quarterly':
+                field_name = 'transit_quarterly_price'
+                days = 90
+            elif period == 'half_yearly':
+                field_name = 'transit_half_yearly_price'
+                days = 180
+            elif period == 'yearly':
+                field_name = 'transit_yearly_price'
+                days = 365
+            else:
+                return Response({
+                    'code': 400,
+                    'message': f'无效的付费周期: {period}',
+                    'data': None
+                }, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            return Response({
+                'code': 400,
+                'message': f'无效的节点类型: {node_type}',
+                'data': None
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        # 获取价格（优先使用自定义价格）
+        money = get_price_or_parent(matched_agent, field_name, user)
+        
+        # 处理优惠券代码
+        coupon_code = data.get('coupon')
+        discount = 0
+        redeemed_coupon = None
+        if coupon_code:
+            print('处理优惠券:', coupon_code)
+            try:
+                coupon = get_coupon_snapshot(coupon_code)
+                if not coupon:
+                    print('优惠券不存在')
+                elif not is_coupon_valid_for_domain(coupon, source_domain):
+                    print('优惠券不适用于此网站')
+                elif redeem_coupon(coupon_code):
+                    # 核销成功（条件更新保证不会超过使用上限）后应用折扣
+                    discount = coupon['discount']
+                    redeemed_coupon = coupon_code
+                    print(f'应用优惠券折扣: {discount}%')
+                else:
+                    print('优惠券无效(过期/未生效/已达使用上限)')
+            except Exception as e:
+                print(f'验证优惠券时出错: {str(e)}')
+        
+        # 应用折扣
+        if discount > 0:
+            # 将 discount/100 转换为 Decimal 类型以避免类型不匹配
+            discount_factor = Decimal(str(1 - discount / 100))
+            money = money * discount_factor
+            print(f'折扣后金额: {money}')
+        
+        # 计算过期时间（当前时间 + 天数）
+        expiry_time = int((now + timedelta(days=days)).timestamp() * 1000)  # 转换为毫秒级时间戳
+        
+        # 设置订单金额
+        data['money'] = float(money) * int(node_count)  # 价格乘以节点数量
+        order_no = f"{timezone.now().strftime('%Y%m%d')}{int(timezone.now().timestamp())}{random.randint(100000, 999999)}"
+        data['order_no'] = order_no
+        # 扣除用户余额（条件更新，余额不足时不会扣款）
+        try:
+            change_balance(user, -Decimal(str(data['money'])), 'payment', order_no=order_no)
+        except InsufficientBalance:
+            if redeemed_coupon:
+                release_coupon(redeemed_coupon)
+            return Response({
+                'code': 400,
+                'message': '余额不足',
+                'data': None
+            }, status=status.HTTP_400_BAD_REQUEST)
+        # 已扣款，之后失败时重试返回保存的结果，不会重复扣款
+        mark_side_effect(request)
+        if user.user_type == 'customer' and user.parent:
+            try:
+                agent = user.parent
+                change_balance(agent, -Decimal(str(data['money'])), 'agent_cost', order_no=order_no, allow_negative=True)
+                logger.info(f"从代理 {agent.username} 的余额中扣除 {data['money']} 元，当前余额: {agent.balance}")
+            except Exception as e:
+                logger.error(f"扣除代理余额时出错: {str(e)}")
+        remark = f"自助下单-{timezone.now().strftime('%Y%m%d%H%M%S')}"
+        # 分别查询3x-ui和x-ui面板
+        if node_type == 'live' and country == "美国":
+            
+            print('==进入live美国节点创建==')
+        else:
+            print('==进入非live美国节点创建==',node_type,country)
+            panels_3x_ui = AgentPanel.objects.filter(
+                is_online=True,
+                country__iexact=country,
+                panel_type='3x-ui'
+            ).order_by('nodes_count')
+        panels_x_ui = AgentPanel.objects.filter(
+            is_online=True,
+            country__iexact=country,
+            panel_type='x-ui'
+        ).order_by('nodes_count')
+        if node_type == 'live' and country == "美国":
+                # 获取所有可用面板列表
+            if not panels_x_ui.exists():
+                return Response({
+                    'code': 404,
+                    'message': f'未找到国家为 {country} 的可用代理面板',
+                    'data': None
+                }, status=status.HTTP_404_NOT_FOUND)
+        else:
+            if not panels_3x_ui.exists() and not panels_x_ui.exists():
+                return Response({
+                    'code': 404,
+                    'message': f'未找到国家为 {country} 的可用代理面板',
+                    'data': None
+                }, status=status.HTTP_404_NOT_FOUND)
+
+        panel_servers = {}
+        if node_type == 'live' and country == "美国":
+            
+            print('==进入live美国节点创建==')
+        else:
+            for panel in panels_3x_ui:
+                try:
+                    # 构建请求头
+                    headers = {
+                        'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
+                        'host': f'{panel.ip_address.split("/")[0]}',
+                        'Accept': 'application/json, text/plain, */*',
+                        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/134.0.0.0 Safari/537.36',
+                        'Origin': f'http://{panel.ip_address.split("/")[0]}',
+                        'Referer': f'http://{panel.ip_address}/panel/'
+                    }
+                    
+                    # 获取xray配置
+                    url = f"http://{panel.ip_address}/panel/xray/"
+                    try:
+                        response = make_request_with_cookie(panel, {
+                            'ip': panel.ip_address,
+                            'username': panel.username,
+                            'password': panel.password,
+                            'panel_type': panel.panel_type
+                        }, url, headers, method='post')
+                    except Exception as e:
+                        logger.error(f"获取面板 {panel.id} 的servers配置失败: {str(e)}")
+                        continue
+                    response = make_request_with_cookie(panel, {
+                        'ip': panel.ip_address,
+                        'username': panel.username,
+                        'password': panel.password,
+                        'panel_type': panel.panel_type
+                    }, url, headers, method='post')
+                    
+                    if response.status_code == 200:
+                        result = response.json()
+                        if result.get('success'):
+                            xray_setting = json.loads(result['obj'])['xraySetting']
+                            servers = []
+                            # 提取所有可用的servers节点
+                            for outbound in xray_setting.get('outbounds', []):
+                                try:
+                                    if outbound.get('protocol') == 'socks':
+                                        settings = outbound.get('settings', {})
+                                        # 检查settings是否是字符串，如果是则需要解析
+                                        if isinstance(settings, str):
+                                            settings = json.loads(settings)
+                                        
+                                        # 获取servers数组
+                                        servers_data = settings.get('servers', [])
+                                        # 如果servers是字符串，需要解析
+                                        if isinstance(servers_data, str):
+                                            servers_data = json.loads(servers_data)
+                                        
+                                        # 确保servers_data是列表
+                                        if isinstance(servers_data, list):
+                                            for server in servers_data:
+                                                # 获取users数组
+                                                users = server.get('users', [])
+                                                # 如果users是字符串，需要解析
+                                                if isinstance(users, str):
+                                                    users = json.loads(users)
+                                                
+                                                # 确保至少有一个用户
+                                                if users and len(users) > 0:
+                                                    user = users[0]  # 获取第一个用户
+                                                    servers.append({
+                                                        'address': server.get('address'),
+                                                        'port': server.get('port'),
+                                                        'user': user.get('user'),
+                                                        'pass': user.get('pass'),
+                                                        'tag': outbound.get('tag', '')
+                                                    })
+                                except Exception as e:
+                                    logger.error(f"处理outbound数据时出错: {str(e)}")
+                                    continue
+
+                            if servers:
+                                random.shuffle(servers)
+                                panel_servers[panel.id] = servers
+                    else:
+                        logger.error(f"面板 {panel.id} HTTP状态码异常: {response.status_code}")
+                        panel.is_online = False
+                        panel.save()
+                        continue
+                except Exception as e:
+                    logger.error(f"获取面板 {panel.id} 的servers配置失败: {str(e)}")
+                    continue
+
+                # 修改节点创建逻辑
+            
+        remaining_nodes = node_count
+        node_info_list = []
+        # 创建节点的参数
+        node_data = request.data
+        # 获取协议类型
+        protocol = node_data.get('protocol', 'vmess')
+        print(f"panel_servers: {panel_servers}")
+        if node_type == 'live' and country == "美国":
+            print('==进入live美国节点创建==')
+        else:
+            for panel in panels_3x_ui:
+                print(f"开始创建3x-ui节点: {panel.id}")
+                if remaining_nodes <= 0:
+                    break
+                available_servers = panel_servers.get(panel.id, [])
+                panel_info = {
+                        'type': 'x-ui',
+                        'id': panel.id,
+                        'ip': panel.ip_address,
+                        'port': panel.port,
+                        'username': panel.username,
+                        'password': panel.password,
+                        'panel_type': panel.panel_type
+                    }
+                while True:
+                    skip_remaining_iterations = False
+
+                    for server in available_servers:
+                        if remaining_nodes <= 0:
+                            skip_remaining_iterations = True
+                            break
+                    
+                        try:
+                            # 生成随机未使用端口
+                            random_port = agent_panel_viewset.generate_random_port(panel)
+                            
+                            # 始终生成新的UUID
+                            client_id = agent_panel_viewset.generate_uuid()
+                            
+                            # 生成随机subId
+                            sub_id = agent_panel_viewset.generate_sub_id()
+                            
+                            # 3x-ui的节点创建数据结构，与x-ui类似但可能有所不同
+                            three_x_ui_create_node_data = {
+                                'up': 0,
+                                'down': 0,
+                                'total': 0,
+                                'remark': node_data.get('remark', '自动创建'),
+                                'enable': True,
+                                'expiryTime': expiry_time,  # 使用计算好的过期时间
+                                'listen':'',
+                                'port': random_port,
+                                'protocol': protocol.lower(),
+                                'settings': {},
+                                'streamSettings': {
+                                    "network": "tcp",
+                                    "security": "none",
+                                    "externalProxy": [],
+                                    "tcpSettings": {
+                                        "acceptProxyProtocol": False,
+                                        "header": {
+                                            "type": "none"
+                                        }
+                                    }
+                                },
+                                'sniffing': {
+                                    "enabled": False,
+                                    "destOverride": [
+                                        "http",
+                                        "tls",
+                                        "quic",
+                                        "fakedns"
+                                    ],
+                                    "metadataOnly": False,
+                                    "routeOnly": False
+                                },
+                                'allocate': {
+                                    "strategy": "always",
+                                    "refresh": 5,
+                                    "concurrency": 3
+                                    }
+                            }
+                            # 获取特定协议的配置信息
+                            
+                            if protocol == 'vmess' or protocol == 'Vmess':
+                                three_x_ui_create_node_data['settings'] = {
+                                    "clients": [
+                                        {
+                                        "id": client_id,
+                                        "security": "auto",
+                                        "email": sub_id+str(random_port),
+                                        "limitIp": 0,
+                                        "totalGB": 0,
+                                        "expiryTime": 0,
+                                        "enable": True,
+                                        "tgId": "",
+                                        "subId": sub_id,
+                                        "comment": "",
+                                        "reset": 0
+                                        }
+                                    ],
+                                }
+                            elif protocol == 'vless' or protocol == 'Vless':
+                                three_x_ui_create_node_data['settings'] = {
+                                    "clients": [
+                                        {
+                                        "id": client_id,  # 使用生成的UUID
+                                        "flow": "",
+                                        "email": sub_id+str(random_port),
+                                        "limitIp": 0,
+                                        "totalGB": 0,
+                                        "expiryTime": 0,
+                                        "enable": True,
+                                        "tgId": "",
+                                        "subId": sub_id,
+                                        "comment": "",
+                                        "reset": 0
+                                        }
+                                    ],
+                                    "decryption": "none",
+                                    "fallbacks": []
+                                }
+                            elif protocol == 'shadowsocks' or protocol == 'Shadowsocks':
+                                three_x_ui_create_node_data['settings'] = {
+                                    "method": "aes-256-gcm",
+                                    "password": node_password,
+                                    "network": "tcp,udp",
+                                    "clients": [
+                                        {
+                                        "method": "aes-256-gcm",
+                                        "password": node_password,
+                                        "email": sub_id+str(random_port),
+                                        "limitIp": 0,
+                                        "totalGB": 0,
+                                        "expiryTime": 0,
+                                        "enable": True,
+                                        "tgId": "",
+                                        "subId": sub_id,
+                                        "comment": "",
+                                        "reset": 0
+                                        }
+                                    ],
+                                    "ivCheck": False
+                                }
+                            elif protocol == 'socks' or protocol == 'Socks':
+                                three_x_ui_create_node_data['streamSettings']=""
+                                three_x_ui_create_node_data['settings'] = {
+                                    "auth": "password",
+                                    "accounts": [
+                                        {
+                                        "user": node_user,
+                                        "pass": node_password
+                                        }
+                                    ],
+                                    "udp": False,
+                                    "ip": "127.0.0.1"
+                                }
+                                three_x_ui_create_node_data['sniffing'] = {}
+                            elif protocol == 'http' or protocol == 'Http':
+                                three_x_ui_create_node_data['streamSettings']=""
+                                three_x_ui_create_node_data['settings'] = {
+                                    "accounts": [
+                                        {
+                                        "user": node_user,
+                                        "pass": node_password
+                                        }
+                                    ],
+                                    "allowTransparent": False
+                                }
+                            
+
+                            # 确保端口不在已使用列表中
+                            used_ports = []
+                            if panel.used_ports:
+                                used_ports = [int(port) for port in panel.used_ports.split(',') if port.strip().isdigit()]
+                            
+                            # 检查端口是否已被使用
+                            while True:
+                                if random_port not in used_ports:
+                                    three_x_ui_create_node_data['port'] = random_port
+                                    # 更新used_ports列表
+                                    used_ports.append(random_port)
+                                    panel.used_ports = ','.join(map(str, used_ports))
+                                    panel.save()
+                                    break
+                                else:
+                                    # 生成新的随机端口
+                                    random_port = random.randint(1, 65534)
+                            
+                            # 设置为节点数据
+                            node_data = three_x_ui_create_node_data
+                            # 创建FormData格式的数据
+                            form_data = {
+                                'up': node_data.get('up', 0),
+                                'down': node_data.get('down', 0),
+                                'total': node_data.get('total', 0),
+                                'remark': node_data.get('remark', '自动创建'),
+                                'enable': node_data.get('enable', True),
+                                'expiryTime': node_data.get('expiryTime', 0),
+                                'listen': node_data.get('listen', ''),
+                                'port': node_data.get('port', random_port),
+                                'protocol': node_data.get('protocol', 'vmess'),
+                                'settings': node_data.get('settings', {}),
+                                'streamSettings': node_data.get('streamSettings', {}),
+                                'sniffing': node_data.get('sniffing', {}),
+                                'allocate': node_data.get('allocate', {})
+                            }
+
+                            port = form_data.get('port')
+                            protocol = form_data.get('protocol')
+                            panel_info["tag"] = server.get('tag')
+                            host_config = json.dumps(panel_info, ensure_ascii=False, indent=4)
+                            print('==host_config--------------tiaos==',host_config)
+                            # 获取节点设置信息
+                            settings = form_data.get('settings', {})
+                            uuid_str = None
+                            node_user = None
+                            node_password = None
+                            if protocol in ['vmess', 'vless', 'Vmess', 'Vless']:
+                                # vmess和vless只使用uuid，没有用户名和密码
+                                clients = settings.get('clients', [{}])
+                                if clients:
+                                    uuid_str = clients[0].get('id')
+                            elif protocol == 'shadowsocks' or protocol == 'Shadowsocks':
+                                # shadowsocks没有用户名和uuid，只有密码
+                                if panel.panel_type == 'x-ui':
+                                    node_password = settings.get('password')
+                                else:  # 3x-ui
+                                    clients = settings.get('clients', [{}])
+                                    if clients:
+                                        node_password = clients[0].get('password')
+                            elif protocol in ['socks', 'http', 'Socks', 'Http']:
+                                # socks和http使用用户名和密码，没有uuid
+                                accounts = settings.get('accounts', [{}])
+                                if accounts:
+                                    node_user = accounts[0].get('user', '')
+                                    node_password = accounts[0].get('pass', '')
+                        # 创建节点信息字典，但不立即保存
+
+                            node_info_dict = {
+                                'user': request.user,
+                                'protocol': protocol,
+                                'host_config': host_config,
+                                'remark': remark,
+                                'remark_custom': '',
+                                'host': panel.ip or panel.ip_address,
+                                'port': port,
+                                'uuid': uuid_str,
+                                'udp': data.get('udpForward', False),
+                                'node_user': node_user,
+                                'node_password': node_password,
+                                'panel_id': panel.id,
+                                'panel_node_id': None,
+                                'config_text': json.dumps(form_data, ensure_ascii=False, indent=4),
+                                'status': 'pending',
+                                'expiry_time': datetime.fromtimestamp(form_data.get('expiryTime', 0)/1000),  # 从毫秒转换为datetime对象
+                                'form_data': form_data
+                            }
+                            udp_config = None  # 初始化 udp_config 变量
+                            if data.get('udpForward', False):
+                                try:
+                                    # 获取登录账户的二级代理
+                                    agent = request.user.parent if request.user.parent else None
+                                    if agent and agent.user_type == 'agent_l2':
+                                        # 获取中转账号信息
+                                        transit_account = agent.default_transit_account
+                                        if transit_account:
+                                            # 获取默认入口和出口
+                                            default_in = transit_account.default_inbound
+                                            default_out = transit_account.default_outbound
+                                            
+                                            # 构建中转配置
+                                            udp_config =  {
+                                                "config": {
+                                                    "id": transit_account.id,
+                                                    "username": transit_account.username,
+                                                    "password": transit_account.password,
+                                                },
+                                                "udpConfig": {
+                                                    "device_group_in": json.loads(default_in).get('id'),
+                                                    "device_group_out": json.loads(default_out).get('id'),
+                                                    "config": json.dumps({
+                                                        "dest": [f"{panel.ip}:{form_data['port']}"]
+                                                    }),
+                                                    "name": f"{country}-{datetime.fromtimestamp(expiry_time / 1000).strftime('%Y/%m/%d')}-{order_no}"
+                                                }
+                                            }
+                                            
+                                            # 更新 NodeInfo 表的 udp_config 字段
+                                            print(f"最终生成的udp_config: {udp_config}")
+                                        else:
+                                            print("transit_account 不存在")
+                                    else:
+                                        print("用户没有关联的二级代理或代理不是二级代理")
+                                except Exception as e:
+                                    logger.error(f"处理UDP中转配置失败: {str(e)}")
+                                    udp_config = None  # 发生错误时设置为 None
+                            node_info_dict['udp_config'] = json.dumps(udp_config)
+                            # 添加到节点信息列表
+                            node_info_list.append(node_info_dict)
+
+                            # 更新剩余节点数
+                            remaining_nodes -= 1
+                        except Exception as e:
+                            logger.error(f"获取面板 {panel.id} 的节点信息失败: {str(e)}")
+                            break
+
+                    if skip_remaining_iterations:
+                        break
+                    if list(panels_x_ui):
+                        break
+
+        if remaining_nodes > 0:
+            x_ui_list = list(panels_x_ui)
+            for i in range(remaining_nodes):
+                if remaining_nodes <= 0:
+                    break
+                panel_index = i % len(x_ui_list)
+                panel = x_ui_list[panel_index]
+                # 获取面板连接信息
+                panel_info = {
+                    'type': 'x-ui',
+                    'id': panel.id,
+                    'ip': panel.ip_address,
+                    'port': panel.port,
+                    'username': panel.username,
+                    'password': panel.password,
+                    'panel_type': panel.panel_type
+                }
+                
+                form_data = None
+                try:
+                    random_port = agent_panel_viewset.generate_random_port(panel)
+                    # 始终生成新的UUID
+                    client_id = agent_panel_viewset.generate_uuid()
+                    
+                    # 生成随机subId
+                    sub_id = agent_panel_viewset.generate_sub_id()
+                    
+                    x_ui_create_node_data = {
+                        'up': 0,
+                        'down': 0,
+                        'total': 0,
+                        'remark': node_data.get('remark', '自动创建'),
+                        'enable': True,
+                        'expiryTime': expiry_time,  # 使用计算好的过期时间
+                        'listen':'',
+                        'port': random_port,  # 使用生成的随机端口
+                        'protocol': protocol.lower(),
+                        'settings': {},
+                        'streamSettings': {
+                            "network": "tcp",
+                            "security": "none",
+                            "tcpSettings": {
+                                "header": {
+                                "type": "none"
+                                }
+                            }
+                        },
+                        'sniffing': {
+                            "enabled": True,
+                            "destOverride": [
+                                "http",
+                                "tls",
+                                "quic"
+                            ]
+                        }
+                    }
+                    if protocol == 'vmess' or protocol == 'Vmess':
+                        x_ui_create_node_data['sniffing'] = {
+                            "enabled": True,
+                            "destOverride": [
+                                "http",
+                                "tls"
+                            ]
+                        }
+                        x_ui_create_node_data['settings'] = {
+                            "clients": [
+                                {
+                                "id": client_id,  # 使用生成的UUID
+                                "alterId": 0
+                                }
+                            ],
+                            "disableInsecureEncryption": False
+                        }
+                    elif protocol == 'vless' or protocol == 'Vless':
+                        # 尝试获取cookie
+                        if not panel.cookie:
+                            cookie = get_login_cookie(panel, panel_info)
+                            if not cookie:
+                                logger.error(f"无法获取面板 {panel.id} 的cookie")
+                                continue
+                        url_version = f"http://{panel.ip_address}/server/status"
+                        headers = {
+                            'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
+                            'Accept': 'application/json, text/plain, */*',
+                            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/96.0.4664.45 Safari/537.36',
+                        }
+                        try:
+                            response_version = make_request_with_cookie(
+                                    panel, 
+                                    panel_info, 
+                                    url_version, 
+                                    headers, 
+                                    method='post', 
+                                    data=None
+                                )
+                        except Exception as e:
+                            logger.error(f"获取面板 {panel.id} 的版本信息失败: {str(e)}")
+                            continue
+                        # 添加状态码检查
+                        if response_version.status_code != 200:
+                            logger.error(f"面板 {panel.id} 版本检查失败，状态码: {response_version.status_code}")
+                            panel.is_online = False
+                            panel.save()
+                            continue
+
+                        # 获取系统版本
+                        version = response_version.json().get('obj').get('xray').get('version')
+                        
+                        x_ui_create_node_data['sniffing'] = {
+                            "enabled": True,
+                            "destOverride": [
+                                "http",
+                                "tls"
+                            ]
+                        }
+                        if version == '25.3.6':
+                            x_ui_create_node_data['settings'] = {
+                                "clients": [
+                                    {
+                                    "id": client_id,  # 使用生成的UUID
+                                    "flow": ""
+                                    }
+                                ],
+                                "decryption": "none",
+                                "fallbacks": []
+                            }
+                        else:
+                            x_ui_create_node_data['settings'] = {
+                                "clients": [
+                                    {
+                                    "id": client_id,  # 使用生成的UUID
+                                    "flow": "xtls-rprx-direct"
+                                    }
+                                ],
+                                "decryption": "none",
+                                "fallbacks": []
+                            }
+                    elif protocol == 'shadowsocks' or protocol == 'Shadowsocks':
+                        x_ui_create_node_data['sniffing'] = {
+                            "enabled": True,
+                            "destOverride": [
+                                "http",
+                                "tls"
+                            ]
+                        }
+                        x_ui_create_node_data['settings'] = {
+                            "method": "aes-256-gcm",
+                            "password": node_password,
+                            "network": "tcp,udp"
+                        }
+                    elif protocol == 'socks' or protocol == 'Socks':
+                        x_ui_create_node_data['sniffing'] = {}
+                        x_ui_create_node_data['settings'] = {
+                            "auth": "password",
+                            "accounts": [
+                                {
+                                "user": node_user,
+                                "pass": node_password
+                                }
+                            ],
+                            "udp": False,
+                            "ip": "127.0.0.1"
+                        }
+                    elif protocol == 'http' or protocol == 'Http':
+                        x_ui_create_node_data['sniffing'] = {}
+                        x_ui_create_node_data['settings'] = {
+                            "accounts": [
+                                {
+                                "user": node_user,
+                                "pass": node_password
+                                }
+                            ]    
+                        }    
+                    # 确保端口不在已使用列表中
+                    used_ports = []
+                    if panel.used_ports:
+                        used_ports = [int(port) for port in panel.used_ports.split(',') if port.strip().isdigit()]
+                    
+                    # 检查端口是否已被使用
+                    while True:
+                        if random_port not in used_ports:
+                            x_ui_create_node_data['port'] = random_port
+                            # 更新used_ports列表
+                            used_ports.append(random_port)
+                            panel.used_ports = ','.join(map(str, used_ports))
+                            panel.save()
+                            break
+                        else:
+                            # 生成新的随机端口
+                            random_port = random.randint(1, 65534)
+                    
+                    # 设置为节点数据
+                    node_data = x_ui_create_node_data
+                    
+                    # 创建FormData格式的数据
+                    form_data = {
+                        'up': node_data.get('up', 0),
+                        'down': node_data.get('down', 0),
+                        'total': node_data.get('total', 0),
+                        'remark': node_data.get('remark', '自动创建'),
+                        'enable': node_data.get('enable', True),
+                        'expiryTime': node_data.get('expiryTime', 0),
+                        'listen': node_data.get('listen', ''),
+                        'port': node_data.get('port', random_port),
+                        'protocol': node_data.get('protocol', 'vmess'),
+                        'settings': node_data.get('settings', {}),
+                        'streamSettings': node_data.get('streamSettings', {}),
+                        'sniffing': node_data.get('sniffing', {})
+                    }
+                    # 获取节点基本信息
+                    port = form_data.get('port')
+                    protocol = form_data.get('protocol')
+                    host_config = json.dumps(panel_info, ensure_ascii=False, indent=4)
+                    
+                    
+                    # 获取节点设置信息
+                    settings = form_data.get('settings', {})
+                    
+                    # 获取特定协议的配置信息
+                    uuid_str = None
+                    node_user = None
+                    node_password = None
+                    
+                    if protocol in ['vmess', 'vless', 'Vmess', 'Vless']:
+                        # vmess和vless只使用uuid，没有用户名和密码
+                        clients = settings.get('clients', [{}])
+                        if clients:
+                            uuid_str = clients[0].get('id')
+                    elif protocol == 'shadowsocks' or protocol == 'Shadowsocks':
+                        # shadowsocks没有用户名和uuid，只有密码
+                        if panel.panel_type == 'x-ui':
+                            node_password = settings.get('password')
+                        else:  # 3x-ui
+                            clients = settings.get('clients', [{}])
+                            if clients:
+                                node_password = clients[0].get('password')
+                    elif protocol in ['socks', 'http', 'Socks', 'Http']:
+                        # socks和http使用用户名和密码，没有uuid
+                        accounts = settings.get('accounts', [{}])
+                        if accounts:
+                            node_user = accounts[0].get('user', '')
+                            node_password = accounts[0].get('pass', '')
+                    # 创建节点信息字典，但不立即保存
+                    
+                    node_info_dict = {
+                        'user': request.user,
+                        'protocol': protocol,
+                        'host_config': host_config,
+                        'remark': remark,
+                        'remark_custom': '',
+                        'host': panel.ip or panel.ip_address,
+                        'port': port,
+                        'uuid': uuid_str,
+                        'udp': data.get('udpForward', False),
+                        'node_user': node_user,
+                        'node_password': node_password,
+                        'panel_id': panel.id,
+                        'panel_node_id': None,
+                        'config_text': json.dumps(form_data, ensure_ascii=False, indent=4),
+                        'status': 'pending',
+                        'expiry_time': datetime.fromtimestamp(form_data.get('expiryTime', 0)/1000),  # 从毫秒转换为datetime对象
+                        'form_data': form_data
+                    }
+                    udp_config = None  # 初始化 udp_config 变量
+                    if data.get('udpForward', False):
+                        try:
+                            # 获取登录账户的二级代理
+                            agent = request.user.parent if request.user.parent else None
+                            if agent and agent.user_type == 'agent_l2':
+                                # 获取中转账号信息
+                                transit_account = agent.default_transit_account
+                                if transit_account:
+                                    # 获取默认入口和出口
+                                    default_in = transit_account.default_inbound
+                                    default_out = transit_account.default_outbound
+                                    
+                                    # 构建中转配置
+                                    udp_config =  {
+                                        "config": {
+                                            "id": transit_account.id,
+                                            "username": transit_account.username,
+                                            "password": transit_account.password,
+                                        },
+                                        "udpConfig": {
+                                            "device_group_in": json.loads(default_in).get('id'),
+                                            "device_group_out": json.loads(default_out).get('id'),
+                                            "config": json.dumps({
+                                                "dest": [f"{panel.ip}:{form_data['port']}"]
+                                            }),
+                                            "name": f"{country}-{datetime.fromtimestamp(expiry_time / 1000).strftime('%Y/%m/%d')}-{order_no}"
+                                        }
+                                    }
+                                    
+                                    # 更新 NodeInfo 表的 udp_config 字段
+                                else:
+                                    print("transit_account 不存在")
+                            else:
+                                print("用户没有关联的二级代理或代理不是二级代理")
+                        except Exception as e:
+                            logger.error(f"处理UDP中转配置失败: {str(e)}")
+                            udp_config = None  # 发生错误时设置为 None
+                    node_info_dict['udp_config'] = json.dumps(udp_config)
+                    # 添加到节点信息列表
+                    node_info_list.append(node_info_dict)
+                    # ... 原有的x-ui节点创建逻辑 ...
+                    
+                    remaining_nodes -= 1
+                    
+                except Exception as e:
+                    logger.error(f"使用x-ui面板创建节点失败: {str(e)}")
+                    continue
+        # 
+        # 创建订单
+        payment_order = PaymentOrder(
+                    user=request.user,
+                    out_trade_no=order_no,
+                    payment_type=data['paymentMethod'],
+                    product_name=f"{node_type}-{period}-{node_count}节点",
+                    amount=Decimal(str(data['money'])),
+                    status='pending',
+                    param=json.dumps({
+                        'region': country,
+                        'nodeType': node_type,
+                        'protocol': data.get('protocol', 'vmess'),
+                        'period': period
+                    }),
+                    country=country,
+                    node_count=node_count,
+                    node_protocol=data.get('protocol', 'vmess')
+                )
+        payment_order.save()
+        
+        payment_order.trade_no = order_no
+        payment_order.save(update_fields=['trade_no'])
+        # 保存所有节点信息
+        for node_info_dict in node_info_list:
+            try:
+                # 从字典中移除表单数据
+                form_data = node_info_dict.pop('form_data', None)
+                # 创建NodeInfo实例
+                node_info = NodeInfo(
+                    order=payment_order,
+                    **node_info_dict
+                )
+                
+                # 保存节点信息
+                node_info.save()
+                    
+            except Exception as e:
+                logger.error(f"保存节点信息失败: {str(e)}")
+        
+                # 继续处理，不中断流程
+        
+        nodes = NodeInfo.objects.filter(order=payment_order.id)
+        # 异步处理节点创建
+        thread = Thread(target=process_node_creation, args=(nodes,))
+        thread.start()
+
+        # 更新订单状态
+        payment_order.status = 'success'
+        payment_order.is_processed = True
+        payment_order.save()
+
+        return Response({
+            'code': 200,
+            'message': '支付成功，等待1-2分钟后，到节点列表查看创建状态，如状态与预期不符，建议联系客服处理',
+            'data': {'order_no': order_no}
+        })
+            
+    except Exception as e:
+        logger.error(f"余额支付处理失败: {str(e)}")
+        return Response({
+            'code': 500,
+            'message': f'支付处理失败: {str(e)}',
+            'data': None
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -0,0 +1,442 @@
+"""
+价格接口：价格查询、代理价格设置和用户自定义价格
+"""
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.response import Response
+from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.views import APIView
+from django.contrib.auth import get_user_model
+from decimal import Decimal
+from ..permissions import IsAgentL2
+import logging
+from ..pricing import get_price_or_parent
+
+User = get_user_model()
+
+logger = logging.getLogger(__name__)
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def get_prices(request):
+    """
+    获取价格接口
+    1. 如果请求携带token，优先使用当前用户的自定义价格
+    2. 如果用户没有自定义价格，根据请求域名获取对应二级代理设置的价格
+    3. 如果二级代理设置了自定义价格(custom_*)，则优先使用自定义价格
+    4. 如果没有设置自定义价格，则使用普通价格字段
+    """
+    try:
+        # 获取请求域名
+        requesting_domain = request.META.get('HTTP_HOST', '')
+        origin = request.META.get('HTTP_ORIGIN', '')    # 获取请求的源域名
+        host = request.META.get('HTTP_HOST', '')
+        referer = request.META.get('HTTP_REFERER', '')  # 获取请求的来源URL
+        
+        # 尝试从HTTP_REFERER中提取域名
+        referer_domain = ''
+        if referer and '://' in referer:
+            referer_parts = referer.split('://', 1)[1]
+            if '/' in referer_parts:
+                referer_domain = referer_parts.split('/', 1)[0]
+            else:
+                referer_domain = referer_parts
+        
+        # 尝试从HTTP_ORIGIN中提取域名
+        origin_domain = ''
+        if origin and '://' in origin:
+            origin_domain = origin.split('://', 1)[1]
+        
+        # 使用多种方法尝试获取源地址
+        source_domain = referer_domain or origin_domain or requesting_domain
+        
+        if not source_domain:
+            return Response({
+                'code': 400,
+                'message': '无法获取请求域名',
+                'data': None
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        # 查找匹配的二级代理
+        matched_agent = None
+        agents = User.objects.filter(user_type='agent_l2')
+        
+        for agent in agents:
+            if agent.domain and source_domain.endswith(agent.domain):
+                matched_agent = agent
+                break
+        
+        if not matched_agent:
+            return Response({
+                'code': 404,
+                'message': '未找到匹配的代理',
+                'data': None
+            }, status=status.HTTP_404_NOT_FOUND)
+        
+        # 获取当前登录用户（如果有）
+        current_user = request.user if request.user.is_authenticated else None
+        
+        # 构建价格数据
+        prices = {
+            "normal": {
+                "monthly": get_price_or_parent(matched_agent, 'normal_monthly_price', current_user),
+                "quarterly": get_price_or_parent(matched_agent, 'normal_quarterly_price', current_user),
+                "half_yearly": get_price_or_parent(matched_agent, 'normal_half_yearly_price', current_user),
+                "yearly": get_price_or_parent(matched_agent, 'normal_yearly_price', current_user)
+            },
+            "live": {
+                "monthly": get_price_or_parent(matched_agent, 'live_monthly_price', current_user),
+                "quarterly": get_price_or_parent(matched_agent, 'live_quarterly_price', current_user),
+                "half_yearly": get_price_or_parent(matched_agent, 'live_half_yearly_price', current_user),
+                "yearly": get_price_or_parent(matched_agent, 'live_yearly_price', current_user)
+            },
+            "transit": {
+                "monthly": get_price_or_parent(matched_agent, 'transit_monthly_price', current_user),
+                "quarterly": get_price_or_parent(matched_agent, 'transit_quarterly_price', current_user),
+                "half_yearly": get_price_or_parent(matched_agent, 'transit_half_yearly_price', current_user),
+                "yearly": get_price_or_parent(matched_agent, 'transit_yearly_price', current_user)
+            }
+        }
+        
+        return Response({
+            'code': 200,
+            'message': '获取价格成功',
+            'data': prices
+        })
+        
+    except Exception as e:
+        logger.error(f"获取价格失败: {str(e)}")
+        return Response({
+            'code': 500,
+            'message': f'获取价格失败: {str(e)}',
+            'data': None
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class AgentPricingView(APIView):
+    """获取二级代理定价"""
+    permission_classes = [AllowAny]  # 修改为允许所有访问，我们将在方法内部处理权限
+    
+    def get(self, request):
+        try:
+            # 获取查询参数中的用户ID
+            user_id = request.query_params.get('user_id')
+            
+            # 获取当前登录用户（如果有）
+            current_user = request.user if request.user.is_authenticated else None
+            
+            # 初始化响应数据
+            response_data = {}
+            
+            # 如果指定了用户ID，查询该用户
+            target_user = None
+            if user_id:
+                try:
+                    target_user = User.objects.get(id=user_id)
+                except User.DoesNotExist:
+                    return Response({
+                        'code': 404,
+                        'message': '未找到指定用户',
+                        'data': None
+                    }, status=status.HTTP_404_NOT_FOUND)
+            
+            # 如果有当前登录用户但没有指定user_id，使用当前用户
+            if not target_user and current_user:
+                target_user = current_user
+            
+            # 如果既没有指定用户ID也没有当前登录用户，返回错误
+            if not target_user:
+                return Response({
+                    'code': 401,
+                    'message': '未授权访问',
+                    'data': None
+                }, status=status.HTTP_401_UNAUTHORIZED)
+            
+            # 获取用户的代理（如果用户是客户）或用户本身（如果用户是代理）
+            agent = target_user if target_user.is_agent else target_user.parent
+            
+            if not agent:
+                return Response({
+                    'code': 404,
+                    'message': '未找到关联的代理',
+                    'data': None
+                }, status=status.HTTP_404_NOT_FOUND)
+            
+            # 获取默认定价
+            default_prices = {
+                'normal': {
+                    'monthly': agent.normal_monthly_price,
+                    'quarterly': agent.normal_quarterly_price,
+                    'half_yearly': agent.normal_half_yearly_price,
+                    'yearly': agent.normal_yearly_price
+                },
+                'live': {
+                    'monthly': agent.live_monthly_price,
+                    'quarterly': agent.live_quarterly_price,
+                    'half_yearly': agent.live_half_yearly_price,
+                    'yearly': agent.live_yearly_price
+                },
+                'transit': {
+                    'monthly': agent.transit_monthly_price,
+                    'quarterly': agent.transit_quarterly_price,
+                    'half_yearly': agent.transit_half_yearly_price,
+                    'yearly': agent.transit_yearly_price
+                }
+            }
+            
+            response_data['default_prices'] = default_prices
+            
+            # 获取代理的自定义定价
+            agent_custom_prices = {
+                'normal': {
+                    'monthly': agent.custom_normal_monthly_price,
+                    'quarterly': agent.custom_normal_quarterly_price,
+                    'half_yearly': agent.custom_normal_half_yearly_price,
+                    'yearly': agent.custom_normal_yearly_price
+                },
+                'live': {
+                    'monthly': agent.custom_live_monthly_price,
+                    'quarterly': agent.custom_live_quarterly_price,
+                    'half_yearly': agent.custom_live_half_yearly_price,
+                    'yearly': agent.custom_live_yearly_price
+                },
+                'transit': {
+                    'monthly': agent.custom_transit_monthly_price,
+                    'quarterly': agent.custom_transit_quarterly_price,
+                    'half_yearly': agent.custom_transit_half_yearly_price,
+                    'yearly': agent.custom_transit_yearly_price
+                }
+            }
+            
+            response_data['custom_prices'] = agent_custom_prices
+            
+            # 如果目标用户是客户且有自定义价格，添加用户价格
+            if not target_user.is_agent:
+                user_custom_prices = {
+                    'normal': {
+                        'monthly': target_user.custom_normal_monthly_price,
+                        'quarterly': target_user.custom_normal_quarterly_price,
+                        'half_yearly': target_user.custom_normal_half_yearly_price,
+                        'yearly': target_user.custom_normal_yearly_price
+                    },
+                    'live': {
+                        'monthly': target_user.custom_live_monthly_price,
+                        'quarterly': target_user.custom_live_quarterly_price,
+                        'half_yearly': target_user.custom_live_half_yearly_price,
+                        'yearly': target_user.custom_live_yearly_price
+                    },
+                    'transit': {
+                        'monthly': target_user.custom_transit_monthly_price,
+                        'quarterly': target_user.custom_transit_quarterly_price,
+                        'half_yearly': target_user.custom_transit_half_yearly_price,
+                        'yearly': target_user.custom_transit_yearly_price
+                    }
+                }
+                response_data['user_prices'] = user_custom_prices
+            
+            return Response({
+                'code': 200,
+                'message': '获取成功',
+                'data': response_data
+            })
+            
+        except Exception as e:
+            logger.error(f"获取定价失败: {str(e)}")
+            return Response({
+                'code': 500,
+                'message': '获取失败',
+                'error': str(e)
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class UpdateCustomPricingView(APIView):
+    """修改二级代理自定义定价"""
+    permission_classes = [IsAuthenticated, IsAgentL2]  # 只允许二级代理访问
+    
+    def post(self, request):
+        try:
+            agent = request.user
+            data = request.data
+            
+            # 验证请求数据格式
+            if not isinstance(data, dict):
+                return Response({
+                    'code': 400,
+                    'message': '请求数据格式无效'
+                }, status=status.HTTP_400_BAD_REQUEST)
+            
+            # 定义所有可能的节点类型和周期
+            node_types = ['normal', 'live', 'transit']
+            periods = ['monthly', 'quarterly', 'half_yearly', 'yearly']
+            
+            # 验证并更新每个价格
+            updated_prices = {}
+            update_fields = []  # 用于记录需要更新的字段
+            
+            for node_type in node_types:
+                if node_type not in data:
+                    continue
+                    
+                node_prices = data[node_type]
+                if not isinstance(node_prices, dict):
+                    continue
+                
+                updated_prices[node_type] = {}
+                for period in periods:
+                    if period not in node_prices:
+                        continue
+                    
+                    try:
+                        # 验证价格
+                        price = Decimal(str(node_prices[period]))
+                        if price <= 0:
+                            continue
+                        
+                        # 获取对应的默认定价
+                        default_price_field = f"{node_type}_{period}_price"
+                        default_price = getattr(agent, default_price_field)
+                        
+                        # 验证自定义价格不能低于默认定价
+                        if price < default_price:
+                            continue
+                        
+                        # 更新自定义价格
+                        custom_price_field = f"custom_{node_type}_{period}_price"
+                        setattr(agent, custom_price_field, price)
+                        updated_prices[node_type][period] = str(price)
+                        update_fields.append(custom_price_field)  # 记录需要更新的字段
+                        
+                    except (ValueError, TypeError):
+                        continue
+            
+            # 保存所有更新
+            if update_fields:
+                agent.save(update_fields=update_fields)
+            
+            return Response({
+                'code': 200,
+                'message': '更新成功',
+                'data': {
+                    'updated_prices': updated_prices,
+                    'update_fields': update_fields  # 返回更新的字段列表，方便调试
+                }
+            })
+            
+        except Exception as e:
+            logger.error(f"更新二级代理自定义定价失败: {str(e)}")
+            return Response({
+                'code': 500,
+                'message': '更新失败',
+                'error': str(e)
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class UpdateUserPricingView(APIView):
+    """修改用户独立定价"""
+    permission_classes = [IsAuthenticated, IsAgentL2]  # 只允许二级代理访问
+    
+    def post(self, request):
+        try:
+            # 获取请求数据
+            data = request.data
+            user_id = data.get('userid')
+            user_prices = data.get('user_prices')
+            
+            # 验证必要参数
+            if not user_id or not user_prices:
+                return Response({
+                    'code': 400,
+                    'message': '缺少必要参数',
+                    'data': None
+                }, status=status.HTTP_400_BAD_REQUEST)
+            
+            # 查找用户
+            try:
+                user = User.objects.get(id=user_id)
+            except User.DoesNotExist:
+                return Response({
+                    'code': 404,
+                    'message': '未找到指定用户',
+                    'data': None
+                }, status=status.HTTP_404_NOT_FOUND)
+            
+            # 验证用户是否属于当前代理
+            if user.parent != request.user:
+                return Response({
+                    'code': 403,
+                    'message': '无权修改此用户的价格',
+                    'data': None
+                }, status=status.HTTP_403_FORBIDDEN)
+            
+            # 定义价格字段映射
+            price_fields = {
+                'normal': {
+                    'monthly': 'custom_normal_monthly_price',
+                    'quarterly': 'custom_normal_quarterly_price',
+                    'half_yearly': 'custom_normal_half_yearly_price',
+                    'yearly': 'custom_normal_yearly_price'
+                },
+                'live': {
+                    'monthly': 'custom_live_monthly_price',
+                    'quarterly': 'custom_live_quarterly_price',
+                    'half_yearly': 'custom_live_half_yearly_price',
+                    'yearly': 'custom_live_yearly_price'
+                },
+                'transit': {
+                    'monthly': 'custom_transit_monthly_price',
+                    'quarterly': 'custom_transit_quarterly_price',
+                    'half_yearly': 'custom_transit_half_yearly_price',
+                    'yearly': 'custom_transit_yearly_price'
+                }
+            }
+            
+            # 更新字段
+            update_fields = []
+            for node_type, periods in user_prices.items():
+                if node_type not in price_fields:
+                    continue
+                    
+                for period, value in periods.items():
+                    if period not in price_fields[node_type]:
+                        continue
+                        
+                    field_name = price_fields[node_type][period]
+                    if value is not None:
+                        try:
+                            # 转换为Decimal类型
+                            decimal_value = Decimal(str(value))
+                            # 获取代理的对应价格字段
+                            agent_field_name = field_name.replace('custom_', '')
+                            agent_price = getattr(request.user, agent_field_name)
+                            
+                            # 验证价格不能低于代理价格
+                            if decimal_value < agent_price:
+                                continue
+                                
+                            setattr(user, field_name, decimal_value)
+                            update_fields.append(field_name)
+                        except (ValueError, TypeError, InvalidOperation):
+                            continue
+                    else:
+                        # 如果值为null，设置为0
+                        setattr(user, field_name, Decimal('0'))
+                        update_fields.append(field_name)
+            
+            # 保存更新
+            if update_fields:
+                user.save(update_fields=update_fields)
+                
+            return Response({
+                'code': 200,
+                'message': '更新用户价格成功',
+                'data': None
+            })
+            
+        except Exception as e:
+            logger.error(f"更新用户价格失败: {str(e)}")
+            return Response({
+                'code': 500,
+                'message': '更新失败',
+                'error': str(e)
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -0,0 +1,562 @@
+"""
+续费接口
+"""
+import json
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.response import Response
+from rest_framework.permissions import IsAuthenticated
+from django.contrib.auth import get_user_model
+import random
+from decimal import Decimal
+from django.utils import timezone
+from datetime import timedelta, datetime
+from ..models import NodeInfo, PaymentOrder
+from panels.models import AgentPanel
+import logging
+from threading import Thread
+from ..ledger import change_balance, InsufficientBalance
+from ..pricing import get_price_or_parent
+from ..provisioning import process_node_creation_time
+
+User = get_user_model()
+
+logger = logging.getLogger(__name__)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def node_renewal(request):
+    """节点续费接口"""
+    try:
+        # 获取节点ID
+        node_id = request.data.get('node_id')
+        if not node_id:
+            return Response({
+                'code': 400,
+                'message': '节点ID不能为空',
+                'data': None
+            }, status=status.HTTP_400_BAD_REQUEST)
+            
+        # 获取节点信息
+        try:
+            node = NodeInfo.objects.select_related('order', 'user').get(
+                id=node_id,
+                user=request.user  # 确保只能续费自己的节点
+            )
+            
+            # 创建节点
+            node_data = {
+                'user': request.user,
+                'remark': node.remark,
+                'remark_custom': node.remark_custom,
+                'protocol': node.protocol,
+                'host_config': node.host_config,
+                'host': node.host,
+                'port': node.port,
+                'uuid': node.uuid,
+                'node_user': node.node_user,
+                'node_password': node.node_password,
+                'panel_id': node.panel_id,
+                'panel_node_id': node.panel_node_id,
+                'status': node.status,
+                'expiry_time': node.expiry_time,
+                'config_text': node.config_text,
+                'udp': node.udp,
+                'udp_config': node.udp_config,
+                'udp_host': node.udp_host,
+            }
+            
+        except NodeInfo.DoesNotExist:
+            return Response({
+                'code': 404,
+                'message': '节点不存在或无权访问',
+                'data': None
+            }, status=status.HTTP_404_NOT_FOUND)
+            
+        # 获取原始订单信息
+        original_order = node.order
+        
+        
+        # 解析host_config获取面板信息
+        try:
+            import json
+            host_config = json.loads(node.host_config)
+            panel_type = host_config.get('panel_type', '')  # x-ui 或 3x-ui
+            panel_id = host_config.get('id')
+            # 解析节点配置
+            form_data = json.loads(node.config_text)
+            
+            # 获取面板详细信息
+            print(f'panel_id: {panel_id}')
+            
+            panel = None
+            if panel_id:
+                try:
+                    panel = AgentPanel.objects.get(id=panel_id)
+                except AgentPanel.DoesNotExist:
+                    logger.warning(f"面板不存在: panel_id={panel_id}")
+        except json.JSONDecodeError:
+            logger.error(f"解析host_config失败: {node.host_config}")
+            panel = None
+            panel_type = ''
+        
+
+        node_type = (original_order.node_type or '').lower()  # 'normal' 或 'live' 或 'transit'
+        period = (original_order.period or '').lower()  # 'monthly', 'quarterly', 'half_yearly', 'yearly'
+        field_name =''
+        user = request.user
+        days = 0
+        # 根据节点类型和付费周期获取对应的价格
+        if node_type == 'normal':
+            # 先检查是否有自定义价格，如果没有则使用普通价格
+            if period == 'monthly':
+                field_name = 'normal_monthly_price'
+                days = 30
+            elif period == 'quarterly':
+                field_name = 'normal_quarterly_price'
+                days = 90
+            elif period == 'half_yearly':
+                field_name = 'normal_half_yearly_price'
+                days = 180
+            elif period == 'yearly':
+                field_name = 'normal_yearly_price'
+                days = 365
+            else:
+                return Response({
+                    'code': 400,
+                    'message': f'无效的付费周期: {period}',
+                    'data': None
+                }, status=status.HTTP_400_BAD_REQUEST)
+        elif node_type == 'live':
+            # 先检查是否有自定义价格，如果没有则使用普通价格
+            if period == 'monthly':
+                field_name = 'live_monthly_price'
+                days = 30
+            elif period == 'quarterly':
+                field_name = 'live_quarterly_price'
+                days = 90
+            elif period == 'half_yearly':
+                field_name = 'live_half_yearly_price'
+                days = 180
+            elif period == 'yearly':
+                field_name = 'live_yearly_price'
+                days = 365
+            else:
+                return Response({
+                    'code': 400,
+                    'message': f'无效的付费周期: {period}',
+                    'data': None
+                }, status=status.HTTP_400_BAD_REQUEST)
+        elif node_type == 'transit':
+            # 获取中转节点价格
+            if period == 'monthly':
+                field_name = 'transit_monthly_price'
+                days = 30
+            elif period == 'quarterly':
+                field_name = 'transit_quarterly_price'
+                days = 90
+            elif period == 'half_yearly':
+                field_name = 'transit_half_yearly_price'
+                days = 180
+            elif period == 'yearly':
+                field_name = 'transit_yearly_price'
+                days = 365
+            else:
+                return Response({
+                    'code': 400,
+                    'message': f'无效的付费周期: {period}',
+                    'data': None
+                }, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            return Response({
+                'code': 400,
+                'message': f'无效的节点类型: {node_type}',
+                'data': None
+            }, status=status.HTTP_400_BAD_REQUEST)
+        # 获取价格（优先使用自定义价格）
+
+        referer_domain = ''
+        requesting_domain = request.META.get('HTTP_HOST', '')
+        origin = request.META.get('HTTP_ORIGIN', '')    # 获取请求的源域名
+        referer = request.META.get('HTTP_REFERER', '')  # 获取请求的来源URL
+        if referer and '://' in referer:
+            referer_parts = referer.split('://', 1)[1]
+            if '/' in referer_parts:
+                referer_domain = referer_parts.split('/', 1)[0]
+            else:
+                referer_domain = referer_parts
+        
+        # 尝试从HTTP_ORIGIN中提取域名
+        origin_domain = ''
+        if origin and '://' in origin:
+            origin_domain = origin.split('://', 1)[1]
+        
+        
+        # 使用多种方法尝试获取源地址
+        source_domain = referer_domain or origin_domain or requesting_domain
+            
+        # 计算价格和过期时间
+        money = 0
+        expiry_time = 0
+        now = timezone.now()  # 获取当前时间
+
+        matched_agent = None
+        agents = User.objects.filter(user_type='agent_l2')
+        
+        for agent in agents:
+            if agent.domain and source_domain.endswith(agent.domain):
+                matched_agent = agent
+                break
+        
+        if not matched_agent:
+            return Response({
+                'code': 404,
+                'message': '未找到匹配的代理',
+                'data': None
+            }, status=status.HTTP_404_NOT_FOUND)
+
+        money = get_price_or_parent(matched_agent, field_name, user)
+        expiry_time = int((node.expiry_time + timedelta(days=days)).timestamp() * 1000)  # 转换为毫秒级时间戳
+        order_no = f"{timezone.now().strftime('%Y%m%d')}{int(timezone.now().timestamp())}{random.randint(100000, 999999)}"
+
+        form_data['expiryTime'] = expiry_time
+        node_data['expiry_time'] =datetime.fromtimestamp(expiry_time/1000)
+        print('==node_data==',node_data)
+        if node_data['udp']:
+            new_udp_config = json.loads(node_data['udp_config'])
+            new_udp_config['udpConfig']['name'] = f"{original_order.country}-{datetime.fromtimestamp(expiry_time / 1000).strftime('%Y/%m/%d')}-{order_no}"
+            print('==new_udp_config-udpConfig-name==',new_udp_config['udpConfig']['name'])
+            node_data['udp_config'] = json.dumps(new_udp_config)
+        print('==form_data==',expiry_time)
+        node_data['config_text'] = json.dumps(form_data)
+        # 扣除用户余额（条件更新，余额不足时不会扣款）
+        try:
+            change_balance(user, -Decimal(str(money)), 'renewal', order_no=order_no)
+        except InsufficientBalance:
+            return Response({
+                'code': 400,
+                'message': '余额不足',
+                'data': None
+            }, status=status.HTTP_400_BAD_REQUEST)
+        if user.user_type == 'customer' and user.parent:
+            try:
+                agent = user.parent
+                change_balance(agent, -Decimal(str(money)), 'agent_cost', order_no=order_no, allow_negative=True)
+                logger.info(f"从代理 {agent.username} 的余额中扣除 {money} 元，当前余额: {agent.balance}")
+            except Exception as e:
+                logger.error(f"扣除代理余额时出错: {str(e)}")
+        
+        remark = f"单节点续费-{timezone.now().strftime('%Y%m%d%H%M%S')}"
+        node_data['remark'] = remark
+        payment_order = PaymentOrder(
+                    user=request.user,
+                    out_trade_no=order_no,
+                    trade_no=order_no,
+                    payment_type='balance',
+                    product_name= original_order.product_name,
+                    amount=Decimal(money),
+                    status='pending',
+                    param=original_order.param,
+                    country=original_order.country,
+                    node_count=1,
+                    node_protocol= original_order.node_protocol
+                )
+        payment_order.save()
+        node_info = NodeInfo(
+                    order=payment_order,
+                    **node_data
+        )
+        node_info.save()
+        
+        
+        nodes = NodeInfo.objects.filter(order=payment_order.id)
+        # 异步处理节点创建
+        thread = Thread(target=process_node_creation_time, args=(nodes))
+        thread.start()
+        # 更新订单状态
+        payment_order.status = 'success'
+        payment_order.is_processed = True
+        payment_order.save()
+
+        return Response({
+            'code': 200,
+            'money': money,
+            'message': f'支付成功，本次扣费{money}元，等待1-2分钟后，到节点列表查看创建状态，如状态与预期不符，建议联系客服处理'.format(money),
+            'data': {}
+        })
+            
+    except Exception as e:
+        logger.error(f"节点续费失败: {str(e)}")
+        return Response({
+            'code': 500,
+            'message': f'节点续费失败: {str(e)}',
+            'data': None
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def order_renewal(request):
+    """订单续费接口"""
+    try:
+        # 获取节点ID
+        order_id = request.data.get('order_id')
+        if not order_id:
+            return Response({
+                'code': 400,
+                'message': '订单ID不能为空',
+                'data': None
+            }, status=status.HTTP_400_BAD_REQUEST)
+            
+        # 获取节点信息
+        try:
+            node_list = NodeInfo.objects.filter(
+                order_id=order_id,
+                user=request.user  # 确保只能续费自己的节点
+            )
+            print(node_list)
+            order = PaymentOrder.objects.get(id=order_id)
+            print(order)
+            
+            
+            
+        except NodeInfo.DoesNotExist:
+            return Response({
+                'code': 404,
+                'message': '节点不存在或无权访问',
+                'data': None
+            }, status=status.HTTP_404_NOT_FOUND)
+            
+
+        node_type = (order.node_type or '').lower()  # 'normal' 或 'live' 或 'transit'
+        period = (order.period or '').lower()  # 'monthly', 'quarterly', 'half_yearly', 'yearly'
+        field_name =''
+        user = request.user
+        days = 0
+        # 根据节点类型和付费周期获取对应的价格
+        if node_type == 'normal':
+            # 先检查是否有自定义价格，如果没有则使用普通价格
+            if period == 'monthly':
+                field_name = 'normal_monthly_price'
+                days = 30
+            elif period == 'quarterly':
+                field_name = 'normal_quarterly_price'
+                days = 90
+            elif period == 'half_yearly':
+                field_name = 'normal_half_yearly_price'
+                days = 180
+            elif period == 'yearly':
+                field_name = 'normal_yearly_price'
+                days = 365
+            else:
+                return Response({
+                    'code': 400,
+                    'message': f'无效的付费周期: {period}',
+                    'data': None
+                }, status=status.HTTP_400_BAD_REQUEST)
+        elif node_type == 'live':
+            # 先检查是否有自定义价格，如果没有则使用普通价格
+            if period == 'monthly':
+                field_name = 'live_monthly_price'
+                days = 30
+            elif period == 'quarterly':
+                field_name = 'live_quarterly_price'
+                days = 90
+            elif period == 'half_yearly':
+                field_name = 'live_half_yearly_price'
+                days = 180
+            elif period == 'yearly':
+                field_name = 'live_yearly_price'
+                days = 365
+            else:
+                return Response({
+                    'code': 400,
+                    'message': f'无效的付费周期: {period}',
+                    'data': None
+                }, status=status.HTTP_400_BAD_REQUEST)
+        elif node_type == 'transit':
+            # 获取中转节点价格
+            if period == 'monthly':
+                field_name = 'transit_monthly_price'
+                days = 30
+            elif period == 'quarterly':
+                field_name = 'transit_quarterly_price'
+                days = 90
+            elif period == 'half_yearly':
+                field_name = 'transit_half_yearly_price'
+                days = 180
+            elif period == 'yearly':
+                field_name = 'transit_yearly_price'
+                days = 365
+            else:
+                return Response({
+                    'code': 400,
+                    'message': f'无效的付费周期: {period}',
+                    'data': None
+                }, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            return Response({
+                'code': 400,
+                'message': f'无效的节点类型: {node_type}',
+                'data': None
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        # 获取价格（优先使用自定义价格）
+
+        referer_domain = ''
+        requesting_domain = request.META.get('HTTP_HOST', '')
+        origin = request.META.get('HTTP_ORIGIN', '')    # 获取请求的源域名
+        referer = request.META.get('HTTP_REFERER', '')  # 获取请求的来源URL
+        if referer and '://' in referer:
+            referer_parts = referer.split('://', 1)[1]
+            if '/' in referer_parts:
+                referer_domain = referer_parts.split('/', 1)[0]
+            else:
+                referer_domain = referer_parts
+        
+        # 尝试从HTTP_ORIGIN中提取域名
+        origin_domain = ''
+        if origin and '://' in origin:
+            origin_domain = origin.split('://', 1)[1]
+        
+        
+        # 使用多种方法尝试获取源地址
+        source_domain = referer_domain or origin_domain or requesting_domain
+            
+        # 计算价格和过期时间
+        money = 0
+        expiry_time = 0
+        now = timezone.now()  # 获取当前时间
+
+        matched_agent = None
+        agents = User.objects.filter(user_type='agent_l2')
+        
+        for agent in agents:
+            if agent.domain and source_domain.endswith(agent.domain):
+                matched_agent = agent
+                break
+        
+        if not matched_agent:
+            return Response({
+                'code': 404,
+                'message': '未找到匹配的代理',
+                'data': None
+            }, status=status.HTTP_404_NOT_FOUND)
+
+        money = get_price_or_parent(matched_agent, field_name, user)
+        money = money * order.node_count
+        
+        expiry_time = int((now + timedelta(days=days)).timestamp() * 1000)  # 转换为毫秒级时间戳
+
+        
+        order_no = f"{timezone.now().strftime('%Y%m%d')}{int(timezone.now().timestamp())}{random.randint(100000, 999999)}"
+        # 扣除用户余额（条件更新，余额不足时不会扣款）
+        try:
+            change_balance(user, -Decimal(str(money)), 'renewal', order_no=order_no)
+        except InsufficientBalance:
+            return Response({
+                'code': 400,
+                'message': '余额不足',
+                'data': None
+            }, status=status.HTTP_400_BAD_REQUEST)
+        if user.user_type == 'customer' and user.parent:
+            try:
+                agent = user.parent
+                change_balance(agent, -Decimal(str(money)), 'agent_cost', order_no=order_no, allow_negative=True)
+                logger.info(f"从代理 {agent.username} 的余额中扣除 {money} 元，当前余额: {agent.balance}")
+            except Exception as e:
+                logger.error(f"扣除代理余额时出错: {str(e)}")
+        remark = f"订单续费-{timezone.now().strftime('%Y%m%d%H%M%S')}"
+        payment_order = PaymentOrder(
+                    user=request.user,
+                    out_trade_no=order_no,
+                    trade_no=order_no,
+                    payment_type='balance',
+                    product_name= order.product_name,
+                    amount=Decimal(money),
+                    status='pending',
+                    param=order.param,
+                    country=order.country,
+                    node_count=order.node_count,
+                    node_protocol= order.node_protocol
+                )
+        payment_order.save()
+        
+        
+        for node in node_list:
+            # 创建节点
+            expiry_time = int((node.expiry_time + timedelta(days=days)).timestamp() * 1000)  # 转换为毫秒级时间戳
+            node_data = {
+                'user': request.user,
+                'remark': node.remark,
+                'remark_custom': node.remark_custom,
+                'protocol': node.protocol,
+                'host_config': node.host_config,
+                'host': node.host,
+                'port': node.port,
+                'uuid': node.uuid,
+                'node_user': node.node_user,
+                'node_password': node.node_password,
+                'panel_id': node.panel_id,
+                'panel_node_id': node.panel_node_id,
+                'status': node.status,
+                'expiry_time': expiry_time,
+                'config_text': node.config_text,
+                'udp': node.udp,
+                'udp_config': node.udp_config,
+                'udp_host': node.udp_host,
+            }
+            node_data['remark'] = remark
+            print(node_data)
+            host_config = json.loads(node.host_config)
+            panel_type = host_config.get('panel_type', '')  # x-ui 或 3x-ui
+            panel_id = host_config.get('id')
+            form_data = json.loads(node.config_text)
+            form_data['expiryTime'] = expiry_time
+            panel = None
+            if panel_id:
+                try:
+                    panel = AgentPanel.objects.get(id=panel_id)
+                except AgentPanel.DoesNotExist:
+                    logger.warning(f"面板不存在: panel_id={panel_id}")
+            node_data['expiry_time'] =datetime.fromtimestamp(expiry_time/1000)
+            if node_data['udp']:
+                new_udp_config = json.loads(node_data['udp_config'])
+                new_udp_config['udpConfig']['name'] = f"{order.country}-{datetime.fromtimestamp(expiry_time / 1000).strftime('%Y/%m/%d')}-{order_no}"
+                print('==new_udp_config-udpConfig-name==',new_udp_config['udpConfig']['name'])
+                node_data['udp_config'] = json.dumps(new_udp_config)
+        
+            node_data['config_text'] = json.dumps(form_data)
+            node_info = NodeInfo(
+                        order=payment_order,
+                        **node_data
+            )
+            node_info.save()
+        
+        
+        
+        nodes_new = NodeInfo.objects.filter(order=payment_order.id)
+        for nodes_n_new in nodes_new:
+            # 异步处理节点创建
+            thread = Thread(target=process_node_creation_time, args=(nodes_n_new,))
+        thread.start()
+        # 更新订单状态
+        payment_order.status = 'success'
+        payment_order.is_processed = True
+        payment_order.save()
+
+        return Response({
+            'code': 200,
+            'money': money,
+            'message': f'支付成功，本次扣费{money}元，等待1-2分钟后，到节点列表查看创建状态，如状态与预期不符，建议联系客服处理'.format(money),
+            'data': {}
+        })
+            
+    except Exception as e:
+        logger.error(f"节点续费失败: {str(e)}")
+        return Response({
+            'code': 500,
+            'message': f'节点续费失败: {str(e)}',
+            'data': None
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -0,0 +1,281 @@
+"""
+请求耗时统计
+
+设置 INSTRUMENTATION_ENABLED = True（或环境变量 INSTRUMENTATION_ENABLED=1）后启用，默认关闭：
+- 每个请求记录数据库查询次数和耗时、对外HTTP请求次数和耗时（按面板、中转、支付网关分类）以及总耗时
+- 通过 Server-Timing 响应头返回，浏览器开发者工具中可直接查看
+- /metrics 以 Prometheus 文本格式输出累计指标（每个进程单独统计）
+- 超过 SLOW_REQUEST_MS 或查询次数超过 SLOW_REQUEST_QUERIES 的请求记录日志，附带耗时最长的几条SQL
+  （每个请求只保留耗时最长的 SLOW_REQUEST_TOP_QUERIES 条，批量接口的内存占用不随查询次数增长）
+
+对外HTTP统计：
+- 通过 requests 发出的请求由 install_http_hook 包装 requests.Session.send 统计
+- 面板驱动（panels.drivers）的 httpx.AsyncClient 使用 InstrumentedAsyncTransport 包装连接池统计；
+  驱动协程继承调用线程的 contextvars，PanelClient、run_fleet 的请求也归属到发起它们的请求
+- 后台线程中的请求只计入 /metrics，不归属到具体请求
+"""
+import contextvars
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+import httpx
+import requests
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.http import HttpResponse, Http404
+
+logger = logging.getLogger(__name__)
+
+INSTRUMENTATION_ENABLED = getattr(
+    settings, 'INSTRUMENTATION_ENABLED', os.environ.get('INSTRUMENTATION_ENABLED', '') in ('1', 'true', 'True')
+)
+SLOW_REQUEST_MS = getattr(settings, 'SLOW_REQUEST_MS', 1000)
+SLOW_REQUEST_QUERIES = getattr(settings, 'SLOW_REQUEST_QUERIES', 50)
+SLOW_REQUEST_TOP_QUERIES = 5
+# 访问 /metrics 需要的令牌，为空时不校验
+METRICS_TOKEN = getattr(settings, 'METRICS_TOKEN', os.environ.get('METRICS_TOKEN', ''))
+PAYMENT_GATEWAY_HOSTS = getattr(settings, 'PAYMENT_GATEWAY_HOSTS', ['pototapay.com'])
+PANEL_PATH_PREFIXES = ('/xui/', '/panel/', '/server/', '/login')
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+HTTP_CLASSES = ('panel', 'transit', 'payment', 'other')
+
+current_stats = contextvars.ContextVar('request_stats', default=None)
+
+
+class RequestStats:
+    """单个请求的统计数据"""
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.db_count = 0
+        self.db_time = 0.0
+        # 最小堆，只保留耗时最长的几条SQL
+        self.queries = []
+        self.query_seq = itertools.count()
+        self.http = {name: [0, 0.0] for name in HTTP_CLASSES}
+
+    def add_query(self, sql, duration, limit=SLOW_REQUEST_TOP_QUERIES):
+        self.db_count += 1
+        self.db_time += duration
+        item = (duration, next(self.query_seq), sql)
+        if len(self.queries) < limit:
+            heapq.heappush(self.queries, item)
+        elif duration > self.queries[0][0]:
+            heapq.heapreplace(self.queries, item)
+
+    def add_http(self, host_class, duration):
+        self.http[host_class][0] += 1
+        self.http[host_class][1] += duration
+
+    def top_queries(self, limit=SLOW_REQUEST_TOP_QUERIES):
+        return [(duration, sql) for duration, _, sql in heapq.nlargest(limit, self.queries)]
+
+
+class MetricsRegistry:
+    """进程内累计指标"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.latency_buckets = {bucket: 0 for bucket in LATENCY_BUCKETS}
+        self.latency_sum = 0.0
+        self.latency_count = 0
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.http = {name: [0, 0.0] for name in HTTP_CLASSES}
+        self.slow_requests = 0
+
+    def observe_request(self, route, method, status_code, duration, stats, slow):
+        with self.lock:
+            key = (route, method, status_code)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            for bucket in LATENCY_BUCKETS:
+                if duration <= bucket:
+                    self.latency_buckets[bucket] += 1
+            self.latency_sum += duration
+            self.latency_count += 1
+            self.db_queries += stats.db_count
+            self.db_time += stats.db_time
+            if slow:
+                self.slow_requests += 1
+
+    def observe_http(self, host_class, duration):
+        with self.lock:
+            self.http[host_class][0] += 1
+            self.http[host_class][1] += duration
+
+    def render(self):
+        with self.lock:
+            lines = [
+                '# HELP vpncms_requests_total 请求数',
+                '# TYPE vpncms_requests_total counter',
+            ]
+            for (route, method, status_code), count in sorted(self.requests.items()):
+                lines.append(f'vpncms_requests_total{{route="{route}",method="{method}",status="{status_code}"}} {count}')
+            lines += [
+                '# HELP vpncms_request_duration_seconds 请求耗时',
+                '# TYPE vpncms_request_duration_seconds histogram',
+            ]
+            for bucket in LATENCY_BUCKETS:
+                lines.append(f'vpncms_request_duration_seconds_bucket{{le="{bucket}"}} {self.latency_buckets[bucket]}')
+            lines.append(f'vpncms_request_duration_seconds_bucket{{le="+Inf"}} {self.latency_count}')
+            lines.append(f'vpncms_request_duration_seconds_sum {self.latency_sum:.6f}')
+            lines.append(f'vpncms_request_duration_seconds_count {self.latency_count}')
+            lines += [
+                '# TYPE vpncms_db_queries_total counter',
+                f'vpncms_db_queries_total {self.db_queries}',
+                '# TYPE vpncms_db_query_seconds_total counter',
+                f'vpncms_db_query_seconds_total {self.db_time:.6f}',
+                '# TYPE vpncms_outbound_requests_total counter',
+            ]
+            for name in HTTP_CLASSES:
+                lines.append(f'vpncms_outbound_requests_total{{target="{name}"}} {self.http[name][0]}')
+            lines.append('# TYPE vpncms_outbound_seconds_total counter')
+            for name in HTTP_CLASSES:
+                lines.append(f'vpncms_outbound_seconds_total{{target="{name}"}} {self.http[name][1]:.6f}')
+            lines += [
+                '# TYPE vpncms_slow_requests_total counter',
+                f'vpncms_slow_requests_total {self.slow_requests}',
+            ]
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
+
+
+def classify_host(url):
+    """按URL判断对外请求的类型"""
+    parsed = urlparse(url)
+    host = parsed.hostname or ''
+    transit_host = urlparse(getattr(settings, 'API_BASE_URL', '') or '').hostname
+    if transit_host and host == transit_host:
+        return 'transit'
+    if any(host == gateway or host.endswith('.' + gateway) for gateway in PAYMENT_GATEWAY_HOSTS):
+        return 'payment'
+    if parsed.path.startswith(PANEL_PATH_PREFIXES):
+        return 'panel'
+    return 'other'
+
+
+def observe_outbound(url, duration):
+    """记录一次对外请求，当前线程（或协程）属于某个请求时同时计入该请求"""
+    host_class = classify_host(url)
+    metrics.observe_http(host_class, duration)
+    stats = current_stats.get()
+    if stats is not None:
+        stats.add_http(host_class, duration)
+
+
+_http_hook_lock = threading.Lock()
+_http_hook_installed = False
+
+
+def install_http_hook():
+    """包装 requests.Session.send，统计所有通过 requests 发出的请求"""
+    global _http_hook_installed
+    with _http_hook_lock:
+        if _http_hook_installed:
+            return
+        original_send = requests.Session.send
+
+        def instrumented_send(session, request, **kwargs):
+            started_at = time.perf_counter()
+            try:
+                return original_send(session, request, **kwargs)
+            finally:
+                observe_outbound(request.url, time.perf_counter() - started_at)
+
+        requests.Session.send = instrumented_send
+        _http_hook_installed = True
+
+
+class InstrumentedAsyncTransport(httpx.AsyncBaseTransport):
+    """包装 httpx 的异步传输层，统计每个请求到收到响应头的耗时（包括连接失败、超时的请求）"""
+
+    def __init__(self, transport):
+        self.transport = transport
+
+    async def handle_async_request(self, request):
+        started_at = time.perf_counter()
+        try:
+            return await self.transport.handle_async_request(request)
+        finally:
+            observe_outbound(str(request.url), time.perf_counter() - started_at)
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+def instrument_async_transport(transport):
+    """启用统计时返回包装后的传输层，否则原样返回"""
+    return InstrumentedAsyncTransport(transport) if INSTRUMENTATION_ENABLED else transport
+
+
+class InstrumentationMiddleware:
+    """请求耗时统计中间件，INSTRUMENTATION_ENABLED 为False时不加载"""
+
+    def __init__(self, get_response):
+        if not INSTRUMENTATION_ENABLED:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        install_http_hook()
+
+    def __call__(self, request):
+        stats = RequestStats()
+        token = current_stats.set(stats)
+
+        def record_query(execute, sql, params, many, context):
+            started_at = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                stats.add_query(sql, time.perf_counter() - started_at)
+
+        try:
+            with connection.execute_wrapper(record_query):
+                response = self.get_response(request)
+        finally:
+            current_stats.reset(token)
+
+        duration = time.perf_counter() - stats.started_at
+        route = request.resolver_match.view_name if getattr(request, 'resolver_match', None) else 'unmatched'
+        slow = duration * 1000 >= SLOW_REQUEST_MS or stats.db_count >= SLOW_REQUEST_QUERIES
+        metrics.observe_request(route, request.method, response.status_code, duration, stats, slow)
+
+        timings = [f'db;dur={stats.db_time * 1000:.1f};desc="{stats.db_count} queries"']
+        for name in HTTP_CLASSES:
+            count, http_time = stats.http[name]
+            if count:
+                timings.append(f'{name};dur={http_time * 1000:.1f};desc="{count} requests"')
+        timings.append(f'total;dur={duration * 1000:.1f}')
+        response['Server-Timing'] = ', '.join(timings)
+
+        if slow:
+            top_queries = '\n'.join(
+                f'  {query_time * 1000:.1f}ms {sql[:500]}' for query_time, sql in stats.top_queries()
+            )
+            http_summary = ', '.join(
+                f'{name} {count}次/{http_time * 1000:.0f}ms' for name, (count, http_time) in stats.http.items() if count
+            )
+            logger.warning(
+                f"慢请求 {request.method} {request.path} {response.status_code} 耗时 {duration * 1000:.0f}ms, "
+                f"查询 {stats.db_count} 次/{stats.db_time * 1000:.0f}ms, 对外请求: {http_summary or '无'}\n{top_queries}"
+            )
+        return response
+
+
+def metrics_view(request):
+    """Prometheus 指标接口，未启用统计时返回404"""
+    if not INSTRUMENTATION_ENABLED:
+        raise Http404()
+    if METRICS_TOKEN:
+        auth = request.META.get('HTTP_AUTHORIZATION', '')
+        if auth != f'Bearer {METRICS_TOKEN}' and request.GET.get('token') != METRICS_TOKEN:
+            return HttpResponse('Unauthorized', status=401)
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,32 @@
+"""
+延迟导入的视图
+
+URL 配置中用 lazy_view('模块路径.视图名') 代替直接导入视图，视图所在模块在第一次请求该接口时才导入，
+worker 启动、自动重载和不处理请求的管理命令不再需要加载这些模块。
+
+只用于 DRF 视图（api_view 函数或 APIView 子类）：包装函数本身免除 CSRF 校验，
+与 DRF 视图一致，由 DRF 的认证类自行校验。注册在路由器上的 ViewSet 仍需直接导入。
+"""
+from django.utils.module_loading import import_string
+
+
+def lazy_view(dotted_path, **initkwargs):
+    """
+    返回第一次调用时才导入视图的包装函数
+
+    参数:
+    - dotted_path: 视图的完整路径，例如 'users.views.payment.balance_payment'
+    - initkwargs: 视图是 APIView 子类时传给 as_view 的参数
+    """
+    resolved = []
+
+    def view(request, *args, **kwargs):
+        if not resolved:
+            target = import_string(dotted_path)
+            resolved.append(target.as_view(**initkwargs) if isinstance(target, type) else target)
+        return resolved[0](request, *args, **kwargs)
+
+    view.csrf_exempt = True
+    view.__name__ = view.__qualname__ = dotted_path.rsplit('.', 1)[-1]
+    view.__module__ = dotted_path.rsplit('.', 1)[0]
+    return view
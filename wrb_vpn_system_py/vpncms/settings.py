@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 from datetime import timedelta
 
@@ -47,9 +48,11 @@ INSTALLED_APPS = [
     'panels',
     'transits',
     'chat',
+    'reports',
 ]
 
 MIDDLEWARE = [
+    'vpncms.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -104,6 +107,24 @@ DATABASES = {
     }
 }
 
+# 缓存：熔断器状态、xray 重启历史、入站索引、优惠券快照、中转域名映射、迁移进度等需要在所有 worker 进程之间共享，
+# 不能使用默认的进程内缓存。配置了 REDIS_URL 时使用 Redis，否则使用数据库缓存表（由 users 的迁移创建）
+REDIS_URL = os.environ.get('REDIS_URL', '')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'django_cache',
+        }
+    }
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -224,3 +245,35 @@ LOGGING = {
         },
     },
 }
+
+# 请求耗时统计（Server-Timing 响应头、/metrics、慢请求日志），默认关闭
+INSTRUMENTATION_ENABLED = os.environ.get('INSTRUMENTATION_ENABLED', '') in ('1', 'true', 'True')
+SLOW_REQUEST_MS = 1000
+SLOW_REQUEST_QUERIES = 50
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# 离线IP归属地数据库（由 manage.py build_geoip 生成），本地查不到时是否使用 ip-api.com 在线查询
+GEOIP_DATABASE_PATH = os.path.join(BASE_DIR, 'data', 'geoip.bin')
+GEOIP_HTTP_FALLBACK = True
+
+# xray 重启调度：合并窗口（秒）、最长推迟时间（秒）、每个面板每小时最多重启次数
+XRAY_RESTART_DEBOUNCE = 10
+XRAY_RESTART_MAX_DELAY = 60
+XRAY_RESTART_MAX_PER_HOUR = 6
+
+# 面板熔断器：连续失败多少次后熔断，第一次/最长重试间隔（秒）
+PANEL_BREAKER_FAILURE_THRESHOLD = 3
+PANEL_BREAKER_BASE_BACKOFF = 15
+PANEL_BREAKER_MAX_BACKOFF = 600
+
+# 面板驱动：请求超时（秒）、连接池大小、批量操作并发数
+PANEL_DRIVER_TIMEOUT = 10
+PANEL_DRIVER_MAX_CONNECTIONS = 1000
+PANEL_FLEET_CONCURRENCY = 500
+
+# 接口幂等：没有幂等键时重复提交的判定窗口（秒）、幂等记录保留时间（小时）
+IDEMPOTENCY_DERIVED_WINDOW = 30
+IDEMPOTENCY_RETENTION_HOURS = 24
+
+# 导入耗时预算（毫秒）：django.setup() 加 vpncms.urls 的导入耗时中位数超过时 users.tests 中的检查失败
+IMPORT_TIME_BUDGET_MS = 1500
@@ -17,7 +17,9 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from users.views import UserViewSet, LoginView, CustomTokenObtainPairView, AgentViewSet, CustomerViewSet, PackageViewSet, CustomerPackageViewSet, WebsiteTemplateViewSet, CustomerLoginView, payment_callback, payment_submit, validate_coupon, get_prices, payment_status, PaymentOrderViewSet, ContactInfoViewSet, balance_payment, get_user_balance
+# 注册在路由器上的 ViewSet 需要直接导入，accounts、orders 不能用 lazy_view 延迟导入
+from users.views.accounts import UserViewSet, ContactInfoViewSet, get_user_balance
+from users.views.orders import PaymentOrderViewSet
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from news.urls import urlpatterns as news_urls
 from django.conf import settings
@@ -25,6 +27,8 @@ from django.conf.urls.static import static
 from django.views.decorators.csrf import csrf_exempt
 from panels.views import AgentPanelViewSet
 from django.views.static import serve
+from vpncms.instrumentation import metrics_view
+from vpncms.lazy import lazy_view
 
 router = DefaultRouter()
 router.register(r'users', UserViewSet)
@@ -34,6 +38,7 @@ router.register(r'contact-info', ContactInfoViewSet, basename='contact-info')
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),
     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('api/', include(router.urls)),
@@ -42,7 +47,8 @@ urlpatterns = [
     path('api/cdk/', include('cdk.urls')),
     path('api/', include('transits.urls')),
     path('api/chat/', include('chat.urls')),
-    path('api/balance-payment/', balance_payment, name='balance-payment'),
+    path('api/reports/', include('reports.urls')),
+    path('api/balance-payment/', lazy_view('users.views.payment.balance_payment'), name='balance-payment'),
     path('api/user-balance/', get_user_balance, name='user-balance'),
     
     # 无论是开发环境还是生产环境，都使用相同的方式处理媒体文件